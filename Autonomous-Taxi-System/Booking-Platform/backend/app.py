@@ -13,6 +13,9 @@ import json
 from sqlalchemy import text
 from decimal import Decimal
 from datetime import date, timedelta
+import requests
+import threading
+import time
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
@@ -24,6 +27,9 @@ CORS(app, supports_credentials=True)
 db = SQLAlchemy(app)
 mail = init_mail(app)  # 初始化邮件服务
 
+# 管理平台地址，用于读取内存中的车队实时状态
+MANAGEMENT_PLATFORM_URL = os.getenv('MANAGEMENT_PLATFORM_URL', 'http://localhost:5000')
+
 # 全局变量，存储从数据库加载的参数
 city_centers = {}
 city_scale_factors = {}
@@ -131,6 +137,112 @@ class SystemParameter(db.Model):
     param_type = db.Column(db.Enum('int', 'float', 'string', 'boolean', 'json', 'array'), nullable=False)
     updated_at = db.Column(db.DateTime)
 
+class SystemParameterCache:
+    """系统参数缓存
+
+    用一条 SELECT 批量加载 system_parameters，按类型转换后保存在进程内，热点接口读取时不访问数据库。
+    每隔 poll_interval 秒执行一次轻量的水位查询（行数 + MAX(updated_at) + 键值校验和），
+    水位变化时才重新加载；本进程修改参数后调用 invalidate()。加载时预先解析各车型订单价格系数。
+    """
+
+    WATERMARK_QUERY = text("""
+        SELECT COUNT(*) AS total, MAX(updated_at) AS watermark,
+               COALESCE(SUM(CRC32(CONCAT(param_key, '=', param_value, ':', param_type))), 0) AS checksum
+        FROM system_parameters
+    """)
+
+    def __init__(self, poll_interval=5):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._values = None
+        self._raw = {}
+        self._price_coefficients = {}
+        self._watermark = None
+        self._checked_at = 0.0
+        self.reloads = 0
+
+    @staticmethod
+    def _convert(param_value, param_type):
+        if param_type == 'int':
+            return int(param_value)
+        if param_type == 'float':
+            return float(param_value)
+        if param_type == 'boolean':
+            return param_value.lower() in ('true', '1', 'yes')
+        if param_type in ('json', 'array'):
+            return json.loads(param_value)
+        return param_value
+
+    def _current_watermark(self):
+        row = db.session.execute(self.WATERMARK_QUERY).fetchone()
+        return (int(row.total or 0), str(row.watermark), int(row.checksum or 0))
+
+    def _reload(self, watermark=None):
+        if watermark is None:
+            watermark = self._current_watermark()
+        rows = db.session.execute(text(
+            "SELECT param_key, param_value, param_type FROM system_parameters"
+        )).fetchall()
+        values = {}
+        raw = {}
+        price_coefficients = {}
+        for row in rows:
+            raw[row.param_key] = row.param_value
+            try:
+                values[row.param_key] = self._convert(row.param_value, row.param_type)
+            except (ValueError, AttributeError, json.JSONDecodeError) as e:
+                print(f"参数 {row.param_key} 值转换失败，已跳过: {str(e)}")
+                continue
+            if row.param_key.endswith('_ORDER_PRICE'):
+                try:
+                    price_coefficients[row.param_key[:-len('_ORDER_PRICE')]] = float(row.param_value)
+                except ValueError:
+                    pass
+        self._values = values
+        self._raw = raw
+        self._price_coefficients = price_coefficients
+        self._watermark = watermark
+        self._checked_at = time.time()
+        self.reloads += 1
+
+    def _ensure_fresh(self):
+        if self._values is not None and time.time() - self._checked_at < self.poll_interval:
+            return
+        with self._lock:
+            if self._values is None:
+                self._reload()
+            elif time.time() - self._checked_at >= self.poll_interval:
+                watermark = self._current_watermark()
+                self._checked_at = time.time()
+                if watermark != self._watermark:
+                    self._reload(watermark)
+
+    def get(self, param_key, default=None):
+        """获取类型化的参数值"""
+        self._ensure_fresh()
+        return self._values.get(param_key, default)
+
+    def get_raw(self, param_key, default=None):
+        """获取数据库中保存的原始字符串值"""
+        self._ensure_fresh()
+        return self._raw.get(param_key, default)
+
+    def get_price_coefficients(self):
+        """各车型订单价格系数 {车型参数前缀: 系数}（副本）"""
+        self._ensure_fresh()
+        return dict(self._price_coefficients)
+
+    def invalidate(self):
+        """本进程修改参数后调用，下次读取时重新加载
+
+        只清除水位和检查时间，不清空已加载的参数，并发读取在重新加载完成前仍返回旧值
+        """
+        with self._lock:
+            self._watermark = None
+            self._checked_at = 0.0
+
+system_parameter_cache = SystemParameterCache()
+
 class CouponPackage(db.Model):
     __tablename__ = 'coupon_packages'
     id = db.Column(db.Integer, primary_key=True)
@@ -219,6 +331,36 @@ class Expense(db.Model):
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
+# 管理平台的财务页面只读取按天预聚合的事实表（见管理平台 app/utils/rollups.py），
+# 本平台写入收入/支出记录时在同一会话中累加对应的事实行，与明细同时提交或回滚。
+# 充值、优惠券包和提现不关联订单、车辆或充电站，城市和车型维度记为空字符串。
+INCOME_FACT_UPSERT = text("""
+    INSERT INTO fact_daily_income (fact_date, city_code, vehicle_model, source, amount, record_count)
+    VALUES (:fact_date, '', '', :source, :amount, 1)
+    ON DUPLICATE KEY UPDATE amount = amount + VALUES(amount), record_count = record_count + 1
+""")
+EXPENSE_FACT_UPSERT = text("""
+    INSERT INTO fact_daily_expense (fact_date, city_code, vehicle_model, expense_type, sub_type, amount, record_count)
+    VALUES (:fact_date, '', '', :expense_type, '', :amount, 1)
+    ON DUPLICATE KEY UPDATE amount = amount + VALUES(amount), record_count = record_count + 1
+""")
+
+def _record_fact(statement, params):
+    """在保存点内累加事实表；事实表尚未创建时跳过（管理平台重建事实表时会补上这部分明细）"""
+    try:
+        with db.session.begin_nested():
+            db.session.execute(statement, params)
+    except Exception as e:
+        print(f"更新财务事实表失败，已跳过: {str(e)}")
+
+def record_income_fact(income):
+    """把新增的收入记录累加到 fact_daily_income（调用方随后提交会话）"""
+    _record_fact(INCOME_FACT_UPSERT, {'fact_date': income.date, 'source': income.source, 'amount': income.amount})
+
+def record_expense_fact(expense):
+    """把新增的支出记录累加到 fact_daily_expense（本平台写入的支出类型没有子类规则，子类为空）"""
+    _record_fact(EXPENSE_FACT_UPSERT, {'fact_date': expense.date, 'expense_type': expense.type, 'amount': expense.amount})
+
 class Vehicle(db.Model): #车辆信息表
     __tablename__ = 'vehicles'
     vehicle_id = db.Column(db.Integer, primary_key=True)
@@ -938,6 +1080,9 @@ def create_order():
         
         print(f"订单创建成功: {new_order.order_number}")
         
+        # 通知管理平台调度器有新订单
+        notify_order_created(new_order.order_id)
+        
         return jsonify({
             'code': 0,
             'message': '订单创建成功',
@@ -1617,6 +1762,7 @@ def purchase_coupon_package():
             description=f'用户{user.username}购买优惠券包：{package.name}，支付方式：{payment_method}'
         )
         db.session.add(new_income)
+        record_income_fact(new_income)
         
         # 保存到数据库
         db.session.commit()
@@ -2033,6 +2179,7 @@ def recharge_wallet():
         
         # 保存到数据库
         db.session.add(new_income)
+        record_income_fact(new_income)
         db.session.commit()
         
         print(f"用户 {user.username} 充值成功：{amount}元，支付方式：{payment_method}")
@@ -2120,6 +2267,7 @@ def withdraw_wallet():
         
         # 保存到数据库
         db.session.add(new_expense)
+        record_expense_fact(new_expense)
         db.session.commit()
         
         print(f"用户 {user.username} 提现成功：{amount}元，提现方式：{withdraw_method}")
@@ -2979,6 +3127,58 @@ def get_user_travel_habits():
         print(f"获取出行习惯分析数据失败: {str(e)}")
         return jsonify({'code': 500, 'message': f'获取出行习惯分析数据失败: {str(e)}'}), 500
 
+def fetch_live_vehicle_state(vehicle_id):
+    """从管理平台的车队实时状态读取车辆位置，失败时返回None（调用方回退到数据库）"""
+    try:
+        response = requests.get(
+            f"{MANAGEMENT_PLATFORM_URL}/vehicles/api/fleet_state/{vehicle_id}",
+            timeout=0.5
+        )
+        if response.status_code != 200:
+            return None
+        result = response.json()
+        if result.get('status') != 'success':
+            return None
+        return result.get('data')
+    except Exception as e:
+        print(f"读取车辆 {vehicle_id} 实时状态失败，使用数据库数据: {str(e)}")
+        return None
+
+def fetch_travel_distance(city_code, pickup_coords, dropoff_coords):
+    """从管理平台的行驶距离表查询避障行驶距离（系统距离单位），失败时返回None（调用方使用直线距离）"""
+    try:
+        response = requests.get(
+            f"{MANAGEMENT_PLATFORM_URL}/map_obstacles/api/travel_distance",
+            params={
+                'city_code': city_code,
+                'start_x': pickup_coords['x'],
+                'start_y': pickup_coords['y'],
+                'end_x': dropoff_coords['x'],
+                'end_y': dropoff_coords['y']
+            },
+            timeout=0.5
+        )
+        if response.status_code != 200:
+            return None
+        result = response.json()
+        if not result.get('success'):
+            return None
+        return result['data'].get('distance')
+    except Exception as e:
+        print(f"查询行驶距离失败，使用直线距离: {str(e)}")
+        return None
+
+def notify_order_created(order_id):
+    """通知管理平台的连续调度器有新订单，失败时忽略（调度器会定期对账补入）"""
+    try:
+        requests.post(
+            f"{MANAGEMENT_PLATFORM_URL}/orders/api/dispatcher/order_created",
+            json={'order_id': order_id},
+            timeout=0.5
+        )
+    except Exception as e:
+        print(f"通知调度器新订单 {order_id} 失败，等待调度器对账: {str(e)}")
+
 # 获取车辆实时位置API
 @app.route('/api/vehicle/location/<int:vehicle_id>', methods=['GET'])
 def get_vehicle_location(vehicle_id):
@@ -3017,16 +3217,25 @@ def get_vehicle_location(vehicle_id):
         if not active_order:
             return jsonify({'code': 403, 'message': '您没有权限查看该车辆位置'}), 403
         
+        # 优先使用管理平台内存中的实时状态，数据库中的位置可能尚未同步
+        live_state = fetch_live_vehicle_state(vehicle_id) or {}
+        location_x = live_state.get('current_location_x', vehicle.current_location_x)
+        location_y = live_state.get('current_location_y', vehicle.current_location_y)
+        location_name = live_state.get('current_location_name', vehicle.current_location_name)
+        current_status = live_state.get('current_status', vehicle.current_status)
+        battery_level = live_state.get('battery_level', vehicle.battery_level)
+        current_city = live_state.get('current_city', vehicle.current_city)
+        
         # 获取车辆当前位置坐标
-        if vehicle.current_location_x is None or vehicle.current_location_y is None:
+        if location_x is None or location_y is None:
             return jsonify({'code': 404, 'message': '车辆位置信息不可用'}), 404
         
         # 将系统坐标转换为经纬度
         try:
             geo_coords = system_to_geo_coordinates(
-                vehicle.current_location_x,
-                vehicle.current_location_y,
-                vehicle.current_city or active_order.city_code
+                location_x,
+                location_y,
+                current_city or active_order.city_code
             )
         except Exception as e:
             return jsonify({'code': 500, 'message': f'坐标转换失败: {str(e)}'}), 500
@@ -3035,15 +3244,15 @@ def get_vehicle_location(vehicle_id):
         location_data = {
             'vehicleId': vehicle.vehicle_id,
             'plateNumber': vehicle.plate_number,
-            'currentStatus': vehicle.current_status,
-            'batteryLevel': vehicle.battery_level,
+            'currentStatus': current_status,
+            'batteryLevel': battery_level,
             'location': {
                 'longitude': geo_coords['longitude'],
                 'latitude': geo_coords['latitude'],
-                'systemX': vehicle.current_location_x,
-                'systemY': vehicle.current_location_y,
-                'locationName': vehicle.current_location_name,
-                'city': vehicle.current_city
+                'systemX': location_x,
+                'systemY': location_y,
+                'locationName': location_name,
+                'city': current_city
             },
             'orderInfo': {
                 'orderId': active_order.order_id,
@@ -3182,14 +3391,14 @@ except Exception as e:
 def get_city_centers():
     """获取城市中心点坐标配置"""
     try:
-        # 从数据库获取城市中心点参数
-        centers_param = SystemParameter.query.filter_by(param_key='city_centers').first()
-        if not centers_param:
+        # 从系统参数缓存获取城市中心点参数
+        centers_value = system_parameter_cache.get_raw('city_centers')
+        if not centers_value:
             return jsonify({'code': 404, 'message': '城市中心点配置不存在'}), 404
         
         # 解析JSON数据
         try:
-            city_centers = json.loads(centers_param.param_value)
+            city_centers = json.loads(centers_value)
         except json.JSONDecodeError as e:
             return jsonify({'code': 500, 'message': f'城市中心点配置解析失败: {str(e)}'}), 500
         
@@ -3208,14 +3417,14 @@ def get_city_centers():
 def get_city_scale_factors():
     """获取城市缩放因子配置"""
     try:
-        # 从数据库获取城市缩放因子参数
-        scale_param = SystemParameter.query.filter_by(param_key='city_scale_factors').first()
-        if not scale_param:
+        # 从系统参数缓存获取城市缩放因子参数
+        scale_value = system_parameter_cache.get_raw('city_scale_factors')
+        if not scale_value:
             return jsonify({'code': 404, 'message': '城市缩放因子配置不存在'}), 404
         
         # 解析JSON数据
         try:
-            city_scale_factors = json.loads(scale_param.param_value)
+            city_scale_factors = json.loads(scale_value)
         except json.JSONDecodeError as e:
             return jsonify({'code': 500, 'message': f'城市缩放因子配置解析失败: {str(e)}'}), 500
         
@@ -3263,10 +3472,10 @@ def update_vehicle_rating(vehicle_id):
 def get_city_order_price_factor(city_code):
     """获取城市订单价格系数"""
     try:
-        # 获取城市价格系数配置
-        city_factors_param = SystemParameter.query.filter_by(param_key='CITY_PRICE_FACTORS').first()
+        # 获取城市价格系数配置（读取系统参数缓存）
+        city_factors_value = system_parameter_cache.get_raw('CITY_PRICE_FACTORS')
         
-        if not city_factors_param:
+        if city_factors_value is None:
             # 如果没有配置，创建默认配置并保存到数据库
             default_factors = {
                 '沈阳市': {'orderPrice': 1.0},
@@ -3289,10 +3498,11 @@ def get_city_order_price_factor(city_code):
             )
             db.session.add(new_param)
             db.session.commit()
+            system_parameter_cache.invalidate()
         
             return default_factors.get(city_code, {}).get('orderPrice', 1.0)
         else:
-            city_factors = json.loads(city_factors_param.param_value)
+            city_factors = json.loads(city_factors_value)
             return city_factors.get(city_code, {}).get('orderPrice', 1.0)
         
     except Exception as e:
@@ -3304,12 +3514,10 @@ def get_city_order_price_factor(city_code):
 def get_vehicle_price_coefficient_range():
     """获取车辆价格系数的最小值和最大值，用于计算订单价格区间"""
     try:
-        # 查询所有车型的订单价格系数
-        vehicle_price_params = SystemParameter.query.filter(
-            SystemParameter.param_key.like('%_ORDER_PRICE')
-        ).all()
+        # 所有车型的订单价格系数（参数缓存加载时已预先解析）
+        vehicle_models = system_parameter_cache.get_price_coefficients()
         
-        if not vehicle_price_params:
+        if not vehicle_models:
             # 如果没有配置，返回默认值
             return jsonify({
                 'code': 0,
@@ -3321,33 +3529,7 @@ def get_vehicle_price_coefficient_range():
                 }
             })
         
-        # 提取所有价格系数
-        coefficients = []
-        vehicle_models = {}
-        
-        for param in vehicle_price_params:
-            try:
-                coefficient = float(param.param_value)
-                coefficients.append(coefficient)
-                
-                # 提取车型名称（移除_ORDER_PRICE后缀）
-                model_name = param.param_key.replace('_ORDER_PRICE', '')
-                vehicle_models[model_name] = coefficient
-            except ValueError:
-                continue
-        
-        if not coefficients:
-            # 如果没有有效的系数，返回默认值
-            return jsonify({
-                'code': 0,
-                'message': '获取成功',
-                'data': {
-                    'min_coefficient': 1.0,
-                    'max_coefficient': 1.0,
-                    'vehicle_models': {}
-                }
-            })
-        
+        coefficients = list(vehicle_models.values())
         min_coefficient = min(coefficients)
         max_coefficient = max(coefficients)
         
@@ -3396,15 +3578,17 @@ def get_order_price_estimate():
         except ValueError as e:
             return jsonify({'code': 1, 'message': str(e)}), 400
         
-        # 计算系统坐标距离（欧氏距离）
-        dx = dropoff_coords['x'] - pickup_coords['x']
-        dy = dropoff_coords['y'] - pickup_coords['y']
-        distance_in_units = ((dx ** 2 + dy ** 2) ** 0.5)  # 系统距离单位
+        # 计算系统坐标距离（优先使用管理平台的避障行驶距离，失败时使用欧氏距离）
+        distance_in_units = fetch_travel_distance(city_code, pickup_coords, dropoff_coords)
+        if distance_in_units is None:
+            dx = dropoff_coords['x'] - pickup_coords['x']
+            dy = dropoff_coords['y'] - pickup_coords['y']
+            distance_in_units = ((dx ** 2 + dy ** 2) ** 0.5)  # 系统距离单位
         
         # 从系统参数表获取城市距离转换比例
-        city_distance_param = SystemParameter.query.filter_by(param_key=city_code).first()
-        if city_distance_param:
-            city_ratio = float(city_distance_param.param_value)
+        city_distance_value = system_parameter_cache.get_raw(city_code)
+        if city_distance_value is not None:
+            city_ratio = float(city_distance_value)
         else:
             # 如果找不到对应城市的比例，使用默认值
             city_ratio = 0.1
@@ -3415,18 +3599,14 @@ def get_order_price_estimate():
         distance = round(distance, 2)  # 保留两位小数
         
         # 获取订单价格参数
-        base_price_param = SystemParameter.query.filter_by(param_key='ORDER_BASE_PRICE').first()
-        price_per_km_param = SystemParameter.query.filter_by(param_key='ORDER_PRICE_PER_KM').first()
-        base_km_param = SystemParameter.query.filter_by(param_key='ORDER_BASE_KM').first()
-        
-        ORDER_BASE_PRICE = float(base_price_param.param_value) if base_price_param else 10.0
-        ORDER_PRICE_PER_KM = float(price_per_km_param.param_value) if price_per_km_param else 2.5
-        ORDER_BASE_KM = float(base_km_param.param_value) if base_km_param else 3.5
+        ORDER_BASE_PRICE = float(system_parameter_cache.get_raw('ORDER_BASE_PRICE', 10.0))
+        ORDER_PRICE_PER_KM = float(system_parameter_cache.get_raw('ORDER_PRICE_PER_KM', 2.5))
+        ORDER_BASE_KM = float(system_parameter_cache.get_raw('ORDER_BASE_KM', 3.5))
         
         # 获取城市价格系数
-        city_price_factors_param = SystemParameter.query.filter_by(param_key='CITY_PRICE_FACTORS').first()
-        if city_price_factors_param:
-            city_price_factors = json.loads(city_price_factors_param.param_value)
+        city_price_factors_value = system_parameter_cache.get_raw('CITY_PRICE_FACTORS')
+        if city_price_factors_value:
+            city_price_factors = json.loads(city_price_factors_value)
             city_factor_data = city_price_factors.get(city_code, {})
             city_price_factor = city_factor_data.get('orderPrice', 1.0)
         else:
@@ -26,6 +26,12 @@ from app.admin.map_obstacles import map_obstacles_bp
 from datetime import datetime
 from app.admin.coupons import coupons_bp
 from app.admin.language import language_bp
+from app.admin.jobs import jobs_bp
+from app.utils.dispatcher import get_dispatcher
+from app.utils.jobs import get_job_manager
+from app.utils.travel_time import get_travel_time_tables
+from app.utils.dashboard_snapshots import get_dashboard_snapshots
+from app.utils.fleet_stream import register_fleet_stream_handlers
 
 # 创建SocketIO对象，供所有模块使用
 socketio = SocketIO()
@@ -83,6 +89,9 @@ def create_app():
     
     # 初始化Socket.IO
     socketio.init_app(app, cors_allowed_origins="*", async_mode='threading')
+
+    # 地图页面的车队位置推送通道
+    register_fleet_stream_handlers(socketio)
     
     # 添加根路由重定向到dashboard
     @app.route('/')
@@ -96,6 +105,21 @@ def create_app():
         zero_battery_checker_thread.daemon = True
         zero_battery_checker_thread.start()
 
+    # 后台任务在本应用的上下文中执行
+    get_job_manager().init_app(app)
+
+    # 启动连续订单调度器（多进程或命令行场景可通过 DISPATCHER_AUTOSTART 关闭）
+    if app.config.get('DISPATCHER_AUTOSTART', True):
+        get_dispatcher()
+    else:
+        print("已关闭连续订单调度器自动启动")
+
+    # 后台加载（或生成）各城市的行驶距离表
+    get_travel_time_tables().warm_up()
+
+    # 启动仪表盘快照的后台刷新
+    get_dashboard_snapshots()
+
     # 调用初始化函数    
     init_app()
     
@@ -248,7 +272,20 @@ def init_app():
             # 初始化车辆参数
             from app.config.vehicle_params import init_params
             init_params()
-                
+
+            # 创建财务/订单事实表，首次创建时在后台从明细表回填
+            from app.utils.rollups import ensure_rollup_tables, rebuild_job
+            created_tables = ensure_rollup_tables()
+            if created_tables:
+                print(f"已创建事实表 {', '.join(created_tables)}，正在后台回填历史数据...")
+                get_job_manager().submit('rollup_rebuild', rebuild_job, description='回填财务/订单事实表')
+
+            # 创建车辆状态变更事件表，并预建分区
+            from app.utils.vehicle_events import ensure_vehicle_event_table, maintain_partitions
+            if ensure_vehicle_event_table():
+                print("已创建车辆状态变更事件表")
+            maintain_partitions()
+
         except Exception as e:
             app.logger.error(f"数据库初始化错误: {str(e)}")
 
@@ -278,6 +315,7 @@ def init_app():
     app.register_blueprint(financial_health_bp)
     app.register_blueprint(coupons_bp)
     app.register_blueprint(language_bp)
+    app.register_blueprint(jobs_bp)
     
     # 初始化数据
     init_test_data_if_needed()
@@ -2,20 +2,36 @@ from flask import Blueprint, render_template, jsonify, request
 from app.dao.order_dao import OrderDAO
 from app.dao.vehicle_dao import VehicleDAO
 from app.dao.base_dao import BaseDAO
+from app.utils.fleet_state import get_fleet_state
+from app.utils.routing import get_routing_engine
+from app.utils.travel_time import get_travel_time_tables
+from app.utils.spatial_index import GridIndex
+from app.utils.vehicle_profiles import get_vehicle_profiles
 import traceback
 import math
+import numpy as np
 from datetime import datetime
 from app.config import vehicle_params as vp
 
 # 尝试导入scipy进行匈牙利算法计算
 try:
     from scipy.optimize import linear_sum_assignment
-    import numpy as np
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import min_weight_full_bipartite_matching
     SCIPY_AVAILABLE = True
 except ImportError:
     SCIPY_AVAILABLE = False
     print("警告：未安装scipy，将使用贪心算法进行订单分配")
 
+# 车辆数×订单数不超过该值时使用稠密成本矩阵求解
+DENSE_ASSIGNMENT_MAX_CELLS = 250000
+# 稀疏模式下每个订单考虑的最近车辆数
+CANDIDATE_VEHICLES_PER_ORDER = 12
+# 稀疏模式下候选车辆的最大接驾ETA（与成本矩阵同单位：距离 / 速度系数）
+MAX_PICKUP_ETA = 400
+# 订单无候选车辆时虚拟边的成本，保证稀疏二分图总存在完美匹配
+UNASSIGNED_PENALTY = 1e9
+
 # 创建蓝图
 algorithm_bp = Blueprint('algorithm', __name__, url_prefix='/algorithm')
 
@@ -264,110 +280,73 @@ class OrderAssignmentAlgorithm:
         failed = []
         
         try:
-            # 获取所有空闲车辆
-            idle_vehicles_query = """
-            SELECT v.vehicle_id, v.plate_number, v.model, v.current_location_x, v.current_location_y, 
-                   v.battery_level, v.operating_city
-            FROM vehicles v
-            WHERE v.operating_city = %s AND v.current_status = '空闲中'
-            """
-            idle_vehicles = BaseDAO.execute_query(idle_vehicles_query, (city,))
+            # 从内存车队状态获取所有空闲车辆
+            idle_vehicles = get_fleet_state().find(city=city, status='空闲中')
             
             if not idle_vehicles:
                 for order in orders:
                     failed.append({"order_id": order['order_id'], "reason": "城市中没有空闲车辆"})
                 return {"successful": successful, "failed": failed}
             
-            # 设置车辆速度参数
+            # 设置车辆速度系数（与仿真引擎一致，按车型读取）
+            model_speeds = {}
             for vehicle in idle_vehicles:
                 model = vehicle.get('model')
-                if model:
-                    try:
-                        speed_var_name = f"{model.replace('-', '_')}_SPEED"
-                        vehicle['max_speed'] = getattr(vp, speed_var_name, 60)
-                    except:
-                        vehicle['max_speed'] = 60
-                else:
-                    vehicle['max_speed'] = 60
+                if model not in model_speeds:
+                    model_speeds[model] = OrderAssignmentAlgorithm._speed_coefficient(model)
+                vehicle['speed_factor'] = model_speeds[model]
             
             print(f"批量优化: {len(orders)}个订单 vs {len(idle_vehicles)}辆车辆")
             
-            # 构建成本矩阵
-            cost_matrix = []
-            for vehicle in idle_vehicles:
-                veh_x, veh_y = float(vehicle['current_location_x']), float(vehicle['current_location_y'])
-                speed_factor = vehicle['max_speed'] / 60
-                
-                vehicle_costs = []
-                for order in orders:
-                    order_x = float(order['pickup_location_x'])
-                    order_y = float(order['pickup_location_y'])
-                    distance = math.sqrt((veh_x - order_x)**2 + (veh_y - order_y)**2)
-                    eta = distance / speed_factor if speed_factor > 0 else float('inf')
-                    vehicle_costs.append(eta)
-                cost_matrix.append(vehicle_costs)
+            vehicle_xy = np.array([[float(v['current_location_x'] or 0), float(v['current_location_y'] or 0)]
+                                   for v in idle_vehicles])
+            speed_factors = np.array([v['speed_factor'] for v in idle_vehicles], dtype=float)
+            order_xy = np.array([[float(o['pickup_location_x']), float(o['pickup_location_y'])] for o in orders])
+            # 城市行驶距离表（避障），尚未生成或城市没有障碍物时使用直线距离
+            travel_table = get_travel_time_tables().get_table(city)
             
             # 使用匈牙利算法或贪心算法进行分配
-            assignments = []
-            if SCIPY_AVAILABLE and len(orders) > 1:
-                try:
-                    print("使用匈牙利算法进行批量全局优化")
-                    cost_array = np.array(cost_matrix)
-                    
-                    # 处理矩阵尺寸不匹配
-                    if len(idle_vehicles) != len(orders):
-                        if len(idle_vehicles) > len(orders):
-                            diff = len(idle_vehicles) - len(orders)
-                            virtual_costs = np.full((len(idle_vehicles), diff), 0)
-                            cost_array = np.hstack([cost_array, virtual_costs])
-                        else:
-                            diff = len(orders) - len(idle_vehicles)
-                            virtual_costs = np.full((diff, len(orders)), 1000)
-                            cost_array = np.vstack([cost_array, virtual_costs])
-                    
-                    row_indices, col_indices = linear_sum_assignment(cost_array)
-                    
-                    for row_idx, col_idx in zip(row_indices, col_indices):
-                        if row_idx < len(idle_vehicles) and col_idx < len(orders):
-                            assignments.append((row_idx, col_idx))
-                            
-                except Exception as e:
-                    print(f"匈牙利算法失败: {str(e)}, 使用贪心算法")
-                    assignments = OrderAssignmentAlgorithm._greedy_assign(cost_matrix, len(orders), len(idle_vehicles))
-            else:
-                print("使用贪心算法进行批量分配")
-                assignments = OrderAssignmentAlgorithm._greedy_assign(cost_matrix, len(orders), len(idle_vehicles))
+            assignments = OrderAssignmentAlgorithm._match_vehicles(vehicle_xy, speed_factors, order_xy, travel_table)
             
-            # 执行分配
-            for vehicle_idx, order_idx in assignments:
-                try:
-                    order = orders[order_idx]
-                    vehicle = idle_vehicles[vehicle_idx]
-                    
-                    # 分配车辆到订单
-                    if OrderDAO.assign_vehicle(order['order_id'], vehicle['vehicle_id']):
-                        if VehicleDAO.update_vehicle_status(vehicle['vehicle_id'], "运行中"):
-                            successful.append({
-                                "order_id": order['order_id'],
-                                "vehicle_id": vehicle['vehicle_id'],
-                                "plate_number": vehicle.get('plate_number', '未知'),
-                                "distance": f"{cost_matrix[vehicle_idx][order_idx]:.2f} 单位",
-                                "rating_score": 100 / (cost_matrix[vehicle_idx][order_idx] + 1)
-                            })
-                        else:
-                            OrderDAO.update_order_status(order['order_id'], "待分配")  # 回滚
-                            failed.append({"order_id": order['order_id'], "reason": "车辆状态更新失败"})
-                    else:
-                        failed.append({"order_id": order['order_id'], "reason": "订单更新失败"})
-                        
-                except Exception as e:
-                    failed.append({"order_id": orders[order_idx]['order_id'], "reason": f"分配异常: {str(e)}"})
+            # 在一个事务中批量提交分配结果
+            cost_by_order = {}
+            pairs = []
+            for vehicle_idx, order_idx, cost in assignments:
+                order = orders[order_idx]
+                vehicle = idle_vehicles[vehicle_idx]
+                cost_by_order[order['order_id']] = (vehicle, cost)
+                pairs.append((order['order_id'], vehicle['vehicle_id']))
+            
+            commit_result = OrderDAO.bulk_assign_vehicles(pairs)
+            orders_by_id = {order['order_id']: order for order in orders}
+            routes = OrderAssignmentAlgorithm._route_assignments(
+                city, [(orders_by_id[order_id], cost_by_order[order_id][0])
+                       for order_id, _ in commit_result['assigned']]
+            )
+            for order_id, vehicle_id in commit_result['assigned']:
+                vehicle, cost = cost_by_order[order_id]
+                assignment = {
+                    "order_id": order_id,
+                    "vehicle_id": vehicle_id,
+                    "plate_number": vehicle.get('plate_number', '未知'),
+                    "distance": f"{cost:.2f} 单位",
+                    "rating_score": 100 / (cost + 1)
+                }
+                if order_id in routes:
+                    pickup_distance, trip_distance = routes[order_id]
+                    speed_factor = vehicle['speed_factor']
+                    assignment["route_distance"] = round(pickup_distance, 2)
+                    assignment["trip_distance"] = round(trip_distance, 2)
+                    assignment["pickup_eta"] = round(pickup_distance / speed_factor, 2) if speed_factor > 0 else None
+                successful.append(assignment)
+            for conflict in commit_result['conflicts']:
+                failed.append({"order_id": conflict['order_id'], "reason": conflict['reason']})
             
             # 处理未分配的订单
             assigned_orders = {assignment[1] for assignment in assignments}
             for i, order in enumerate(orders):
                 if i not in assigned_orders:
-                    failed.append({"order_id": order['order_id'], "reason": "车辆资源不足"})
+                    failed.append({"order_id": order['order_id'], "reason": "车辆资源不足或附近没有可用车辆"})
             
         except Exception as e:
             for order in orders:
@@ -376,37 +355,253 @@ class OrderAssignmentAlgorithm:
         return {"successful": successful, "failed": failed}
     
     @staticmethod
-    def _greedy_assign(cost_matrix, num_orders, num_vehicles):
-        """贪心算法分配"""
+    def _match_vehicles(vehicle_xy, speed_factors, order_xy, travel_table=None, verbose=True):
+        """车辆与订单的全局匹配（不访问数据库），批量分配和离散事件仿真共用
+        
+        车辆×订单规模较小时用稠密成本矩阵求解（匈牙利算法，scipy 不可用时贪心），
+        否则在最近邻候选边构成的稀疏二分图上求解。
+        
+        Returns:
+            list: (车辆下标, 订单下标, 接驾ETA) 列表
+        """
+        log = print if verbose else (lambda *args: None)
+        num_vehicles, num_orders = len(vehicle_xy), len(order_xy)
+        assignments = []
+        if num_vehicles * num_orders <= DENSE_ASSIGNMENT_MAX_CELLS:
+            cost_matrix = OrderAssignmentAlgorithm._build_cost_matrix(
+                vehicle_xy, speed_factors, order_xy, travel_table
+            )
+            if SCIPY_AVAILABLE and num_orders > 1:
+                try:
+                    log("使用匈牙利算法进行批量全局优化")
+                    row_indices, col_indices = linear_sum_assignment(cost_matrix)
+                    assignments = [(row_idx, col_idx, cost_matrix[row_idx, col_idx])
+                                   for row_idx, col_idx in zip(row_indices, col_indices)
+                                   if np.isfinite(cost_matrix[row_idx, col_idx])]
+                except Exception as e:
+                    log(f"匈牙利算法失败: {str(e)}, 使用贪心算法")
+                    assignments = OrderAssignmentAlgorithm._greedy_assign_with_costs(cost_matrix, num_orders, num_vehicles)
+            else:
+                log("使用贪心算法进行批量分配")
+                assignments = OrderAssignmentAlgorithm._greedy_assign_with_costs(cost_matrix, num_orders, num_vehicles)
+        else:
+            edges = OrderAssignmentAlgorithm._candidate_edges(
+                vehicle_xy, speed_factors, order_xy, travel_table=travel_table
+            )
+            if SCIPY_AVAILABLE:
+                try:
+                    log(f"使用稀疏候选集匹配（每单最近{CANDIDATE_VEHICLES_PER_ORDER}辆车，ETA上限{MAX_PICKUP_ETA}）")
+                    assignments = OrderAssignmentAlgorithm._sparse_assign(
+                        num_vehicles, num_orders, edges
+                    )
+                except Exception as e:
+                    log(f"稀疏匹配失败: {str(e)}, 使用贪心算法")
+                    assignments = OrderAssignmentAlgorithm._greedy_assign_with_costs(
+                        None, num_orders, num_vehicles, edges=edges
+                    )
+            else:
+                log("使用候选集贪心算法进行批量分配")
+                assignments = OrderAssignmentAlgorithm._greedy_assign_with_costs(
+                    None, num_orders, num_vehicles, edges=edges
+                )
+        return assignments
+    
+    @staticmethod
+    def _route_assignments(city, assigned):
+        """为一批分配结果规划接驾和送客路线（进程池并行），同时预热车辆开始行程时使用的路线缓存
+
+        Args:
+            assigned: (订单, 车辆) 列表
+
+        Returns:
+            dict: 订单ID -> (接驾路线距离, 送客路线距离)，规划失败时为空
+        """
+        if not assigned:
+            return {}
+        try:
+            pairs = []
+            for order, vehicle in assigned:
+                pairs.append((float(vehicle['current_location_x'] or 0), float(vehicle['current_location_y'] or 0),
+                              float(order['pickup_location_x']), float(order['pickup_location_y'])))
+                if order.get('dropoff_location_x') is not None and order.get('dropoff_location_y') is not None:
+                    pairs.append((float(order['pickup_location_x']), float(order['pickup_location_y']),
+                                  float(order['dropoff_location_x']), float(order['dropoff_location_y'])))
+                else:
+                    pairs.append(None)
+            routed = get_routing_engine().route_many(city, [pair for pair in pairs if pair is not None])
+            routed_iter = iter(routed)
+            routes = {}
+            for index, (order, _) in enumerate(assigned):
+                pickup_route = next(routed_iter)
+                trip_route = next(routed_iter) if pairs[index * 2 + 1] is not None else None
+                routes[order['order_id']] = (pickup_route['distance'], trip_route['distance'] if trip_route else 0.0)
+            return routes
+        except Exception as e:
+            print(f"批量规划分配路线失败: {str(e)}")
+            traceback.print_exc()
+            return {}
+
+    @staticmethod
+    def _speed_coefficient(model):
+        """车型速度系数（与仿真引擎使用相同的车型档案），未配置时依次使用默认系数和1"""
+        try:
+            profiles = get_vehicle_profiles()
+            value = profiles.for_model(model).speed
+            if value is None:
+                value = profiles.for_model(None).speed
+            return float(value) if value is not None else 1.0
+        except Exception:
+            return 1.0
+
+    @staticmethod
+    def _model_max_speed(model):
+        """车型速度配置（最近车辆查询使用），未配置或读取失败时为60"""
+        try:
+            value = get_vehicle_profiles().for_model(model).speed
+        except Exception as e:
+            print(f"获取车型 {model} 速度出错: {str(e)}，使用默认速度60km/h")
+            return 60
+        if value is None:
+            print(f"未找到车型 {model} 的速度配置，使用默认速度60km/h")
+            return 60
+        return value
+
+    @staticmethod
+    def _build_cost_matrix(vehicle_xy, speed_factors, order_xy, travel_table=None):
+        """用广播一次性计算 车辆×订单 的接驾ETA矩阵，速度系数为0或不可达的车辆成本为无穷大
+
+        travel_table 为城市行驶距离表时按避障行驶距离计算，否则按直线距离计算。
+        """
+        if travel_table is not None:
+            distances = travel_table.distance_matrix(vehicle_xy, order_xy)
+        else:
+            distances = np.hypot(
+                vehicle_xy[:, 0, None] - order_xy[None, :, 0],
+                vehicle_xy[:, 1, None] - order_xy[None, :, 1]
+            )
+        with np.errstate(divide='ignore'):
+            return np.where(speed_factors[:, None] > 0, distances / speed_factors[:, None], np.inf)
+    
+    @staticmethod
+    def _candidate_edges(vehicle_xy, speed_factors, order_xy,
+                         k=CANDIDATE_VEHICLES_PER_ORDER, max_eta=MAX_PICKUP_ETA, travel_table=None):
+        """用空间网格为每个订单找出ETA半径内最近的 k 辆车
+        
+        直线距离是行驶距离的下界，先按直线距离取候选，再用 travel_table（如有）查表得到行驶距离。
+        
+        Returns:
+            tuple: (车辆下标数组, 订单下标数组, ETA数组)
+        """
+        grid = GridIndex()
+        for vehicle_idx, (x, y) in enumerate(vehicle_xy):
+            if speed_factors[vehicle_idx] > 0:
+                grid.upsert(vehicle_idx, 0, x, y)
+        max_distance = max_eta * float(speed_factors.max()) if len(speed_factors) else 0
+        
+        vehicle_indices = []
+        order_indices = []
+        for order_idx, (x, y) in enumerate(order_xy):
+            for _, vehicle_idx in grid.nearest([0], x, y, k=k, max_distance=max_distance):
+                vehicle_indices.append(vehicle_idx)
+                order_indices.append(order_idx)
+        
+        vehicle_indices = np.array(vehicle_indices, dtype=int)
+        order_indices = np.array(order_indices, dtype=int)
+        if travel_table is not None:
+            distances = travel_table.pair_distances(vehicle_xy[vehicle_indices], order_xy[order_indices])
+        else:
+            distances = np.hypot(
+                vehicle_xy[vehicle_indices, 0] - order_xy[order_indices, 0],
+                vehicle_xy[vehicle_indices, 1] - order_xy[order_indices, 1]
+            )
+        etas = distances / speed_factors[vehicle_indices] if len(vehicle_indices) else np.zeros(0)
+        keep = etas <= max_eta
+        return vehicle_indices[keep], order_indices[keep], etas[keep]
+    
+    @staticmethod
+    def _sparse_assign(num_vehicles, num_orders, edges):
+        """在候选边构成的稀疏二分图上求最小权匹配
+        
+        每个订单额外连一条成本为 UNASSIGNED_PENALTY 的虚拟边（对应“不分配”），
+        保证订单一侧总能完全匹配；所有边统一加1，避免0成本边在稀疏矩阵中被视为不存在。
+        
+        Args:
+            num_vehicles: 车辆数量
+            num_orders: 订单数量
+            edges: 候选边 (车辆下标数组, 订单下标数组, ETA数组)
+        
+        Returns:
+            list: (车辆下标, 订单下标, ETA) 列表
+        """
+        vehicle_indices, order_indices, etas = edges
+        
+        dummy_orders = np.arange(num_orders)
+        rows = np.concatenate([order_indices, dummy_orders])
+        cols = np.concatenate([vehicle_indices, num_vehicles + dummy_orders])
+        weights = np.concatenate([etas, np.full(num_orders, UNASSIGNED_PENALTY)]) + 1.0
+        graph = csr_matrix((weights, (rows, cols)), shape=(num_orders, num_vehicles + num_orders))
+        
+        matched_rows, matched_columns = min_weight_full_bipartite_matching(graph)
+        
+        eta_by_edge = dict(zip(zip(vehicle_indices.tolist(), order_indices.tolist()), etas.tolist()))
+        assignments = []
+        for order_idx, column in zip(matched_rows.tolist(), matched_columns.tolist()):
+            if column < num_vehicles:
+                assignments.append((column, order_idx, eta_by_edge[(column, order_idx)]))
+        return assignments
+    
+    @staticmethod
+    def _greedy_assign_with_costs(cost_matrix, num_orders, num_vehicles, edges=None):
+        """贪心分配，并附带每对分配的成本
+        
+        Args:
+            cost_matrix: 车辆×订单成本矩阵，提供 edges 时可为None
+            num_orders: 订单数量
+            num_vehicles: 车辆数量
+            edges: 可选的稀疏候选边 (车辆下标数组, 订单下标数组, 成本数组)，
+                   通常来自 _candidate_edges 的最近邻预筛选
+        
+        Returns:
+            list: (车辆下标, 订单下标, 成本) 列表
+        """
+        if edges is None:
+            costs = np.asarray(cost_matrix, dtype=float).reshape(num_vehicles, num_orders)
+            vehicle_indices, order_indices = np.nonzero(np.isfinite(costs))
+            edge_costs = costs[vehicle_indices, order_indices]
+        else:
+            vehicle_indices, order_indices, edge_costs = (np.asarray(column) for column in edges)
+        
+        # 所有候选边只排序一次：成本升序，成本相同时车辆、订单下标小者优先
+        ordering = np.lexsort((order_indices, vehicle_indices, edge_costs))
+        
         assignments = []
         used_vehicles = set()
         used_orders = set()
-        
         max_assignments = min(num_orders, num_vehicles)
         
-        for _ in range(max_assignments):
-            best_cost = float('inf')
-            best_assignment = None
-            
-            for v_idx in range(num_vehicles):
-                if v_idx in used_vehicles:
-                    continue
-                for o_idx in range(num_orders):
-                    if o_idx in used_orders:
-                        continue
-                    if cost_matrix[v_idx][o_idx] < best_cost:
-                        best_cost = cost_matrix[v_idx][o_idx]
-                        best_assignment = (v_idx, o_idx)
-            
-            if best_assignment:
-                assignments.append(best_assignment)
-                used_vehicles.add(best_assignment[0])
-                used_orders.add(best_assignment[1])
-            else:
+        for edge in ordering.tolist():
+            vehicle_idx = int(vehicle_indices[edge])
+            order_idx = int(order_indices[edge])
+            if vehicle_idx in used_vehicles or order_idx in used_orders:
+                continue
+            assignments.append((vehicle_idx, order_idx, float(edge_costs[edge])))
+            used_vehicles.add(vehicle_idx)
+            used_orders.add(order_idx)
+            if len(assignments) >= max_assignments:
                 break
-                
+        
         return assignments
     
+    @staticmethod
+    def _greedy_assign(cost_matrix, num_orders, num_vehicles, edges=None):
+        """贪心算法分配，返回 (车辆下标, 订单下标) 列表"""
+        return [
+            (vehicle_idx, order_idx)
+            for vehicle_idx, order_idx, _ in OrderAssignmentAlgorithm._greedy_assign_with_costs(
+                cost_matrix, num_orders, num_vehicles, edges
+            )
+        ]
+    
     @staticmethod
     def find_nearest_vehicle(city, pickup_x, pickup_y):
         """查找距离上车点最近的车辆"""
@@ -508,47 +703,11 @@ class OrderAssignmentAlgorithm:
                             current_order_index = i
                             break
                     
-                    # 为每辆车设置最大速度(从vehicle_params.py中获取)
+                    # 为每辆车设置最大速度(从车型档案中获取)
                     for vehicle in idle_vehicles:
                         model = vehicle.get('model')
                         if model:
-                            # 根据车型获取对应的速度
-                            try:
-                                # 使用动态属性访问
-                                speed_var_name = f"{model.replace('-', '_')}_SPEED"
-                                vehicle['max_speed'] = getattr(vp, speed_var_name, None)
-                                
-                                # 如果找不到对应的速度变量，尝试转换格式
-                                if vehicle['max_speed'] is None:
-                                    alt_var_name = f"{model.split('-')[0]}_{model.split('-')[1]}_SPEED"
-                                    vehicle['max_speed'] = getattr(vp, alt_var_name, None)
-                                    
-                                # 最后的兜底方案
-                                if vehicle['max_speed'] is None:
-                                    # 尝试从常量对照表中找
-                                    model_map = {
-                                        "Alpha-X1": "Alpha_X1_SPEED",
-                                        "Alpha-Nexus": "Alpha_Nexus_SPEED",
-                                        "Nova-S1": "Nova_S1_SPEED",
-                                        "Nova-Quantum": "Nova_Quantum_SPEED",
-                                        "Nova-Pulse": "Nova_Pulse_SPEED",
-                                        "Neon-500": "Neon_500_SPEED",
-                                        "Neon-Zero": "Neon_Zero_SPEED"
-                                    }
-                                    if model in model_map:
-                                        vehicle['max_speed'] = getattr(vp, model_map[model], 60)
-                                    else:
-                                        # 依然没找到，使用默认速度60
-                                        vehicle['max_speed'] = 60
-                                
-                                if vehicle['max_speed'] is None:
-                                    vehicle['max_speed'] = 60
-                                    print(f"未找到车型 {model} 的速度配置，使用默认速度60km/h")
-                                
-                            except (AttributeError, Exception) as e:
-                                # 出错使用默认值
-                                vehicle['max_speed'] = 60
-                                print(f"获取车型 {model} 速度出错: {str(e)}，使用默认速度60km/h")
+                            vehicle['max_speed'] = OrderAssignmentAlgorithm._model_max_speed(model)
                         else:
                             # 无车型信息使用默认值
                             vehicle['max_speed'] = 60
@@ -787,45 +946,9 @@ class OrderAssignmentAlgorithm:
                 
                 # 计算ETA
                 if 'model' in vehicle:
-                    # 从vehicle_params.py获取车辆速度
-                    model = vehicle.get('model')
-                    try:
-                        # 使用动态属性访问
-                        speed_var_name = f"{model.replace('-', '_')}_SPEED"
-                        max_speed = getattr(vp, speed_var_name, None)
-                        
-                        # 如果找不到对应的速度变量，尝试转换格式
-                        if max_speed is None:
-                            alt_var_name = f"{model.split('-')[0]}_{model.split('-')[1]}_SPEED"
-                            max_speed = getattr(vp, alt_var_name, None)
-                            
-                        # 最后的兜底方案
-                        if max_speed is None:
-                            # 尝试从常量对照表中找
-                            model_map = {
-                                "Alpha-X1": "Alpha_X1_SPEED",
-                                "Alpha-Nexus": "Alpha_Nexus_SPEED",
-                                "Nova-S1": "Nova_S1_SPEED",
-                                "Nova-Quantum": "Nova_Quantum_SPEED",
-                                "Nova-Pulse": "Nova_Pulse_SPEED",
-                                "Neon-500": "Neon_500_SPEED",
-                                "Neon-Zero": "Neon_Zero_SPEED"
-                            }
-                            if model in model_map:
-                                max_speed = getattr(vp, model_map[model], 60)
-                            else:
-                                # 依然没找到，使用默认速度60
-                                max_speed = 60
-                        
-                        if max_speed is None:
-                            max_speed = 60
-                            print(f"未找到车型 {model} 的速度配置，使用默认速度60km/h")
-                        
-                    except (AttributeError, Exception) as e:
-                        # 出错使用默认值
-                        max_speed = 60
-                        print(f"获取车型 {model} 速度出错: {str(e)}，使用默认速度60km/h")
-                        
+                    # 从车型档案获取车辆速度
+                    max_speed = OrderAssignmentAlgorithm._model_max_speed(vehicle.get('model'))
+                    
                     # 计算ETA
                     speed_factor = max_speed / 60  # 转换为km/min
                     eta = vehicle['distance'] / speed_factor
@@ -1060,9 +1183,16 @@ def algorithm_status():
                         "optimality": "全局最优",
                         "available": SCIPY_AVAILABLE
                     },
+                    "sparse_matching": {
+                        "name": "稀疏候选集最小权匹配",
+                        "complexity": f"每单最多{CANDIDATE_VEHICLES_PER_ORDER}条候选边",
+                        "optimality": "候选集内全局最优",
+                        "available": SCIPY_AVAILABLE,
+                        "dense_max_cells": DENSE_ASSIGNMENT_MAX_CELLS
+                    },
                     "greedy_algorithm": {
                         "name": "贪心算法",
-                        "complexity": "O(n²)",
+                        "complexity": "O(E log E)",
                         "optimality": "局部最优",
                         "available": True
                     }
@@ -1074,4 +1204,98 @@ def algorithm_status():
         return jsonify({
             "status": "error",
             "message": f"获取算法状态失败: {str(e)}"
-        }), 500 
\ No newline at end of file
+        }), 500 
+def run_fleet_study_job(job, city_code, day, order_count, fleet_size, param_overrides, match_window, max_wait,
+                        follow_hotspots, seed):
+    """后台任务：运行离散事件车队研究，报告同时保存为结果文件"""
+    import json
+    from app.utils.event_simulation import run_fleet_study
+
+    job.progress(0, 100, "正在准备车队、充电站和订单数据")
+    report = run_fleet_study(
+        city_code, day=day, order_count=order_count, fleet_size=fleet_size, param_overrides=param_overrides,
+        match_window=match_window, max_wait=max_wait, follow_hotspots=follow_hotspots, seed=seed,
+        progress=lambda clock, horizon: job.progress(
+            int(clock * 100 / horizon), 100, f"仿真进行中 {clock / 3600:.1f}/{horizon / 3600:.0f} 小时"
+        ),
+        cancelled=lambda: job.cancelled
+    )
+    job.check_cancelled()
+    job.save_file(
+        json.dumps(report, ensure_ascii=False, indent=2).encode('utf-8'),
+        f"fleet_study_{city_code}_{datetime.now().strftime('%Y%m%d%H%M%S')}.json",
+        'application/json'
+    )
+    job.progress(100, 100, "仿真完成")
+    return report
+
+@algorithm_bp.route('/api/simulation/run', methods=['POST'])
+def run_simulation():
+    """
+    提交离散事件车队研究（后台任务，不写入业务表）
+    参数:
+        city: 城市
+        date: 回放该日期的历史订单（YYYY-MM-DD），与 order_count 二选一
+        order_count: 合成订单数量
+        fleet_size: 可选，车队规模
+        params: 可选，覆盖的仿真参数，如 {"LOW_BATTERY_THRESHOLD": 30}
+        match_window: 可选，匹配窗口（秒）
+        max_wait: 可选，订单最长等待分配时间（秒）
+        follow_hotspots: 可选，合成订单按历史热点分布
+        seed: 可选，随机数种子
+    返回:
+        成功: {"status": "success", "message": "...", "data": {"job_id": ...}}，报告通过 /jobs/<job_id> 查询或下载
+        失败: {"status": "error", "message": "错误信息"}
+    """
+    from app.utils.dispatcher import MATCH_WINDOW
+    from app.utils.event_simulation import OVERRIDABLE_PARAMS
+    from app.utils.jobs import get_job_manager, JobQueueFull
+
+    try:
+        data = request.json or {}
+        city_code = data.get('city')
+        if not city_code:
+            return jsonify({"status": "error", "message": "请选择城市"}), 400
+
+        day = datetime.strptime(data['date'], '%Y-%m-%d').date() if data.get('date') else None
+        order_count = int(data['order_count']) if data.get('order_count') else None
+        if day is None and not order_count:
+            return jsonify({"status": "error", "message": "请指定回放日期或合成订单数量"}), 400
+        if order_count is not None and not 0 < order_count <= 1000000:
+            return jsonify({"status": "error", "message": "合成订单数量必须在1到1000000之间"}), 400
+
+        fleet_size = int(data['fleet_size']) if data.get('fleet_size') else None
+        if fleet_size is not None and fleet_size < 1:
+            return jsonify({"status": "error", "message": "车队规模必须大于0"}), 400
+
+        param_overrides = {key: float(value) for key, value in (data.get('params') or {}).items()}
+        unknown = set(param_overrides) - set(OVERRIDABLE_PARAMS)
+        if unknown:
+            return jsonify({"status": "error", "message": f"不支持覆盖的参数: {', '.join(sorted(unknown))}"}), 400
+
+        match_window = float(data['match_window']) if data.get('match_window') not in (None, '') else MATCH_WINDOW
+        if not 0 < match_window < float('inf'):
+            return jsonify({"status": "error", "message": "匹配窗口必须大于0"}), 400
+        max_wait = float(data['max_wait']) if data.get('max_wait') not in (None, '') else None
+        if max_wait is not None and not 0 < max_wait < float('inf'):
+            return jsonify({"status": "error", "message": "最长等待时间必须大于0"}), 400
+        seed = int(data['seed']) if data.get('seed') is not None else None
+
+        job = get_job_manager().submit(
+            'fleet_study', run_fleet_study_job, city_code, day, order_count, fleet_size, param_overrides,
+            match_window, max_wait, bool(data.get('follow_hotspots', False)), seed,
+            description=f"{city_code} 车队仿真研究"
+        )
+        return jsonify({
+            "status": "success",
+            "message": "仿真任务已提交",
+            "data": {"job_id": job['job_id']}
+        })
+    except JobQueueFull as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    except (ValueError, TypeError) as e:
+        return jsonify({"status": "error", "message": f"参数无效: {str(e)}"}), 400
+    except Exception as e:
+        print(f"提交仿真任务失败: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"status": "error", "message": f"提交仿真任务失败: {str(e)}"}), 500
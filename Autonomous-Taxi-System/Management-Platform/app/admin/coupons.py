@@ -1,19 +1,8 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app
 import random
 from datetime import datetime, timedelta
-import pymysql
 import json
-import os
-from dotenv import load_dotenv
-
-# 加载环境变量
-load_dotenv()
-
-# 数据库连接配置
-DB_HOST = os.getenv('DB_HOST', 'localhost')
-DB_USER = os.getenv('DB_USER', 'root')
-DB_PASSWORD = os.getenv('DB_PASSWORD', '123456')
-DB_NAME = os.getenv('DB_NAME', 'autonomous_taxi_system')
+from app.utils.db_pool import get_pymysql_dict_connection
 
 # 创建优惠券蓝图
 coupons_bp = Blueprint('coupons', __name__, url_prefix='/coupons')
@@ -191,15 +180,8 @@ statistics = {
 }
 
 def get_db_connection():
-    """获取数据库连接"""
-    return pymysql.connect(
-        host=DB_HOST,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_NAME,
-        charset='utf8mb4',
-        cursorclass=pymysql.cursors.DictCursor
-    )
+    """从连接池获取数据库连接（字典游标）"""
+    return get_pymysql_dict_connection()
 
 def get_coupon_types():
     """获取所有优惠券类型信息"""
@@ -1356,8 +1338,9 @@ def buy_package():
                 # 批量购买，售出数量+用户数量
                 cursor.execute('UPDATE coupon_packages SET sale_count = sale_count + %s WHERE id = %s', (user_count, package_id,))
             
-            # 添加收入记录
+            # 添加收入记录（同时累加每日收入事实表）
             from datetime import date
+            from app.utils.rollups import record_income
             today = date.today()
             
             if user_type == 'single':
@@ -1372,6 +1355,7 @@ def buy_package():
                     today,
                     f'用户{user_id}购买套餐"{package_dict.get("name", "未知套餐")}"'
                 ))
+                record_income(cursor, [{'date': today, 'source': '优惠券套餐购买', 'amount': price}])
             elif user_type == 'all':
                 # 为批量购买添加收入记录
                 cursor.execute("""
@@ -1383,6 +1367,7 @@ def buy_package():
                     today,
                     f'管理员为{user_count}位用户批量购买套餐"{package_dict.get("name", "未知套餐")}"'
                 ))
+                record_income(cursor, [{'date': today, 'source': '其他', 'amount': price * user_count}])
             
             conn.commit()
         except Exception as e:
@@ -1,7 +1,12 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, jsonify
+from functools import partial
 from datetime import datetime, date, timedelta
+import traceback
 import pymysql
-from app.config.database import db_config
+from app.utils.db_pool import get_pymysql_connection
+from app.utils.rollups import summarize, daily_series
+from app.utils.dashboard_snapshots import get_dashboard_snapshots
+from app.utils.vehicle_events import count_transitions
 from app.models.vehicle import Vehicle
 from app.models.order import Order
 from app.extensions import db
@@ -12,13 +17,28 @@ dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
 def get_db_connection():
     """获取数据库连接"""
     try:
-        conn = pymysql.connect(**db_config)
+        conn = get_pymysql_connection()
         return conn
     except Exception as e:
         print("数据库连接失败:", e)
         raise
 
-def get_vehicle_stats(connection, today, yesterday):
+def _compute_directly(key, day, compute):
+    """不经快照服务缓存，直接计算"""
+    return compute()
+
+def _day_range(day):
+    """'YYYY-MM-DD' 对应的 [当天0点, 次日0点) 时间范围，便于使用 created_at 索引"""
+    start = datetime.strptime(day, '%Y-%m-%d')
+    return start, start + timedelta(days=1)
+
+def _count(connection, sql, params=()):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        result = cursor.fetchone()
+    return result[0] if result and result[0] is not None else 0
+
+def get_vehicle_stats(today, yesterday, settled=_compute_directly, raise_errors=False):
     """获取车辆统计数据"""
     stats = {
         'total_vehicles': 0,
@@ -26,261 +46,115 @@ def get_vehicle_stats(connection, today, yesterday):
         'running_vehicles_percent_change': 0
     }
     
+    connection = None
     try:
+        connection = get_db_connection()
         with connection.cursor() as cursor:
-            # 总车辆数
-            cursor.execute("SELECT COUNT(*) FROM vehicles")
-            stats['total_vehicles'] = cursor.fetchone()[0]
-            print("总车辆数:", stats['total_vehicles'])
-            
-            # 运行中车辆数
-            cursor.execute("SELECT COUNT(*) FROM vehicles WHERE current_status = '运行中'")
-            stats['running_vehicles'] = cursor.fetchone()[0]
-            print("运行中车辆数:", stats['running_vehicles'])
-            
-            # 昨日运行中车辆数（为了计算百分比变化）
-            cursor.execute(
-                "SELECT COUNT(*) FROM vehicle_logs WHERE log_type = '状态变更' "
-                "AND log_content LIKE '%到\"运行中\"%' AND DATE(created_at) = %s", 
-                (yesterday,)
-            )
-            yesterday_running = cursor.fetchone()[0]
-            if yesterday_running > 0:
-                stats['running_vehicles_percent_change'] = round(
-                    ((stats['running_vehicles'] - yesterday_running) / yesterday_running) * 100
-                )
-            print("昨日运行中车辆数:", yesterday_running, "变化百分比:", stats['running_vehicles_percent_change'], "%")
+            # 总车辆数与运行中车辆数
+            cursor.execute("SELECT COUNT(*), COALESCE(SUM(current_status = '运行中'), 0) FROM vehicles")
+            total, running = cursor.fetchone()
+            stats['total_vehicles'] = int(total)
+            stats['running_vehicles'] = int(running)
+        
+        # 昨日切换为运行中的次数（为了计算百分比变化），来自状态变更事件表，昨日结束后不再变化，每天只统计一次
+        yesterday_running = settled('running_vehicles', yesterday, lambda: count_transitions(
+            *_day_range(yesterday), to_status='运行中'
+        ))
+        stats['running_vehicles_percent_change'] = _percent_change(stats['running_vehicles'], yesterday_running)
     except Exception as e:
         print("获取车辆统计失败:", repr(e))
+        if raise_errors:
+            raise
+    finally:
+        if connection:
+            connection.close()
     
     return stats
 
-def get_order_stats(connection, today, yesterday):
-    """获取订单统计数据"""
+def _percent_change(current, previous):
+    """今日相对昨日的变化百分比，昨日为0时返回0"""
+    return round((current - previous) / previous * 100) if previous > 0 else 0
+
+def get_order_stats(today, yesterday, settled=_compute_directly, raise_errors=False):
+    """获取订单统计数据（来自每日订单事实表）"""
     stats = {
         'today_orders': 0,
         'today_orders_percent_change': 0
     }
     
     try:
-        # 检查order_details表
-        with connection.cursor() as cursor:
-            cursor.execute("SHOW TABLES LIKE 'order_details'")
-            if not cursor.fetchone():
-                print("错误: order_details表不存在!")
-                return stats
-                
-            # 检查表结构
-            cursor.execute("DESCRIBE order_details")
-            columns = [col[0] for col in cursor.fetchall()]
-            print("order_details表字段:", columns)
-            
-            # 检查是否有created_at字段
-            if 'created_at' not in columns:
-                print("错误: order_details表没有created_at字段!")
-                return stats
-        
-        # 尝试方法1: 使用DATE函数
-        try:
-            with connection.cursor() as cursor:
-                # 今日完成订单数
-                sql = "SELECT COUNT(*) FROM order_details WHERE DATE(created_at) = %s"
-                print("执行SQL:", sql, "参数:", today)
-                cursor.execute(sql, (today,))
-                result = cursor.fetchone()
-                print("今日订单查询结果:", result)
-                
-                if result and result[0] is not None:
-                    stats['today_orders'] = result[0]
-                
-                # 昨日订单数
-                cursor.execute(sql, (yesterday,))
-                result = cursor.fetchone()
-                print("昨日订单查询结果:", result)
-                
-                yesterday_orders = result[0] if result and result[0] is not None else 0
-                    
-                if yesterday_orders > 0:
-                    stats['today_orders_percent_change'] = round(
-                        ((stats['today_orders'] - yesterday_orders) / yesterday_orders) * 100
-                    )
-                
-                print("方法1 - 今日订单数:", stats['today_orders'], "昨日订单数:", yesterday_orders)
-        except Exception as e:
-            print("方法1获取订单统计失败:", repr(e))
-        
-        # 如果方法1返回0，尝试方法2: 使用时间范围
-        if stats['today_orders'] == 0:
-            try:
-                with connection.cursor() as cursor:
-                    sql = "SELECT COUNT(*) FROM order_details WHERE created_at >= %s AND created_at < %s"
-                    print("执行SQL:", sql, "参数:", today+" 00:00:00", today+" 23:59:59")
-                    cursor.execute(sql, (today+" 00:00:00", today+" 23:59:59"))
-                    result = cursor.fetchone()
-                    print("方法2 - 今日订单查询结果:", result)
-                    
-                    if result and result[0] is not None and result[0] > 0:
-                        stats['today_orders'] = result[0]
-                        print("使用方法2更新今日订单数:", stats['today_orders'])
-            except Exception as e:
-                print("方法2获取订单统计失败:", repr(e))
-        
-        # 如果还是0，检查最近记录
-        if stats['today_orders'] == 0:
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute("SELECT created_at FROM order_details ORDER BY created_at DESC LIMIT 5")
-                    recent_orders = cursor.fetchall()
-                    print("最近的订单记录创建时间:", recent_orders)
-            except Exception as e:
-                print("获取最近订单记录失败:", repr(e))
+        series = daily_series('fact_daily_orders', yesterday, today, measure='order_count')
+        today_orders = int(series[date.fromisoformat(today)])
+        yesterday_orders = int(series[date.fromisoformat(yesterday)])
+        stats['today_orders'] = today_orders
+        stats['today_orders_percent_change'] = _percent_change(today_orders, yesterday_orders)
     except Exception as e:
         print("获取订单统计失败:", repr(e))
+        if raise_errors:
+            raise
     
     return stats
 
-def get_income_stats(connection, today, yesterday):
-    """获取收入统计数据"""
+def get_income_stats(today, yesterday, settled=_compute_directly, raise_errors=False):
+    """获取收入统计数据（来自每日收入事实表）"""
     stats = {
         'today_income': 0,
         'today_income_percent_change': 0
     }
     
     try:
-        # 检查income表
-        with connection.cursor() as cursor:
-            cursor.execute("SHOW TABLES LIKE 'income'")
-            if not cursor.fetchone():
-                print("错误: income表不存在!")
-                return stats
-                
-            # 检查表结构
-            cursor.execute("DESCRIBE income")
-            columns = [col[0] for col in cursor.fetchall()]
-            print("income表字段:", columns)
-            
-            # 检查是否有date字段
-            if 'date' not in columns:
-                print("错误: income表没有date字段!")
-                return stats
-        
-        # 尝试方法1: 使用DATE函数
-        try:
-            with connection.cursor() as cursor:
-                # 今日收入
-                sql = "SELECT COALESCE(SUM(amount), 0) FROM income WHERE DATE(date) = %s"
-                print("执行SQL:", sql, "参数:", today)
-                cursor.execute(sql, (today,))
-                result = cursor.fetchone()
-                print("今日收入查询结果:", result)
-                
-                if result and result[0] is not None:
-                    stats['today_income'] = float(result[0])
-                
-                # 昨日收入
-                cursor.execute(sql, (yesterday,))
-                result = cursor.fetchone()
-                print("昨日收入查询结果:", result)
-                
-                yesterday_income = float(result[0]) if result and result[0] is not None else 0
-                    
-                if yesterday_income > 0:
-                    stats['today_income_percent_change'] = round(
-                        ((stats['today_income'] - yesterday_income) / yesterday_income) * 100
-                    )
-                
-                print("方法1 - 今日收入:", stats['today_income'], "昨日收入:", yesterday_income)
-        except Exception as e:
-            print("方法1获取收入统计失败:", repr(e))
-        
-        # 如果方法1返回0，尝试方法2: 直接匹配日期
-        if stats['today_income'] == 0:
-            try:
-                with connection.cursor() as cursor:
-                    sql = "SELECT COALESCE(SUM(amount), 0) FROM income WHERE date = %s"
-                    print("执行SQL:", sql, "参数:", today)
-                    cursor.execute(sql, (today,))
-                    result = cursor.fetchone()
-                    print("方法2 - 今日收入查询结果:", result)
-                    
-                    if result and result[0] is not None and float(result[0]) > 0:
-                        stats['today_income'] = float(result[0])
-                        print("使用方法2更新今日收入:", stats['today_income'])
-            except Exception as e:
-                print("方法2获取收入统计失败:", repr(e))
-        
-        # 如果还是0，检查最近记录
-        if stats['today_income'] == 0:
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute("SELECT date, amount FROM income ORDER BY date DESC LIMIT 5")
-                    recent_income = cursor.fetchall()
-            except Exception as e:
-                print("获取最近收入记录失败:", repr(e))
+        series = daily_series('fact_daily_income', yesterday, today)
+        today_income = series[date.fromisoformat(today)]
+        yesterday_income = series[date.fromisoformat(yesterday)]
+        stats['today_income'] = today_income
+        stats['today_income_percent_change'] = _percent_change(today_income, yesterday_income)
     except Exception as e:
         print("获取收入统计失败:", repr(e))
+        if raise_errors:
+            raise
     
     return stats
 
-def get_active_users_stats(connection, today, yesterday):
-    """获取活跃用户统计数据"""
+def get_active_users_stats(today, yesterday, settled=_compute_directly, raise_errors=False):
+    """获取活跃用户统计数据（当天下过单的去重用户数）"""
     stats = {
         'active_users': 0,
         'active_users_percent_change': 0
     }
     
+    sql = "SELECT COUNT(DISTINCT user_id) FROM order_details WHERE created_at >= %s AND created_at < %s"
+    connection = None
     try:
-        # 尝试方法1: 使用DATE函数
-        try:
-            with connection.cursor() as cursor:
-                # 今日活跃用户
-                sql = "SELECT COUNT(DISTINCT user_id) FROM order_details WHERE DATE(created_at) = %s"
-                print("执行SQL:", sql, "参数:", today)
-                cursor.execute(sql, (today,))
-                result = cursor.fetchone()
-                
-                if result and result[0] is not None:
-                    stats['active_users'] = result[0]
-                
-                # 昨日活跃用户
-                cursor.execute(sql, (yesterday,))
-                result = cursor.fetchone()
-                
-                yesterday_active = result[0] if result and result[0] is not None else 0
-                    
-                if yesterday_active > 0:
-                    stats['active_users_percent_change'] = round(
-                        ((stats['active_users'] - yesterday_active) / yesterday_active) * 100
-                    )
-                
-        except Exception as e:
-            print("方法1获取活跃用户统计失败:", repr(e))
-        
-        # 如果方法1返回0，尝试方法2: 使用时间范围
-        if stats['active_users'] == 0:
-            try:
-                with connection.cursor() as cursor:
-                    sql = "SELECT COUNT(DISTINCT user_id) FROM order_details WHERE created_at >= %s AND created_at < %s"
-        
-                    cursor.execute(sql, (today+" 00:00:00", today+" 23:59:59"))
-                    result = cursor.fetchone()
-                    
-                    if result and result[0] is not None and result[0] > 0:
-                        stats['active_users'] = result[0]
-      
-            except Exception as e:
-                print("方法2获取活跃用户统计失败:", repr(e))
+        connection = get_db_connection()
+        stats['active_users'] = _count(connection, sql, _day_range(today))
+        yesterday_active = settled('active_users', yesterday, lambda: _count(connection, sql, _day_range(yesterday)))
+        stats['active_users_percent_change'] = _percent_change(stats['active_users'], yesterday_active)
     except Exception as e:
         print("获取活跃用户统计失败:", repr(e))
+        if raise_errors:
+            raise
+    finally:
+        if connection:
+            connection.close()
     
     return stats
 
-def get_dashboard_stats():
-    """获取仪表盘统计信息"""
-    today = date.today().strftime('%Y-%m-%d')
-    yesterday = (date.today() - timedelta(days=1)).strftime('%Y-%m-%d')
+# 仪表盘快照中的统计组：组名 -> 计算函数(今天, 昨天, settled)，由快照服务并发计算
+# 快照服务调用时出错直接抛出，由快照服务沿用上一份快照中该组的结果并记入 errors
+SNAPSHOT_GROUPS = {
+    'vehicles': partial(get_vehicle_stats, raise_errors=True),
+    'orders': partial(get_order_stats, raise_errors=True),
+    'income': partial(get_income_stats, raise_errors=True),
+    'active_users': partial(get_active_users_stats, raise_errors=True),
+    'chart_data': lambda today, yesterday, settled: get_chart_data(raise_errors=True),
+    'model_finance': lambda today, yesterday, settled: get_model_finance_data(raise_errors=True),
+    'warnings': lambda today, yesterday, settled: get_system_warnings(raise_errors=True)
+}
+# 合并为顶部指标卡片的统计组
+STAT_GROUPS = ('vehicles', 'orders', 'income', 'active_users')
 
-    
+def get_dashboard_stats(snapshot=None):
+    """获取仪表盘统计信息（来自仪表盘快照）"""
     stats = {
         'running_vehicles': 0,
         'total_vehicles': 0,
@@ -293,36 +167,13 @@ def get_dashboard_stats():
         'active_users_percent_change': 0
     }
     
-    connection = None
-    try:
-        connection = get_db_connection()
-        
-        # 1. 获取车辆统计
-        vehicle_stats = get_vehicle_stats(connection, today, yesterday)
-        stats.update(vehicle_stats)
-        
-        # 2. 获取订单统计
-        order_stats = get_order_stats(connection, today, yesterday)
-        stats.update(order_stats)
-        
-        # 3. 获取收入统计
-        income_stats = get_income_stats(connection, today, yesterday)
-        stats.update(income_stats)
-        
-        # 4. 获取活跃用户统计
-        user_stats = get_active_users_stats(connection, today, yesterday)
-        stats.update(user_stats)
-        
-    except Exception as e:
-        print("获取仪表盘统计信息失败:", repr(e))
-    finally:
-        if connection:
-            connection.close()
-    
-    print("最终统计结果:", stats)
+    if snapshot is None:
+        snapshot = get_dashboard_snapshots().get()
+    for name in STAT_GROUPS:
+        stats.update(snapshot['groups'].get(name) or {})
     return stats
 
-def get_model_finance_data():
+def get_model_finance_data(raise_errors=False):
     """获取按车型的财务数据"""
     model_data = {
         'models': [],      # 车辆型号
@@ -345,57 +196,41 @@ def get_model_finance_data():
             models = [row[0] for row in cursor.fetchall()]
             
             model_data['models'] = models
+        
+        # 近30天各车型的收入和支出来自每日事实表
+        start_date = date.today() - timedelta(days=30)
+        end_date = date.today()
+        income_by_model = {
+            row['vehicle_model']: row['amount']
+            for row in summarize('fact_daily_income', start_date, end_date, ('vehicle_model',))
+        }
+        expense_by_model = {
+            row['vehicle_model']: row['amount']
+            for row in summarize('fact_daily_expense', start_date, end_date, ('vehicle_model',))
+        }
+        
+        for model in models:
+            income = income_by_model.get(model, 0.0)
+            expense = expense_by_model.get(model, 0.0)
+            model_data['income'].append(income)
+            model_data['expense'].append(expense)
             
-            # 对每个车型查询财务数据
-            for model in models:
-                # 查询该车型的总收入
-                try:
-                    cursor.execute("""
-                        SELECT COALESCE(SUM(i.amount), 0) 
-                        FROM income i
-                        JOIN order_details od ON i.order_id = od.order_id
-                        JOIN vehicles v ON od.vehicle_id = v.vehicle_id
-                        WHERE v.model = %s AND 
-                              i.date >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-                    """, (model,))
-                    income = cursor.fetchone()[0] or 0
-                    model_data['income'].append(float(income))
-                except Exception as e:
-                    print("查询车型", model, "收入失败，可能是表结构问题:", repr(e))
-                    # 不使用随机数据，保持为0
-                    model_data['income'].append(0.0)
-                
-                # 查询该车型的总支出
-                try:
-                    cursor.execute("""
-                        SELECT COALESCE(SUM(amount), 0)
-                        FROM expense
-                        WHERE vehicle_id IN (SELECT vehicle_id FROM vehicles WHERE model = %s)
-                        AND date >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-                    """, (model,))
-                    expense = cursor.fetchone()[0] or 0
-                    model_data['expense'].append(float(expense))
-                except Exception as e:
-                    print("查询车型", model, "支出失败，可能是表结构问题:", repr(e))
-                    # 不使用随机数据，保持为0
-                    model_data['expense'].append(0.0)
-                
-                # 计算利润率
-                income = model_data['income'][-1]
-                expense = model_data['expense'][-1]
-                profit = income - expense
-                profit_rate = (profit / income * 100) if income > 0 else 0
-                model_data['profit_rate'].append(round(profit_rate, 1))
+            # 计算利润率
+            profit = income - expense
+            profit_rate = (profit / income * 100) if income > 0 else 0
+            model_data['profit_rate'].append(round(profit_rate, 1))
                 
     except Exception as e:
         print("获取车型财务数据失败:", repr(e))
+        if raise_errors:
+            raise
     finally:
         if connection:
             connection.close()
     
     return model_data
 
-def get_chart_data():
+def get_chart_data(raise_errors=False):
     """获取图表数据"""
     chart_data = {
         'avg_order_amount': {
@@ -418,19 +253,19 @@ def get_chart_data():
     try:
         connection = get_db_connection()
         
-        # 1. 获取每日平均订单金额
-        with connection.cursor() as cursor:
-            avg_amounts = []
-            for i in range(6, -1, -1):
-                target_date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
-                cursor.execute(
-                    "SELECT AVG(amount) FROM order_details WHERE DATE(created_at) = %s", 
-                    (target_date,)
-                )
-                result = cursor.fetchone()[0]
-                # 如果没有数据，使用0
-                avg_amounts.append(round(float(result), 2) if result is not None else 0)
-            chart_data['avg_order_amount']['data'] = avg_amounts
+        # 最近7天每日订单数和订单金额来自每日订单事实表
+        days = [today - timedelta(days=i) for i in range(6, -1, -1)]
+        daily_orders = {
+            row['fact_date']: row
+            for row in summarize('fact_daily_orders', days[0], days[-1], ('fact_date',))
+        }
+        
+        # 1. 每日平均订单金额
+        avg_amounts = []
+        for day in days:
+            row = daily_orders.get(day)
+            avg_amounts.append(round(row['amount'] / row['order_count'], 2) if row and row['order_count'] > 0 else 0)
+        chart_data['avg_order_amount']['data'] = avg_amounts
         
         # 2. 获取每辆车每天完成的平均订单数
         with connection.cursor() as cursor:
@@ -442,14 +277,9 @@ def get_chart_data():
             
             # 计算每天的订单数除以车辆总数
             avg_orders_per_vehicle = []
-            for i in range(6, -1, -1):
-                target_date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
-                # 计算每日订单总数
-                cursor.execute(
-                    "SELECT COUNT(*) FROM order_details WHERE DATE(created_at) = %s", 
-                    (target_date,)
-                )
-                order_count = cursor.fetchone()[0]
+            for day in days:
+                row = daily_orders.get(day)
+                order_count = row['order_count'] if row else 0
                 
                 # 计算平均每辆车的订单数
                 avg = round(order_count / vehicle_count, 2) if order_count > 0 else 0
@@ -459,13 +289,15 @@ def get_chart_data():
     
     except Exception as e:
         print("获取图表数据失败:", repr(e))
+        if raise_errors:
+            raise
     finally:
         if connection:
             connection.close()
     
     return chart_data
 
-def get_system_warnings():
+def get_system_warnings(raise_errors=False):
     """获取系统警告通知"""
     warnings = []
     
@@ -491,6 +323,8 @@ def get_system_warnings():
     
     except Exception as e:
         print("获取系统警告通知失败:", repr(e))
+        if raise_errors:
+            raise
     finally:
         if connection:
             connection.close()
@@ -500,10 +334,43 @@ def get_system_warnings():
 @dashboard_bp.route('/')
 def index():
     """仪表盘主页"""
-    print("开始加载仪表盘页面")
-    stats = get_dashboard_stats()
-    chart_data = get_chart_data()
-    model_finance = get_model_finance_data()
-    warnings = get_system_warnings()
-    print("仪表盘数据加载完成，准备渲染页面")
-    return render_template('dashboard/index.html', stats=stats, chart_data=chart_data, model_finance=model_finance, warnings=warnings) 
\ No newline at end of file
+    snapshot = get_dashboard_snapshots().get()
+    groups = snapshot['groups']
+    stats = get_dashboard_stats(snapshot)
+    chart_data = groups.get('chart_data') or get_chart_data()
+    model_finance = groups.get('model_finance') or get_model_finance_data()
+    warnings = groups.get('warnings') or []
+    return render_template('dashboard/index.html', stats=stats, chart_data=chart_data, model_finance=model_finance,
+                           warnings=warnings, snapshot_time=snapshot['generated_at'],
+                           snapshot_age=snapshot['age_seconds'])
+
+@dashboard_bp.route('/api/snapshot', methods=['GET'])
+def get_snapshot():
+    """获取最近一份仪表盘快照（含快照生成时间与时长）"""
+    try:
+        snapshot = get_dashboard_snapshots().get()
+        groups = snapshot['groups']
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'stats': get_dashboard_stats(snapshot),
+                'chart_data': groups.get('chart_data'),
+                'model_finance': groups.get('model_finance'),
+                'warnings': groups.get('warnings') or [],
+                'generated_at': snapshot['generated_at'],
+                'age_seconds': snapshot['age_seconds'],
+                'stale': snapshot['stale']
+            }
+        })
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': f'获取仪表盘快照失败: {str(e)}'}), 500
+
+@dashboard_bp.route('/api/snapshot_metrics', methods=['GET'])
+def get_snapshot_metrics():
+    """获取仪表盘快照服务的运行指标"""
+    try:
+        return jsonify({'status': 'success', 'data': get_dashboard_snapshots().get_metrics()})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': f'获取仪表盘快照指标失败: {str(e)}'}), 500
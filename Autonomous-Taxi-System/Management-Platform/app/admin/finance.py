@@ -4,11 +4,10 @@ from app.dao.expense_dao import ExpenseDAO
 from app.dao.user_dao import UserDAO
 from app.dao.vehicle_dao import VehicleDAO
 from app.dao.charging_station_dao import ChargingStationDAO
-from app.dao.base_dao import BaseDAO
+from app.utils.rollups import summarize, daily_series
 from app.config.database import db_config
 from datetime import datetime, timedelta
 import pymysql
-import calendar
 import random
 from app.utils.flash_helper import flash_success, flash_error, flash_warning, flash_info, flash_add_success, flash_update_success, flash_delete_success
 
@@ -45,56 +44,19 @@ def index():
     last_month_start = (first_day - timedelta(days=1)).replace(day=1)
     last_month_end = first_day
     
-    # 将月份转换为字符串格式,用于SQL查询
-    current_month = first_day.strftime('%Y-%m-%d')
-    next_month_str = next_month.strftime('%Y-%m-%d')
-    last_month_start_str = last_month_start.strftime('%Y-%m-%d')
-    last_month_end_str = last_month_end.strftime('%Y-%m-%d')
-    
     # 当前月份值(用于月份选择器默认值)
     current_month_value = first_day.strftime('%Y-%m')
     
-    # 创建数据库连接
-    connection = None
     try:
-        connection = pymysql.connect(**db_config)
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
+        # 财务汇总数据全部来自每日事实表，读取量与明细行数无关
+        month_end = next_month - timedelta(days=1)
+        last_month_last_day = last_month_end - timedelta(days=1)
         
-        # 查询当月总收入
-        cursor.execute("""
-            SELECT SUM(amount) as total_income 
-            FROM income 
-            WHERE date >= %s AND date < %s
-        """, (current_month, next_month_str))
-        current_income_result = cursor.fetchone()
-        current_income = float(current_income_result['total_income']) if current_income_result['total_income'] else 0
-        
-        # 查询上月总收入
-        cursor.execute("""
-            SELECT SUM(amount) as total_income 
-            FROM income 
-            WHERE date >= %s AND date < %s
-        """, (last_month_start_str, last_month_end_str))
-        last_income_result = cursor.fetchone()
-        last_income = float(last_income_result['total_income']) if last_income_result['total_income'] else 0
-        
-        # 查询当月总支出
-        cursor.execute("""
-            SELECT SUM(amount) as total_expense 
-            FROM expense 
-            WHERE date >= %s AND date < %s
-        """, (current_month, next_month_str))
-        current_expense_result = cursor.fetchone()
-        current_expense = float(current_expense_result['total_expense']) if current_expense_result['total_expense'] else 0
-        
-        # 查询上月总支出
-        cursor.execute("""
-            SELECT SUM(amount) as total_expense 
-            FROM expense 
-            WHERE date >= %s AND date < %s
-        """, (last_month_start_str, last_month_end_str))
-        last_expense_result = cursor.fetchone()
-        last_expense = float(last_expense_result['total_expense']) if last_expense_result['total_expense'] else 0
+        # 当月/上月总收入和总支出
+        current_income = summarize('fact_daily_income', first_day, month_end)[0]['amount']
+        last_income = summarize('fact_daily_income', last_month_start, last_month_last_day)[0]['amount']
+        current_expense = summarize('fact_daily_expense', first_day, month_end)[0]['amount']
+        last_expense = summarize('fact_daily_expense', last_month_start, last_month_last_day)[0]['amount']
         
         # 计算净利润和比率
         current_profit = current_income - current_expense
@@ -110,28 +72,13 @@ def index():
         last_profit_rate = (last_profit / last_income * 100) if last_income > 0 else 0
         profit_rate_growth = current_profit_rate - last_profit_rate
         
-        # 查询选定月份每日收入数据用于图表
-        daily_revenues = []
-        days_in_month = calendar.monthrange(first_day.year, first_day.month)[1]
-        
-        for day in range(1, days_in_month + 1):
-            day_date = datetime(first_day.year, first_day.month, day).strftime('%Y-%m-%d')
-            cursor.execute("""
-                SELECT SUM(amount) as day_income 
-                FROM income 
-                WHERE date = %s
-            """, (day_date,))
-            day_result = cursor.fetchone()
-            daily_revenues.append(float(day_result['day_income']) if day_result['day_income'] else 0)
+        # 选定月份每日收入和成本数据（用于收入、成本分析图表）
+        daily_revenues = list(daily_series('fact_daily_income', first_day, month_end).values())
+        daily_expenses = list(daily_series('fact_daily_expense', first_day, month_end).values())
+        days_in_month = len(daily_revenues)
         
         # 获取收入来源分布
-        cursor.execute("""
-            SELECT source, SUM(amount) as total 
-            FROM income 
-            WHERE date >= %s AND date < %s 
-            GROUP BY source
-        """, (current_month, next_month_str))
-        income_sources = cursor.fetchall()
+        income_sources = summarize('fact_daily_income', first_day, month_end, ('source',))
         
         # 准备图表数据
         revenue_sources = []
@@ -139,19 +86,7 @@ def index():
         
         for source in income_sources:
             revenue_sources.append(source['source'])
-            revenue_amounts.append(float(source['total']))
-        
-        # 获取月内每日成本数据(用于成本分析图表)
-        daily_expenses = []
-        for day in range(1, days_in_month + 1):
-            day_date = datetime(first_day.year, first_day.month, day).strftime('%Y-%m-%d')
-            cursor.execute("""
-                SELECT SUM(amount) as day_expense 
-                FROM expense 
-                WHERE date = %s
-            """, (day_date,))
-            day_result = cursor.fetchone()
-            daily_expenses.append(float(day_result['day_expense']) if day_result['day_expense'] else 0)
+            revenue_amounts.append(source['amount'])
         
         # 计算月内每日利润数据(用于利润走势图表)
         daily_profits = []
@@ -159,16 +94,14 @@ def index():
             daily_profit = daily_revenues[i] - daily_expenses[i]
             daily_profits.append(daily_profit)
         
-        # 获取成本明细
-        cursor.execute("""
-            SELECT description, SUM(amount) as total 
-            FROM expense 
-            WHERE date >= %s AND date < %s 
-            GROUP BY description
-            ORDER BY total DESC
-            LIMIT 5
-        """, (current_month, next_month_str))
-        expense_details = cursor.fetchall()
+        # 获取成本明细：按支出类型和子类取金额最高的5项
+        expense_details = summarize('fact_daily_expense', first_day, month_end, ('expense_type', 'sub_type'))
+        expense_details.sort(key=lambda row: row['amount'], reverse=True)
+        expense_details = expense_details[:5]
+        last_expense_details = {
+            (row['expense_type'], row['sub_type']): row['amount']
+            for row in summarize('fact_daily_expense', last_month_start, last_month_last_day, ('expense_type', 'sub_type'))
+        }
         
         # 计算各成本占比
         expense_types = []
@@ -177,18 +110,12 @@ def index():
         expense_changes = []
         
         for detail in expense_details:
-            expense_type = detail['description'] or '其他成本'
-            expense_amount = float(detail['total'])
+            expense_type = detail['sub_type'] or detail['expense_type'] or '其他成本'
+            expense_amount = detail['amount']
             expense_percentage = (expense_amount / current_expense * 100) if current_expense > 0 else 0
             
-            # 查询该类型上月支出
-            cursor.execute("""
-                SELECT SUM(amount) as last_month_expense 
-                FROM expense 
-                WHERE date >= %s AND date < %s AND description = %s
-            """, (last_month_start_str, last_month_end_str, detail['description']))
-            last_detail = cursor.fetchone()
-            last_amount = float(last_detail['last_month_expense']) if last_detail['last_month_expense'] else 0
+            # 该类型上月支出
+            last_amount = last_expense_details.get((detail['expense_type'], detail['sub_type']), 0)
             
             # 计算变化率
             expense_change = ((expense_amount - last_amount) / last_amount * 100) if last_amount > 0 else 0
@@ -202,97 +129,14 @@ def index():
         month_display = first_day.strftime('%Y年%m月')
         last_month_display = last_month_start.strftime('%Y年%m月')
         
-        # 获取订单地理分布数据（按城市统计订单数量）
-        order_geo_query = """
-        SELECT 
-            o.city_code as name, 
-            COUNT(*) as value 
-        FROM 
-            orders o 
-        WHERE 
-            o.order_status = '已结束'
-            AND DATE(o.create_time) >= %s 
-            AND DATE(o.create_time) < %s
-        GROUP BY 
-            o.city_code
-        """
-        order_geo_data = BaseDAO.execute_query(order_geo_query, (current_month, next_month_str))
-
-        
-        # 检查order_details表中数据格式
-        check_order_details = """
-        SELECT od.order_id, od.amount, o.create_time 
-        FROM order_details od
-        JOIN orders o ON od.order_id = o.order_number
-        WHERE DATE(o.create_time) >= %s AND DATE(o.create_time) < %s
-        LIMIT 5
-        """
-        order_details_data = BaseDAO.execute_query(check_order_details, (current_month, next_month_str))
-
-        
-        # 检查orders表数据格式
-        check_orders = """
-        SELECT order_id, order_number, city_code, order_status, create_time 
-        FROM orders 
-        WHERE order_status = '已结束' 
-        AND DATE(create_time) >= %s 
-        AND DATE(create_time) < %s
-        LIMIT 5
-        """
-        orders_data = BaseDAO.execute_query(check_orders, (current_month, next_month_str))
-  
-
-        # 构建可靠的订单金额地理分布查询
+        # 订单地理分布数据（按城市统计订单数量和订单金额）
+        order_geo_data = []
         order_amount_geo_data = []
-        
-        try:
-            # 尝试使用ORDER_NUMBER作为字符串关联 - 按月份筛选
-            query = """
-            SELECT 
-                o.city_code as name, 
-                SUM(od.amount) as value 
-            FROM 
-                orders o
-            JOIN 
-                order_details od ON o.order_number = od.order_id COLLATE utf8mb4_unicode_ci
-            WHERE 
-                o.order_status = '已结束'
-                AND DATE(o.create_time) >= %s 
-                AND DATE(o.create_time) < %s
-            GROUP BY 
-                o.city_code
-            """
-            result = BaseDAO.execute_query(query, (current_month, next_month_str))
-            
-            if result:
-                order_amount_geo_data = result
-            else:
-                # 如果没有结果，尝试使用ORDER_ID作为字符串关联 - 按月份筛选
-                query_alt = """
-                SELECT 
-                    o.city_code as name, 
-                    SUM(od.amount) as value 
-                FROM 
-                    orders o
-                JOIN 
-                    order_details od ON CAST(o.order_id AS CHAR) COLLATE utf8mb4_unicode_ci = od.order_id
-                WHERE 
-                    o.order_status = '已结束' 
-                    AND DATE(o.create_time) >= %s 
-                    AND DATE(o.create_time) < %s
-                GROUP BY 
-                    o.city_code
-                """
-                result_alt = BaseDAO.execute_query(query_alt, (current_month, next_month_str))
-          
-                
-                if result_alt:
-                    order_amount_geo_data = result_alt
-             
-            
-        except Exception as e:
-            print(f"订单金额地理分布查询出错: {str(e)}")
-            order_amount_geo_data = []
+        for row in summarize('fact_daily_orders', first_day, month_end, ('city_code',)):
+            if not row['city_code'] or row['order_count'] <= 0:
+                continue
+            order_geo_data.append({'name': row['city_code'], 'value': row['order_count']})
+            order_amount_geo_data.append({'name': row['city_code'], 'value': row['amount']})
         
         # 省份名称映射（城市到省份的映射）
         province_name_map = {
@@ -418,10 +262,6 @@ def index():
                               finance_data=None,
                               selected_month=selected_month,
                               current_month_value=datetime.now().strftime('%Y-%m'))
-    
-    finally:
-        if connection:
-            connection.close()
 
 @finance_bp.route('/income')
 def income():
@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request
 from app.dao.base_dao import BaseDAO
+from app.utils.rollups import summarize
 from datetime import datetime, timedelta
 import json
 from decimal import Decimal
@@ -62,57 +63,26 @@ def finance_balance_data():
         if not start_date or not end_date:
             start_date, end_date = get_date_range(30)
         
-        # 获取总收入
-        income_query = """
-        SELECT COALESCE(SUM(amount), 0) as total_income
-        FROM income
-        WHERE date BETWEEN %s AND %s
-        """
-        income_result = BaseDAO.execute_query(income_query, (start_date, end_date))
-        total_income = float(income_result[0]['total_income'] if income_result else 0)
-        
-        # 获取总支出
-        expense_query = """
-        SELECT COALESCE(SUM(amount), 0) as total_expense
-        FROM expense
-        WHERE date BETWEEN %s AND %s
-        """
-        expense_result = BaseDAO.execute_query(expense_query, (start_date, end_date))
-        total_expense = float(expense_result[0]['total_expense'] if expense_result else 0)
+        # 收入和支出来自每日事实表
+        income_breakdown_result = summarize('fact_daily_income', start_date, end_date, ('source',))
+        expense_breakdown_result = summarize('fact_daily_expense', start_date, end_date, ('expense_type',))
+        
+        total_income = sum(item['amount'] for item in income_breakdown_result)
+        total_expense = sum(item['amount'] for item in expense_breakdown_result)
         
         # 计算收支平衡和利润率
         balance = total_income - total_expense
         profit_margin = round(balance / total_income * 100, 1) if total_income > 0 else 0
         
-        # 获取收入明细数据
-        income_breakdown_query = """
-        SELECT source, COALESCE(SUM(amount), 0) as total
-        FROM income
-        WHERE date BETWEEN %s AND %s
-        GROUP BY source
-        ORDER BY total DESC
-        """
-        income_breakdown_result = BaseDAO.execute_query(income_breakdown_query, (start_date, end_date))
-        
-        # 构建收入明细字典
+        # 构建收入明细字典（按金额降序）
         income_breakdown = {}
-        for item in income_breakdown_result:
-            income_breakdown[item['source']] = float(item['total'])
-        
-        # 获取支出明细数据
-        expense_breakdown_query = """
-        SELECT type, COALESCE(SUM(amount), 0) as total
-        FROM expense
-        WHERE date BETWEEN %s AND %s
-        GROUP BY type
-        ORDER BY total DESC
-        """
-        expense_breakdown_result = BaseDAO.execute_query(expense_breakdown_query, (start_date, end_date))
+        for item in sorted(income_breakdown_result, key=lambda row: row['amount'], reverse=True):
+            income_breakdown[item['source']] = item['amount']
         
-        # 构建支出明细字典
+        # 构建支出明细字典（按金额降序）
         expense_breakdown = {}
-        for item in expense_breakdown_result:
-            expense_breakdown[item['type']] = float(item['total'])
+        for item in sorted(expense_breakdown_result, key=lambda row: row['amount'], reverse=True):
+            expense_breakdown[item['expense_type']] = item['amount']
         
         # 构建返回数据
         result = {
@@ -150,15 +120,14 @@ def cost_structure_data():
         if not start_date or not end_date:
             start_date, end_date = get_date_range(90)
         
-        # 获取支出主类型数据
-        expense_types_query = """
-        SELECT type, COALESCE(SUM(amount), 0) as total
-        FROM expense
-        WHERE date BETWEEN %s AND %s
-        GROUP BY type
-        ORDER BY total DESC
-        """
-        expense_types_result = BaseDAO.execute_query(expense_types_query, (start_date, end_date))
+        # 支出主类型和子类（子类规则见 app.utils.rollups.EXPENSE_SUB_TYPE_RULES）来自每日事实表
+        expense_rows = summarize('fact_daily_expense', start_date, end_date, ('expense_type', 'sub_type'))
+        type_totals = {}
+        sub_type_totals = {}
+        for row in expense_rows:
+            type_totals[row['expense_type']] = type_totals.get(row['expense_type'], 0) + row['amount']
+            if row['sub_type']:
+                sub_type_totals.setdefault(row['expense_type'], []).append((row['sub_type'], row['amount']))
         
         # 构建节点和连接数据
         nodes = [{'name': '总支出'}]
@@ -166,107 +135,28 @@ def cost_structure_data():
         
         # 计算总支出
         total_expense = 0
-        for item in expense_types_result:
-            total_expense += float(item['total'])
+        for expense_type, total in sorted(type_totals.items(), key=lambda item: item[1], reverse=True):
+            total_expense += total
             # 添加支出类型节点
-            nodes.append({'name': item['type']})
+            nodes.append({'name': expense_type})
             # 添加从总支出到各类型的链接
             links.append({
                 'source': '总支出',
-                'target': item['type'],
-                'value': float(item['total'])
-            })
-        
-        # 获取详细支出分类数据（基于描述）
-        # 1. 获取车辆支出的详细分类
-        vehicle_expense_query = """
-        SELECT 
-            CASE 
-                WHEN description LIKE '%保险%' THEN '车辆保险'
-                WHEN description LIKE '%维护%' OR description LIKE '%维修%' OR description LIKE '%保养%' THEN '车辆维护'
-                WHEN description LIKE '%购置%' OR description LIKE '%购买%' OR description LIKE '%采购%' THEN '车辆采购'
-                ELSE '其他车辆支出'
-            END as sub_type,
-            COALESCE(SUM(amount), 0) as total
-        FROM expense
-        WHERE type = '车辆支出' AND date BETWEEN %s AND %s
-        GROUP BY sub_type
-        ORDER BY total DESC
-        """
-        vehicle_expense_result = BaseDAO.execute_query(vehicle_expense_query, (start_date, end_date))
-        
-        # 添加车辆支出的子节点和链接
-        for item in vehicle_expense_result:
-            sub_type = item['sub_type']
-            amount = float(item['total'])
-            # 添加子节点
-            nodes.append({'name': sub_type})
-            # 添加从车辆支出到子类型的链接
-            links.append({
-                'source': '车辆支出',
-                'target': sub_type,
-                'value': amount
-            })
-        
-        # 2. 获取充电站支出的详细分类
-        charging_expense_query = """
-        SELECT 
-            CASE 
-                WHEN amount < 10000 THEN '充电费用'
-                WHEN description LIKE '%维护%' OR description LIKE '%维修%' OR description LIKE '%检测%' THEN '充电站维护'
-                WHEN description LIKE '%建设%' OR description LIKE '%建造%' OR description LIKE '%安装%' THEN '充电站建设'
-                ELSE '其他充电站支出'
-            END as sub_type,
-            COALESCE(SUM(amount), 0) as total
-        FROM expense
-        WHERE type = '充电站支出' AND date BETWEEN %s AND %s
-        GROUP BY sub_type
-        ORDER BY total DESC
-        """
-        charging_expense_result = BaseDAO.execute_query(charging_expense_query, (start_date, end_date))
-        
-        # 添加充电站支出的子节点和链接
-        for item in charging_expense_result:
-            sub_type = item['sub_type']
-            amount = float(item['total'])
-            # 添加子节点
-            nodes.append({'name': sub_type})
-            # 添加从充电站支出到子类型的链接
-            links.append({
-                'source': '充电站支出',
-                'target': sub_type,
-                'value': amount
+                'target': expense_type,
+                'value': total
             })
         
-        # 3. 获取其他支出的详细分类
-        other_expense_query = """
-        SELECT 
-            CASE 
-                WHEN description LIKE '%人工%' OR description LIKE '%工资%' OR description LIKE '%薪资%' THEN '人力成本'
-                WHEN description LIKE '%平台%' OR description LIKE '%系统%' OR description LIKE '%服务器%' THEN '平台运营'
-                WHEN description LIKE '%营销%' OR description LIKE '%推广%' OR description LIKE '%广告%' THEN '市场营销'
-                ELSE '其他运营支出'
-            END as sub_type,
-            COALESCE(SUM(amount), 0) as total
-        FROM expense
-        WHERE type = '其他支出' AND date BETWEEN %s AND %s
-        GROUP BY sub_type
-        ORDER BY total DESC
-        """
-        other_expense_result = BaseDAO.execute_query(other_expense_query, (start_date, end_date))
-        
-        # 添加其他支出的子节点和链接
-        for item in other_expense_result:
-            sub_type = item['sub_type']
-            amount = float(item['total'])
-            # 添加子节点
-            nodes.append({'name': sub_type})
-            # 添加从其他支出到子类型的链接
-            links.append({
-                'source': '其他支出',
-                'target': sub_type,
-                'value': amount
-            })
+        # 添加车辆支出、充电站支出、其他支出的子节点和链接
+        for expense_type in ('车辆支出', '充电站支出', '其他支出'):
+            for sub_type, amount in sorted(sub_type_totals.get(expense_type, []), key=lambda item: item[1], reverse=True):
+                # 添加子节点
+                nodes.append({'name': sub_type})
+                # 添加从支出类型到子类型的链接
+                links.append({
+                    'source': expense_type,
+                    'target': sub_type,
+                    'value': amount
+                })
         
         # 构建最终返回数据
         result = {
@@ -301,29 +191,15 @@ def financial_metrics_forecast():
             start_date = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
             end_date = datetime.now().strftime('%Y-%m-%d')
         
-        # 获取按日期分组的收入数据
-        income_query = """
-        SELECT 
-            date,
-            COALESCE(SUM(amount), 0) as total_income
-        FROM income
-        WHERE date BETWEEN %s AND %s
-        GROUP BY date
-        ORDER BY date
-        """
-        income_data = BaseDAO.execute_query(income_query, (start_date, end_date))
-        
-        # 获取按日期分组的支出数据
-        expense_query = """
-        SELECT 
-            date,
-            COALESCE(SUM(amount), 0) as total_expense
-        FROM expense
-        WHERE date BETWEEN %s AND %s
-        GROUP BY date
-        ORDER BY date
-        """
-        expense_data = BaseDAO.execute_query(expense_query, (start_date, end_date))
+        # 按日期分组的收入和支出数据来自每日事实表
+        income_data = [
+            {'date': row['fact_date'], 'total_income': row['amount']}
+            for row in summarize('fact_daily_income', start_date, end_date, ('fact_date',))
+        ]
+        expense_data = [
+            {'date': row['fact_date'], 'total_expense': row['amount']}
+            for row in summarize('fact_daily_expense', start_date, end_date, ('fact_date',))
+        ]
         
         # 如果收入或支出数据为空，则抛出异常
         if not income_data or not expense_data:
@@ -463,31 +339,14 @@ def city_financial_data():
         """
         completion_data = BaseDAO.execute_query(completion_query, (f"{start_date} 00:00:00", f"{end_date} 23:59:59"))
         
-        # 查询各城市的人均订单金额
-        avg_order_query = """
-        SELECT 
-            o.city_code,
-            AVG(od.amount) as avg_amount
-        FROM orders o
-        JOIN order_details od ON o.order_number = od.order_id
-        WHERE o.city_code IS NOT NULL 
-        AND o.create_time BETWEEN %s AND %s
-        GROUP BY o.city_code
-        """
-        avg_order_data = BaseDAO.execute_query(avg_order_query, (f"{start_date} 00:00:00", f"{end_date} 23:59:59"))
-        
-        # 查询各城市的订单行驶里程
-        distance_query = """
-        SELECT 
-            o.city_code,
-            AVG(od.distance) as avg_distance
-        FROM orders o
-        JOIN order_details od ON o.order_number = od.order_id
-        WHERE o.city_code IS NOT NULL 
-        AND o.create_time BETWEEN %s AND %s
-        GROUP BY o.city_code
-        """
-        distance_data = BaseDAO.execute_query(distance_query, (f"{start_date} 00:00:00", f"{end_date} 23:59:59"))
+        # 各城市的平均订单金额和平均行驶里程来自每日订单事实表
+        avg_order_data = []
+        distance_data = []
+        for row in summarize('fact_daily_orders', start_date, end_date, ('city_code',)):
+            if not row['city_code'] or row['order_count'] <= 0:
+                continue
+            avg_order_data.append({'city_code': row['city_code'], 'avg_amount': round(row['amount'] / row['order_count'], 2)})
+            distance_data.append({'city_code': row['city_code'], 'avg_distance': round(row['distance'] / row['order_count'], 2)})
         
         # 查询各城市的用户注册量
         user_query = """
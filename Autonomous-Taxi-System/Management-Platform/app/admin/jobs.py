@@ -0,0 +1,54 @@
+from flask import Blueprint, jsonify, request, send_file
+from app.utils.jobs import get_job_manager
+import traceback
+
+# 创建蓝图
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+@jobs_bp.route('/', methods=['GET'])
+def list_jobs():
+    """列出后台任务，可按 type 和 status 过滤"""
+    try:
+        limit = request.args.get('limit', 100, type=int)
+        jobs = get_job_manager().list(
+            job_type=request.args.get('type') or None,
+            status=request.args.get('status') or None,
+            limit=max(1, min(limit, 500))
+        )
+        return jsonify({"status": "success", "data": jobs})
+    except Exception as e:
+        print(f"获取后台任务列表失败: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"status": "error", "message": f"获取后台任务列表失败: {str(e)}"}), 500
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """获取后台任务的状态、进度和结果"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "任务不存在或已过期"}), 404
+    return jsonify({"status": "success", "data": job})
+
+@jobs_bp.route('/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消排队中或运行中的后台任务"""
+    manager = get_job_manager()
+    if manager.get(job_id) is None:
+        return jsonify({"status": "error", "message": "任务不存在或已过期"}), 404
+    if not manager.cancel(job_id):
+        return jsonify({"status": "error", "message": "任务已结束，无法取消"}), 400
+    return jsonify({"status": "success", "message": "已发送取消请求", "data": manager.get(job_id)})
+
+@jobs_bp.route('/<job_id>/download', methods=['GET'])
+def download_job_file(job_id):
+    """下载后台任务生成的结果文件"""
+    info = get_job_manager().file_info(job_id)
+    if info is None:
+        return jsonify({"status": "error", "message": "任务没有可下载的文件或已过期"}), 404
+    path, filename, mimetype = info
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=filename)
+
+@jobs_bp.route('/metrics', methods=['GET'])
+def get_job_metrics():
+    """获取后台任务队列的运行指标"""
+    return jsonify({"status": "success", "data": get_job_manager().get_metrics()})
@@ -1,5 +1,9 @@
 from flask import Blueprint, render_template, jsonify, request, redirect, url_for
 from app.dao.map_obstacle_dao import MapObstacleDAO
+from app.utils.obstacle_index import get_obstacle_index
+from app.utils.routing import get_routing_engine
+from app.utils.travel_time import get_travel_time_tables
+import math
 import traceback
 import time
 
@@ -257,4 +261,116 @@ def api_delete():
             'success': False,
             'message': str(e),
             'traceback': error_traceback
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@map_obstacles_bp.route('/api/index_metrics', methods=['GET'])
+def api_index_metrics():
+    """API: 障碍物占用栅格索引的编译情况"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_obstacle_index().get_metrics()
+        })
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        print(f"获取障碍物索引指标API错误: {error_traceback}")
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'traceback': error_traceback
+        }), 500
+
+
+@map_obstacles_bp.route('/api/route', methods=['GET'])
+def api_route():
+    """API: 规划两点之间的避障路线"""
+    try:
+        city_code = request.args.get('city_code')
+        coordinates = [request.args.get(name, type=float) for name in ('start_x', 'start_y', 'end_x', 'end_y')]
+        if not city_code or any(value is None for value in coordinates):
+            return jsonify({
+                'success': False,
+                'message': '缺少必要参数'
+            }), 400
+        route = get_routing_engine().route(city_code, *coordinates)
+        return jsonify({
+            'success': True,
+            'data': route
+        })
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        print(f"规划路线API错误: {error_traceback}")
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'traceback': error_traceback
+        }), 500
+
+
+@map_obstacles_bp.route('/api/route_metrics', methods=['GET'])
+def api_route_metrics():
+    """API: 路径规划服务的缓存命中和规划耗时"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_routing_engine().get_metrics()
+        })
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        print(f"获取路径规划指标API错误: {error_traceback}")
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'traceback': error_traceback
+        }), 500
+
+
+@map_obstacles_bp.route('/api/travel_distance', methods=['GET'])
+def api_travel_distance():
+    """API: 查行驶距离表得到两点之间的避障行驶距离（表未生成时为直线距离）"""
+    try:
+        city_code = request.args.get('city_code')
+        coordinates = [request.args.get(name, type=float) for name in ('start_x', 'start_y', 'end_x', 'end_y')]
+        if not city_code or any(value is None for value in coordinates):
+            return jsonify({
+                'success': False,
+                'message': '缺少必要参数'
+            }), 400
+        table = get_travel_time_tables().get_table(city_code)
+        if table is not None:
+            distance, source = table.distance(*coordinates), 'table'
+        else:
+            distance, source = math.hypot(coordinates[2] - coordinates[0], coordinates[3] - coordinates[1]), 'straight'
+        return jsonify({
+            'success': True,
+            'data': {
+                'distance': distance if math.isfinite(distance) else None,
+                'source': source
+            }
+        })
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        print(f"查询行驶距离API错误: {error_traceback}")
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'traceback': error_traceback
+        }), 500
+
+
+@map_obstacles_bp.route('/api/travel_time_metrics', methods=['GET'])
+def api_travel_time_metrics():
+    """API: 行驶距离表的生成和命中情况"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_travel_time_tables().get_metrics()
+        })
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        print(f"获取行驶距离表指标API错误: {error_traceback}")
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'traceback': error_traceback
+        }), 500
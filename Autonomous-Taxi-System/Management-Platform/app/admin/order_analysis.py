@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request
 import json
 import random
 from app.dao.base_dao import BaseDAO
+from app.utils.rollups import summarize
 from datetime import datetime, timedelta
 
 # 创建订单分析的蓝图 - 注意这里不指定url_prefix，因为会由admin蓝图自动添加前缀
@@ -113,17 +114,9 @@ def get_basic_metrics(start_date, end_date):
     ))
     completion_rate = round(float(completion_rate_result[0]['completion_rate'] if completion_rate_result and completion_rate_result[0]['completion_rate'] else 0), 1)
     
-    # 平均订单金额
-    avg_amount_query = """
-    SELECT AVG(amount) as avg_amount 
-    FROM order_details 
-    WHERE created_at BETWEEN %s AND %s
-    """
-    amount_result = BaseDAO.execute_query(avg_amount_query, (
-        start_date.strftime('%Y-%m-%d %H:%M:%S'), 
-        end_date.strftime('%Y-%m-%d %H:%M:%S')
-    ))
-    avg_amount = round(float(amount_result[0]['avg_amount'] if amount_result and amount_result[0]['avg_amount'] else 0), 2)
+    # 平均订单金额（来自每日订单事实表）
+    order_totals = summarize('fact_daily_orders', start_date, end_date)[0]
+    avg_amount = round(order_totals['amount'] / order_totals['order_count'], 2) if order_totals['order_count'] > 0 else 0
     
     # 订单完成时长(分钟)
     duration_query = """
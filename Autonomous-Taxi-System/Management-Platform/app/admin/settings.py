@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, jsonify
 from app.extensions import db
 from app.dao.system_parameter_dao import SystemParameterDAO
+from app.utils.db_pool import get_pool_metrics
 import json
 import traceback
 
@@ -153,4 +154,20 @@ def save_city_zoom_levels():
         return jsonify({
             'status': 'error',
             'message': f'保存城市缩放级别设置失败: {str(e)}'
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@settings_bp.route('/api/db_pool_metrics')
+def db_pool_metrics():
+    """获取数据库连接池运行指标API"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'message': '成功获取连接池指标',
+            'data': get_pool_metrics()
+        })
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({
+            'status': 'error',
+            'message': f'获取连接池指标失败: {str(e)}'
+        }), 500
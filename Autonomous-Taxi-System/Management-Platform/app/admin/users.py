@@ -7,7 +7,8 @@ import pandas as pd
 import io
 import tempfile
 import os
-from sqlalchemy.sql import func
+from app.utils.jobs import async_export
+from app.utils.user_cohorts import get_user_cohorts, invalidate_user_cohorts, CHANNELS as USER_CHANNELS, AGE_BUCKETS, CREDIT_LABELS
 from app.utils.flash_helper import flash_success, flash_error, flash_warning, flash_info, flash_add_success, flash_update_success, flash_delete_success
 
 # 导入PDF生成相关库
@@ -146,6 +147,7 @@ def get_user_details(user_id):
 
 # 导出用户数据到Excel
 @users_bp.route('/export')
+@async_export('export_users', '导出用户数据')
 def export_users():
     users = User.query.all()
     users_data = [user.to_dict() for user in users]
@@ -206,6 +208,7 @@ def add_user():
             )
             db.session.add(user)
             db.session.commit()
+            invalidate_user_cohorts()
             flash_success('用户添加成功！')
             return redirect(url_for('users.index'))
         except Exception as e:
@@ -311,6 +314,7 @@ def delete_user(user_id):
         # 直接删除用户,不需要处理vehicle_logs表,因为没有关联关系
         db.session.delete(user)
         db.session.commit()
+        invalidate_user_cohorts()
         
         # 检查是否是AJAX请求
         is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
@@ -591,132 +595,29 @@ def analytics():
         return redirect(url_for('users.index'))
 
 def calculate_user_tags():
-    """计算用户标签分布"""
-    # 获取所有有标签的用户
-    users_with_tags = User.query.filter(User.tags.isnot(None)).all()
-    
-    # 统计各标签出现次数
-    tag_counts = {}
-    for user in users_with_tags:
-        if not user.tags:
-            continue
-            
-        # 将标签以逗号分隔
-        user_tags = user.tags.split(',')
-        for tag in user_tags:
-            tag = tag.strip()
-            if tag:
-                if tag in tag_counts:
-                    tag_counts[tag] += 1
-                else:
-                    tag_counts[tag] = 1
-    
-    # 转换为前端需要的格式并按出现次数排序
-    result = [{"name": tag, "count": count} for tag, count in tag_counts.items()]
-    result.sort(key=lambda x: x['count'], reverse=True)
-    
-    # 只返回前50个标签
-    return result[:50]
+    """计算用户标签分布（只返回前50个标签）"""
+    return get_user_cohorts().tag_counts(50)
 
 def calculate_retention_rates():
     """计算最近6个月的用户留存率数据"""
-    now = datetime.now()
-    retention_data = {
-        'months': [],
-        'one_month_retention': [],
-        'three_month_retention': [],
-        'six_month_retention': []
-    }
-    
-    # 计算最近6个月的月份标签
-    for i in range(5, -1, -1):
-        # 生成月份标签
-        month_label = f'{6-i}个月前'
-        retention_data['months'].append(month_label)
-        
-        # 当前月份的起始日期
-        current_month_date = now.replace(day=1) - relativedelta(months=i)
-        
-        # 计算本月对应的过去30天区间
-        last_30_days_end = now
-        if i > 0:  # 非当前月需要往前推
-            last_30_days_end = now - relativedelta(months=i)
-        last_30_days_start = last_30_days_end - timedelta(days=30)
-        
-        # 计算1个月留存：30-60天前注册的用户中，最近30天内有登录记录的比例
-        one_month_reg_start = last_30_days_start - timedelta(days=30)  # 60天前
-        one_month_reg_end = last_30_days_start  # 30天前
-        
-        users_30_60_days_ago = User.query.filter(
-            User.registration_time >= one_month_reg_start,
-            User.registration_time < one_month_reg_end
-        ).count()
-        
-        retained_one_month = User.query.filter(
-            User.registration_time >= one_month_reg_start,
-            User.registration_time < one_month_reg_end,
-            User.last_login_time >= last_30_days_start,
-            User.last_login_time <= last_30_days_end
-        ).count()
-        
-        one_month_rate = round((retained_one_month / users_30_60_days_ago) * 100, 1) if users_30_60_days_ago > 0 else 0
-        retention_data['one_month_retention'].append(one_month_rate)
-        
-        # 计算3个月留存：90-120天前注册的用户中，最近30天内有登录记录的比例
-        three_month_reg_start = last_30_days_start - timedelta(days=90)  # 120天前
-        three_month_reg_end = last_30_days_start - timedelta(days=60)  # 90天前
-        
-        users_90_120_days_ago = User.query.filter(
-            User.registration_time >= three_month_reg_start,
-            User.registration_time < three_month_reg_end
-        ).count()
-        
-        retained_three_month = User.query.filter(
-            User.registration_time >= three_month_reg_start,
-            User.registration_time < three_month_reg_end,
-            User.last_login_time >= last_30_days_start,
-            User.last_login_time <= last_30_days_end
-        ).count()
-        
-        three_month_rate = round((retained_three_month / users_90_120_days_ago) * 100, 1) if users_90_120_days_ago > 0 else 0
-        retention_data['three_month_retention'].append(three_month_rate)
-        
-        # 计算6个月留存：180-210天前注册的用户中，最近30天内有登录记录的比例
-        six_month_reg_start = last_30_days_start - timedelta(days=180)  # 210天前
-        six_month_reg_end = last_30_days_start - timedelta(days=150)  # 180天前
-        
-        users_180_210_days_ago = User.query.filter(
-            User.registration_time >= six_month_reg_start,
-            User.registration_time < six_month_reg_end
-        ).count()
-        
-        retained_six_month = User.query.filter(
-            User.registration_time >= six_month_reg_start,
-            User.registration_time < six_month_reg_end,
-            User.last_login_time >= last_30_days_start,
-            User.last_login_time <= last_30_days_end
-        ).count()
-        
-        six_month_rate = round((retained_six_month / users_180_210_days_ago) * 100, 1) if users_180_210_days_ago > 0 else 0
-        retention_data['six_month_retention'].append(six_month_rate)
-    
-    return retention_data
+    cohorts = get_user_cohorts()
+    return cohorts.memoize('retention_rates', lambda: cohorts.retention_matrix(6))
 
 def get_analytics_data():
-    """获取用户数据分析所需的数据"""
-    now = datetime.now()
+    """获取用户数据分析所需的数据（基于当天的用户分析快照，同一天内只计算一次）"""
+    cohorts = get_user_cohorts()
+    return cohorts.memoize('analytics_data', lambda: _compute_analytics_data(cohorts))
+
+def _compute_analytics_data(cohorts):
+    now = cohorts.now
     thirty_days_ago = now - timedelta(days=30)
     sixty_days_ago = now - timedelta(days=60)
     ninety_days_ago = now - timedelta(days=90)
     last_year = now - timedelta(days=365)
     
-    # 计算当前月份和年份
-    current_month = now.month
-    current_year = now.year
-    
     # 计算用户总数和同比增长率
-    total_users = User.query.count()
-    users_last_year = User.query.filter(User.registration_time <= last_year).count()
+    total_users = cohorts.total
+    users_last_year = cohorts.registered(end=last_year, end_inclusive=True)
     if users_last_year > 0:
         yoy_growth = round(((total_users - users_last_year) / users_last_year) * 100, 1)
     else:
@@ -727,9 +628,8 @@ def get_analytics_data():
     last_month_end = this_month_start - timedelta(days=1)
     last_month_start = last_month_end.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    new_users_this_month = User.query.filter(User.registration_time >= this_month_start).count()
-    new_users_last_month = User.query.filter(User.registration_time >= last_month_start,
-                                           User.registration_time < this_month_start).count()
+    new_users_this_month = cohorts.registered(this_month_start)
+    new_users_last_month = cohorts.registered(last_month_start, this_month_start)
     
     if new_users_last_month > 0:
         mom_growth = round(((new_users_this_month - new_users_last_month) / new_users_last_month) * 100, 1)
@@ -737,16 +637,15 @@ def get_analytics_data():
         mom_growth = 100
     
     # 计算用户活跃率
-    active_users = User.query.filter(User.last_login_time >= thirty_days_ago).count()
+    active_users = cohorts.logged_in(thirty_days_ago)
     if total_users > 0:
         activity_rate = round((active_users / total_users) * 100, 1)
     else:
         activity_rate = 0
     
     # 计算上个月的活跃率，用于环比计算
-    active_users_last_month = User.query.filter(User.last_login_time >= sixty_days_ago, 
-                                              User.last_login_time < thirty_days_ago).count()
-    users_last_month = User.query.filter(User.registration_time < thirty_days_ago).count()
+    active_users_last_month = cohorts.logged_in(sixty_days_ago, thirty_days_ago)
+    users_last_month = cohorts.registered(end=thirty_days_ago)
     
     if users_last_month > 0:
         activity_rate_last_month = (active_users_last_month / users_last_month) * 100
@@ -755,11 +654,7 @@ def get_analytics_data():
         activity_rate_change = 0
     
     # 计算用户留存率
-    users_30_60_days_ago = User.query.filter(User.registration_time >= sixty_days_ago,
-                                           User.registration_time < thirty_days_ago).count()
-    retained_users = User.query.filter(User.registration_time >= sixty_days_ago,
-                                     User.registration_time < thirty_days_ago,
-                                     User.last_login_time >= thirty_days_ago).count()
+    users_30_60_days_ago, retained_users = cohorts.retained(sixty_days_ago, thirty_days_ago, thirty_days_ago)
     
     if users_30_60_days_ago > 0:
         retention_rate = round((retained_users / users_30_60_days_ago) * 100, 1)
@@ -767,12 +662,9 @@ def get_analytics_data():
         retention_rate = 0
     
     # 计算上个月的留存率，用于环比计算
-    users_60_90_days_ago = User.query.filter(User.registration_time >= ninety_days_ago,
-                                           User.registration_time < sixty_days_ago).count()
-    retained_users_last_month = User.query.filter(User.registration_time >= ninety_days_ago,
-                                                User.registration_time < sixty_days_ago,
-                                                User.last_login_time >= sixty_days_ago,
-                                                User.last_login_time < thirty_days_ago).count()
+    users_60_90_days_ago, retained_users_last_month = cohorts.retained(
+        ninety_days_ago, sixty_days_ago, sixty_days_ago, thirty_days_ago
+    )
     
     if users_60_90_days_ago > 0:
         retention_rate_last_month = (retained_users_last_month / users_60_90_days_ago) * 100
@@ -780,30 +672,6 @@ def get_analytics_data():
     else:
         retention_rate_change = 0
     
-    # 生成近12个月用户增长趋势数据
-    growth_trend_data = generate_growth_trend_data()
-    
-    # 计算用户注册渠道分布
-    channel_distribution = calculate_channel_distribution()
-    
-    # 计算用户年龄分布
-    age_distribution = calculate_age_distribution()
-    
-    # 计算用户性别分布
-    gender_distribution = calculate_gender_distribution()
-    
-    # 计算用户信用分分布
-    credit_score_distribution = calculate_credit_score_distribution()
-    
-    # 计算用户地理分布
-    geographic_distribution = calculate_geographic_distribution()
-    
-    # 计算用户标签分布
-    user_tags = calculate_user_tags()
-    
-    # 计算用户留存率数据
-    retention_data = calculate_retention_rates()
-    
     # 返回所有数据
     return {
         'total_users': total_users,
@@ -814,99 +682,42 @@ def get_analytics_data():
         'activity_rate_change': activity_rate_change,
         'retention_rate': retention_rate,
         'retention_rate_change': retention_rate_change,
-        'growth_trend_data': growth_trend_data,
-        'channel_distribution': channel_distribution,
-        'age_distribution': age_distribution,
-        'gender_distribution': gender_distribution,
-        'credit_score_distribution': credit_score_distribution,
-        'geographic_distribution': geographic_distribution,
-        'user_tags': user_tags,
-        'retention_data': retention_data
+        'growth_trend_data': generate_growth_trend_data(),
+        'channel_distribution': calculate_channel_distribution(),
+        'age_distribution': calculate_age_distribution(),
+        'gender_distribution': calculate_gender_distribution(),
+        'credit_score_distribution': calculate_credit_score_distribution(),
+        'geographic_distribution': calculate_geographic_distribution(),
+        'user_tags': calculate_user_tags(),
+        'retention_data': calculate_retention_rates()
     }
 
 def generate_growth_trend_data():
     """生成近12个月用户增长趋势数据"""
-    now = datetime.now()
-    months = []
-    new_users = []
-    active_users = []
-    
-    for i in range(11, -1, -1):
-        # 计算月份
-        month_date = now.replace(day=1) - relativedelta(months=i)
-        next_month = month_date + relativedelta(months=1)
-        
-        # 添加月份标签
-        month_label = month_date.strftime('%Y年%m月')
-        months.append(month_label)
-        
-        # 计算该月新增用户数
-        month_new_users = User.query.filter(
-            User.registration_time >= month_date,
-            User.registration_time < next_month
-        ).count()
-        new_users.append(month_new_users)
-        
-        # 计算该月活跃用户数
-        month_active_users = User.query.filter(
-            User.last_login_time >= month_date,
-            User.last_login_time < next_month
-        ).count()
-        active_users.append(month_active_users)
-    
+    month_starts, new_users, active_users = get_user_cohorts().monthly_trend(12)
     return {
-        'months': months,
+        'months': [month_start.strftime('%Y年%m月') for month_start in month_starts],
         'new_users': new_users,
         'active_users': active_users
     }
 
 def calculate_channel_distribution():
     """计算用户注册渠道分布"""
-    channels = ['手机应用', '网站', '微信小程序', '合作推广', '其他']
-    counts = []
-    
-    for channel in channels:
-        count = User.query.filter(User.registration_channel == channel).count()
-        counts.append(count)
-    
     return {
-        'channels': channels,
-        'counts': counts
+        'channels': list(USER_CHANNELS),
+        'counts': get_user_cohorts().channel_counts(USER_CHANNELS)
     }
 
 def calculate_age_distribution():
     """计算用户年龄分布"""
-    labels = ['18-24岁', '25-34岁', '35-44岁', '45-54岁', '55岁以上']
-    data = [0, 0, 0, 0, 0]
-    
-    users = User.query.all()
-    for user in users:
-        if not user.birth_date:
-            continue
-            
-        age = (datetime.now().date() - user.birth_date).days // 365
-        
-        if 18 <= age <= 24:
-            data[0] += 1
-        elif 25 <= age <= 34:
-            data[1] += 1
-        elif 35 <= age <= 44:
-            data[2] += 1
-        elif 45 <= age <= 54:
-            data[3] += 1
-        elif age >= 55:
-            data[4] += 1
-    
     return {
-        'labels': labels,
-        'data': data
+        'labels': [label for label, _, _ in AGE_BUCKETS],
+        'data': get_user_cohorts().age_counts()
     }
 
 def calculate_gender_distribution():
     """计算用户性别分布"""
-    male_count = User.query.filter(User.gender == '男').count()
-    female_count = User.query.filter(User.gender == '女').count()
-    other_count = User.query.filter(User.gender == '其他').count()
+    male_count, female_count, other_count = get_user_cohorts().gender_counts()
     
     total = male_count + female_count + other_count
     if total > 0:
@@ -923,33 +734,15 @@ def calculate_gender_distribution():
 
 def calculate_credit_score_distribution():
     """计算用户信用分分布"""
-    labels = ['0-30', '31-60', '61-90', '91-120', '121-150']
-    data = [0, 0, 0, 0, 0]
-    
-    users = User.query.all()
-    for user in users:
-        score = user.credit_score or 0
-        
-        if score < 30:
-            data[0] += 1
-        elif 30 <= score < 60:
-            data[1] += 1
-        elif 60 <= score < 90:
-            data[2] += 1
-        elif 90 <= score < 120:
-            data[3] += 1
-        elif score >= 120:
-            data[4] += 1
-    
     return {
-        'labels': labels,
-        'data': data
+        'labels': list(CREDIT_LABELS),
+        'data': get_user_cohorts().credit_counts()
     }
 
 def calculate_geographic_distribution():
     """计算用户地理分布"""
-    # 获取所有有注册城市的用户
-    users_with_location = User.query.filter(User.registration_city.isnot(None)).all()
+    # 各注册城市的用户数
+    city_counts = get_user_cohorts().city_counts()
     
     # 城市到省份的映射表
     city_to_province = {
@@ -1007,11 +800,7 @@ def calculate_geographic_distribution():
     
     # 统计各省份用户数量
     province_counts = {}
-    for user in users_with_location:
-        city = user.registration_city
-        if not city:
-            continue
-            
+    for city, count in city_counts.items():
         # 先通过城市到省份的映射表转换为省份
         province = city_to_province.get(city)
         
@@ -1021,11 +810,7 @@ def calculate_geographic_distribution():
             
         # 再通过省份映射表转换为标准格式
         mapped_province = province_name_map.get(province, province)
-        
-        if mapped_province in province_counts:
-            province_counts[mapped_province] += 1
-        else:
-            province_counts[mapped_province] = 1
+        province_counts[mapped_province] = province_counts.get(mapped_province, 0) + count
     
     # 转换为前端需要的格式
     result = [{"name": province, "value": count} for province, count in province_counts.items()]
@@ -1107,574 +892,265 @@ def get_china_geo_json():
     }
 
 # 导出用户分析报表 (Excel格式)
-@users_bp.route('/export_analytics_report')
-def export_analytics_report():
-    """导出用户分析报表 (Excel格式)"""
-    try:
-        # 从数据库获取真实数据
-        now = datetime.now()
-        thirty_days_ago = now - timedelta(days=30)
-        sixty_days_ago = now - timedelta(days=60)
-        ninety_days_ago = now - timedelta(days=90)
-        last_year = now - timedelta(days=365)
-        
-        # 计算当前月份和年份
-        current_month = now.month
-        current_year = now.year
-        
-        # 计算用户总数和同比增长率
-        total_users = User.query.count()
-        users_last_year = User.query.filter(User.registration_time <= last_year).count()
-        if users_last_year > 0:
-            yoy_growth = ((total_users - users_last_year) / users_last_year) * 100
-        else:
-            yoy_growth = 100
-        
-        # 计算本月新增用户数和环比增长率
-        this_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        new_users_this_month = User.query.filter(
-            User.registration_time >= this_month_start,
-            User.registration_time <= now
-        ).count()
-        
-        # 计算上月新增用户
-        last_month = now - relativedelta(months=1)
-        last_month_start = last_month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        last_month_end = this_month_start - timedelta(seconds=1)
-        new_users_last_month = User.query.filter(
-            User.registration_time >= last_month_start,
-            User.registration_time <= last_month_end
-        ).count()
-        
-        # 计算环比增长
-        if new_users_last_month > 0:
-            mom_growth = ((new_users_this_month - new_users_last_month) / new_users_last_month) * 100
-        else:
-            mom_growth = 100
-        
-        # 计算用户活跃率
-        active_users = User.query.filter(User.last_login_time >= thirty_days_ago).count()
-        activity_rate = (active_users / total_users) * 100 if total_users > 0 else 0
-        
-        # 计算平均用户消费/余额
-        avg_balance = db.session.query(func.avg(User.balance)).scalar() or 0
-        
-        # 计算近12个月的用户增长数据
-        months = []
-        user_growth = []
-        monthly_active_users = []
-        
-        for i in range(11, -1, -1):
-            # 计算当前循环月份的开始和结束日期
-            month_start = (now - relativedelta(months=i)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            if i > 0:
-                next_month = (now - relativedelta(months=i-1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                month_end = next_month - timedelta(seconds=1)
-            else:
-                month_end = now
-            
-            # 获取月份名称
-            if month_start.year < now.year:
-                month_label = f'上年{month_start.month}月'
-            else:
-                month_label = f'本年{month_start.month}月'
-            months.append(month_label)
-            
-            # 统计每月新增用户数
-            monthly_new_users = User.query.filter(
-                User.registration_time >= month_start,
-                User.registration_time <= month_end
-            ).count()
-            user_growth.append(monthly_new_users)
-            
-            # 统计每月活跃用户
-            monthly_active = User.query.filter(
-                User.last_login_time >= month_start,
-                User.last_login_time <= month_end
-            ).count()
-            monthly_active_users.append(monthly_active)
-        
-        # 计算用户注册渠道分布
-        channel_distribution = {}
-        channels = ['手机应用', '网站', '微信小程序', '合作推广', '其他']
-        
-        for channel in channels:
-            count = User.query.filter(User.registration_channel == channel).count()
-            percentage = round((count / total_users) * 100, 1) if total_users > 0 else 0
-            channel_distribution[channel] = percentage
-        
-        # 计算用户年龄分布
-        age_distribution = {}
-        age_labels = ['18-24岁', '25-34岁', '35-44岁', '45-54岁', '55岁以上']
-        age_counts = [0, 0, 0, 0, 0]
-        
-        users_with_birth_date = User.query.filter(User.birth_date != None).all()
-        for user in users_with_birth_date:
-            age = current_year - user.birth_date.year
-            if 18 <= age <= 24:
-                age_counts[0] += 1
-            elif 25 <= age <= 34:
-                age_counts[1] += 1
-            elif 35 <= age <= 44:
-                age_counts[2] += 1
-            elif 45 <= age <= 54:
-                age_counts[3] += 1
-            elif age >= 55:
-                age_counts[4] += 1
-        
-        for i, label in enumerate(age_labels):
-            age_distribution[label] = age_counts[i]
-        
-        # 计算性别比例
-        gender_distribution = {}
-        male_count = User.query.filter(User.gender == '男').count()
-        female_count = User.query.filter(User.gender == '女').count()
-        other_gender_count = User.query.filter(User.gender == '其他').count()
-        
-        total_with_gender = male_count + female_count + other_gender_count
-        if total_with_gender > 0:
-            gender_distribution['男性'] = round((male_count / total_with_gender) * 100, 1)
-            gender_distribution['女性'] = round((female_count / total_with_gender) * 100, 1)
-            gender_distribution['其他'] = round((other_gender_count / total_with_gender) * 100, 1)
-        else:
-            gender_distribution = {'男性': 0, '女性': 0, '其他': 0}
-        
-        # 计算信用分分布
-        credit_score_distribution = {}
-        credit_labels = ['0-30', '31-60', '61-90', '91-120', '121-150']
-        credit_counts = [0, 0, 0, 0, 0]
-        
-        users_with_credit = User.query.all()
-        for user in users_with_credit:
-            score = user.credit_score or 0
-            if score < 30:
-                credit_counts[0] += 1
-            elif 30 <= score < 60:
-                credit_counts[1] += 1
-            elif 60 <= score < 90:
-                credit_counts[2] += 1
-            elif 90 <= score < 120:
-                credit_counts[3] += 1
-            elif score >= 120:
-                credit_counts[4] += 1
-        
-        for i, label in enumerate(credit_labels):
-            credit_score_distribution[label] = credit_counts[i]
-        
-        # 计算用户地理分布
-        geographic_distribution = {}
-        provinces = [
-            '北京', '天津', '上海', '重庆', '河北', '河南', '云南', '辽宁', '黑龙江', 
-            '湖南', '安徽', '山东', '江苏', '浙江', '江西', '湖北', '广西', '甘肃', 
-            '山西', '内蒙古', '陕西', '吉林', '福建', '贵州', '广东', '青海', '西藏', 
-            '四川', '宁夏', '海南', '台湾', '香港', '澳门'
-        ]
-        
-        # 城市到省份的映射表
-        city_to_province = {
-            '沈阳市': '辽宁',
-            '上海市': '上海',
-            '北京市': '北京',
-            '广州市': '广东',
-            '深圳市': '广东',
-            '杭州市': '浙江',
-            '南京市': '江苏',
-            '成都市': '四川',
-            '重庆市': '重庆',
-            '武汉市': '湖北',
-            '西安市': '陕西',
-            # 可以添加更多城市到省份的映射
-        }
-        
-        # 省份名称映射（转换为地图要求的名称格式）
-        province_name_map = {
-            '北京': '北京市',
-            '天津': '天津市',
-            '上海': '上海市',
-            '重庆': '重庆市',
-            '河北': '河北省',
-            '山西': '山西省',
-            '辽宁': '辽宁省',
-            '吉林': '吉林省',
-            '黑龙江': '黑龙江省',
-            '江苏': '江苏省',
-            '浙江': '浙江省',
-            '安徽': '安徽省',
-            '福建': '福建省',
-            '江西': '江西省',
-            '山东': '山东省',
-            '河南': '河南省',
-            '湖北': '湖北省',
-            '湖南': '湖南省',
-            '广东': '广东省',
-            '海南': '海南省',
-            '四川': '四川省',
-            '贵州': '贵州省',
-            '云南': '云南省',
-            '陕西': '陕西省',
-            '甘肃': '甘肃省',
-            '青海': '青海省',
-            '台湾': '台湾省',
-            '内蒙古': '内蒙古自治区',
-            '广西': '广西壮族自治区',
-            '西藏': '西藏自治区',
-            '宁夏': '宁夏回族自治区',
-            '新疆': '新疆维吾尔自治区',
-            '香港': '香港特别行政区',
-            '澳门': '澳门特别行政区'
+def _collect_report_metrics():
+    """汇总Excel/PDF用户分析报表所需的数据（基于当天的用户分析快照，同一天内只计算一次）"""
+    cohorts = get_user_cohorts()
+    return cohorts.memoize('report_metrics', lambda: _compute_report_metrics(cohorts))
+
+def _compute_report_metrics(cohorts):
+    now = cohorts.now
+    thirty_days_ago = now - timedelta(days=30)
+    last_year = now - timedelta(days=365)
+    
+    # 计算用户总数和同比增长率
+    total_users = cohorts.total
+    users_last_year = cohorts.registered(end=last_year, end_inclusive=True)
+    if users_last_year > 0:
+        yoy_growth = ((total_users - users_last_year) / users_last_year) * 100
+    else:
+        yoy_growth = 100
+    
+    # 计算本月新增用户数和上月新增用户
+    this_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last_month_start = (now - relativedelta(months=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    new_users_this_month = cohorts.registered(this_month_start, now, end_inclusive=True)
+    new_users_last_month = cohorts.registered(last_month_start, this_month_start)
+    
+    # 计算环比增长
+    if new_users_last_month > 0:
+        mom_growth = ((new_users_this_month - new_users_last_month) / new_users_last_month) * 100
+    else:
+        mom_growth = 100
+    
+    # 计算用户活跃率
+    active_users = cohorts.logged_in(thirty_days_ago)
+    activity_rate = (active_users / total_users) * 100 if total_users > 0 else 0
+    
+    # 计算平均用户消费/余额
+    avg_balance = cohorts.average_balance()
+    
+    # 计算近12个月的用户增长数据
+    month_starts, user_growth, monthly_active_users = cohorts.monthly_trend(12)
+    months = [
+        f'上年{month_start.month}月' if month_start.year < now.year else f'本年{month_start.month}月'
+        for month_start in month_starts
+    ]
+    
+    # 计算用户注册渠道分布
+    channels = list(USER_CHANNELS)
+    channel_distribution = {}
+    for channel, count in zip(channels, cohorts.channel_counts(channels)):
+        channel_distribution[channel] = round((count / total_users) * 100, 1) if total_users > 0 else 0
+    
+    # 计算用户年龄分布（按出生年份计算年龄）
+    age_counts = cohorts.age_counts(by_year=True)
+    age_distribution = {label: count for (label, _, _), count in zip(AGE_BUCKETS, age_counts)}
+    
+    # 计算性别比例
+    male_count, female_count, other_gender_count = cohorts.gender_counts()
+    total_with_gender = male_count + female_count + other_gender_count
+    if total_with_gender > 0:
+        gender_distribution = {
+            '男性': round((male_count / total_with_gender) * 100, 1),
+            '女性': round((female_count / total_with_gender) * 100, 1),
+            '其他': round((other_gender_count / total_with_gender) * 100, 1)
         }
+    else:
+        gender_distribution = {'男性': 0, '女性': 0, '其他': 0}
+    
+    # 计算信用分分布
+    credit_counts = cohorts.credit_counts()
+    credit_score_distribution = dict(zip(CREDIT_LABELS, credit_counts))
+    
+    # 计算用户地理分布
+    geographic_distribution = {}
+    provinces = [
+        '北京', '天津', '上海', '重庆', '河北', '河南', '云南', '辽宁', '黑龙江', 
+        '湖南', '安徽', '山东', '江苏', '浙江', '江西', '湖北', '广西', '甘肃', 
+        '山西', '内蒙古', '陕西', '吉林', '福建', '贵州', '广东', '青海', '西藏', 
+        '四川', '宁夏', '海南', '台湾', '香港', '澳门'
+    ]
+    
+    # 城市到省份的映射表
+    city_to_province = {
+        '沈阳市': '辽宁',
+        '上海市': '上海',
+        '北京市': '北京',
+        '广州市': '广东',
+        '深圳市': '广东',
+        '杭州市': '浙江',
+        '南京市': '江苏',
+        '成都市': '四川',
+        '重庆市': '重庆',
+        '武汉市': '湖北',
+        '西安市': '陕西',
+        # 可以添加更多城市到省份的映射
+    }
+    
+    # 省份名称映射（转换为地图要求的名称格式）
+    province_name_map = {
+        '北京': '北京市',
+        '天津': '天津市',
+        '上海': '上海市',
+        '重庆': '重庆市',
+        '河北': '河北省',
+        '山西': '山西省',
+        '辽宁': '辽宁省',
+        '吉林': '吉林省',
+        '黑龙江': '黑龙江省',
+        '江苏': '江苏省',
+        '浙江': '浙江省',
+        '安徽': '安徽省',
+        '福建': '福建省',
+        '江西': '江西省',
+        '山东': '山东省',
+        '河南': '河南省',
+        '湖北': '湖北省',
+        '湖南': '湖南省',
+        '广东': '广东省',
+        '海南': '海南省',
+        '四川': '四川省',
+        '贵州': '贵州省',
+        '云南': '云南省',
+        '陕西': '陕西省',
+        '甘肃': '甘肃省',
+        '青海': '青海省',
+        '台湾': '台湾省',
+        '内蒙古': '内蒙古自治区',
+        '广西': '广西壮族自治区',
+        '西藏': '西藏自治区',
+        '宁夏': '宁夏回族自治区',
+        '新疆': '新疆维吾尔自治区',
+        '香港': '香港特别行政区',
+        '澳门': '澳门特别行政区'
+    }
+    
+    # 创建省份-用户数量映射字典
+    province_counts = {province: 0 for province in provinces}
+    
+    # 统计各省份用户数量
+    for city, count in cohorts.city_counts().items():
+        # 先通过城市到省份的映射表转换为省份
+        province = city_to_province.get(city)
         
-        # 创建省份-用户数量映射字典
-        province_counts = {province: 0 for province in provinces}
-        
-        # 获取所有有注册城市信息的用户
-        users_with_location = User.query.filter(User.registration_city != None, User.registration_city != '').all()
-        
-        # 统计各省份用户数量
-        for user in users_with_location:
-            city = user.registration_city
-            
-            # 先通过城市到省份的映射表转换为省份
-            province = city_to_province.get(city)
-            
-            # 如果城市不在映射表中，尝试直接使用（可能本身就是省份）
-            if not province:
-                province = city
-                
-            if province in province_counts:
-                province_counts[province] += 1
-        
-        # 将地理分布数据添加到导出数据中
-        for province, count in province_counts.items():
-            if count > 0:  # 只包含有用户的省份
-                # 使用映射转换省份名称
-                mapped_province = province_name_map.get(province, province)
-                geographic_distribution[mapped_province] = count
-        
-        # 创建多个数据表
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # 核心指标表
-            core_metrics = pd.DataFrame([
-                {"指标名称": "总用户数", "值": total_users, "同比增长": f"{round(yoy_growth, 1)}%"},
-                {"指标名称": "本月新增用户", "值": new_users_this_month, "环比增长": f"{round(mom_growth, 1)}%"},
-                {"指标名称": "用户活跃率", "值": f"{round(activity_rate, 1)}%", "环比变化": f"{'+' if activity_rate > 0 else ''}{round(activity_rate, 1)}%"},
-                {"指标名称": "平均用户余额", "值": f"¥{round(avg_balance, 2)}", "同比增长": ""}
-            ])
-            core_metrics.to_excel(writer, index=False, sheet_name='核心指标')
-            
-            # 用户增长趋势
-            growth_df = pd.DataFrame({
-                "月份": months,
-                "新增用户数": user_growth,
-                "活跃用户数": monthly_active_users
-            })
-            growth_df.to_excel(writer, index=False, sheet_name='用户增长趋势')
-            
-            # 用户注册渠道
-            channel_df = pd.DataFrame([
-                {"渠道": k, "占比": f"{v}%"} for k, v in channel_distribution.items()
-            ])
-            channel_df.to_excel(writer, index=False, sheet_name='注册渠道分布')
-            
-            # 用户年龄分布
-            age_df = pd.DataFrame([
-                {"年龄段": k, "用户数": v} for k, v in age_distribution.items()
-            ])
-            age_df.to_excel(writer, index=False, sheet_name='年龄分布')
-            
-            # 用户性别比例
-            gender_df = pd.DataFrame([
-                {"性别": k, "占比": f"{v}%"} for k, v in gender_distribution.items()
-            ])
-            gender_df.to_excel(writer, index=False, sheet_name='性别比例')
-            
-            # 信用分分布
-            credit_df = pd.DataFrame([
-                {"信用分范围": k, "用户数": v} for k, v in credit_score_distribution.items()
-            ])
-            credit_df.to_excel(writer, index=False, sheet_name='信用分分布')
+        # 如果城市不在映射表中，尝试直接使用（可能本身就是省份）
+        if not province:
+            province = city
             
-            # 地理分布
-            geo_df = pd.DataFrame([
-                {"省份": k, "用户数": v} for k, v in geographic_distribution.items()
-            ])
-            geo_df.to_excel(writer, index=False, sheet_name='地理分布')
-        
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'用户数据分析报表_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        )
-    except Exception as e:
-        # 清理图表文件
-        for chart_file in chart_files:
-            if os.path.exists(chart_file):
-                os.remove(chart_file)
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
-        raise e 
+        if province in province_counts:
+            province_counts[province] += count
+    
+    # 将地理分布数据添加到导出数据中
+    for province, count in province_counts.items():
+        if count > 0:  # 只包含有用户的省份
+            # 使用映射转换省份名称
+            mapped_province = province_name_map.get(province, province)
+            geographic_distribution[mapped_province] = count
+    
+    return {
+        'total_users': total_users,
+        'yoy_growth': yoy_growth,
+        'new_users_this_month': new_users_this_month,
+        'mom_growth': mom_growth,
+        'activity_rate': activity_rate,
+        'avg_balance': avg_balance,
+        'months': months,
+        'user_growth': user_growth,
+        'monthly_active_users': monthly_active_users,
+        'channel_distribution': channel_distribution,
+        'age_distribution': age_distribution,
+        'gender_distribution': gender_distribution,
+        'credit_score_distribution': credit_score_distribution,
+        'geographic_distribution': geographic_distribution
+    }
+
+@users_bp.route('/export_analytics_report')
+@async_export('export_analytics_report', '导出用户分析报表（Excel）')
+def export_analytics_report():
+    """导出用户分析报表 (Excel格式)"""
+    # 从当天的用户分析快照汇总报表数据
+    report = _collect_report_metrics()
+    
+    # 创建多个数据表
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        # 核心指标表
+        core_metrics = pd.DataFrame([
+            {"指标名称": "总用户数", "值": report['total_users'], "同比增长": f"{round(report['yoy_growth'], 1)}%"},
+            {"指标名称": "本月新增用户", "值": report['new_users_this_month'], "环比增长": f"{round(report['mom_growth'], 1)}%"},
+            {"指标名称": "用户活跃率", "值": f"{round(report['activity_rate'], 1)}%", "环比变化": f"{'+' if report['activity_rate'] > 0 else ''}{round(report['activity_rate'], 1)}%"},
+            {"指标名称": "平均用户余额", "值": f"¥{round(report['avg_balance'], 2)}", "同比增长": ""}
+        ])
+        core_metrics.to_excel(writer, index=False, sheet_name='核心指标')
+        
+        # 用户增长趋势
+        growth_df = pd.DataFrame({
+            "月份": report['months'],
+            "新增用户数": report['user_growth'],
+            "活跃用户数": report['monthly_active_users']
+        })
+        growth_df.to_excel(writer, index=False, sheet_name='用户增长趋势')
+        
+        # 用户注册渠道
+        channel_df = pd.DataFrame([
+            {"渠道": k, "占比": f"{v}%"} for k, v in report['channel_distribution'].items()
+        ])
+        channel_df.to_excel(writer, index=False, sheet_name='注册渠道分布')
+        
+        # 用户年龄分布
+        age_df = pd.DataFrame([
+            {"年龄段": k, "用户数": v} for k, v in report['age_distribution'].items()
+        ])
+        age_df.to_excel(writer, index=False, sheet_name='年龄分布')
+        
+        # 用户性别比例
+        gender_df = pd.DataFrame([
+            {"性别": k, "占比": f"{v}%"} for k, v in report['gender_distribution'].items()
+        ])
+        gender_df.to_excel(writer, index=False, sheet_name='性别比例')
+        
+        # 信用分分布
+        credit_df = pd.DataFrame([
+            {"信用分范围": k, "用户数": v} for k, v in report['credit_score_distribution'].items()
+        ])
+        credit_df.to_excel(writer, index=False, sheet_name='信用分分布')
+        
+        # 地理分布
+        geo_df = pd.DataFrame([
+            {"省份": k, "用户数": v} for k, v in report['geographic_distribution'].items()
+        ])
+        geo_df.to_excel(writer, index=False, sheet_name='地理分布')
+    
+    output.seek(0)
+    
+    return send_file(
+        output,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=f'用户数据分析报表_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    )
 
 # 导出用户分析报表 (PDF格式)
 @users_bp.route('/export_analytics_report_pdf')
+@async_export('export_analytics_report_pdf', '导出用户分析报表（PDF）')
 def export_analytics_report_pdf():
     """导出用户分析报表 (PDF格式)"""
     try:
-        # 从数据库获取真实数据
-        now = datetime.now()
-        thirty_days_ago = now - timedelta(days=30)
-        sixty_days_ago = now - timedelta(days=60)
-        ninety_days_ago = now - timedelta(days=90)
-        last_year = now - timedelta(days=365)
-        
-        # 计算当前月份和年份
-        current_month = now.month
-        current_year = now.year
-        
-        # 计算用户总数和同比增长率
-        total_users = User.query.count()
-        users_last_year = User.query.filter(User.registration_time <= last_year).count()
-        if users_last_year > 0:
-            yoy_growth = ((total_users - users_last_year) / users_last_year) * 100
-        else:
-            yoy_growth = 100
-        
-        # 计算本月新增用户数和环比增长率
-        this_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        new_users_this_month = User.query.filter(
-            User.registration_time >= this_month_start,
-            User.registration_time <= now
-        ).count()
-        
-        # 计算上月新增用户
-        last_month = now - relativedelta(months=1)
-        last_month_start = last_month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        last_month_end = this_month_start - timedelta(seconds=1)
-        new_users_last_month = User.query.filter(
-            User.registration_time >= last_month_start,
-            User.registration_time <= last_month_end
-        ).count()
-        
-        # 计算环比增长
-        if new_users_last_month > 0:
-            mom_growth = ((new_users_this_month - new_users_last_month) / new_users_last_month) * 100
-        else:
-            mom_growth = 100
-        
-        # 计算用户活跃率
-        active_users = User.query.filter(User.last_login_time >= thirty_days_ago).count()
-        activity_rate = (active_users / total_users) * 100 if total_users > 0 else 0
-        
-        # 计算平均用户消费/余额
-        avg_balance = db.session.query(func.avg(User.balance)).scalar() or 0
-        
-        # 计算近12个月的用户增长数据
-        months = []
-        user_growth = []
-        monthly_active_users = []
-        
-        for i in range(11, -1, -1):
-            # 计算当前循环月份的开始和结束日期
-            month_start = (now - relativedelta(months=i)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            if i > 0:
-                next_month = (now - relativedelta(months=i-1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                month_end = next_month - timedelta(seconds=1)
-            else:
-                month_end = now
-            
-            # 获取月份名称
-            if month_start.year < now.year:
-                month_label = f'上年{month_start.month}月'
-            else:
-                month_label = f'本年{month_start.month}月'
-            months.append(month_label)
-            
-            # 统计每月新增用户数
-            monthly_new_users = User.query.filter(
-                User.registration_time >= month_start,
-                User.registration_time <= month_end
-            ).count()
-            user_growth.append(monthly_new_users)
-            
-            # 统计每月活跃用户
-            monthly_active = User.query.filter(
-                User.last_login_time >= month_start,
-                User.last_login_time <= month_end
-            ).count()
-            monthly_active_users.append(monthly_active)
-        
-        # 计算用户注册渠道分布
-        channel_distribution = {}
-        channels = ['手机应用', '网站', '微信小程序', '合作推广', '其他']
-        
-        for channel in channels:
-            count = User.query.filter(User.registration_channel == channel).count()
-            percentage = round((count / total_users) * 100, 1) if total_users > 0 else 0
-            channel_distribution[channel] = percentage
-        
-        # 计算用户年龄分布
-        age_distribution = {}
-        age_labels = ['18-24岁', '25-34岁', '35-44岁', '45-54岁', '55岁以上']
-        age_counts = [0, 0, 0, 0, 0]
-        
-        users_with_birth_date = User.query.filter(User.birth_date != None).all()
-        for user in users_with_birth_date:
-            age = current_year - user.birth_date.year
-            if 18 <= age <= 24:
-                age_counts[0] += 1
-            elif 25 <= age <= 34:
-                age_counts[1] += 1
-            elif 35 <= age <= 44:
-                age_counts[2] += 1
-            elif 45 <= age <= 54:
-                age_counts[3] += 1
-            elif age >= 55:
-                age_counts[4] += 1
-        
-        for i, label in enumerate(age_labels):
-            age_distribution[label] = age_counts[i]
-        
-        # 计算性别比例
-        gender_distribution = {}
-        male_count = User.query.filter(User.gender == '男').count()
-        female_count = User.query.filter(User.gender == '女').count()
-        other_gender_count = User.query.filter(User.gender == '其他').count()
-        
-        total_with_gender = male_count + female_count + other_gender_count
-        if total_with_gender > 0:
-            gender_distribution['男性'] = round((male_count / total_with_gender) * 100, 1)
-            gender_distribution['女性'] = round((female_count / total_with_gender) * 100, 1)
-            gender_distribution['其他'] = round((other_gender_count / total_with_gender) * 100, 1)
-        else:
-            gender_distribution = {'男性': 0, '女性': 0, '其他': 0}
-        
-        # 计算信用分分布
-        credit_score_distribution = {}
-        credit_labels = ['0-30', '31-60', '61-90', '91-120', '121-150']
-        credit_counts = [0, 0, 0, 0, 0]
-        
-        users_with_credit = User.query.all()
-        for user in users_with_credit:
-            score = user.credit_score or 0
-            if score < 30:
-                credit_counts[0] += 1
-            elif 30 <= score < 60:
-                credit_counts[1] += 1
-            elif 60 <= score < 90:
-                credit_counts[2] += 1
-            elif 90 <= score < 120:
-                credit_counts[3] += 1
-            elif score >= 120:
-                credit_counts[4] += 1
-        
-        for i, label in enumerate(credit_labels):
-            credit_score_distribution[label] = credit_counts[i]
-        
-        # 计算用户地理分布
-        geographic_distribution = {}
-        provinces = [
-            '北京', '天津', '上海', '重庆', '河北', '河南', '云南', '辽宁', '黑龙江', 
-            '湖南', '安徽', '山东', '江苏', '浙江', '江西', '湖北', '广西', '甘肃', 
-            '山西', '内蒙古', '陕西', '吉林', '福建', '贵州', '广东', '青海', '西藏', 
-            '四川', '宁夏', '海南', '台湾', '香港', '澳门'
-        ]
-        
-        # 城市到省份的映射表
-        city_to_province = {
-            '沈阳市': '辽宁',
-            '上海市': '上海',
-            '北京市': '北京',
-            '广州市': '广东',
-            '深圳市': '广东',
-            '杭州市': '浙江',
-            '南京市': '江苏',
-            '成都市': '四川',
-            '重庆市': '重庆',
-            '武汉市': '湖北',
-            '西安市': '陕西',
-            # 可以添加更多城市到省份的映射
-        }
-        
-        # 省份名称映射（转换为地图要求的名称格式）
-        province_name_map = {
-            '北京': '北京市',
-            '天津': '天津市',
-            '上海': '上海市',
-            '重庆': '重庆市',
-            '河北': '河北省',
-            '山西': '山西省',
-            '辽宁': '辽宁省',
-            '吉林': '吉林省',
-            '黑龙江': '黑龙江省',
-            '江苏': '江苏省',
-            '浙江': '浙江省',
-            '安徽': '安徽省',
-            '福建': '福建省',
-            '江西': '江西省',
-            '山东': '山东省',
-            '河南': '河南省',
-            '湖北': '湖北省',
-            '湖南': '湖南省',
-            '广东': '广东省',
-            '海南': '海南省',
-            '四川': '四川省',
-            '贵州': '贵州省',
-            '云南': '云南省',
-            '陕西': '陕西省',
-            '甘肃': '甘肃省',
-            '青海': '青海省',
-            '台湾': '台湾省',
-            '内蒙古': '内蒙古自治区',
-            '广西': '广西壮族自治区',
-            '西藏': '西藏自治区',
-            '宁夏': '宁夏回族自治区',
-            '新疆': '新疆维吾尔自治区',
-            '香港': '香港特别行政区',
-            '澳门': '澳门特别行政区'
-        }
-        
-        # 创建省份-用户数量映射字典
-        province_counts = {province: 0 for province in provinces}
-        
-        # 获取所有有注册城市信息的用户
-        users_with_location = User.query.filter(User.registration_city != None, User.registration_city != '').all()
-        
-        # 统计各省份用户数量
-        for user in users_with_location:
-            city = user.registration_city
-            
-            # 先通过城市到省份的映射表转换为省份
-            province = city_to_province.get(city)
-            
-            # 如果城市不在映射表中，尝试直接使用（可能本身就是省份）
-            if not province:
-                province = city
-                
-            if province in province_counts:
-                province_counts[province] += 1
-        
-        # 将地理分布数据添加到导出数据中
-        for province, count in province_counts.items():
-            if count > 0:  # 只包含有用户的省份
-                # 使用映射转换省份名称
-                mapped_province = province_name_map.get(province, province)
-                geographic_distribution[mapped_province] = count
+        # 从当天的用户分析快照汇总报表数据
+        report = _collect_report_metrics()
         
         # 合并所有数据
         user_data = {
-            "总用户数": total_users,
-            "本月新增用户": new_users_this_month,
-            "用户活跃率": f"{round(activity_rate, 1)}%",
-            "平均用户消费": round(avg_balance, 2),
-            "用户增长": user_growth,
-            "用户注册渠道": channel_distribution,
-            "用户年龄分布": age_distribution,
-            "用户性别比例": gender_distribution,
-            "信用分分布": credit_score_distribution,
-            "地理分布": geographic_distribution
+            "总用户数": report['total_users'],
+            "本月新增用户": report['new_users_this_month'],
+            "用户活跃率": f"{round(report['activity_rate'], 1)}%",
+            "平均用户消费": round(report['avg_balance'], 2),
+            "用户增长": report['user_growth'],
+            "用户注册渠道": report['channel_distribution'],
+            "用户年龄分布": report['age_distribution'],
+            "用户性别比例": report['gender_distribution'],
+            "信用分分布": report['credit_score_distribution'],
+            "地理分布": report['geographic_distribution']
         }
         
         # 创建临时目录存放图表
@@ -1715,7 +1191,7 @@ def export_analytics_report_pdf():
             try:
                 # 1. 用户增长趋势图
                 plt.figure(figsize=(10, 4))
-                plt.plot(months, user_data["用户增长"], marker='o', linewidth=2, color='#3366cc')
+                plt.plot(report['months'], user_data["用户增长"], marker='o', linewidth=2, color='#3366cc')
                 plt.title('用户增长趋势 (近12个月)')
                 plt.ylabel('新增用户数')
                 plt.grid(True, linestyle='--', alpha=0.7)
@@ -1884,11 +1360,11 @@ def export_analytics_report_pdf():
                 # 核心指标数据
                 core_data = [['指标名称', '数值', '同比增长']] if CHINESE_FONT_REGISTERED else [['Metric', 'Value', 'YoY Growth']]
                 core_data.append(['总用户数' if CHINESE_FONT_REGISTERED else 'Total Users', 
-                             f"{user_data['总用户数']}", f"+{round(yoy_growth, 1)}%"])
+                             f"{user_data['总用户数']}", f"+{round(report['yoy_growth'], 1)}%"])
                 core_data.append(['本月新增用户' if CHINESE_FONT_REGISTERED else 'New Users This Month', 
-                             f"{user_data['本月新增用户']}", f"+{round(mom_growth, 1)}%"])
+                             f"{user_data['本月新增用户']}", f"+{round(report['mom_growth'], 1)}%"])
                 core_data.append(['用户活跃率' if CHINESE_FONT_REGISTERED else 'User Activity Rate', 
-                             f"{user_data['用户活跃率']}", f"{'+' if activity_rate > 0 else ''}{round(activity_rate, 1)}%"])
+                             f"{user_data['用户活跃率']}", f"{'+' if report['activity_rate'] > 0 else ''}{round(report['activity_rate'], 1)}%"])
                 core_data.append(['平均用户余额' if CHINESE_FONT_REGISTERED else 'Average User Balance', 
                              f"¥{user_data['平均用户消费']}", ""])
                 
@@ -2427,6 +1903,7 @@ def get_credit_logs():
 
 # 添加信用变动记录导出API
 @users_bp.route('/api/credit/logs/export', methods=['GET'])
+@async_export('export_credit_logs', '导出信用变动记录')
 def export_credit_logs():
     """导出信用变动记录"""
     try:
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request
 from app.dao.base_dao import BaseDAO
 from app.dao.vehicle_dao import VehicleDAO
 from app.dao.order_dao import OrderDAO
+from app.utils.rollups import summarize
 from datetime import datetime, timedelta
 import json
 import traceback
@@ -126,29 +127,14 @@ def get_model_rankings(start_date, end_date):
     Returns:
         dict: 包含车型排名数据的字典
     """
-    # 各车型累计完成订单数排名
-    orders_query = """
-    SELECT 
-        v.model, 
-        COUNT(o.order_id) as total_orders
-    FROM 
-        vehicles v
-    LEFT JOIN 
-        orders o ON v.vehicle_id = o.vehicle_id
-    WHERE 
-        o.create_time BETWEEN %s AND %s
-        AND o.order_status = '已结束'
-    GROUP BY 
-        v.model
-    ORDER BY 
-        total_orders DESC
-    LIMIT 10
-    """
-    
-    orders_result = BaseDAO.execute_query(orders_query, (
-        start_date.strftime('%Y-%m-%d %H:%M:%S'), 
-        end_date.strftime('%Y-%m-%d %H:%M:%S')
-    ))
+    # 各车型累计完成订单数排名（来自每日订单事实表）
+    orders_result = [
+        {'model': row['vehicle_model'], 'total_orders': row['order_count']}
+        for row in summarize('fact_daily_orders', start_date, end_date, ('vehicle_model',))
+        if row['vehicle_model'] and row['order_count'] > 0
+    ]
+    orders_result.sort(key=lambda item: item['total_orders'], reverse=True)
+    orders_result = orders_result[:10]
     
     # 各车型累计行驶里程排名 - 使用vehicles表中的mileage字段获取车辆累计里程
     mileage_query = """
@@ -4,6 +4,10 @@ import traceback
 import threading
 import time
 from app.dao.base_dao import BaseDAO
+from app.utils.charging_reservations import get_charging_reservations
+from app.utils.fleet_state import get_fleet_state
+from app.utils.fleet_stream import get_fleet_stream
+from app.utils.vehicle_events import record_transition, get_vehicle_event_log, transition_matrix, utilization
 from app.models.vehicle import Vehicle
 from app.models.charging_station import ChargingStation
 from app.models.vehicle_log import VehicleLog
@@ -298,6 +302,90 @@ def get_city_vehicles():
             'message': f'获取车辆数据失败: {str(e)}'
         }), 500
 
+@vehicles_bp.route('/api/fleet_state/<int:vehicle_id>', methods=['GET'])
+def get_vehicle_fleet_state(vehicle_id):
+    """获取单辆车的实时状态（内存车队状态，供约车平台查询实时位置）"""
+    try:
+        vehicle = get_fleet_state().get(vehicle_id)
+        if not vehicle:
+            return jsonify({'status': 'error', 'message': '车辆不存在'}), 404
+        
+        VehicleDAO._format_vehicle_data(vehicle)
+        return jsonify({'status': 'success', 'data': vehicle})
+        
+    except Exception as e:
+        print(f"获取车辆实时状态错误: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'status': 'error',
+            'message': f'获取车辆实时状态失败: {str(e)}'
+        }), 500
+
+@vehicles_bp.route('/api/state_events/summary', methods=['GET'])
+def get_state_event_summary():
+    """获取时间范围内的车辆状态流转次数和利用率（来自状态变更事件表）"""
+    try:
+        end = request.args.get('end')
+        start = request.args.get('start')
+        end = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else datetime.now()
+        start = datetime.strptime(start, '%Y-%m-%d') if start else end - timedelta(days=1)
+        city = request.args.get('city') or None
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+                'end': end.strftime('%Y-%m-%d %H:%M:%S'),
+                'transitions': transition_matrix(start, end, city),
+                'utilization': utilization(start, end, city)
+            }
+        })
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '日期格式应为 YYYY-MM-DD'}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': f'获取车辆状态流转统计失败: {str(e)}'}), 500
+
+@vehicles_bp.route('/api/state_events/metrics', methods=['GET'])
+def get_state_event_metrics():
+    """获取车辆状态事件写入线程的运行指标"""
+    try:
+        return jsonify({'status': 'success', 'data': get_vehicle_event_log().get_metrics()})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': f'获取状态事件指标失败: {str(e)}'}), 500
+
+@vehicles_bp.route('/api/fleet_stream_metrics', methods=['GET'])
+def get_fleet_stream_metrics():
+    """获取车队位置推送通道的运行指标"""
+    try:
+        return jsonify({'status': 'success', 'data': get_fleet_stream().get_metrics()})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': f'获取车队推送指标失败: {str(e)}'}), 500
+
+@vehicles_bp.route('/api/fleet_state_metrics', methods=['GET'])
+def get_fleet_state_metrics():
+    """获取车队实时状态存储的运行指标"""
+    try:
+        return jsonify({'status': 'success', 'data': get_fleet_state().get_metrics()})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': f'获取车队状态指标失败: {str(e)}'}), 500
+
+@vehicles_bp.route('/api/charging_reservation_metrics', methods=['GET'])
+def get_charging_reservation_metrics():
+    """获取充电站预约管理的运行指标；带 city 参数时附带该城市的充电站汇总"""
+    try:
+        manager = get_charging_reservations()
+        data = manager.get_metrics()
+        city_code = request.args.get('city')
+        if city_code:
+            data['city'] = manager.city_status(city_code)
+        return jsonify({'status': 'success', 'data': data})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': f'获取充电站预约指标失败: {str(e)}'}), 500
+
 @vehicles_bp.route('/api/city_charging_stations')
 def get_city_charging_stations():
     """获取指定城市的充电站数据"""
@@ -772,6 +860,8 @@ def rescue_vehicle(vehicle_id):
         """
         
         VehicleDAO.execute_update(update_query, (vehicle_id,))
+        get_fleet_state().apply(vehicle_id, battery_level=100, current_status='空闲中')
+        record_transition(vehicle_id, '电量不足', '空闲中', vehicle.get('operating_city'), 100)
         
         # 尝试记录日志，如果日志表不存在，捕获异常但不影响主要功能
         try:
@@ -1209,19 +1299,12 @@ def add_vehicle_submit():
 def add_charging_station():
     """添加充电站页面"""
     try:
-        # 直接从数据库获取充电站基础成本和可变成本参数
-        from app.dao.base_dao import BaseDAO
-        
-        # 获取充电站基础成本
-        base_cost_query = "SELECT param_value FROM system_parameters WHERE param_key = 'CHARGING_STATION_BASE_COST'"
-        base_cost_result = BaseDAO.execute_query(base_cost_query)
-        base_cost = float(base_cost_result[0]['param_value']) if base_cost_result else 250000.0
-        
-        # 获取充电站可变成本
-        variable_cost_query = "SELECT param_value FROM system_parameters WHERE param_key = 'CHARGING_STATION_VARIABLE_COST'"
-        variable_cost_result = BaseDAO.execute_query(variable_cost_query)
-        variable_cost = float(variable_cost_result[0]['param_value']) if variable_cost_result else 35000.0
+        # 从系统参数缓存获取充电站基础成本和可变成本参数
+        from app.utils.param_cache import get_param_cache
         
+        param_cache = get_param_cache()
+        base_cost = float(param_cache.get('CHARGING_STATION_BASE_COST', 250000.0))
+        variable_cost = float(param_cache.get('CHARGING_STATION_VARIABLE_COST', 35000.0))
         
         return render_template(
             'vehicles/add_charging_station.html',
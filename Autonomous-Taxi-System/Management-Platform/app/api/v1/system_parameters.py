@@ -91,4 +91,23 @@ def update_system_parameters():
         return jsonify({
             'success': False,
             'message': f'更新系统参数失败: {str(e)}'
-        }), 500 
\ No newline at end of file
+        }), 500 
+@api_v1.route('/system_parameters/cache_metrics', methods=['GET'])
+def get_system_parameter_cache_metrics():
+    """获取系统参数缓存运行指标"""
+    try:
+        from app.utils.param_cache import get_param_cache
+        
+        return jsonify({
+            'success': True,
+            'message': '成功获取系统参数缓存指标',
+            'metrics': get_param_cache().get_metrics()
+        })
+    except Exception as e:
+        print(f"获取系统参数缓存指标错误: {e}")
+        traceback.print_exc()
+        
+        return jsonify({
+            'success': False,
+            'message': f'获取系统参数缓存指标失败: {str(e)}'
+        }), 500
@@ -2,6 +2,7 @@
 配置模块
 包含数据库配置和其他应用程序配置
 """
+import os
 
 from app.config.database import db_config, SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS
 
@@ -13,6 +14,9 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = SQLALCHEMY_TRACK_MODIFICATIONS
     DEBUG = False
     TESTING = False
+    # 应用启动时是否启动连续订单调度器；多进程部署时只应在一个进程中开启，
+    # 可通过环境变量 DISPATCHER_AUTOSTART=0 关闭
+    DISPATCHER_AUTOSTART = os.environ.get('DISPATCHER_AUTOSTART', '1') != '0'
 
 # 开发环境配置
 class DevelopmentConfig(Config):
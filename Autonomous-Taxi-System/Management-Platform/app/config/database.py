@@ -19,4 +19,13 @@ SQLALCHEMY_DATABASE_URI = (
     f"mysql+pymysql://{db_config['user']}:{db_config['password']}"
     f"@{db_config['host']}:{db_config['port']}/{db_config['database']}"
 )
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# 数据库连接池配置
+db_pool_config = {
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),              # 常驻连接数
+    'max_overflow': int(os.getenv('DB_POOL_MAX_OVERFLOW', 20)),   # 高峰期允许额外创建的连接数
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),           # 获取连接的最长等待时间（秒）
+    'recycle': int(os.getenv('DB_POOL_RECYCLE', 3600)),           # 连接最长存活时间（秒），超过后重建
+    'ping_interval': int(os.getenv('DB_POOL_PING_INTERVAL', 30))  # 空闲超过该时间的连接在借出前做健康检查（秒）
+}
@@ -2,11 +2,8 @@
 车辆相关的全局参数配置文件 - 从数据库中读取参数
 """
 
-import mysql.connector
 import os
-import json
 import logging
-from functools import lru_cache
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -33,12 +30,9 @@ class ParameterNotFoundError(Exception):
     """参数不存在异常"""
     pass
 
-# 创建一个全局的参数字典
+# 创建一个全局的参数字典（init_params 时从参数缓存复制，供兼容旧代码读取）
 _PARAMS = {}
 
-# 初始化连接状态
-_DB_CONNECTION_FAILED = False
-
 # 创建城市距离转换比例字典
 CITY_DISTANCE_RATIO = {
     "沈阳市": 0.0,
@@ -63,27 +57,19 @@ CITY_PAYMENT_FACTORS = {}
 # 当前城市 - 默认为沈阳市
 CURRENT_CITY = "沈阳市"
 
-@lru_cache(maxsize=1)
-def get_db_connection():
-    """获取数据库连接"""
-    global _DB_CONNECTION_FAILED
-    
-    if _DB_CONNECTION_FAILED:
-        # 如果之前已经失败过，不再尝试连接
-        logger.error("之前数据库连接失败")
-        raise DatabaseConnectionError("数据库连接失败")
-        
+def _param_snapshot():
+    """获取进程内共享的系统参数快照（app.utils.param_cache），数据库不可用时抛出 DatabaseConnectionError"""
+    from app.utils.param_cache import get_param_cache
+
     try:
-        conn = mysql.connector.connect(**db_config)
-        return conn
+        return get_param_cache().snapshot()
     except Exception as e:
-        _DB_CONNECTION_FAILED = True
         logger.error(f"数据库连接失败: {str(e)}")
         raise DatabaseConnectionError(f"数据库连接失败: {str(e)}")
 
 def get_param(param_key, default_value=None):
     """
-    从数据库获取参数值
+    获取参数值（读取进程内参数缓存，不直接访问数据库）
     
     Args:
         param_key: 参数键名
@@ -96,74 +82,27 @@ def get_param(param_key, default_value=None):
         DatabaseConnectionError: 数据库连接失败时抛出
         ParameterNotFoundError: 参数不存在时抛出
     """
-    # 首先检查全局参数字典中是否已有缓存值
-    if param_key in _PARAMS:
-        return _PARAMS[param_key]
+    values = _param_snapshot().values
+    if param_key in values:
+        return values[param_key]
     
-    logger.info(f"开始从数据库获取参数: {param_key}")
+    if default_value is not None:
+        logger.warning(f"参数 {param_key} 在数据库中不存在，使用传入的默认值: {default_value}")
+        return default_value
     
-    try:
-        conn = get_db_connection()
-        
-        cursor = conn.cursor(dictionary=True)
-        query = "SELECT param_value, param_type FROM system_parameters WHERE param_key = %s"
-        logger.info(f"执行查询: {query} with param: {param_key}")
-        
-        cursor.execute(query, (param_key,))
-        result = cursor.fetchone()
-        cursor.close()
-        
-        if not result:
-            if default_value is not None:
-                logger.warning(f"参数 {param_key} 在数据库中不存在，使用传入的默认值: {default_value}")
-                _PARAMS[param_key] = default_value
-                return default_value
-            else:
-                error_msg = f"参数 {param_key} 在数据库中不存在"
-                logger.error(error_msg)
-                raise ParameterNotFoundError(error_msg)
-        
-        # 根据参数类型转换值
-        param_value = result['param_value']
-        param_type = result['param_type']
-        
-        
-        try:
-            if param_type == 'int':
-                param_value = int(param_value)
-            elif param_type == 'float':
-                param_value = float(param_value)
-            elif param_type == 'boolean':
-                param_value = param_value.lower() in ('true', '1', 'yes')
-            elif param_type == 'json' or param_type == 'array':
-                param_value = json.loads(param_value)
-                
-            logger.info(f"参数 {param_key} 转换后的值: {param_value}")
-        except (ValueError, json.JSONDecodeError) as e:
-            error_msg = f"参数 {param_key} 值转换失败: {str(e)}"
-            logger.error(error_msg)
-            raise ValueError(error_msg)
-        
-        # 将值存入全局参数字典
-        _PARAMS[param_key] = param_value
-        return param_value
-    except DatabaseConnectionError:
-        # 直接向上传递数据库连接异常
-        raise
-    except Exception as e:
-        if isinstance(e, ParameterNotFoundError) or isinstance(e, ValueError):
-            # 直接向上传递参数不存在或值转换异常
-            raise
-        # 其他未预期的异常
-        error_msg = f"获取参数 {param_key} 时出错: {str(e)}"
-        logger.error(error_msg)
-        raise Exception(error_msg)
-    finally:
-        if 'conn' in locals() and conn:
-            try:
-                conn.close()
-            except:
-                pass
+    error_msg = f"参数 {param_key} 在数据库中不存在"
+    logger.error(error_msg)
+    raise ParameterNotFoundError(error_msg)
+
+def get_model_params(vehicle_model):
+    """
+    获取车型的六个系数（缓存中预先解析），车型为空时返回默认系数
+    
+    Returns:
+        dict: speed_coefficient、capacity_coefficient、charging_speed_coefficient、
+              energy_consumption_coefficient、maintenance_cost_coefficient、order_price_coefficient
+    """
+    return dict(_param_snapshot().model_params(vehicle_model))
 
 def init_params():
     """
@@ -193,64 +132,22 @@ def init_params():
     global Nova_Quantum_MAINTENANCE_COST, Nova_Pulse_MAINTENANCE_COST, Neon_500_MAINTENANCE_COST, Neon_Zero_MAINTENANCE_COST
     global Alpha_X1_ENERGY_CONSUMPTION_COEFFICIENT, Alpha_Nexus_ENERGY_CONSUMPTION_COEFFICIENT, Alpha_Voyager_ENERGY_CONSUMPTION_COEFFICIENT, Nova_S1_ENERGY_CONSUMPTION_COEFFICIENT
     global Nova_Quantum_ENERGY_CONSUMPTION_COEFFICIENT, Nova_Pulse_ENERGY_CONSUMPTION_COEFFICIENT, Neon_500_ENERGY_CONSUMPTION_COEFFICIENT, Neon_Zero_ENERGY_CONSUMPTION_COEFFICIENT
-    global _DB_CONNECTION_FAILED
     global CITY_DISTANCE_RATIO, CITY_PRICE_FACTORS, CITY_PAYMENT_FACTORS, CURRENT_CITY
     global BASE_MAINTENANCE_COST, MAINTENANCE_INTERVAL
 
-    # 重置数据库连接状态，强制重新连接
-    _DB_CONNECTION_FAILED = False
-    if hasattr(get_db_connection, 'cache_clear'):
-        get_db_connection.cache_clear()
-    
-    # 清空参数字典
-    _PARAMS.clear()
-    
-    # 读取所有参数
+    # 从参数缓存（一条 SELECT 批量加载）读取所有参数
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT param_key, param_value, param_type FROM system_parameters")
-        results = cursor.fetchall()
-        cursor.close()
-        
-        if not results:
+        values = _param_snapshot().values
+        if not values:
             logger.error("数据库中没有找到任何参数")
             raise ParameterNotFoundError("数据库中没有找到任何参数")
-        
-        for result in results:
-            param_key = result['param_key']
-            param_value = result['param_value']
-            param_type = result['param_type']
-            
-            
-            try:
-                if param_type == 'int':
-                    param_value = int(param_value)
-                elif param_type == 'float':
-                    param_value = float(param_value)
-                elif param_type == 'boolean':
-                    param_value = param_value.lower() in ('true', '1', 'yes')
-                elif param_type == 'json' or param_type == 'array':
-                    param_value = json.loads(param_value)
-                    
-                _PARAMS[param_key] = param_value
-            except Exception as e:
-                error_msg = f"参数 {param_key} 值转换失败: {str(e)}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-        
-
+        _PARAMS.clear()
+        _PARAMS.update(values)
     except Exception as e:
         error_msg = f"初始化参数时出错: {str(e)}"
         logger.error(error_msg)
         print(f"初始化参数失败: {error_msg}")
         raise
-    finally:
-        if 'conn' in locals() and conn:
-            try:
-                conn.close()
-            except:
-                pass
     
     # 给全局变量赋值，如果参数不存在则会抛出异常
     try:
@@ -393,12 +290,14 @@ def refresh_params():
         DatabaseConnectionError: 数据库连接失败时抛出
         ParameterNotFoundError: 必需参数不存在时抛出
     """
-    global _DB_CONNECTION_FAILED
-    
-    # 重置连接状态和缓存
-    _DB_CONNECTION_FAILED = False
-    get_db_connection.cache_clear()
-    _PARAMS.clear()
+    from app.utils.param_cache import get_param_cache
+
+    # 立即重新加载参数缓存
+    try:
+        get_param_cache().invalidate()
+    except Exception as e:
+        logger.error(f"数据库连接失败: {str(e)}")
+        raise DatabaseConnectionError(f"数据库连接失败: {str(e)}")
     
     # 重新初始化所有参数
     init_params()
@@ -1,14 +1,13 @@
-import mysql.connector
-from app.config.database import db_config
+from app.utils.db_pool import get_mysql_connection
 
 class BaseDAO:
     """数据访问基类，提供基础数据库连接和操作方法"""
     
     @staticmethod
     def get_connection():
-        """获取数据库连接"""
+        """从连接池获取数据库连接，close() 时归还连接池"""
         try:
-            conn = mysql.connector.connect(**db_config)
+            conn = get_mysql_connection()
             return conn
         except Exception as e:
             print(f"数据库连接错误: {str(e)}")
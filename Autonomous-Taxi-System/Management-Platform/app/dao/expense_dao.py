@@ -4,6 +4,7 @@
 from datetime import datetime
 import pymysql
 from app.config.database import db_config
+from app.utils.rollups import record_expense
 
 class ExpenseDAO:
     """支出数据访问对象"""
@@ -183,8 +184,14 @@ class ExpenseDAO:
                 """
                 now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 cursor.execute(sql, (amount, expense_type, vehicle_id, charging_station_id, user_id, date, description, now, now))
+                expense_id = cursor.lastrowid
+                # 在同一事务中累加每日支出事实表
+                record_expense(cursor, [{
+                    'date': date, 'type': expense_type, 'amount': amount, 'description': description,
+                    'vehicle_id': vehicle_id, 'charging_station_id': charging_station_id
+                }])
                 connection.commit()
-                return cursor.lastrowid
+                return expense_id
         except Exception as e:
             if connection:
                 connection.rollback()
@@ -243,9 +250,21 @@ class ExpenseDAO:
             if not update_fields:
                 return False
             
-            with connection.cursor() as cursor:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                # 锁定旧记录，事实表先扣减旧值再累加新值
+                select_sql = """
+                SELECT amount, type, description, vehicle_id, charging_station_id, date
+                FROM expense WHERE id = %s FOR UPDATE
+                """
+                cursor.execute(select_sql, (expense_id,))
+                old_row = cursor.fetchone()
                 sql = f"UPDATE expense SET {', '.join(update_fields)} WHERE id = %s"
                 result = cursor.execute(sql, params)
+                if old_row:
+                    cursor.execute(select_sql, (expense_id,))
+                    new_row = cursor.fetchone()
+                    record_expense(cursor, [old_row], sign=-1)
+                    record_expense(cursor, [new_row])
                 connection.commit()
                 return result > 0
         except Exception as e:
@@ -263,9 +282,16 @@ class ExpenseDAO:
         connection = None
         try:
             connection = pymysql.connect(**db_config)
-            with connection.cursor() as cursor:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute("""
+                SELECT amount, type, description, vehicle_id, charging_station_id, date
+                FROM expense WHERE id = %s FOR UPDATE
+                """, (expense_id,))
+                old_row = cursor.fetchone()
                 sql = "DELETE FROM expense WHERE id = %s"
                 result = cursor.execute(sql, (expense_id,))
+                if old_row:
+                    record_expense(cursor, [old_row], sign=-1)
                 connection.commit()
                 return result > 0
         except Exception as e:
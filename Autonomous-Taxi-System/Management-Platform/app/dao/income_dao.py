@@ -4,6 +4,7 @@
 from datetime import datetime
 import pymysql
 from app.config.database import db_config
+from app.utils.rollups import record_income
 
 class IncomeDAO:
     """收入数据访问对象"""
@@ -175,8 +176,11 @@ class IncomeDAO:
                 """
                 now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 cursor.execute(sql, (amount, source, user_id, order_id, date, description, now, now))
+                income_id = cursor.lastrowid
+                # 在同一事务中累加每日收入事实表
+                record_income(cursor, [{'date': date, 'source': source, 'amount': amount, 'order_id': order_id}])
                 connection.commit()
-                return cursor.lastrowid
+                return income_id
         except Exception as e:
             if connection:
                 connection.rollback()
@@ -227,9 +231,18 @@ class IncomeDAO:
             if not update_fields:
                 return False
             
-            with connection.cursor() as cursor:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                # 锁定旧记录，事实表先扣减旧值再累加新值
+                select_sql = "SELECT amount, source, order_id, date FROM income WHERE id = %s FOR UPDATE"
+                cursor.execute(select_sql, (income_id,))
+                old_row = cursor.fetchone()
                 sql = f"UPDATE income SET {', '.join(update_fields)} WHERE id = %s"
                 result = cursor.execute(sql, params)
+                if old_row:
+                    cursor.execute(select_sql, (income_id,))
+                    new_row = cursor.fetchone()
+                    record_income(cursor, [old_row], sign=-1)
+                    record_income(cursor, [new_row])
                 connection.commit()
                 return result > 0
         except Exception as e:
@@ -247,9 +260,13 @@ class IncomeDAO:
         connection = None
         try:
             connection = pymysql.connect(**db_config)
-            with connection.cursor() as cursor:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute("SELECT amount, source, order_id, date FROM income WHERE id = %s FOR UPDATE", (income_id,))
+                old_row = cursor.fetchone()
                 sql = "DELETE FROM income WHERE id = %s"
                 result = cursor.execute(sql, (income_id,))
+                if old_row:
+                    record_income(cursor, [old_row], sign=-1)
                 connection.commit()
                 return result > 0
         except Exception as e:
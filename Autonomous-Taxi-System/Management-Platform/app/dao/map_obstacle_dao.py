@@ -1,4 +1,6 @@
 from app.dao.base_dao import BaseDAO
+from app.utils.obstacle_index import get_obstacle_index, invalidate_obstacle_index
+from app.utils.travel_time import rebuild_travel_tables
 import math
 import traceback
 
@@ -114,7 +116,10 @@ class MapObstacleDAO(BaseDAO):
                 data.get('is_active', 1)
             )
             
-            return BaseDAO.execute_update(query, params)
+            result = BaseDAO.execute_update(query, params)
+            invalidate_obstacle_index(data.get('city_code'))
+            rebuild_travel_tables(data.get('city_code'))
+            return result
         except Exception as e:
             print(f"创建障碍物错误: {str(e)}")
             traceback.print_exc()
@@ -169,7 +174,11 @@ class MapObstacleDAO(BaseDAO):
             query = f"UPDATE map_obstacles SET {', '.join(update_fields)} WHERE id = %s"
             params.append(obstacle_id)
             
-            return BaseDAO.execute_update(query, params)
+            result = BaseDAO.execute_update(query, params)
+            # 城市可能被修改，清空所有城市的索引
+            invalidate_obstacle_index()
+            rebuild_travel_tables()
+            return result
         except Exception as e:
             print(f"更新障碍物错误: {str(e)}")
             traceback.print_exc()
@@ -182,7 +191,10 @@ class MapObstacleDAO(BaseDAO):
             query = "DELETE FROM map_obstacles WHERE id = %s"
             params = (obstacle_id,)
             
-            return BaseDAO.execute_update(query, params)
+            result = BaseDAO.execute_update(query, params)
+            invalidate_obstacle_index()
+            rebuild_travel_tables()
+            return result
         except Exception as e:
             print(f"删除障碍物错误: {str(e)}")
             traceback.print_exc()
@@ -195,7 +207,10 @@ class MapObstacleDAO(BaseDAO):
             query = "UPDATE map_obstacles SET is_active = %s WHERE id = %s"
             params = (1 if active_status else 0, obstacle_id)
             
-            return BaseDAO.execute_update(query, params)
+            result = BaseDAO.execute_update(query, params)
+            invalidate_obstacle_index()
+            rebuild_travel_tables()
+            return result
         except Exception as e:
             print(f"切换障碍物状态错误: {str(e)}")
             traceback.print_exc()
@@ -211,20 +226,11 @@ class MapObstacleDAO(BaseDAO):
             city_code: 城市代码
             
         Returns:
-            bool: 是否在障碍物内
+            bool: 是否在障碍物内（线段类型不考虑点是否在内部）
         """
         try:
-            obstacles = MapObstacleDAO.get_obstacles_by_city(city_code)
-            
-            for obstacle in obstacles:
-                # 线段类型不考虑点是否在内部
-                if obstacle['geometry_type'] == 'line':
-                    continue
-                
-                if MapObstacleDAO.is_point_in_polygon(x, y, obstacle['polygon_points']):
-                    return True
-                    
-            return False
+            # 查询城市的障碍物占用栅格，只对所在格子的候选障碍物做精确判断
+            return get_obstacle_index().is_point_blocked(x, y, city_code)
         except Exception as e:
             print(f"检测点是否在障碍物内错误: {str(e)}")
             traceback.print_exc()
@@ -287,17 +293,8 @@ class MapObstacleDAO(BaseDAO):
             bool: 是否相交
         """
         try:
-            obstacles = MapObstacleDAO.get_obstacles_by_city(city_code)
-            
-            for obstacle in obstacles:
-                if MapObstacleDAO.does_line_intersect_polygon(
-                    x1, y1, x2, y2, 
-                    obstacle['polygon_points'], 
-                    obstacle.get('geometry_type', 'polygon')
-                ):
-                    return True
-                    
-            return False
+            # 沿线段查询占用栅格，只对经过格子的候选障碍物做精确判断
+            return get_obstacle_index().is_segment_blocked(x1, y1, x2, y2, city_code)
         except Exception as e:
             print(f"检测线段是否与障碍物相交错误: {str(e)}")
             traceback.print_exc()
@@ -370,6 +370,8 @@ class OrderDAO(BaseDAO):
                 order_id_query = "SELECT order_id FROM orders WHERE order_number = %s"
                 result = BaseDAO.execute_query(order_id_query, (order_number,))
                 if result:
+                    from app.utils.dispatcher import notify_order_created
+                    notify_order_created(result[0]['order_id'])
                     return result[0]['order_id']
             
             return None
@@ -395,6 +397,142 @@ class OrderDAO(BaseDAO):
             traceback.print_exc()
             raise e
     
+    @staticmethod
+    def bulk_assign_vehicles(assignments):
+        """在一个事务中批量提交订单分配结果
+        
+        订单和车辆先按乐观条件（订单为'待分配'、车辆为'空闲中'）加行锁校验，
+        不满足条件或在本批中重复出现的记录作为冲突返回，其余记录用两条批量UPDATE
+        同时完成订单分配和车辆状态切换为'运行中'。
+        
+        Args:
+            assignments: (订单ID, 车辆ID) 列表
+            
+        Returns:
+            dict: {'assigned': [(订单ID, 车辆ID), ...],
+                   'conflicts': [{'order_id', 'vehicle_id', 'reason'}, ...]}
+        """
+        from app.utils.telemetry_buffer import flush_pending_telemetry
+        from app.utils.fleet_state import get_fleet_state
+        from app.utils.vehicle_events import record_transition
+        
+        assigned = []
+        conflicts = []
+        if not assignments:
+            return {'assigned': assigned, 'conflicts': conflicts}
+        
+        # 本批内部重复的订单或车辆只保留第一次出现
+        seen_orders = set()
+        seen_vehicles = set()
+        candidates = []
+        for order_id, vehicle_id in assignments:
+            if order_id in seen_orders:
+                conflicts.append({'order_id': order_id, 'vehicle_id': vehicle_id, 'reason': '订单在本批中重复'})
+                continue
+            if vehicle_id in seen_vehicles:
+                conflicts.append({'order_id': order_id, 'vehicle_id': vehicle_id, 'reason': '车辆在本批中重复'})
+                continue
+            seen_orders.add(order_id)
+            seen_vehicles.add(vehicle_id)
+            candidates.append((order_id, vehicle_id))
+        
+        if not candidates:
+            return {'assigned': assigned, 'conflicts': conflicts}
+        
+        # 车辆状态变更前先写出缓冲中的位置和电量
+        for _, vehicle_id in candidates:
+            flush_pending_telemetry(vehicle_id)
+        
+        conn = None
+        cursor = None
+        try:
+            conn = BaseDAO.get_connection()
+            conn.start_transaction()
+            cursor = conn.cursor(dictionary=True)
+            
+            order_ids = [order_id for order_id, _ in candidates]
+            vehicle_ids = [vehicle_id for _, vehicle_id in candidates]
+            
+            # 1. 锁定仍处于待分配状态的订单和仍处于空闲状态的车辆
+            cursor.execute(f"""
+                SELECT order_id FROM orders
+                WHERE order_id IN ({', '.join(['%s'] * len(order_ids))}) AND order_status = '待分配'
+                FOR UPDATE
+            """, order_ids)
+            pending_orders = {row['order_id'] for row in cursor.fetchall()}
+            
+            cursor.execute(f"""
+                SELECT vehicle_id, operating_city, battery_level FROM vehicles
+                WHERE vehicle_id IN ({', '.join(['%s'] * len(vehicle_ids))}) AND current_status = '空闲中'
+                FOR UPDATE
+            """, vehicle_ids)
+            idle_vehicles = {row['vehicle_id']: row for row in cursor.fetchall()}
+            
+            valid = []
+            for order_id, vehicle_id in candidates:
+                if order_id not in pending_orders:
+                    conflicts.append({'order_id': order_id, 'vehicle_id': vehicle_id, 'reason': '订单已不是待分配状态'})
+                elif vehicle_id not in idle_vehicles:
+                    conflicts.append({'order_id': order_id, 'vehicle_id': vehicle_id, 'reason': '车辆已不是空闲状态'})
+                else:
+                    valid.append((order_id, vehicle_id))
+            
+            if not valid:
+                conn.rollback()
+                return {'assigned': assigned, 'conflicts': conflicts}
+            
+            # 2. 批量分配订单
+            case_params = []
+            for order_id, vehicle_id in valid:
+                case_params.extend([order_id, vehicle_id])
+            valid_order_ids = [order_id for order_id, _ in valid]
+            cursor.execute(f"""
+                UPDATE orders
+                SET vehicle_id = CASE order_id {' '.join(['WHEN %s THEN %s'] * len(valid))} END,
+                    order_status = '进行中'
+                WHERE order_id IN ({', '.join(['%s'] * len(valid))}) AND order_status = '待分配'
+            """, case_params + valid_order_ids)
+            updated_orders = cursor.rowcount
+            
+            # 3. 批量切换车辆状态
+            valid_vehicle_ids = [vehicle_id for _, vehicle_id in valid]
+            cursor.execute(f"""
+                UPDATE vehicles
+                SET current_status = '运行中'
+                WHERE vehicle_id IN ({', '.join(['%s'] * len(valid))}) AND current_status = '空闲中'
+            """, valid_vehicle_ids)
+            updated_vehicles = cursor.rowcount
+            
+            # 行已加锁，影响行数不一致说明数据异常，整体回滚
+            if updated_orders != len(valid) or updated_vehicles != len(valid):
+                conn.rollback()
+                print(f"批量分配行数不一致: 订单 {updated_orders}/{len(valid)}，车辆 {updated_vehicles}/{len(valid)}，已回滚")
+                for order_id, vehicle_id in valid:
+                    conflicts.append({'order_id': order_id, 'vehicle_id': vehicle_id, 'reason': '批量提交行数不一致，已回滚'})
+                return {'assigned': assigned, 'conflicts': conflicts}
+            
+            conn.commit()
+            assigned.extend(valid)
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            print(f"批量分配车辆错误: {str(e)}")
+            traceback.print_exc()
+            raise e
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+        
+        fleet_state = get_fleet_state()
+        for _, vehicle_id in assigned:
+            fleet_state.apply(vehicle_id, current_status='运行中')
+            vehicle = idle_vehicles[vehicle_id]
+            record_transition(vehicle_id, '空闲中', '运行中', vehicle['operating_city'], vehicle['battery_level'])
+        
+        return {'assigned': assigned, 'conflicts': conflicts}
+    
     @staticmethod
     def cancel_order(order_id):
         """取消订单"""
@@ -612,10 +750,11 @@ class OrderDAO(BaseDAO):
             float: 订单距离（公里）
         """
         try:
-            # 计算欧氏距离
-            dx = dropoff_x - pickup_x
-            dy = dropoff_y - pickup_y
-            distance_in_units = ((dx ** 2 + dy ** 2) ** 0.5)  # 系统距离单位
+            # 按避障路线计算行驶距离，规划失败时退回欧氏距离
+            from app.utils.routing import get_routing_engine
+            distance_in_units = get_routing_engine().route_distance(
+                city_code, pickup_x, pickup_y, dropoff_x, dropoff_y
+            )  # 系统距离单位
             
             # 使用城市距离转换比例将距离单位转换为公里
             try:
@@ -665,11 +804,11 @@ class OrderDAO(BaseDAO):
             
             if vehicle_model:
                 try:
-                    # 获取车辆参数
-                    from app.admin.orders import get_vehicle_parameters
-                    _, vehicle_params_dict = get_vehicle_parameters(vehicle_id)
-                    if vehicle_params_dict and 'order_price_coefficient' in vehicle_params_dict:
-                        order_price_coefficient = vehicle_params_dict.get('order_price_coefficient')
+                    # 直接按车型读取档案，无需再按车辆ID查询车型
+                    from app.utils.vehicle_profiles import get_vehicle_profiles
+                    profile = get_vehicle_profiles().for_model(vehicle_model)
+                    if profile.order_price is not None:
+                        order_price_coefficient = profile.order_price
                     else:
                         print(f"未能获取车型 {vehicle_model} 的订单价格系数，使用默认值1.0")
                 except Exception as e:
@@ -718,49 +857,59 @@ class OrderDAO(BaseDAO):
             """
             coupons = BaseDAO.execute_query(coupon_query, (user_id,))
             
-            # 初始化优惠券相关变量
-            best_coupon = None
-            max_discount = 0
-            final_amount = original_amount  # 默认为原价
-            discount_amount = 0
-            
-            # 筛选出满足订单金额条件的优惠券，找出最优惠的一张
-            for coupon in coupons:
-                # 检查是否满足使用门槛
-                if original_amount < coupon['min_amount']:
-                    continue
-                
-                # 计算优惠金额
-                if coupon['coupon_category'] == '满减券':
-                    # 满减券直接减去指定金额
-                    current_discount = float(coupon['value'])
-                elif coupon['coupon_category'] == '折扣券':
-                    # 折扣券，例如0.8表示8折，优惠为原价的20%
-                    current_discount = original_amount * (1 - float(coupon['value']))
-                else:
-                    continue
-                
-                # 更新最优惠券
-                if current_discount > max_discount:
-                    max_discount = current_discount
-                    best_coupon = coupon
-            
-            # 应用优惠券折扣
-            if best_coupon:
-                discount_amount = max_discount
-                final_amount = original_amount - discount_amount
-                final_amount = max(final_amount, 0)  # 确保金额不小于0
-                final_amount = round(final_amount, 2)  # 保留两位小数
-            else:
-                # 如果没有可用优惠券，最终金额就是原始金额
-                final_amount = original_amount
-            
-            return best_coupon, discount_amount, final_amount
+            return OrderDAO.select_best_coupon(coupons, original_amount)
         except Exception as e:
             print(f"查找最佳优惠券错误: {str(e)}")
             traceback.print_exc()
             return None, 0, original_amount
     
+    @staticmethod
+    def select_best_coupon(coupons, original_amount):
+        """从给定的可用优惠券中选出优惠金额最大的一张
+        
+        Args:
+            coupons: 优惠券列表（需包含 coupon_id, coupon_category, value, min_amount）
+            original_amount: 订单原始金额
+            
+        Returns:
+            tuple: (最佳优惠券, 优惠金额, 最终金额)
+        """
+        # 初始化优惠券相关变量
+        best_coupon = None
+        max_discount = 0
+        final_amount = original_amount  # 默认为原价
+        discount_amount = 0
+        
+        # 筛选出满足订单金额条件的优惠券，找出最优惠的一张
+        for coupon in coupons:
+            # 检查是否满足使用门槛
+            if original_amount < coupon['min_amount']:
+                continue
+            
+            # 计算优惠金额
+            if coupon['coupon_category'] == '满减券':
+                # 满减券直接减去指定金额
+                current_discount = float(coupon['value'])
+            elif coupon['coupon_category'] == '折扣券':
+                # 折扣券，例如0.8表示8折，优惠为原价的20%
+                current_discount = original_amount * (1 - float(coupon['value']))
+            else:
+                continue
+            
+            # 更新最优惠券
+            if current_discount > max_discount:
+                max_discount = current_discount
+                best_coupon = coupon
+        
+        # 应用优惠券折扣
+        if best_coupon:
+            discount_amount = max_discount
+            final_amount = original_amount - discount_amount
+            final_amount = max(final_amount, 0)  # 确保金额不小于0
+            final_amount = round(final_amount, 2)  # 保留两位小数
+        
+        return best_coupon, discount_amount, final_amount
+    
     @staticmethod
     def apply_coupon(order_id, coupon_id, discount_amount):
         """应用优惠券至订单
@@ -944,7 +1093,9 @@ class OrderDAO(BaseDAO):
     @staticmethod
     def update_order_completion(order_id, arrival_time):
         """
-        更新订单为完成状态
+        更新订单为完成状态（同步结算单个订单）
+        
+        行程结束时仿真引擎通过结算流水线（app.utils.settlement）批量结算，这里供需要同步结果的调用方使用。
         
         Args:
             order_id (int): 订单ID
@@ -954,150 +1105,290 @@ class OrderDAO(BaseDAO):
             dict: 包含操作结果的字典，keys: success, message
         """
         try:
-            # 获取订单当前信息和车辆ID
-            query = """
-            SELECT o.order_id, o.order_status, o.vehicle_id, o.user_id, 
-                   o.pickup_location, o.dropoff_location,
-                   o.pickup_location_x, o.pickup_location_y,
-                   o.dropoff_location_x, o.dropoff_location_y,
-                   o.city_code, v.plate_number, v.model
-            FROM orders o
-            LEFT JOIN vehicles v ON o.vehicle_id = v.vehicle_id
-            WHERE o.order_id = %s
-            """
-            result = BaseDAO.execute_query(query, (order_id,))
+            result = OrderDAO.settle_completed_orders([(order_id, arrival_time)])
+            if result['skipped']:
+                return {"success": False, "message": result['skipped'][0]['reason']}
+            return {"success": True, "message": "订单状态已更新为已结束"}
+        except Exception as e:
+            print(f"更新订单为完成状态出错: {str(e)}")
+            traceback.print_exc()
+            return {"success": False, "message": f"更新订单为完成状态出错: {str(e)}"}
+    
+    @staticmethod
+    def settle_completed_orders(completions):
+        """在一个事务中批量结算到达终点的订单
+        
+        订单、车辆、用户和用户的可用优惠券一次性加行锁读取，已是完成/取消/评价状态的订单
+        作为跳过返回（同一订单重复提交不会重复结算）。从"进行中"完成的订单依次计算距离、金额、
+        最佳优惠券（同一用户在本批中不会重复使用同一张券）、支付、收入、订单详情和信用积分，
+        所有写入随订单状态一起提交；任一步骤失败时整批回滚。
+        
+        Args:
+            completions: (订单ID, 到达时间) 列表
             
-            if not result:
-                return {"success": False, "message": f"订单 {order_id} 不存在"}
+        Returns:
+            dict: {'settled': [完成并结算的订单ID], 'completed': [仅更新状态的订单ID],
+                   'skipped': [{'order_id', 'reason'}, ...]}
+        """
+        from collections import defaultdict
+        from app.config.vehicle_params import get_weighted_payment_method, PAYMENT_METHODS
+        from app.utils.fleet_state import get_fleet_state
+        from app.utils.rollups import record_income, record_orders
+        
+        result = {'settled': [], 'completed': [], 'skipped': []}
+        
+        # 同一订单在本批中只处理第一次提交
+        arrivals = {}
+        for order_id, arrival_time in completions:
+            arrivals.setdefault(order_id, arrival_time)
+        if not arrivals:
+            return result
+        
+        order_ids = list(arrivals)
+        vehicle_mileage = {}
+        conn = None
+        cursor = None
+        try:
+            conn = BaseDAO.get_connection()
+            conn.start_transaction()
+            cursor = conn.cursor(dictionary=True)
+            
+            # 1. 锁定订单及其车辆
+            cursor.execute(f"""
+                SELECT o.order_id, o.order_status, o.vehicle_id, o.user_id,
+                       o.pickup_location_x, o.pickup_location_y,
+                       o.dropoff_location_x, o.dropoff_location_y,
+                       o.city_code, v.plate_number, v.model, v.mileage
+                FROM orders o
+                LEFT JOIN vehicles v ON o.vehicle_id = v.vehicle_id
+                WHERE o.order_id IN ({', '.join(['%s'] * len(order_ids))})
+                FOR UPDATE
+            """, order_ids)
+            orders = {row['order_id']: row for row in cursor.fetchall()}
+            
+            to_complete = []
+            to_settle = []
+            for order_id in order_ids:
+                order = orders.get(order_id)
+                status = order['order_status'] if order else None
+                if order is None:
+                    result['skipped'].append({'order_id': order_id, 'reason': f"订单 {order_id} 不存在"})
+                elif status in ('已结束', '已完成', 3):
+                    result['skipped'].append({'order_id': order_id, 'reason': "订单已经是完成状态"})
+                elif status in ('已取消', 4):
+                    result['skipped'].append({'order_id': order_id, 'reason': "订单已取消，无法更新为完成状态"})
+                elif status in ('已评价', 5):
+                    result['skipped'].append({'order_id': order_id, 'reason': "订单已评价，无法再次更新"})
+                else:
+                    to_complete.append(order)
+                    if status in ('进行中', 2):
+                        to_settle.append(order)
+            
+            if not to_complete:
+                conn.rollback()
+                return result
+            
+            # 2. 批量读取用户余额/信用分、可用优惠券和当日已完成订单数（须在更新订单状态之前）
+            users = {}
+            coupons_by_user = defaultdict(list)
+            completed_today = {}
+            today = datetime.now().strftime('%Y-%m-%d')
+            user_ids = sorted({order['user_id'] for order in to_settle if order['user_id'] is not None})
+            if user_ids:
+                user_placeholders = ', '.join(['%s'] * len(user_ids))
+                cursor.execute(f"""
+                    SELECT user_id, balance, credit_score FROM users
+                    WHERE user_id IN ({user_placeholders})
+                    FOR UPDATE
+                """, user_ids)
+                users = {row['user_id']: row for row in cursor.fetchall()}
                 
-            order_data = result[0]
-            
-            # 检查当前状态是否允许更新为完成
-            current_status = order_data['order_status']
-            vehicle_id = order_data['vehicle_id']
-            user_id = order_data['user_id']
-            city_code = order_data['city_code']  # 获取城市代码
-            
-            # 使用硬编码的状态值，不再尝试检测枚举
-            if current_status in ['已结束', '已完成', 3]:
-                return {"success": False, "message": "订单已经是完成状态"}
+                cursor.execute(f"""
+                    SELECT c.coupon_id, c.user_id, c.coupon_type_id, ct.coupon_category, ct.value, ct.min_amount, ct.description
+                    FROM coupons c
+                    JOIN coupon_types ct ON c.coupon_type_id = ct.id
+                    WHERE c.user_id IN ({user_placeholders})
+                      AND c.status = '未使用'
+                      AND NOW() BETWEEN c.validity_start AND c.validity_end
+                    ORDER BY c.coupon_id
+                    FOR UPDATE
+                """, user_ids)
+                for coupon in cursor.fetchall():
+                    coupons_by_user[coupon['user_id']].append(coupon)
                 
-            if current_status in ['已取消', 4]:
-                return {"success": False, "message": "订单已取消，无法更新为完成状态"}
+                cursor.execute(f"""
+                    SELECT user_id, COUNT(*) AS order_count
+                    FROM orders
+                    WHERE user_id IN ({user_placeholders})
+                      AND order_status IN ('已结束', '已完成', 3)
+                      AND DATE(arrival_time) = %s
+                    GROUP BY user_id
+                """, user_ids + [today])
+                completed_today = {row['user_id']: row['order_count'] for row in cursor.fetchall()}
+            
+            # 3. 逐单计算金额、优惠、支付和积分（纯内存计算）
+            vehicle_stats = {}
+            coupon_updates = []
+            income_rows = []
+            detail_rows = []
+            income_facts = []
+            order_facts = []
+            credit_logs = []
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for order in to_settle:
+                order_id = order['order_id']
+                vehicle_id = order['vehicle_id']
+                user_id = order['user_id']
+                city_code = order['city_code']
                 
-            if current_status in ['已评价', 5]:
-                return {"success": False, "message": "订单已评价，无法再次更新"}
-            
-            # 直接使用硬编码的状态值
-            if isinstance(current_status, str):
-                new_status_value = '已结束'
-            else:
-                new_status_value = 3
+                distance = OrderDAO.calculate_order_distance(
+                    order['pickup_location_x'],
+                    order['pickup_location_y'],
+                    order['dropoff_location_x'],
+                    order['dropoff_location_y'],
+                    city_code
+                )
                 
-            # 更新订单状态为完成
-            update_query = """
-            UPDATE orders
-            SET order_status = %s, arrival_time = %s
-            WHERE order_id = %s
-            """
-            
-            try:
-                affected_rows = BaseDAO.execute_update(update_query, (new_status_value, arrival_time, order_id))
+                if vehicle_id is not None and order['mileage'] is not None:
+                    mileage, count = vehicle_stats.get(vehicle_id, (float(order['mileage']), 0))
+                    vehicle_stats[vehicle_id] = (round(mileage + float(distance), 2), count + 1)
                 
-                if affected_rows <= 0:
-                    # 尝试使用数字状态
-                    if isinstance(new_status_value, str):
-                        new_status_value = 3
-                        affected_rows = BaseDAO.execute_update(update_query, (new_status_value, arrival_time, order_id))
+                original_amount, price_coefficient, city_price_factor = OrderDAO.calculate_order_amount(
+                    distance, vehicle_id, order.get('model'), city_code
+                )
                 
-                if affected_rows <= 0:
-                    return {"success": False, "message": "更新订单状态失败"}
-            except Exception as update_error:
-                print(f"更新订单状态错误: {str(update_error)}")
-                traceback.print_exc()
-                return {"success": False, "message": f"更新订单状态错误: {str(update_error)}"}
-            
-            # 如果是从"进行中"到"已完成"状态，处理后续操作
-            if current_status in ['进行中', 2]:
-                try:
-                    # 1. 计算行驶距离
-                    distance = OrderDAO.calculate_order_distance(
-                        order_data['pickup_location_x'], 
-                        order_data['pickup_location_y'],
-                        order_data['dropoff_location_x'], 
-                        order_data['dropoff_location_y'],
-                        city_code
-                    )
-                    
-                    # 2. 更新车辆统计信息（里程和订单数）
-                    from app.dao import VehicleDAO
-                    update_success = VehicleDAO.update_vehicle_statistics(vehicle_id, distance)
-                    
-                    # 3. 计算订单原始金额
-                    original_amount, price_coefficient, city_price_factor = OrderDAO.calculate_order_amount(
-                        distance, 
-                        vehicle_id, 
-                        order_data.get('model'), 
-                        city_code
-                    )
-                    
-                    # 4. 查找最佳优惠券并计算优惠后金额
-                    best_coupon, discount_amount, final_amount = OrderDAO.find_best_coupon(user_id, original_amount)
-                    
-                    # 5. 应用优惠券（如果有）
-                    coupon_info = None
-                    if best_coupon:
-                        OrderDAO.apply_coupon(order_id, best_coupon['coupon_id'], discount_amount)
-                        coupon_info = (best_coupon['coupon_id'], discount_amount)
-                    
-                    # 6. 获取支付方式
-                    from app.config.vehicle_params import get_weighted_payment_method
-                    payment_method = get_weighted_payment_method(city_code)
-                    
-                    # 7. 处理用户支付
-                    payment_success = OrderDAO.process_user_payment(user_id, final_amount, payment_method)
-                    if not payment_success:
-                        print(f"订单 {order_id} 支付处理失败，但继续处理订单完成流程")
-                    
-                    # 8. 创建收入记录（如果不是余额支付）
-                    if payment_method != '余额支付':
-                        income_id = OrderDAO.create_income_record(
-                            order_id, 
-                            user_id, 
-                            final_amount, 
-                            payment_method, 
-                            distance, 
-                            order_data, 
-                            city_price_factor, 
-                            price_coefficient, 
-                            coupon_info
-                        )
-                    
-                    # 9. 创建订单详情记录
-                    order_detail_id = OrderDAO.create_order_detail_record(
-                        order_id, 
-                        vehicle_id, 
-                        user_id, 
-                        final_amount, 
-                        distance, 
-                        payment_method
-                    )
-                    
-                    
-                    # 10. 更新用户信用积分
-                    OrderDAO.update_user_credit_score(user_id, order_id)
-                    
-                except Exception as e:
-                    print(f"订单完成后续处理出错: {str(e)}")
-                    traceback.print_exc()
-                    return {"success": True, "message": "订单状态已更新，但后续处理出现错误"}
-                    
-            return {"success": True, "message": "订单状态已更新为已结束"}
+                best_coupon, discount_amount, final_amount = OrderDAO.select_best_coupon(
+                    coupons_by_user.get(user_id, []), original_amount
+                )
+                coupon_info = None
+                if best_coupon:
+                    coupons_by_user[user_id].remove(best_coupon)
+                    coupon_updates.append((order_id, best_coupon['coupon_id']))
+                    coupon_info = (best_coupon['coupon_id'], discount_amount)
+                
+                payment_method = get_weighted_payment_method(city_code)
+                user = users.get(user_id)
+                if payment_method == '余额支付':
+                    if user:
+                        current_balance = float(user['balance']) if user['balance'] else 0
+                        user['balance'] = round(current_balance - float(final_amount), 2)
+                    else:
+                        print(f"获取用户 {user_id} 余额信息失败，订单 {order_id} 未扣减余额")
+                else:
+                    coupon_desc = ""
+                    if coupon_info:
+                        coupon_desc = f"，使用了优惠券(ID:{coupon_info[0]})，优惠金额:{coupon_info[1]}元"
+                    description = f"订单{order_id}的车费，支付方式：{payment_method}，车辆：{order.get('plate_number') or '未知'}，车型：{order.get('model') or '未知'}，距离：{distance}公里，价格系数：{price_coefficient}，城市价格系数：{city_price_factor}{coupon_desc}"
+                    income_rows.append((final_amount, "车费收入", user_id, str(order_id), today, description, now, now))
+                    income_facts.append({'date': today, 'source': "车费收入", 'amount': final_amount,
+                                         'city_code': city_code or '', 'vehicle_model': order.get('model') or ''})
+                
+                # 订单详情只接受允许的支付方式，否则记为余额支付
+                detail_method = payment_method
+                if PAYMENT_METHODS is not None and detail_method not in PAYMENT_METHODS:
+                    print(f"支付方式 '{detail_method}' 不允许，使用余额支付")
+                    detail_method = '余额支付'
+                detail_rows.append((str(order_id), vehicle_id, user_id, final_amount, distance, detail_method))
+                order_facts.append({'date': today, 'amount': final_amount, 'distance': distance,
+                                    'city_code': city_code or '', 'vehicle_model': order.get('model') or ''})
+                
+                # 信用积分：完成订单+1，当日首单再+1
+                if user:
+                    credit_before = user['credit_score'] or 0
+                    credit_after = credit_before + 1
+                    credit_logs.append((user_id, 1, credit_before, credit_after, "订单完成",
+                                        "订单完成获得基础积分", str(order_id), "system"))
+                    if completed_today.get(user_id, 0) == 0:
+                        credit_logs.append((user_id, 1, credit_after, credit_after + 1, "系统奖励",
+                                            "当日首单额外奖励", str(order_id), "system"))
+                        credit_after += 1
+                    user['credit_score'] = credit_after
+                    completed_today[user_id] = completed_today.get(user_id, 0) + 1
+                elif user_id is not None:
+                    print(f"未找到用户 {user_id} 的信用积分信息")
+            
+            # 4. 批量写入
+            status_params = []
+            for order in to_complete:
+                new_status = '已结束' if isinstance(order['order_status'], str) else 3
+                status_params.extend([order['order_id'], new_status])
+            arrival_params = []
+            for order in to_complete:
+                arrival_params.extend([order['order_id'], arrivals[order['order_id']]])
+            complete_ids = [order['order_id'] for order in to_complete]
+            cursor.execute(f"""
+                UPDATE orders
+                SET order_status = CASE order_id {' '.join(['WHEN %s THEN %s'] * len(to_complete))} END,
+                    arrival_time = CASE order_id {' '.join(['WHEN %s THEN %s'] * len(to_complete))} END
+                WHERE order_id IN ({', '.join(['%s'] * len(to_complete))})
+            """, status_params + arrival_params + complete_ids)
+            if cursor.rowcount != len(to_complete):
+                raise Exception(f"更新订单状态行数不一致: {cursor.rowcount}/{len(to_complete)}")
+            
+            if vehicle_stats:
+                cursor.executemany(
+                    "UPDATE vehicles SET mileage = %s, total_orders = total_orders + %s WHERE vehicle_id = %s",
+                    [(mileage, count, vehicle_id) for vehicle_id, (mileage, count) in vehicle_stats.items()]
+                )
+            
+            if coupon_updates:
+                cursor.executemany("""
+                    UPDATE coupons
+                    SET status = '已使用', use_time = NOW(), order_id = %s
+                    WHERE coupon_id = %s
+                """, coupon_updates)
+            
+            if users:
+                cursor.executemany(
+                    "UPDATE users SET balance = %s, credit_score = %s WHERE user_id = %s",
+                    [(user['balance'], user['credit_score'], user_id) for user_id, user in users.items()]
+                )
             
+            if income_rows:
+                cursor.executemany("""
+                    INSERT INTO income (amount, source, user_id, order_id, date, description, created_at, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, income_rows)
+                record_income(cursor, income_facts)
+            
+            if detail_rows:
+                cursor.executemany("""
+                    INSERT INTO order_details
+                    (order_id, vehicle_id, user_id, amount, distance, payment_method)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, detail_rows)
+                record_orders(cursor, order_facts)
+            
+            if credit_logs:
+                cursor.executemany("""
+                    INSERT INTO user_credit_logs
+                    (user_id, change_amount, credit_before, credit_after, change_type, reason, related_order_id, operator)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, credit_logs)
+            
+            conn.commit()
+            vehicle_mileage = {vehicle_id: mileage for vehicle_id, (mileage, _) in vehicle_stats.items()}
+            settle_ids = {order['order_id'] for order in to_settle}
+            for order in to_complete:
+                key = 'settled' if order['order_id'] in settle_ids else 'completed'
+                result[key].append(order['order_id'])
         except Exception as e:
-            print(f"更新订单为完成状态出错: {str(e)}")
+            if conn:
+                conn.rollback()
+            print(f"批量结算订单错误: {str(e)}")
             traceback.print_exc()
-            return {"success": False, "message": f"更新订单为完成状态出错: {str(e)}"}
+            raise e
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+        
+        fleet_state = get_fleet_state()
+        for vehicle_id, mileage in vehicle_mileage.items():
+            fleet_state.apply(vehicle_id, mileage=mileage)
+        
+        return result
     
     @staticmethod
     def update_user_credit_score(user_id, order_id=None):
@@ -1212,106 +1503,64 @@ class OrderDAO(BaseDAO):
             return False
     
     @staticmethod
-    def bulk_create_orders(city_code, order_count):
-        """批量添加订单 - 修改为随机坐标起点/终点
+    def bulk_create_orders(city_code, order_count, progress=None, cancelled=None, follow_hotspots=False,
+                           avoid_obstacles=False, seed=None, chunk_size=None):
+        """批量添加订单 - 由 NumPy 批量生成随机坐标起点/终点，按块以多行 INSERT 写入
 
         Args:
             city_code: 城市名称(中文名)
             order_count: 要添加的订单数量
+            progress: 进度回调 progress(已写入数, 总数)，每提交一块调用一次
+            cancelled: 每块开始前调用，返回 True 时停止生成（已写入的订单保留）
+            follow_hotspots: 上下车点按该城市历史订单热点分布
+            avoid_obstacles: 上下车点避开障碍物
+            seed: 随机数种子
+            chunk_size: 每块订单数，默认 GENERATION_CHUNK_SIZE
 
         Returns:
-            字典包含：成功添加的订单数量和已创建订单的用户ID列表
+            字典包含：成功添加的订单数量和已创建订单的用户ID列表（去重）
         """
+        from app.utils.order_generator import OrderBatchGenerator, stream_insert_orders, GENERATION_CHUNK_SIZE
+
+        success_count = 0
+        user_ids = []
         try:
             # 获取指定城市的用户ID列表
             users_query = "SELECT user_id FROM users WHERE registration_city = %s"
             users_result = BaseDAO.execute_query(users_query, (city_code,))
-            user_ids = [row['user_id'] for row in users_result] if users_result else []
+            city_user_ids = [row['user_id'] for row in users_result] if users_result else []
 
-            if not user_ids:
+            if not city_user_ids:
                 raise Exception(f"城市 {city_code} 没有可用的用户，无法创建订单")
 
-            # 准备批量插入的数据
-            now = datetime.now()
-            order_data_list = []
-            GRID_SIZE = 1000 # 定义网格大小
-            created_user_ids = []  # 用于存储已创建订单的用户ID
-
-            for i in range(order_count):
-                # 随机选择用户ID
-                user_id = random.choice(user_ids) if user_ids else random.randint(1, 10)
-                created_user_ids.append(user_id)  # 记录用户ID
-
-                # 生成订单编号
-                order_number = f"O{now.strftime('%Y%m%d')}{random.randint(100000, 999999)}"
-
-                # 创建时间
-                create_time = now.strftime('%Y-%m-%d %H:%M:%S')
-
-                # --- 修改开始：生成随机坐标作为起点和终点 ---
-                pickup_location_x = random.randint(0, GRID_SIZE - 1)
-                pickup_location_y = random.randint(0, GRID_SIZE - 1)
-
-                dropoff_location_x = random.randint(0, GRID_SIZE - 1)
-                dropoff_location_y = random.randint(0, GRID_SIZE - 1)
-
-                # 确保上下车坐标不太近
-                min_distance = 50  # 最小距离
-                while True:
-                    dx = dropoff_location_x - pickup_location_x
-                    dy = dropoff_location_y - pickup_location_y
-                    # 计算欧氏距离的平方，避免开方运算提高效率
-                    if (dx**2 + dy**2) >= min_distance**2:
-                        break
-                    # 如果太近，重新生成下车点坐标
-                    dropoff_location_x = random.randint(0, GRID_SIZE - 1)
-                    dropoff_location_y = random.randint(0, GRID_SIZE - 1)
-
-                # 将地点名称格式化为坐标字符串
-                pickup_location = f"({pickup_location_x}, {pickup_location_y})"
-                dropoff_location = f"({dropoff_location_x}, {dropoff_location_y})"
-                # --- 修改结束 ---
-
-                # 添加到批量插入数据列表
-                order_data_list.append((
-                    order_number, user_id, None, '待分配', create_time, None,
-                    pickup_location, pickup_location_x, pickup_location_y,
-                    dropoff_location, dropoff_location_x, dropoff_location_y, city_code
-                ))
-
-            # 批量插入订单数据
-            insert_order_query = """
-            INSERT INTO orders
-            (order_number, user_id, vehicle_id, order_status, create_time, arrival_time,
-            pickup_location, pickup_location_x, pickup_location_y,
-            dropoff_location, dropoff_location_x, dropoff_location_y, city_code)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-
-            batch_size = 100
-            success_count = 0
-            successful_user_ids = []  # 存储成功创建订单的用户ID
+            generator = OrderBatchGenerator(
+                city_code, city_user_ids, follow_hotspots=follow_hotspots,
+                avoid_obstacles=avoid_obstacles, seed=seed
+            )
 
-            for i in range(0, len(order_data_list), batch_size):
-                batch = order_data_list[i:i + batch_size]
-                batch_user_ids = created_user_ids[i:i + batch_size]  # 当前批次的用户ID
-                try:
-                    BaseDAO.execute_batch(insert_order_query, batch)
-                    success_count += len(batch)
-                    successful_user_ids.extend(batch_user_ids)  # 添加成功创建订单的用户ID
-                except Exception as e:
-                    print(f"批量插入订单数据失败: {str(e)}")
-                    traceback.print_exc()
+            def on_chunk(inserted, total):
+                nonlocal success_count
+                success_count = inserted
+                if progress:
+                    progress(inserted, total)
 
-            return {
-                "success_count": success_count,
-                "user_ids": successful_user_ids
-            }
+            result = stream_insert_orders(
+                generator, order_count, progress=on_chunk, cancelled=cancelled,
+                chunk_size=chunk_size or GENERATION_CHUNK_SIZE
+            )
+            success_count = result['inserted']
+            user_ids = result['user_ids']
 
         except Exception as e:
-            print(f"批量添加订单失败: {str(e)}")
+            print(f"批量添加订单失败（已写入 {success_count} 个）: {str(e)}")
             traceback.print_exc()
-            return {
-                "success_count": 0,
-                "user_ids": []
-            } 
\ No newline at end of file
+
+        # 通知调度器对账，把新订单补入待分配队列
+        if success_count:
+            from app.utils.dispatcher import notify_orders_bulk_created
+            notify_orders_bulk_created()
+
+        return {
+            "success_count": success_count,
+            "user_ids": user_ids
+        } 
\ No newline at end of file
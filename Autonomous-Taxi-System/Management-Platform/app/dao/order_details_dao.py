@@ -6,6 +6,7 @@ import traceback
 from datetime import datetime
 from app.dao.base_dao import BaseDAO
 from app.models.order_details import OrderDetails
+from app.utils.rollups import record_orders
 
 class OrderDetailsDAO(BaseDAO):
     """订单详情数据访问对象"""
@@ -68,23 +69,40 @@ class OrderDetailsDAO(BaseDAO):
                     order_details.payment_method
                 )
             
-            # 执行插入并获取行数
-            affected_rows = BaseDAO.execute_update(query, params)
-            
-            if affected_rows > 0:
-                # 获取最后插入的ID
-                id_query = "SELECT LAST_INSERT_ID() as id"
-                result = BaseDAO.execute_query(id_query)
-                
-                if result and 'id' in result[0]:
-                    insert_id = result[0]['id']
-                    return insert_id
-                else:
-                    print("无法获取新插入记录的ID")
+            # 插入订单详情并在同一事务中累加每日订单事实表
+            conn = None
+            cursor = None
+            try:
+                conn = BaseDAO.get_connection()
+                conn.start_transaction()
+                cursor = conn.cursor()
+                cursor.execute(query, params)
+                if cursor.rowcount <= 0:
+                    conn.rollback()
+                    print("添加订单详情记录失败")
                     return None
-            else:
-                print("添加订单详情记录失败")
+                insert_id = cursor.lastrowid
+                record_orders(cursor, [{
+                    'order_id': params[0],
+                    'vehicle_id': params[1],
+                    'amount': params[3],
+                    'distance': params[4]
+                }])
+                conn.commit()
+            except Exception:
+                if conn:
+                    conn.rollback()
+                raise
+            finally:
+                if cursor:
+                    cursor.close()
+                if conn:
+                    conn.close()
+            
+            if not insert_id:
+                print("无法获取新插入记录的ID")
                 return None
+            return insert_id
                 
         except Exception as e:
             print(f"创建订单详情记录出错: {str(e)}")
@@ -168,11 +186,11 @@ class OrderDetailsDAO(BaseDAO):
             
             if vehicle_id:
                 try:
-                    # 获取车辆参数
-                    from app.admin.orders import get_vehicle_parameters
-                    _, vehicle_params_dict = get_vehicle_parameters(vehicle_id)
-                    if vehicle_params_dict and 'order_price_coefficient' in vehicle_params_dict:
-                        order_price_coefficient = vehicle_params_dict.get('order_price_coefficient')
+                    # 获取车型档案
+                    from app.utils.vehicle_profiles import get_vehicle_profiles
+                    _, profile = get_vehicle_profiles().for_vehicle(vehicle_id)
+                    if profile.order_price is not None:
+                        order_price_coefficient = profile.order_price
                     else:
                         print(f"未能获取车型 {vehicle_model} 的订单价格系数，使用默认值1.0")
                 except Exception as e:
@@ -293,7 +311,36 @@ class OrderDetailsDAO(BaseDAO):
                 order_details.id
             )
             
-            affected_rows = BaseDAO.execute_update(query, params)
+            # 锁定旧记录，事实表先扣减旧值再累加新值（事实日期取创建日期，不随更新变化）
+            select_query = """
+            SELECT order_id, vehicle_id, amount, distance, DATE(created_at) AS date
+            FROM order_details WHERE id = %s FOR UPDATE
+            """
+            conn = None
+            cursor = None
+            try:
+                conn = BaseDAO.get_connection()
+                conn.start_transaction()
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(select_query, (order_details.id,))
+                old_row = cursor.fetchone()
+                cursor.execute(query, params)
+                affected_rows = cursor.rowcount
+                if old_row:
+                    cursor.execute(select_query, (order_details.id,))
+                    new_row = cursor.fetchone()
+                    record_orders(cursor, [old_row], sign=-1)
+                    record_orders(cursor, [new_row])
+                conn.commit()
+            except Exception:
+                if conn:
+                    conn.rollback()
+                raise
+            finally:
+                if cursor:
+                    cursor.close()
+                if conn:
+                    conn.close()
             return affected_rows > 0
             
         except Exception as e:
@@ -2,6 +2,11 @@ import traceback
 from datetime import datetime
 import random
 from app.dao.base_dao import BaseDAO
+from app.utils.charging_reservations import get_charging_reservations
+from app.utils.telemetry_buffer import get_telemetry_buffer, flush_pending_telemetry
+from app.utils.fleet_state import get_fleet_state
+from app.utils.vehicle_profiles import forget_vehicle_model
+from app.utils.vehicle_events import record_transition
 
 class VehicleDAO(BaseDAO):
     """车辆数据访问对象，封装所有车辆相关的数据库操作"""
@@ -263,18 +268,9 @@ class VehicleDAO(BaseDAO):
     
     @staticmethod
     def get_city_vehicles(city):
-        """获取指定城市的车辆数据"""
+        """获取指定城市的车辆数据（读取内存中的车队实时状态）"""
         try:
-            query = """
-            SELECT 
-                vehicle_id, plate_number, model, current_status, battery_level,
-                mileage, current_location_x, current_location_y, current_location_name,
-                current_city, operating_city, last_maintenance_date
-            FROM vehicles 
-            WHERE operating_city = %s OR %s = 'all'
-            """
-            
-            vehicles = BaseDAO.execute_query(query, (city, city))
+            vehicles = get_fleet_state().get_city_vehicles(city)
             
             # 处理车辆数据
             for vehicle in vehicles:
@@ -309,6 +305,8 @@ class VehicleDAO(BaseDAO):
             # 删除车辆
             delete_query = "DELETE FROM vehicles WHERE vehicle_id = %s"
             affected_rows = BaseDAO.execute_update(delete_query, (vehicle_id,))
+            get_fleet_state().remove(vehicle_id)
+            forget_vehicle_model(vehicle_id)
             
             return affected_rows > 0
         except Exception as e:
@@ -320,12 +318,16 @@ class VehicleDAO(BaseDAO):
     def update_vehicle(vehicle_id, vehicle_data):
         """更新车辆信息"""
         try:
-            # 检查车辆是否存在
-            check_query = "SELECT vehicle_id FROM vehicles WHERE vehicle_id = %s"
+            # 检查车辆是否存在，同时读取修改前的状态用于记录状态变更
+            check_query = """
+                SELECT vehicle_id, current_status, operating_city, battery_level
+                FROM vehicles WHERE vehicle_id = %s
+            """
             results = BaseDAO.execute_query(check_query, (vehicle_id,))
             
             if not results:
                 return False
+            previous = results[0]
             
             # 构建更新SQL语句
             update_query = "UPDATE vehicles SET "
@@ -349,6 +351,17 @@ class VehicleDAO(BaseDAO):
             
             # 执行更新
             affected_rows = BaseDAO.execute_update(update_query, params)
+            get_fleet_state().invalidate(vehicle_id)
+            if vehicle_data.get('model') is not None:
+                forget_vehicle_model(vehicle_id)
+            new_status = vehicle_data.get('current_status')
+            if affected_rows > 0 and new_status is not None and new_status != previous['current_status']:
+                record_transition(
+                    vehicle_id, previous['current_status'], new_status,
+                    vehicle_data.get('operating_city') or previous['operating_city'],
+                    vehicle_data.get('battery_level') if vehicle_data.get('battery_level') is not None
+                    else previous['battery_level']
+                )
             
             return affected_rows > 0
         except Exception as e:
@@ -360,6 +373,7 @@ class VehicleDAO(BaseDAO):
     def update_vehicle_location(vehicle_id, location_data):
         """更新车辆位置信息"""
         try:
+            flush_pending_telemetry(vehicle_id)
             location_name = location_data.get('location_name')
             location_x = location_data.get('location_x')
             location_y = location_data.get('location_y')
@@ -384,6 +398,13 @@ class VehicleDAO(BaseDAO):
             # 执行更新
             affected_rows = BaseDAO.execute_update(update_query, params)
             
+            fields = {'current_location_name': location_name}
+            if location_x is not None and location_y is not None:
+                fields.update(current_location_x=location_x, current_location_y=location_y)
+            if city:
+                fields['current_city'] = city
+            get_fleet_state().apply(vehicle_id, **fields)
+            
             return affected_rows > 0
         except Exception as e:
             print(f"更新车辆位置错误: {str(e)}")
@@ -438,6 +459,10 @@ class VehicleDAO(BaseDAO):
                 results = BaseDAO.execute_transaction(queries_and_params)
                 updated_count = sum(1 for count in results if count > 0)
                 
+                for update in updates:
+                    if update.get('vehicleId') and update.get('locationName'):
+                        get_fleet_state().invalidate(update.get('vehicleId'))
+                
                 # 对于已更新的车辆检查是否有低电量情况
                 for update in updates:
                     vehicle_id = update.get('vehicleId')
@@ -599,6 +624,11 @@ class VehicleDAO(BaseDAO):
         else:
             vehicle['is_available'] = False
     
+    @staticmethod
+    def _sort_by_battery(vehicles, reverse=False):
+        """按电量排序车辆列表"""
+        return sorted(vehicles, key=lambda v: v.get('battery_level') or 0, reverse=reverse)
+    
     @staticmethod
     def get_idle_vehicles_by_city(city_code):
         """获取指定城市中空闲状态的车辆"""
@@ -655,6 +685,9 @@ class VehicleDAO(BaseDAO):
     def update_vehicle_status(vehicle_id, new_status):
         """更新车辆状态"""
         try:
+            # 状态变更前先写出该车缓冲中的位置和电量
+            flush_pending_telemetry(vehicle_id)
+
             # 获取车辆当前信息，用于状态检查和位置信息获取
             vehicle = VehicleDAO.get_vehicle_by_id(vehicle_id)
             if not vehicle:
@@ -683,15 +716,11 @@ class VehicleDAO(BaseDAO):
                     
                     if city_code and station_code:
                         try:
-                            from app.dao.charging_station_dao import ChargingStationDAO
-                            # 释放充电站位置
-                            success, old_count, new_count, max_capacity = ChargingStationDAO.update_station_vehicle_count(
-                                station_code, city_code, -1, check_capacity=False
-                            )
-                            if success:
-                                print(f"车辆 {vehicle_id} 从'前往充电'变为'电量不足'，已释放充电站 {station_code} 位置，当前负载: {new_count}/{max_capacity}")
+                            # 释放充电站位置（车位由预约管理器分配给排队车辆）
+                            if get_charging_reservations().release(vehicle_id, city_code, station_code):
+                                print(f"车辆 {vehicle_id} 从'前往充电'变为'电量不足'，已释放充电站 {station_code} 位置")
                             else:
-                                print(f"车辆 {vehicle_id} 从'前往充电'变为'电量不足'，释放充电站 {station_code} 位置失败")
+                                print(f"车辆 {vehicle_id} 从'前往充电'变为'电量不足'，充电站 {station_code} 没有该车的占用")
                         except Exception as e:
                             print(f"释放充电站位置错误: {str(e)}")
                             traceback.print_exc()
@@ -710,6 +739,7 @@ class VehicleDAO(BaseDAO):
                         WHERE vehicle_id = %s
                         """
                         BaseDAO.execute_update(update_query, (generic_location_name, vehicle_id))
+                        get_fleet_state().apply(vehicle_id, current_location_name=generic_location_name)
                         print(f"已更新车辆 {vehicle_id} 位置名称，移除充电站关联")
                     except Exception as e:
                         print(f"更新位置名称错误: {str(e)}")
@@ -723,6 +753,10 @@ class VehicleDAO(BaseDAO):
             """
             
             affected_rows = BaseDAO.execute_update(query, (new_status, vehicle_id))
+            get_fleet_state().apply(vehicle_id, current_status=new_status)
+            if affected_rows > 0:
+                record_transition(vehicle_id, current_status, new_status,
+                                  vehicle.get('operating_city'), vehicle.get('battery_level'))
             return affected_rows > 0
         except Exception as e:
             print(f"更新车辆状态错误: {str(e)}")
@@ -734,54 +768,25 @@ class VehicleDAO(BaseDAO):
         """获取离上车地点最近的空闲车辆"""
         try:
             
+            fleet_state = get_fleet_state()
+            
             # 如果没有提供坐标，则仅获取空闲车辆
             if pickup_location_x is None or pickup_location_y is None:
                 print("未提供上车点坐标，将按电量排序返回车辆")
-                query = """
-                SELECT 
-                    vehicle_id, plate_number, model, current_status, battery_level,
-                    mileage, current_location_x, current_location_y, current_location_name,
-                    current_city, operating_city
-                FROM vehicles 
-                WHERE operating_city = %s AND current_status = '空闲中'
-                ORDER BY battery_level DESC
-                LIMIT 1
-                """
-                vehicles = BaseDAO.execute_query(query, (city_code,))
+                vehicles = VehicleDAO._sort_by_battery(fleet_state.find(city=city_code, status='空闲中'), reverse=True)
             else:
                 # 确保坐标是数值类型
                 try:
                     pickup_x = float(pickup_location_x)
                     pickup_y = float(pickup_location_y)
-      
                     
-                    # 计算当前位置与乘客上车点之间的欧几里得距离
-                    query = """
-                    SELECT 
-                        vehicle_id, plate_number, model, current_status, battery_level,
-                        mileage, current_location_x, current_location_y, current_location_name,
-                        current_city, operating_city, 
-                        SQRT(POWER(current_location_x - %s, 2) + POWER(current_location_y - %s, 2)) AS distance
-                    FROM vehicles 
-                    WHERE operating_city = %s AND current_status = '空闲中'
-                    ORDER BY distance ASC, battery_level DESC
-                    LIMIT 1
-                    """
-                    vehicles = BaseDAO.execute_query(query, (pickup_x, pickup_y, city_code))
+                    # 通过空间索引查找距离上车点最近的空闲车辆，距离相同时电量高者优先
+                    candidates = fleet_state.nearest(city_code, pickup_x, pickup_y, k=1, status='空闲中')
+                    vehicles = sorted(candidates, key=lambda v: (v['distance'], -(v.get('battery_level') or 0)))
                 except (ValueError, TypeError) as e:
                     print(f"坐标转换错误: {e}, 将按电量排序返回车辆")
                     # 如果坐标转换出错，退回到电量排序
-                    query = """
-                    SELECT 
-                        vehicle_id, plate_number, model, current_status, battery_level,
-                        mileage, current_location_x, current_location_y, current_location_name,
-                        current_city, operating_city
-                    FROM vehicles 
-                    WHERE operating_city = %s AND current_status = '空闲中'
-                    ORDER BY battery_level DESC
-                    LIMIT 1
-                    """
-                    vehicles = BaseDAO.execute_query(query, (city_code,))
+                    vehicles = VehicleDAO._sort_by_battery(fleet_state.find(city=city_code, status='空闲中'), reverse=True)
             
             if not vehicles:
                 print(f"在城市 {city_code} 没有找到空闲车辆")
@@ -808,6 +813,7 @@ class VehicleDAO(BaseDAO):
     def update_vehicle_location_coordinates(vehicle_id, location_x, location_y, location_name=None):
         """更新车辆坐标位置"""
         try:
+            flush_pending_telemetry(vehicle_id)
             if location_name:
                 query = """
                 UPDATE vehicles
@@ -815,6 +821,8 @@ class VehicleDAO(BaseDAO):
                 WHERE vehicle_id = %s
                 """
                 affected_rows = BaseDAO.execute_update(query, (location_x, location_y, location_name, vehicle_id))
+                get_fleet_state().apply(vehicle_id, current_location_x=location_x, current_location_y=location_y,
+                                        current_location_name=location_name)
             else:
                 query = """
                 UPDATE vehicles
@@ -822,6 +830,7 @@ class VehicleDAO(BaseDAO):
                 WHERE vehicle_id = %s
                 """
                 affected_rows = BaseDAO.execute_update(query, (location_x, location_y, vehicle_id))
+                get_fleet_state().apply(vehicle_id, current_location_x=location_x, current_location_y=location_y)
                 
             return affected_rows > 0
         except Exception as e:
@@ -833,12 +842,15 @@ class VehicleDAO(BaseDAO):
     def update_vehicle_location_and_battery(vehicle_id, location_x, location_y, location_name, battery_level):
         """更新车辆坐标位置和电量"""
         try:
+            flush_pending_telemetry(vehicle_id)
             query = """
             UPDATE vehicles
             SET current_location_x = %s, current_location_y = %s, current_location_name = %s, battery_level = %s
             WHERE vehicle_id = %s
             """
             affected_rows = BaseDAO.execute_update(query, (location_x, location_y, location_name, battery_level, vehicle_id))
+            get_fleet_state().apply(vehicle_id, current_location_x=location_x, current_location_y=location_y,
+                                    current_location_name=location_name, battery_level=battery_level)
                 
             
             # 检查电量是否为0，如果是则将状态更新为"电量不足"
@@ -850,9 +862,77 @@ class VehicleDAO(BaseDAO):
             traceback.print_exc()
             raise e 
 
+    @staticmethod
+    def buffer_vehicle_telemetry(vehicle_id, location_x, location_y, location_name=None, battery_level=None):
+        """写入行驶途中的位置/电量到写缓冲，由后台线程合并后批量写库
+
+        电量耗尽时立即同步写入并检查电量不足状态。
+        """
+        buffer = get_telemetry_buffer()
+        buffer.record(vehicle_id, location_x, location_y, location_name, battery_level)
+
+        fields = {'current_location_x': location_x, 'current_location_y': location_y}
+        if location_name is not None:
+            fields['current_location_name'] = location_name
+        if battery_level is not None:
+            fields['battery_level'] = battery_level
+        get_fleet_state().apply(vehicle_id, **fields)
+
+        if battery_level is not None and battery_level <= 0:
+            buffer.flush_vehicle(vehicle_id)
+            VehicleDAO.check_and_update_zero_battery(vehicle_id, battery_level)
+        return True
+
+    @staticmethod
+    def bulk_update_vehicle_telemetry(entries):
+        """用一条 CASE 批量 UPDATE 写入多辆车的位置/电量
+
+        Args:
+            entries: 记录列表，每条包含 vehicle_id、location_x、location_y，
+                     以及可选的 location_name、battery_level（为None时保持原值）
+
+        Returns:
+            int: 影响的行数
+        """
+        try:
+            if not entries:
+                return 0
+
+            assignments = []
+            params = []
+
+            def add_case(column, key, keep_original):
+                rows = [entry for entry in entries if entry.get(key) is not None]
+                if not rows:
+                    return
+                clause = f"{column} = CASE vehicle_id" + " WHEN %s THEN %s" * len(rows)
+                if keep_original:
+                    clause += f" ELSE {column}"
+                assignments.append(clause + " END")
+                for entry in rows:
+                    params.extend([entry['vehicle_id'], entry[key]])
+
+            add_case('current_location_x', 'location_x', False)
+            add_case('current_location_y', 'location_y', False)
+            add_case('current_location_name', 'location_name', True)
+            add_case('battery_level', 'battery_level', True)
+
+            vehicle_ids = [entry['vehicle_id'] for entry in entries]
+            query = (
+                "UPDATE vehicles SET " + ", ".join(assignments) +
+                " WHERE vehicle_id IN (" + ", ".join(["%s"] * len(vehicle_ids)) + ")"
+            )
+            params.extend(vehicle_ids)
+
+            return BaseDAO.execute_update(query, params)
+        except Exception as e:
+            print(f"批量更新车辆遥测错误: {str(e)}")
+            traceback.print_exc()
+            raise e
+
     @staticmethod
     def find_nearest_available_charging_station(vehicle_x, vehicle_y, city_code):
-        """查找最近的有空位的充电站
+        """查找最近的有空位的充电站（只查询，不预约；预约使用充电站预约管理器的 reserve_nearest）
         
         Args:
             vehicle_x: 车辆当前X坐标
@@ -863,115 +943,15 @@ class VehicleDAO(BaseDAO):
             dict: 包含充电站信息的字典，如果找不到则返回None
         """
         try:
-            
-            # 使用事务和临时表获取更准确的充电站负载情况
-            conn = BaseDAO.get_connection()
-            try:
-                # 开始事务
-                conn.start_transaction(isolation_level='READ COMMITTED')
-                cursor = conn.cursor(dictionary=True)
-                
-                # 获取可用的充电站列表，使用更严格的条件筛选
-                query = """
-                SELECT 
-                    station_id, station_code, city_code, location_x, location_y, 
-                    current_vehicles, max_capacity,
-                    SQRT(POWER(location_x - %s, 2) + POWER(location_y - %s, 2)) AS distance
-                FROM 
-                    charging_stations
-                WHERE 
-                    city_code = %s AND
-                    current_vehicles < max_capacity  -- 确保当前车辆数量小于最大容量
-                ORDER BY 
-                    distance ASC
-                """
-                
-                cursor.execute(query, (vehicle_x, vehicle_y, city_code))
-                stations = cursor.fetchall()
-                
-                if not stations:
-                    conn.rollback()
-                    return None
-                
- 
-                # 获取向充电站移动中的车辆数量统计
-                vehicles_to_station_query = """
-                SELECT 
-                    SUBSTRING_INDEX(current_location_name, ' ', -1) AS station_code,
-                    COUNT(*) as vehicles_count
-                FROM vehicles
-                WHERE 
-                    current_status = '前往充电' AND 
-                    current_city = %s AND
-                    current_location_name LIKE '前往充电站%'
-                GROUP BY SUBSTRING_INDEX(current_location_name, ' ', -1)
-                """
-                
-                cursor.execute(vehicles_to_station_query, (city_code,))
-                vehicles_to_station = cursor.fetchall()
-                
-                # 创建充电站ID到前往车辆数量的映射
-                station_pending_count = {}
-                for item in vehicles_to_station:
-                    station_code = item['station_code']
-                    station_pending_count[station_code] = item['vehicles_count']
-                
-             # 找到有足够容量的最近充电站，并确保事务隔离
-                for station in stations:
-                    station_code = station['station_code']
-                    
-                    # 再次查询最新状态确保数据一致性
-                    verify_query = """
-                    SELECT current_vehicles, max_capacity
-                    FROM charging_stations 
-                    WHERE station_code = %s AND city_code = %s
-                    """
-                    cursor.execute(verify_query, (station_code, city_code))
-                    latest_info = cursor.fetchone()
-                    
-                    if not latest_info:
-                        continue
-                    
-                    current_vehicles = latest_info['current_vehicles']
-                    max_capacity = latest_info['max_capacity']
-                    
-                    # 获取前往该充电站的车辆数
-                    pending_vehicles = station_pending_count.get(station_code, 0)
-                    
-                    # 为了防止竞态条件，预留一个位置的缓冲
-                    safety_buffer = 1
-                    
-                    # 检查是否有足够的剩余容量
-                    if (current_vehicles + pending_vehicles + safety_buffer) <= max_capacity:
-                        # 计算距离并格式化
-                        station['distance'] = float(station['distance'])
-                        station['distance_formatted'] = f"{station['distance']:.2f} 单位"
-                        station['available_slots'] = max_capacity - current_vehicles - pending_vehicles
-                        
-                        
-                        # 使用事务中获取的最新值
-                        station['current_vehicles'] = current_vehicles
-                        station['max_capacity'] = max_capacity
-                        conn.commit()
-                        return station
-                
-                conn.rollback()
+            stations = get_charging_reservations().available_stations(city_code, vehicle_x, vehicle_y)
+            if not stations:
                 return None
-                
-            except Exception as tx_e:
-                try:
-                    conn.rollback()
-                except:
-                    pass
-                print(f"查找最近充电站事务错误: {str(tx_e)}")
-                traceback.print_exc()
-                return None
-            finally:
-                try:
-                    cursor.close()
-                    conn.close()
-                except:
-                    pass
+            
+            station = stations[0]
+            station['distance'] = float(station['distance'])
+            station['distance_formatted'] = f"{station['distance']:.2f} 单位"
+            station['current_vehicles'] = station['occupied']
+            return station
                     
         except Exception as e:
             print(f"查找最近充电站错误: {str(e)}")
@@ -990,6 +970,7 @@ class VehicleDAO(BaseDAO):
             bool: 更新是否成功
         """
         try:
+            flush_pending_telemetry(vehicle_id)
             query = """
             UPDATE vehicles
             SET current_location_name = %s
@@ -997,6 +978,7 @@ class VehicleDAO(BaseDAO):
             """
             
             affected_rows = BaseDAO.execute_update(query, (location_name, vehicle_id))
+            get_fleet_state().apply(vehicle_id, current_location_name=location_name)
 
             return affected_rows > 0
         except Exception as e:
@@ -1016,6 +998,7 @@ class VehicleDAO(BaseDAO):
             bool: 更新是否成功
         """
         try:
+            flush_pending_telemetry(vehicle_id)
             # 先获取车辆当前状态和电量
             vehicle = VehicleDAO.get_vehicle_by_id(vehicle_id)
             if not vehicle:
@@ -1037,6 +1020,7 @@ class VehicleDAO(BaseDAO):
             """
             
             affected_rows = BaseDAO.execute_update(query, (battery_level, vehicle_id))
+            get_fleet_state().apply(vehicle_id, battery_level=battery_level)
             
             # 检查电量是否为0，如果是则将状态更新为"电量不足"
             VehicleDAO.check_and_update_zero_battery(vehicle_id, battery_level)
@@ -1058,47 +1042,12 @@ class VehicleDAO(BaseDAO):
             tuple: (总剩余容量, 前往充电站的车辆总数)
         """
         try:
-            print(f"获取城市 {city_code} 的充电站容量状态")
-            
-            # 获取所有充电站的总容量和当前车辆数
-            stations_query = """
-            SELECT 
-                SUM(max_capacity) as total_capacity,
-                SUM(current_vehicles) as total_current_vehicles
-            FROM 
-                charging_stations
-            WHERE 
-                city_code = %s
-            """
-            
-            stations_result = BaseDAO.execute_query(stations_query, (city_code,))
-            
-            if not stations_result or len(stations_result) == 0:
-                print(f"城市 {city_code} 没有充电站数据")
-                return 0, 0
-                
-            total_capacity = stations_result[0]['total_capacity'] or 0
-            total_current_vehicles = stations_result[0]['total_current_vehicles'] or 0
-            total_remaining_capacity = total_capacity - total_current_vehicles
-            
-            # 获取前往充电站的车辆总数
-            vehicles_to_station_query = """
-            SELECT 
-                COUNT(*) as total_pending_vehicles
-            FROM vehicles
-            WHERE 
-                current_status IN ('等待充电', '前往充电', '等待充电') AND 
-                current_city = %s AND
-                current_location_name LIKE '前往充电站%'
-            """
-            
-            pending_result = BaseDAO.execute_query(vehicles_to_station_query, (city_code,))
-            total_pending_vehicles = pending_result[0]['total_pending_vehicles'] if pending_result else 0
+            status = get_charging_reservations().city_status(city_code)
             
-            print(f"城市 {city_code} 充电站总容量: {total_capacity}, 已使用: {total_current_vehicles}, " +
-                  f"剩余: {total_remaining_capacity}, 前往中: {total_pending_vehicles}")
+            print(f"城市 {city_code} 充电站总容量: {status['total_capacity']}, 已使用: {status['occupied']}, " +
+                  f"剩余: {status['remaining']}, 前往中: {status['reserved']}, 排队: {status['queued']}")
                   
-            return total_remaining_capacity, total_pending_vehicles
+            return status['remaining'], status['reserved']
         
         except Exception as e:
             print(f"获取充电站容量状态出错: {str(e)}")
@@ -1158,27 +1107,24 @@ class VehicleDAO(BaseDAO):
                             WHERE vehicle_id = %s
                             """
                             BaseDAO.execute_update(update_query, ("电量耗尽位置", vehicle_id))
+                            get_fleet_state().apply(vehicle_id, current_location_name="电量耗尽位置")
                         except Exception as e:
                             print(f"更新位置名称错误: {str(e)}")
                             traceback.print_exc()
                     
-                    # 从位置名称中检查是否有充电站关联
-                    if '前往充电站' in current_location_name:
+                    # 从位置名称中检查是否有充电站关联（"前往充电"状态的释放由 update_vehicle_status 处理）
+                    if '前往充电站' in current_location_name and current_status != '前往充电':
                         import re
                         match = re.search(r'前往充电站\s+(\w+)', current_location_name)
                         if match and city_code:
                             station_code = match.group(1)
                             print(f"检测到车辆 {vehicle_id} 位置名称包含充电站 {station_code} 信息，尝试释放位置")
                             try:
-                                from app.dao.charging_station_dao import ChargingStationDAO
                                 # 释放充电站位置
-                                success, old_count, new_count, max_capacity = ChargingStationDAO.update_station_vehicle_count(
-                                    station_code, city_code, -1, check_capacity=False
-                                )
-                                if success:
-                                    print(f"车辆 {vehicle_id} 电量耗尽，已释放充电站 {station_code} 位置，当前负载: {new_count}/{max_capacity}")
+                                if get_charging_reservations().release(vehicle_id, city_code, station_code):
+                                    print(f"车辆 {vehicle_id} 电量耗尽，已释放充电站 {station_code} 位置")
                                 else:
-                                    print(f"车辆 {vehicle_id} 电量耗尽，释放充电站 {station_code} 位置失败")
+                                    print(f"车辆 {vehicle_id} 电量耗尽，充电站 {station_code} 没有该车的占用")
                             except Exception as e:
                                 print(f"释放充电站位置错误: {str(e)}")
                                 traceback.print_exc()
@@ -1234,20 +1180,11 @@ class VehicleDAO(BaseDAO):
         try:
             print(f"查找最近等待充电车辆 - 城市: {city_code}, 充电站坐标: ({station_x}, {station_y})")
             
-            # 查询等待充电状态的车辆，按与特定充电站的距离排序（而不是所有充电站）
-            query = """
-            SELECT 
-                vehicle_id, plate_number, model, current_status, battery_level,
-                mileage, current_location_x, current_location_y, current_location_name,
-                current_city, operating_city,
-                SQRT(POWER(current_location_x - %s, 2) + POWER(current_location_y - %s, 2)) AS distance
-            FROM vehicles 
-            WHERE operating_city = %s AND current_status = '等待充电'
-            ORDER BY distance ASC, battery_level ASC
-            LIMIT 1
-            """
-            
-            vehicles = BaseDAO.execute_query(query, (station_x, station_y, city_code))
+            # 通过空间索引查找离该充电站最近的等待充电车辆，距离相同时电量低者优先
+            candidates = get_fleet_state().nearest(
+                city_code, float(station_x), float(station_y), k=1, status='等待充电'
+            )
+            vehicles = sorted(candidates, key=lambda v: (v['distance'], v.get('battery_level') or 0))
             
             if not vehicles:
                 print(f"在城市 {city_code} 没有找到等待充电的车辆")
@@ -1435,6 +1372,7 @@ class VehicleDAO(BaseDAO):
                 # 获取最后插入的ID
                 new_id = cursor.lastrowid
                 print(f"插入成功，获取到新ID: {new_id}")
+                get_fleet_state().invalidate(new_id)
                 
                 return new_id
             finally:
@@ -1486,6 +1424,7 @@ class VehicleDAO(BaseDAO):
             """
             
             affected_rows = BaseDAO.execute_update(update_query, (new_mileage, new_total_orders, vehicle_id))
+            get_fleet_state().apply(vehicle_id, mileage=new_mileage)
             
             if affected_rows > 0:
                 return True
@@ -0,0 +1,79 @@
+/**
+ * 后台任务辅助函数
+ * 耗时操作（批量生成订单、报表导出等）在服务端作为后台任务执行，
+ * 这里负责轮询 /jobs/<job_id> 获取进度，并在导出完成后下载结果文件。
+ */
+
+// 任务结束状态
+const JOB_FINISHED_STATUSES = ['succeeded', 'failed', 'cancelled', 'interrupted'];
+
+/**
+ * 轮询后台任务直到结束
+ * @param {string} jobId 任务ID
+ * @param {function} onProgress 每次轮询后的回调，参数为任务记录
+ * @param {number} interval 轮询间隔（毫秒）
+ * @returns {Promise<object>} 任务成功时返回任务记录，失败、取消或中断时 reject
+ */
+function pollJob(jobId, onProgress, interval = 1000) {
+    return new Promise(function(resolve, reject) {
+        function check() {
+            fetch(`/jobs/${jobId}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (data.status !== 'success') {
+                        reject(new Error(data.message || '查询任务状态失败'));
+                        return;
+                    }
+                    const job = data.data;
+                    if (onProgress) {
+                        onProgress(job);
+                    }
+                    if (job.status === 'succeeded') {
+                        resolve(job);
+                    } else if (JOB_FINISHED_STATUSES.includes(job.status)) {
+                        reject(new Error(job.error || job.progress.message || '任务未完成'));
+                    } else {
+                        setTimeout(check, interval);
+                    }
+                })
+                .catch(reject);
+        }
+        check();
+    });
+}
+
+/**
+ * 以后台任务方式导出文件：提交任务、等待完成后下载
+ * @param {string} url 导出地址（可带查询参数）
+ * @param {string} label 提示中显示的导出名称
+ */
+function runAsyncExport(url, label = '文件') {
+    const separator = url.includes('?') ? '&' : '?';
+    showToast(`${label}正在生成中，请稍候...`, 'info', 1500);
+    return fetch(`${url}${separator}async=1`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.status !== 'success') {
+                throw new Error(data.message || '提交导出任务失败');
+            }
+            return pollJob(data.data.job_id);
+        })
+        .then(job => {
+            window.location.href = `/jobs/${job.job_id}/download`;
+            showToast(`${label}导出成功！`, 'success');
+        })
+        .catch(error => {
+            console.error('导出失败:', error);
+            showToast(`${label}导出失败: ${error.message}`, 'error');
+        });
+}
+
+// 带 data-async-export 属性的导出链接改为后台任务导出
+document.addEventListener('click', function(e) {
+    const link = e.target.closest('a[data-async-export]');
+    if (!link) {
+        return;
+    }
+    e.preventDefault();
+    runAsyncExport(link.getAttribute('href'), link.dataset.asyncExport || '文件');
+});
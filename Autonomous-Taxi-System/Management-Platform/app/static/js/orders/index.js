@@ -878,9 +878,9 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // 显示进度条和状态
             generateProgress.style.display = 'block';
-            generateProgress.querySelector('.progress-bar').style.width = '20%';
+            generateProgress.querySelector('.progress-bar').style.width = '0%';
             generationStatus.style.display = 'block';
-            generationStatus.textContent = '正在生成订单，请稍候...';
+            generationStatus.textContent = '正在提交订单生成任务...';
             generationStatus.className = 'alert alert-info';
             
             // 禁用提交按钮
@@ -898,7 +898,17 @@ document.addEventListener('DOMContentLoaded', function() {
                 formData.update_last_login = updateLastLoginTime.checked;
             }
             
-            // 发送API请求
+            // 获取上下车点分布选项
+            const followHotspots = document.getElementById('followHotspots');
+            if (followHotspots) {
+                formData.follow_hotspots = followHotspots.checked;
+            }
+            const avoidObstacles = document.getElementById('avoidObstacles');
+            if (avoidObstacles) {
+                formData.avoid_obstacles = avoidObstacles.checked;
+            }
+            
+            // 提交后台任务，然后轮询任务进度
             fetch('/orders/api/bulk_add_orders', {
                 method: 'POST',
                 headers: {
@@ -906,42 +916,41 @@ document.addEventListener('DOMContentLoaded', function() {
                 },
                 body: JSON.stringify(formData)
             })
-            .then(response => {
-                // 更新进度条
-                generateProgress.querySelector('.progress-bar').style.width = '70%';
-                return response.json();
-            })
+            .then(response => response.json())
             .then(data => {
-                // 更新进度条到100%
+                if (data.status !== 'success') {
+                    throw new Error(data.message);
+                }
+                return pollJob(data.data.job_id, function(job) {
+                    // 按任务进度更新进度条
+                    generateProgress.querySelector('.progress-bar').style.width = `${job.progress.percent}%`;
+                    if (job.progress.message) {
+                        generationStatus.textContent = job.progress.message;
+                    }
+                });
+            })
+            .then(job => {
+                const message = job.result.message;
                 generateProgress.querySelector('.progress-bar').style.width = '100%';
                 
-                if (data.status === 'success') {
-                    // 显示成功消息
-                    generationStatus.textContent = data.message;
-                    generationStatus.className = 'alert alert-success';
-                    
-                    // 显示Toast消息
-                    showLocalToast(data.message, 'success');
-                    
-                    // 3秒后刷新页面
-                    setTimeout(function() {
-                        window.location.reload();
-                    }, 3000);
-                } else {
-                    // 显示错误消息
-                    generationStatus.textContent = data.message;
-                    generationStatus.className = 'alert alert-danger';
-                    showLocalToast(data.message, 'error');
-                    // 启用提交按钮
-                    generateOrdersBtn.disabled = false;
-                }
+                // 显示成功消息
+                generationStatus.textContent = message;
+                generationStatus.className = 'alert alert-success';
+                
+                // 显示Toast消息
+                showLocalToast(message, 'success');
+                
+                // 3秒后刷新页面
+                setTimeout(function() {
+                    window.location.reload();
+                }, 3000);
             })
             .catch(error => {
                 // 显示错误消息
                 generateProgress.querySelector('.progress-bar').style.width = '100%';
-                generationStatus.textContent = '生成订单时发生错误: ' + error;
+                generationStatus.textContent = '生成订单时发生错误: ' + error.message;
                 generationStatus.className = 'alert alert-danger';
-                showLocalToast('生成订单时发生错误', 'error');
+                showLocalToast(error.message || '生成订单时发生错误', 'error');
                 // 启用提交按钮
                 generateOrdersBtn.disabled = false;
             });
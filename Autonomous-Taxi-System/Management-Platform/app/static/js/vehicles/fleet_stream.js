@@ -0,0 +1,134 @@
+/**
+ * 车队位置推送通道客户端
+ * 通过 common.js 建立的 Socket.IO 连接加入城市房间，解码服务端推送的关键帧/增量帧。
+ * 每辆车 10 字节（小端）：车辆ID uint32、x*10 uint16、y*10 uint16、状态序号 uint8、电量 uint8，坐标缺失为 0xFFFF。
+ * 帧序号不连续或状态序号未知时向服务端请求补发关键帧，收到关键帧前的增量帧直接丢弃。
+ */
+class FleetStreamClient {
+    constructor(onFrame) {
+        this.onFrame = onFrame;
+        this.city = null;
+        this.seq = null;
+        this.statuses = [];
+        this.socket = (typeof socket !== 'undefined') ? socket : null;
+
+        if (this.socket) {
+            this.socket.on('fleet_frame', payload => this.handleFrame(payload));
+            // 断线重连后重新加入房间
+            this.socket.on('connect', () => {
+                if (this.city) {
+                    this.subscribe(this.city);
+                }
+            });
+        }
+    }
+
+    // 是否可以使用推送通道（页面未建立WebSocket连接时退回到定时拉取）
+    isAvailable() {
+        return this.socket !== null;
+    }
+
+    subscribe(city) {
+        this.city = city;
+        this.seq = null;
+        if (this.socket) {
+            this.socket.emit('fleet_subscribe', {city: city});
+        }
+    }
+
+    unsubscribe() {
+        this.city = null;
+        this.seq = null;
+        if (this.socket) {
+            this.socket.emit('fleet_unsubscribe');
+        }
+    }
+
+    requestKeyframe() {
+        this.seq = null;
+        if (this.socket) {
+            this.socket.emit('fleet_resync');
+        }
+    }
+
+    handleFrame(payload) {
+        if (!payload || payload.city !== this.city) {
+            return;
+        }
+        if (payload.statuses) {
+            this.statuses = payload.statuses;
+        }
+        if (payload.keyframe) {
+            // 晚到的旧关键帧不覆盖已经应用的新数据
+            if (this.seq !== null && payload.seq < this.seq) {
+                return;
+            }
+        } else {
+            if (this.seq === null || payload.seq <= this.seq) {
+                return;
+            }
+            if (payload.seq !== this.seq + 1) {
+                console.warn(`车队推送帧序号不连续: ${this.seq} -> ${payload.seq}，请求补发关键帧`);
+                this.requestKeyframe();
+                return;
+            }
+        }
+
+        const vehicles = this.decodeUpdates(payload.updates);
+        if (vehicles === null) {
+            this.requestKeyframe();
+            return;
+        }
+        this.seq = payload.seq;
+        this.onFrame({
+            city: payload.city,
+            keyframe: payload.keyframe,
+            vehicles: vehicles,
+            removed: this.decodeRemoved(payload.removed)
+        });
+    }
+
+    decodeUpdates(buffer) {
+        const view = FleetStreamClient.toDataView(buffer);
+        const vehicles = [];
+        for (let offset = 0; offset + 10 <= view.byteLength; offset += 10) {
+            const statusIndex = view.getUint8(offset + 8);
+            if (statusIndex >= this.statuses.length) {
+                console.warn('车队推送帧中的状态序号未知:', statusIndex);
+                return null;
+            }
+            const x = view.getUint16(offset + 4, true);
+            const y = view.getUint16(offset + 6, true);
+            const vehicle = {
+                vehicle_id: view.getUint32(offset, true),
+                current_status: this.statuses[statusIndex],
+                battery_level: view.getUint8(offset + 9)
+            };
+            if (x !== 0xFFFF && y !== 0xFFFF) {
+                vehicle.current_location_x = x / 10;
+                vehicle.current_location_y = y / 10;
+            }
+            vehicles.push(vehicle);
+        }
+        return vehicles;
+    }
+
+    decodeRemoved(buffer) {
+        const view = FleetStreamClient.toDataView(buffer);
+        const removed = [];
+        for (let offset = 0; offset + 4 <= view.byteLength; offset += 4) {
+            removed.push(view.getUint32(offset, true));
+        }
+        return removed;
+    }
+
+    static toDataView(buffer) {
+        if (!buffer) {
+            return new DataView(new ArrayBuffer(0));
+        }
+        if (buffer instanceof ArrayBuffer) {
+            return new DataView(buffer);
+        }
+        return new DataView(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+    }
+}
@@ -80,6 +80,12 @@ document.addEventListener('DOMContentLoaded', function() {
     
     let autoRefreshInterval = null;
     
+    // 车队位置推送通道，以及两次刷新之间累积的变化
+    const fleetStream = new FleetStreamClient(handleFleetFrame);
+    let pendingFleetChanges = {};
+    let pendingFleetRemoved = new Set();
+    let pendingFleetKeyframe = null;
+    
     // 从服务器加载最新的城市地图配置
     let mapInitialized = false;
     let map = null;
@@ -286,6 +292,12 @@ document.addEventListener('DOMContentLoaded', function() {
             // 加载新城市的数据
             loadCityData(selectedCity);
             
+            // 推送通道切换到新城市的房间
+            if (fleetStream.city) {
+                resetFleetChanges();
+                fleetStream.subscribe(selectedCity);
+            }
+            
             showToast(`已切换到${selectedCity}地图`, 'success');
         });
         
@@ -356,6 +368,17 @@ document.addEventListener('DOMContentLoaded', function() {
         stopAutoRefresh(); // 先停止现有的刷新
         
         const interval = parseInt(refreshIntervalSelect.value) * 1000; // 转换为毫秒
+        
+        // 优先使用推送通道：服务端只推送变化的车辆，按刷新间隔合并后更新地图
+        if (fleetStream.isAvailable()) {
+            fleetStream.subscribe(selectedCity);
+            autoRefreshInterval = setInterval(function() {
+                applyFleetChanges(selectedCity);
+            }, interval);
+            showToast(`自动刷新已启动（实时推送），间隔${refreshIntervalSelect.value}秒`, 'info');
+            return;
+        }
+        
         autoRefreshInterval = setInterval(function() {
             // 使用智能刷新方法
             smartRefresh(selectedCity);
@@ -527,6 +550,10 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // 停止自动刷新
     function stopAutoRefresh() {
+        if (fleetStream.city) {
+            fleetStream.unsubscribe();
+        }
+        resetFleetChanges();
         if (autoRefreshInterval) {
             clearInterval(autoRefreshInterval);
             autoRefreshInterval = null;
@@ -534,6 +561,75 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // 收到推送帧时只记录变化，按刷新间隔统一应用到地图
+    function handleFleetFrame(frame) {
+        if (frame.city !== selectedCity) {
+            return;
+        }
+        if (frame.keyframe) {
+            pendingFleetKeyframe = new Set(frame.vehicles.map(v => v.vehicle_id));
+            pendingFleetRemoved.clear();
+        }
+        frame.vehicles.forEach(vehicle => {
+            pendingFleetChanges[vehicle.vehicle_id] = vehicle;
+            pendingFleetRemoved.delete(vehicle.vehicle_id);
+        });
+        frame.removed.forEach(vehicleId => {
+            delete pendingFleetChanges[vehicleId];
+            pendingFleetRemoved.add(vehicleId);
+        });
+    }
+    
+    function resetFleetChanges() {
+        pendingFleetChanges = {};
+        pendingFleetRemoved = new Set();
+        pendingFleetKeyframe = null;
+    }
+    
+    // 把累积的推送变化应用到车辆标记，出现本地没有的车辆时整体拉取一次
+    function applyFleetChanges(city) {
+        const changes = pendingFleetChanges;
+        const removed = pendingFleetRemoved;
+        const keyframe = pendingFleetKeyframe;
+        resetFleetChanges();
+        
+        Object.keys(vehicleMarkers).forEach(id => {
+            const vehicleId = parseInt(id);
+            if (removed.has(vehicleId) || (keyframe && !keyframe.has(vehicleId))) {
+                map.remove(vehicleMarkers[id]);
+                delete vehicleMarkers[id];
+            }
+        });
+        
+        let unknownVehicles = 0;
+        Object.values(changes).forEach(change => {
+            const marker = vehicleMarkers[change.vehicle_id];
+            if (!marker) {
+                unknownVehicles++;
+                return;
+            }
+            const oldData = marker.getExtData().vehicleData;
+            const vehicle = {...oldData, ...change};
+            // 推送坐标精度为0.1，量化误差以内沿用原坐标，避免触发路径规划
+            if (change.current_location_x === undefined ||
+                (Math.abs(parseFloat(oldData.current_location_x) - change.current_location_x) < 0.1 &&
+                 Math.abs(parseFloat(oldData.current_location_y) - change.current_location_y) < 0.1)) {
+                vehicle.current_location_x = oldData.current_location_x;
+                vehicle.current_location_y = oldData.current_location_y;
+            }
+            try {
+                updateVehicleMarker(marker, vehicle, city);
+            } catch (err) {
+                console.error('应用车辆推送数据时出错:', err, change);
+            }
+        });
+        
+        if (unknownVehicles > 0) {
+            console.log(`推送中有 ${unknownVehicles} 辆本地没有的车辆，重新拉取车辆数据`);
+            smartRefresh(city);
+        }
+    }
+    
     // 更新车辆数据而不重新创建所有标记
     function updateVehiclesData(city) {
         console.log(`更新${city}的车辆数据...`);
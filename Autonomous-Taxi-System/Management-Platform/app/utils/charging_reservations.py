@@ -0,0 +1,469 @@
+"""
+充电站预约管理
+在内存中按充电站维护占用情况：预约（前往中）、充电中和未关联车辆的占用数，以及每个充电站的先进先出等待队列。
+预约、释放和排队在同一把锁内完成，取代原先 SERIALIZABLE 事务 + SELECT ... FOR UPDATE
+以及对 vehicles 表 current_location_name LIKE '前往充电站 X%' 的计数扫描。
+
+- 城市首次访问时从 charging_stations 读取 current_vehicles，并从车队状态关联正在前往、正在充电和等待充电的车辆；
+- 充电站坐标和容量来自充电站空间索引（app.utils.spatial_index），容量修改随索引刷新生效；
+- 占用数变化后由后台线程合并写回 charging_stations.current_vehicles（批量 UPDATE）；
+- 释放车位时先把车位分配给该充电站队列中最早排队的车辆，队列为空时分配给同城其他充电站排队最久的车辆，
+  由车队仿真引擎（app.utils.fleet_simulation）派车前往。
+"""
+import atexit
+import threading
+import time
+import traceback
+from collections import deque
+from itertools import count
+
+from app.utils.spatial_index import get_station_index
+
+# 占用数写回间隔（秒）
+PERSIST_INTERVAL = 1.0
+
+# 车辆在充电站的占用状态
+SLOT_RESERVED = 'reserved'
+SLOT_CHARGING = 'charging'
+
+
+class StationSlots:
+    """单个充电站的占用情况"""
+
+    __slots__ = ('holders', 'untracked', 'queue')
+
+    def __init__(self, untracked=0):
+        self.holders = {}          # 车辆ID -> SLOT_RESERVED / SLOT_CHARGING
+        self.untracked = untracked # 数据库中已计数但没有关联到车辆的占用
+        self.queue = deque()       # (排队序号, 车辆ID)
+
+    @property
+    def occupied(self):
+        return len(self.holders) + self.untracked
+
+
+class ChargingReservationManager(threading.Thread):
+    """充电站预约管理器"""
+
+    def __init__(self, persist_interval=PERSIST_INTERVAL):
+        super().__init__(name='charging-reservations', daemon=True)
+        self.persist_interval = persist_interval
+        self._lock = threading.RLock()
+        self._cities = {}              # 城市 -> {充电站编号: StationSlots}
+        self._vehicle_station = {}     # 车辆ID -> (城市, 充电站编号)，持有车位的车辆
+        self._waiting = {}             # 车辆ID -> (城市, 充电站编号)，排队中的车辆
+        self._dirty = set()            # 待写回的 (城市, 充电站编号)
+        self._sequence = count()
+        self._shutdown = threading.Event()
+
+        # 运行指标
+        self.reservations = 0
+        self.rejections = 0
+        self.releases = 0
+        self.grants = 0
+        self.enqueued = 0
+        self.persist_count = 0
+        self.rows_written = 0
+        self.last_persist_duration = 0.0
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+    def reserve_nearest(self, city_code, vehicle_id, x, y):
+        """为车辆预约最近的有空位充电站
+
+        Returns:
+            dict: 充电站信息（含 distance、available_slots），没有空位时返回 None
+        """
+        with self._lock:
+            slots = self._city(city_code)
+            self._drop_vehicle(vehicle_id)
+            for station in get_station_index().nearest_stations(city_code, x, y):
+                entry = slots.setdefault(station['station_code'], StationSlots())
+                if entry.occupied < station['max_capacity']:
+                    self._hold(city_code, station['station_code'], vehicle_id, SLOT_RESERVED)
+                    station['available_slots'] = station['max_capacity'] - entry.occupied
+                    return station
+            self.rejections += 1
+            return None
+
+    def reserve_or_enqueue(self, city_code, vehicle_id, x, y):
+        """预约最近的有空位充电站，没有空位时在最近的充电站排队
+
+        Returns:
+            dict: 预约到的充电站，排队时返回 None
+        """
+        with self._lock:
+            station = self.reserve_nearest(city_code, vehicle_id, x, y)
+            if station is None:
+                self.enqueue(city_code, vehicle_id, x, y)
+            return station
+
+    def enqueue(self, city_code, vehicle_id, x, y):
+        """在最近的充电站排队等待车位
+
+        Returns:
+            str: 排队的充电站编号，城市没有充电站时返回 None
+        """
+        stations = get_station_index().nearest_stations(city_code, x, y, k=1)
+        if not stations:
+            return None
+        station_code = stations[0]['station_code']
+        with self._lock:
+            slots = self._city(city_code)
+            self._drop_vehicle(vehicle_id)
+            slots.setdefault(station_code, StationSlots()).queue.append((next(self._sequence), vehicle_id))
+            self._waiting[vehicle_id] = (city_code, station_code)
+            self.enqueued += 1
+        return station_code
+
+    def begin_charging(self, vehicle_id):
+        """车辆到达充电站，预约转为充电中"""
+        with self._lock:
+            location = self._vehicle_station.get(vehicle_id)
+            if location is not None:
+                city_code, station_code = location
+                self._cities[city_code][station_code].holders[vehicle_id] = SLOT_CHARGING
+
+    def release(self, vehicle_id, city_code=None, station_code=None):
+        """释放车辆持有的车位（车辆没有关联时按 city_code/station_code 释放一个未关联占用），
+        并把车位分配给排队的车辆
+
+        Returns:
+            bool: 是否释放了车位
+        """
+        grant = None
+        with self._lock:
+            location = self._vehicle_station.pop(vehicle_id, None)
+            if location is not None:
+                city_code, station_code = location
+                self._cities[city_code][station_code].holders.pop(vehicle_id, None)
+            elif city_code and station_code:
+                entry = self._city(city_code).get(station_code)
+                if entry is None or entry.untracked <= 0:
+                    return False
+                entry.untracked -= 1
+            else:
+                self.cancel_wait(vehicle_id)
+                return False
+            self.releases += 1
+            self._dirty.add((city_code, station_code))
+            grant = self._grant_next(city_code, station_code)
+        if grant is not None:
+            self._dispatch_grant(*grant)
+        return True
+
+    def cancel_wait(self, vehicle_id):
+        """车辆离开等待队列
+
+        Returns:
+            bool: 车辆是否在排队
+        """
+        with self._lock:
+            location = self._waiting.pop(vehicle_id, None)
+            if location is None:
+                return False
+            city_code, station_code = location
+            queue = self._cities[city_code][station_code].queue
+            for item in queue:
+                if item[1] == vehicle_id:
+                    queue.remove(item)
+                    break
+            return True
+
+    def adjust(self, station_code, city_code, increment, check_capacity=True):
+        """调整未关联车辆的占用数（兼容按数量增减的调用方）
+
+        Returns:
+            tuple: (成功标志, 更新前数量, 更新后数量, 最大容量)
+        """
+        capacity = self._capacity(city_code, station_code)
+        if capacity is None:
+            print(f"找不到充电站: {station_code}, {city_code}")
+            return False, 0, 0, 0
+        grant = None
+        with self._lock:
+            entry = self._city(city_code).setdefault(station_code, StationSlots())
+            old_count = entry.occupied
+            if increment > 0 and check_capacity and old_count + increment > capacity:
+                self.rejections += 1
+                return False, old_count, old_count, capacity
+            entry.untracked = max(entry.untracked + increment, 0)
+            self._dirty.add((city_code, station_code))
+            if increment < 0:
+                grant = self._grant_next(city_code, station_code)
+            new_count = entry.occupied
+        if grant is not None:
+            self._dispatch_grant(*grant)
+        return True, old_count, new_count, capacity
+
+    def station_load(self, city_code, station_code):
+        """充电站占用情况
+
+        Returns:
+            dict: occupied、reserved、charging、untracked、queued、max_capacity、available_slots；充电站不存在时返回 None
+        """
+        capacity = self._capacity(city_code, station_code)
+        if capacity is None:
+            return None
+        with self._lock:
+            entry = self._city(city_code).get(station_code) or StationSlots()
+            return self._load_of(entry, capacity)
+
+    def available_stations(self, city_code, x, y):
+        """按距离升序返回有空位的充电站（只查询，不预约）"""
+        stations = get_station_index().nearest_stations(city_code, x, y)
+        with self._lock:
+            slots = self._city(city_code)
+            available = []
+            for station in stations:
+                entry = slots.get(station['station_code']) or StationSlots()
+                load = self._load_of(entry, station['max_capacity'])
+                if load['available_slots'] > 0:
+                    station.update(load)
+                    available.append(station)
+            return available
+
+    def city_status(self, city_code):
+        """城市充电站汇总
+
+        Returns:
+            dict: total_capacity、occupied、reserved、charging、queued、remaining
+        """
+        stations = get_station_index().city_stations(city_code)
+        status = {'total_capacity': 0, 'occupied': 0, 'reserved': 0, 'charging': 0, 'queued': 0}
+        with self._lock:
+            slots = self._city(city_code)
+            for station in stations:
+                load = self._load_of(slots.get(station['station_code']) or StationSlots(), station['max_capacity'])
+                status['total_capacity'] += station['max_capacity']
+                for key in ('occupied', 'reserved', 'charging', 'queued'):
+                    status[key] += load[key]
+        status['remaining'] = max(status['total_capacity'] - status['occupied'], 0)
+        return status
+
+    def station_of(self, vehicle_id):
+        """车辆持有车位的充电站 (城市, 充电站编号)，没有时返回 None"""
+        with self._lock:
+            return self._vehicle_station.get(vehicle_id)
+
+    def invalidate(self, city_code=None):
+        """丢弃内存状态，下次访问时从数据库和车队状态重新加载（先写回未保存的占用数）"""
+        self.persist()
+        with self._lock:
+            cities = [city_code] if city_code else list(self._cities)
+            for city in cities:
+                self._cities.pop(city, None)
+            for mapping in (self._vehicle_station, self._waiting):
+                for vehicle_id in [vehicle_id for vehicle_id, (city, _) in mapping.items() if city in cities]:
+                    del mapping[vehicle_id]
+
+    def persist(self):
+        """把有变化的充电站占用数写回数据库
+
+        Returns:
+            int: 写回的充电站数
+        """
+        from app.dao.charging_station_dao import ChargingStationDAO
+
+        with self._lock:
+            if not self._dirty:
+                return 0
+            rows = []
+            for city_code, station_code in self._dirty:
+                entry = self._cities.get(city_code, {}).get(station_code)
+                if entry is not None:
+                    rows.append((entry.occupied, station_code, city_code))
+            dirty, self._dirty = self._dirty, set()
+        started = time.monotonic()
+        try:
+            ChargingStationDAO.bulk_update_vehicle_counts(rows)
+        except Exception as e:
+            with self._lock:
+                self._dirty |= dirty
+            print(f"写回充电站占用数失败，共 {len(rows)} 个充电站: {e}")
+            traceback.print_exc()
+            return 0
+        self.last_persist_duration = time.monotonic() - started
+        self.persist_count += 1
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def get_metrics(self):
+        """预约管理运行指标"""
+        with self._lock:
+            holders = [state for slots in self._cities.values() for entry in slots.values()
+                       for state in entry.holders.values()]
+            untracked = sum(entry.untracked for slots in self._cities.values() for entry in slots.values())
+            metrics = {
+                'cities_loaded': len(self._cities),
+                'reserved': holders.count(SLOT_RESERVED),
+                'charging': holders.count(SLOT_CHARGING),
+                'untracked': untracked,
+                'queued': len(self._waiting),
+                'pending_writes': len(self._dirty)
+            }
+        metrics.update({
+            'reservations': self.reservations,
+            'rejections': self.rejections,
+            'releases': self.releases,
+            'grants': self.grants,
+            'enqueued': self.enqueued,
+            'persist_count': self.persist_count,
+            'rows_written': self.rows_written,
+            'last_persist_ms': round(self.last_persist_duration * 1000, 3),
+            'persist_interval': self.persist_interval
+        })
+        return metrics
+
+    def shutdown(self):
+        """停止后台线程并写回剩余变化"""
+        self._shutdown.set()
+        self.persist()
+
+    def run(self):
+        while not self._shutdown.wait(self.persist_interval):
+            try:
+                self.persist()
+            except Exception as e:
+                print(f"写回充电站占用数出错: {e}")
+                traceback.print_exc()
+
+    # ------------------------------------------------------------------
+    # 内部方法（调用方持有 _lock）
+    # ------------------------------------------------------------------
+    def _city(self, city_code):
+        slots = self._cities.get(city_code)
+        if slots is None:
+            slots = self._load_city(city_code)
+            self._cities[city_code] = slots
+        return slots
+
+    def _load_city(self, city_code):
+        """从数据库读取占用数，并从车队状态关联前往中、充电中和等待充电的车辆"""
+        from app.dao.base_dao import BaseDAO
+        from app.utils.fleet_state import get_fleet_state
+
+        slots = {}
+        rows = BaseDAO.execute_query(
+            "SELECT station_code, current_vehicles FROM charging_stations WHERE city_code = %s", (city_code,)
+        ) or []
+        counts = {row['station_code']: int(row['current_vehicles'] or 0) for row in rows}
+        for station_code in counts:
+            slots[station_code] = StationSlots()
+
+        waiting = []
+        for vehicle in get_fleet_state().find():
+            if vehicle.get('current_city') != city_code:
+                continue
+            status = vehicle.get('current_status')
+            location_name = vehicle.get('current_location_name') or ''
+            if status == '等待充电':
+                waiting.append(vehicle)
+                continue
+            if status == '前往充电' and location_name.startswith('前往充电站 '):
+                state = SLOT_RESERVED
+            elif status == '充电中' and location_name.startswith('充电站 '):
+                state = SLOT_CHARGING
+            else:
+                continue
+            station_code = location_name.split(' ')[1]
+            if station_code in slots:
+                slots[station_code].holders[vehicle['vehicle_id']] = state
+                self._vehicle_station[vehicle['vehicle_id']] = (city_code, station_code)
+
+        for station_code, entry in slots.items():
+            entry.untracked = max(counts[station_code] - len(entry.holders), 0)
+            if counts[station_code] != entry.occupied:
+                self._dirty.add((city_code, station_code))
+
+        # 重启前已在等待的车辆按车辆ID顺序在最近的充电站排队
+        index = get_station_index()
+        for vehicle in sorted(waiting, key=lambda item: item['vehicle_id']):
+            nearest = index.nearest_stations(city_code, vehicle.get('current_location_x') or 0,
+                                             vehicle.get('current_location_y') or 0, k=1)
+            if nearest and nearest[0]['station_code'] in slots:
+                station_code = nearest[0]['station_code']
+                slots[station_code].queue.append((next(self._sequence), vehicle['vehicle_id']))
+                self._waiting[vehicle['vehicle_id']] = (city_code, station_code)
+        return slots
+
+    def _hold(self, city_code, station_code, vehicle_id, state):
+        self._cities[city_code][station_code].holders[vehicle_id] = state
+        self._vehicle_station[vehicle_id] = (city_code, station_code)
+        self._dirty.add((city_code, station_code))
+        self.reservations += 1
+
+    def _drop_vehicle(self, vehicle_id):
+        """车辆重新预约或排队前，释放原有车位并退出等待队列"""
+        if vehicle_id in self._vehicle_station:
+            self.release(vehicle_id)
+        self.cancel_wait(vehicle_id)
+
+    def _grant_next(self, city_code, station_code):
+        """把空出的车位分配给排队车辆：先本站队列，再同城排队最久的车辆
+
+        Returns:
+            tuple: (车辆ID, 城市, 充电站信息)，没有排队车辆或车位已满时返回 None
+        """
+        capacity = self._capacity(city_code, station_code)
+        slots = self._cities[city_code]
+        entry = slots[station_code]
+        if capacity is None or entry.occupied >= capacity:
+            return None
+        queue = entry.queue
+        if not queue:
+            queue = min((other.queue for other in slots.values() if other.queue),
+                        key=lambda other: other[0][0], default=None)
+            if queue is None:
+                return None
+        _, vehicle_id = queue.popleft()
+        del self._waiting[vehicle_id]
+        self._hold(city_code, station_code, vehicle_id, SLOT_RESERVED)
+        self.grants += 1
+        return vehicle_id, city_code, get_station_index().get_station(city_code, station_code)
+
+    def _dispatch_grant(self, vehicle_id, city_code, station):
+        """由车队仿真引擎派获得车位的车辆前往充电站"""
+        from app.utils.fleet_simulation import get_fleet_engine
+
+        try:
+            get_fleet_engine().dispatch_to_station(vehicle_id, city_code, station)
+        except Exception as e:
+            print(f"派遣排队车辆 {vehicle_id} 前往充电站出错: {e}")
+            traceback.print_exc()
+            self.release(vehicle_id)
+
+    @staticmethod
+    def _capacity(city_code, station_code):
+        station = get_station_index().get_station(city_code, station_code)
+        return None if station is None else int(station['max_capacity'] or 0)
+
+    @staticmethod
+    def _load_of(entry, capacity):
+        states = list(entry.holders.values())
+        return {
+            'occupied': entry.occupied,
+            'reserved': states.count(SLOT_RESERVED),
+            'charging': states.count(SLOT_CHARGING),
+            'untracked': entry.untracked,
+            'queued': len(entry.queue),
+            'max_capacity': capacity,
+            'available_slots': max(capacity - entry.occupied, 0)
+        }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_charging_reservations():
+    """获取全局充电站预约管理器（首次调用时启动写回线程）"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ChargingReservationManager()
+                _manager.start()
+                atexit.register(_manager.shutdown)
+    return _manager
@@ -0,0 +1,199 @@
+"""
+仪表盘快照服务
+仪表盘的各组统计（车辆、订单、收入、活跃用户、图表、车型财务、系统警告）由后台线程按固定节奏
+并发计算，每组使用各自的数据库连接，结果合成一份快照整体替换；页面请求直接读取最近一份快照
+及其生成时长，不再在请求中串行执行统计查询。
+
+快照超过 STALE_AFTER 秒时，读取方仍拿到旧快照，同时唤醒后台线程立即刷新（stale-while-revalidate）；
+只有进程启动后尚无快照的第一次请求会同步等待一次计算。
+
+某一组计算失败时沿用上一份快照中该组的结果。已经结束的自然日的数值（昨日对比值）不会再变化，
+通过 settled() 按日缓存，每天只计算一次。
+"""
+import atexit
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+# 后台刷新间隔（秒）
+REFRESH_INTERVAL = 60
+# 快照超过该时长（秒）时，读取会触发一次后台刷新
+STALE_AFTER = 30
+
+
+class DashboardSnapshotService(threading.Thread):
+    """仪表盘统计快照的后台刷新线程"""
+
+    def __init__(self, groups, refresh_interval=REFRESH_INTERVAL, stale_after=STALE_AFTER):
+        """
+        Args:
+            groups: {组名: 计算函数}，计算函数参数为 (今天, 昨天, settled)，日期为 'YYYY-MM-DD' 字符串
+            refresh_interval: 后台刷新间隔（秒）
+            stale_after: 快照过期时长（秒）
+        """
+        super().__init__(name='dashboard-snapshots', daemon=True)
+        self.groups = dict(groups)
+        self.refresh_interval = refresh_interval
+        self.stale_after = stale_after
+        self._executor = ThreadPoolExecutor(max_workers=len(self.groups), thread_name_prefix='dashboard-group')
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()    # 同一时间只进行一次刷新
+        self._settled_lock = threading.Lock()    # 保护 _settled
+        self._settled = {}                       # (键, 日期) -> 已结束自然日的数值
+        self._wake = threading.Event()
+        self._shutdown = threading.Event()
+
+        self.refresh_count = 0
+        self.stale_reads = 0
+        self.reads = 0
+        self.group_errors = 0
+        self.last_refresh_duration = 0.0
+        self.group_durations = {}
+
+    def get(self):
+        """读取最近一份快照
+
+        Returns:
+            dict: {'groups': {组名: 结果}, 'generated_at': 生成时间, 'age_seconds': 快照时长,
+                   'stale': 是否已过期, 'errors': 本次计算失败的组名列表}
+        """
+        self.reads += 1
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh()
+            snapshot = self._snapshot
+        age = time.time() - snapshot['timestamp']
+        stale = age > self.stale_after
+        if stale:
+            self.stale_reads += 1
+            self._wake.set()
+        return {
+            'groups': snapshot['groups'],
+            'generated_at': snapshot['generated_at'],
+            'age_seconds': round(age, 1),
+            'stale': stale,
+            'errors': list(snapshot['errors'])
+        }
+
+    def request_refresh(self):
+        """要求后台线程尽快刷新一次（数据发生变化时可调用）"""
+        self._wake.set()
+
+    def refresh(self):
+        """并发计算全部统计组并替换快照；已有刷新在进行时等待其完成"""
+        refresh_count = self.refresh_count
+        with self._refresh_lock:
+            # 等锁期间其他线程已经刷新完毕，直接使用其结果
+            current = self._snapshot
+            if current is not None and self.refresh_count != refresh_count:
+                return current
+            started = time.monotonic()
+            today_date = date.today()
+            today = today_date.strftime('%Y-%m-%d')
+            yesterday = (today_date - timedelta(days=1)).strftime('%Y-%m-%d')
+            futures = {
+                name: self._executor.submit(self._run_group, name, func, today, yesterday)
+                for name, func in self.groups.items()
+            }
+            previous = current['groups'] if current is not None else {}
+            groups = {}
+            errors = []
+            for name, future in futures.items():
+                ok, value = future.result()
+                if ok:
+                    groups[name] = value
+                else:
+                    errors.append(name)
+                    if name in previous:
+                        groups[name] = previous[name]
+            self._snapshot = {
+                'groups': groups,
+                'errors': errors,
+                'timestamp': time.time(),
+                'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            self.last_refresh_duration = time.monotonic() - started
+            self.refresh_count += 1
+            self._purge_settled(today_date)
+            return self._snapshot
+
+    def settled(self, key, day, compute):
+        """已结束自然日的数值按 (键, 日期) 缓存，每天只计算一次"""
+        with self._settled_lock:
+            if (key, day) in self._settled:
+                return self._settled[(key, day)]
+        value = compute()
+        with self._settled_lock:
+            return self._settled.setdefault((key, day), value)
+
+    def get_metrics(self):
+        """快照服务运行指标"""
+        snapshot = self._snapshot
+        return {
+            'snapshot_age_seconds': round(time.time() - snapshot['timestamp'], 1) if snapshot else None,
+            'generated_at': snapshot['generated_at'] if snapshot else None,
+            'failed_groups': list(snapshot['errors']) if snapshot else [],
+            'refresh_count': self.refresh_count,
+            'reads': self.reads,
+            'stale_reads': self.stale_reads,
+            'group_errors': self.group_errors,
+            'last_refresh_ms': round(self.last_refresh_duration * 1000, 3),
+            'group_ms': dict(self.group_durations),
+            'refresh_interval': self.refresh_interval,
+            'stale_after': self.stale_after
+        }
+
+    def shutdown(self):
+        """停止后台线程"""
+        self._shutdown.set()
+        self._wake.set()
+        self._executor.shutdown(wait=False)
+
+    def run(self):
+        while not self._shutdown.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"刷新仪表盘快照出错: {e}")
+                traceback.print_exc()
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def _run_group(self, name, func, today, yesterday):
+        started = time.monotonic()
+        try:
+            return True, func(today, yesterday, self.settled)
+        except Exception as e:
+            self.group_errors += 1
+            print(f"计算仪表盘统计组 {name} 失败: {e}")
+            traceback.print_exc()
+            return False, None
+        finally:
+            self.group_durations[name] = round((time.monotonic() - started) * 1000, 3)
+
+    def _purge_settled(self, today):
+        """只保留最近两天的缓存"""
+        oldest = (today - timedelta(days=2)).strftime('%Y-%m-%d')
+        with self._settled_lock:
+            for key in [key for key in self._settled if key[1] < oldest]:
+                del self._settled[key]
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_dashboard_snapshots():
+    """获取全局仪表盘快照服务（首次调用时启动后台刷新线程）"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                from app.admin.dashboard import SNAPSHOT_GROUPS
+
+                _service = DashboardSnapshotService(SNAPSHOT_GROUPS)
+                _service.start()
+                atexit.register(_service.shutdown)
+    return _service
@@ -0,0 +1,278 @@
+"""
+数据库连接池
+为 BaseDAO（mysql.connector）以及仪表盘、优惠券模块的 pymysql 辅助函数提供统一的连接复用，
+避免每次查询都重新建立 TCP 连接和认证握手。
+
+借出的连接是一个代理对象，用法与原始连接一致，调用 close() 时连接被归还到池中而不是真正断开。
+连接池支持常驻连接数、溢出连接数、最长存活时间和借出前健康检查，并记录借出次数、等待时间等指标。
+"""
+import threading
+import time
+from collections import deque
+
+from app.config.database import db_config, db_pool_config
+
+
+class PoolTimeoutError(Exception):
+    """等待可用连接超时"""
+    pass
+
+
+class _PooledRecord:
+    """连接池中的一条原始连接及其时间信息"""
+
+    __slots__ = ('raw', 'created_at', 'last_used_at')
+
+    def __init__(self, raw):
+        now = time.time()
+        self.raw = raw
+        self.created_at = now
+        self.last_used_at = now
+
+
+class PooledConnection:
+    """借出的连接代理，close() 时归还连接池"""
+
+    def __init__(self, pool, record):
+        self._pool = pool
+        self._record = record
+
+    @property
+    def open(self):
+        """兼容 pymysql 的 connection.open 判断"""
+        if self._record is None:
+            return False
+        return getattr(self._record.raw, 'open', True)
+
+    def close(self):
+        """归还连接，可重复调用"""
+        record, self._record = self._record, None
+        if record is not None:
+            self._pool._return(record)
+
+    def __getattr__(self, name):
+        record = self.__dict__.get('_record')
+        if record is None:
+            raise AttributeError(f"连接已归还连接池，无法访问 {name}")
+        return getattr(record.raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        # 调用方忘记 close() 时兜底归还，防止连接泄漏
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """线程安全的连接池
+
+    空闲连接按后进先出复用，同一线程连续的 DAO 调用通常会拿到刚归还的那条连接，
+    长时间不用的连接自然沉到队尾，超过存活时间后被回收。
+    """
+
+    def __init__(self, name, creator, pool_size=10, max_overflow=20, timeout=30,
+                 recycle=3600, ping_interval=30):
+        self.name = name
+        self._creator = creator
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+
+        self._idle = deque()
+        self._total = 0                  # 已创建且未关闭的连接数（含借出的）
+        self._condition = threading.Condition(threading.Lock())
+
+        # 运行指标
+        self._checkouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._created = 0
+        self._closed = 0
+        self._recycled = 0
+        self._health_check_failures = 0
+        self._timeouts = 0
+
+    def connect(self):
+        """从连接池借出一条连接"""
+        started = time.time()
+        deadline = started + self.timeout
+        while True:
+            record = None
+            create = False
+            with self._condition:
+                while not self._idle and self._total >= self.pool_size + self.max_overflow:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"连接池 {self.name} 等待可用连接超时（{self.timeout}秒）"
+                        )
+                    self._condition.wait(remaining)
+                if self._idle:
+                    record = self._idle.pop()
+                else:
+                    self._total += 1
+                    create = True
+
+            if create:
+                try:
+                    record = self._create_record()
+                except Exception:
+                    with self._condition:
+                        self._total -= 1
+                        self._condition.notify()
+                    raise
+            elif not self._is_usable(record):
+                self._discard(record)
+                continue
+
+            waited = time.time() - started
+            with self._condition:
+                self._checkouts += 1
+                self._wait_time_total += waited
+                self._wait_time_max = max(self._wait_time_max, waited)
+            return PooledConnection(self, record)
+
+    def get_metrics(self):
+        """连接池运行指标"""
+        with self._condition:
+            idle = len(self._idle)
+            checkouts = self._checkouts
+            return {
+                'name': self.name,
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'total_connections': self._total,
+                'idle_connections': idle,
+                'in_use_connections': self._total - idle,
+                'overflow_connections': max(self._total - self.pool_size, 0),
+                'checkouts': checkouts,
+                'avg_wait_ms': round(self._wait_time_total / checkouts * 1000, 3) if checkouts else 0,
+                'max_wait_ms': round(self._wait_time_max * 1000, 3),
+                'connections_created': self._created,
+                'connections_closed': self._closed,
+                'connections_recycled': self._recycled,
+                'health_check_failures': self._health_check_failures,
+                'timeouts': self._timeouts
+            }
+
+    def dispose(self):
+        """关闭所有空闲连接"""
+        with self._condition:
+            records = list(self._idle)
+            self._idle.clear()
+        for record in records:
+            self._discard(record)
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+    def _create_record(self):
+        raw = self._creator()
+        with self._condition:
+            self._created += 1
+        return _PooledRecord(raw)
+
+    def _is_usable(self, record):
+        """借出前检查：超过存活时间的连接回收，空闲较久的连接做一次 ping"""
+        now = time.time()
+        if self.recycle and now - record.created_at > self.recycle:
+            with self._condition:
+                self._recycled += 1
+            return False
+        if self.ping_interval is not None and now - record.last_used_at > self.ping_interval:
+            try:
+                record.raw.ping(reconnect=False)
+            except Exception as e:
+                print(f"连接池 {self.name} 健康检查失败，重建连接: {e}")
+                with self._condition:
+                    self._health_check_failures += 1
+                return False
+        return True
+
+    def _return(self, record):
+        """归还连接：回滚未提交的事务后放回空闲队列，超出常驻数量的连接直接关闭"""
+        try:
+            record.raw.rollback()
+        except Exception:
+            self._discard(record)
+            return
+        record.last_used_at = time.time()
+        with self._condition:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(record)
+                self._condition.notify()
+                return
+        self._discard(record)
+
+    def _discard(self, record):
+        try:
+            record.raw.close()
+        except Exception:
+            pass
+        with self._condition:
+            self._total -= 1
+            self._closed += 1
+            self._condition.notify()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name, creator):
+    """按名称获取（或创建）连接池，连接池参数来自 db_pool_config"""
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = ConnectionPool(name, creator, **db_pool_config)
+                _pools[name] = pool
+    return pool
+
+
+def get_pool_metrics():
+    """所有连接池的运行指标"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.get_metrics() for pool in pools]
+
+
+def _create_mysql_connector_connection():
+    import mysql.connector
+    return mysql.connector.connect(**db_config)
+
+
+def get_mysql_connection():
+    """从连接池获取 mysql.connector 连接（BaseDAO 使用）"""
+    return get_pool('mysql_connector', _create_mysql_connector_connection).connect()
+
+
+def _create_pymysql_connection():
+    import pymysql
+    return pymysql.connect(**db_config)
+
+
+def get_pymysql_connection():
+    """从连接池获取 pymysql 连接（默认元组游标）"""
+    return get_pool('pymysql', _create_pymysql_connection).connect()
+
+
+def _create_pymysql_dict_connection():
+    import pymysql
+    return pymysql.connect(charset='utf8mb4', cursorclass=pymysql.cursors.DictCursor, **db_config)
+
+
+def get_pymysql_dict_connection():
+    """从连接池获取 pymysql 连接（字典游标，utf8mb4）"""
+    return get_pool('pymysql_dict', _create_pymysql_dict_connection).connect()
@@ -0,0 +1,471 @@
+"""
+连续订单调度器
+常驻后台线程，在内存中按城市维护待分配订单队列，由事件驱动匹配，不再依赖前端轮询维持分配循环：
+
+- 订单创建：OrderDAO.create_order、约车平台下单接口调用 notify_order_created()，
+  订单ID先进入待加载列表，在下一个匹配窗口开始时用一条查询批量加载。
+- 车辆变为空闲：通过车队状态存储的状态回调触发，该城市有排队订单时参与下一个匹配窗口。
+- 定期对账：按固定间隔从数据库读取待分配订单，补入其他进程写入或事件丢失的订单，
+  并移除已被取消或在别处分配的订单。
+
+每个匹配窗口（默认 500 毫秒）聚合窗口期内的所有事件，对有变化的城市各做一次批量全局匹配
+（OrderAssignmentAlgorithm._batch_assign_vehicles）。不同城市在线程池中并行匹配，
+同一城市同一时间只有一个匹配在进行，避免两次匹配争抢同一批空闲车辆。
+
+背压：内存队列有总量上限，超出上限的订单留在数据库中，待队列回落后由对账补入；
+城市没有空闲车辆时进入等待状态，新订单不会触发该城市的空转匹配，直到有车辆变为空闲或下一次对账。
+"""
+import atexit
+import threading
+import time
+import traceback
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.dao.base_dao import BaseDAO
+
+# 匹配窗口（秒），窗口期内到达的事件合并为一次匹配
+MATCH_WINDOW = 0.5
+# 单个城市单次匹配的最大订单数，超出部分留到下一个窗口
+MAX_BATCH_ORDERS = 500
+# 内存队列中待分配订单总数上限
+MAX_PENDING_ORDERS = 5000
+# 同时进行匹配的城市数
+MAX_CONCURRENT_CITIES = 4
+# 数据库对账间隔（秒）
+RECONCILE_INTERVAL = 5
+
+# 订单已在别处分配或取消时批量提交返回的冲突原因
+ORDER_GONE_REASON = '订单已不是待分配状态'
+# 车辆已被占用时批量提交返回的冲突原因
+VEHICLE_TAKEN_REASON = '车辆已不是空闲状态'
+
+_SELECT_PENDING_ORDERS = """
+    SELECT order_id, city_code, create_time,
+           pickup_location, pickup_location_x, pickup_location_y,
+           dropoff_location, dropoff_location_x, dropoff_location_y
+    FROM orders
+    WHERE order_status = '待分配'
+      AND pickup_location_x IS NOT NULL AND pickup_location_y IS NOT NULL
+      AND dropoff_location_x IS NOT NULL AND dropoff_location_y IS NOT NULL
+"""
+
+
+class ContinuousDispatcher(threading.Thread):
+    """事件驱动的连续订单调度器"""
+
+    def __init__(self, match_window=MATCH_WINDOW, max_batch_orders=MAX_BATCH_ORDERS,
+                 max_pending_orders=MAX_PENDING_ORDERS, max_concurrent_cities=MAX_CONCURRENT_CITIES,
+                 reconcile_interval=RECONCILE_INTERVAL):
+        super().__init__(name='order-dispatcher', daemon=True)
+        self.match_window = match_window
+        self.max_batch_orders = max_batch_orders
+        self.max_pending_orders = max_pending_orders
+        self.reconcile_interval = reconcile_interval
+        self.enabled = True
+
+        self._condition = threading.Condition(threading.Lock())
+        self._shutdown = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_cities,
+                                            thread_name_prefix='dispatch-city')
+        self._pending = defaultdict(OrderedDict)    # 城市 -> {订单ID: 订单记录}，按进入队列先后排列
+        self._order_city = {}                       # 订单ID -> 城市
+        self._incoming = []                         # 待从数据库加载的新订单ID
+        self._dirty = set()                         # 下一个窗口需要匹配的城市
+        self._waiting = set()                       # 没有空闲车辆、等待车辆事件的城市
+        self._in_flight = set()                     # 正在匹配的城市
+        self._next_reconcile = 0.0
+
+        # 运行指标
+        self.order_events = 0
+        self.vehicle_events = 0
+        self.orders_queued = 0
+        self.orders_deferred = 0
+        self.orders_assigned = 0
+        self.orders_dropped = 0
+        self.windows = 0
+        self.matches = 0
+        self.reconcile_count = 0
+        self.last_match_duration = 0.0
+        self.last_reconcile_duration = 0.0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self._city_counters = defaultdict(lambda: {'assigned': 0, 'dropped': 0, 'matches': 0})
+
+    # ------------------------------------------------------------------
+    # 事件接口
+    # ------------------------------------------------------------------
+    def submit_order(self, order_id):
+        """新订单事件
+
+        Returns:
+            bool: 是否进入队列；队列已满时返回 False，订单留在数据库中等待对账补入
+        """
+        with self._condition:
+            self.order_events += 1
+            if order_id in self._order_city:
+                return True
+            if len(self._order_city) + len(self._incoming) >= self.max_pending_orders:
+                self.orders_deferred += 1
+                return False
+            self._incoming.append(order_id)
+            self._condition.notify()
+            return True
+
+    def on_vehicle_status(self, vehicle_id, city, old_status, new_status):
+        """车队状态回调：车辆变为空闲时唤醒所在城市的匹配"""
+        if new_status != '空闲中':
+            return
+        with self._condition:
+            self.vehicle_events += 1
+            if self._pending.get(city):
+                self._waiting.discard(city)
+                self._dirty.add(city)
+                self._condition.notify()
+
+    def request_reconcile(self):
+        """请求尽快与数据库对账（例如批量创建订单后）"""
+        with self._condition:
+            self._next_reconcile = 0.0
+            self._condition.notify()
+
+    # ------------------------------------------------------------------
+    # 控制与查询
+    # ------------------------------------------------------------------
+    def pause(self):
+        """暂停匹配，事件和订单仍会入队"""
+        self.enabled = False
+
+    def resume(self):
+        """恢复匹配，并立即对账一次"""
+        self.enabled = True
+        self.request_reconcile()
+
+    def pending_count(self, city=None):
+        """队列中的待分配订单数，city 为 None 时返回全部城市之和"""
+        with self._condition:
+            if city is None:
+                return len(self._order_city) + len(self._incoming)
+            return len(self._pending.get(city, ()))
+
+    def is_idle(self, city=None):
+        """指定城市（或全部城市）当前没有排队或正在匹配的订单"""
+        with self._condition:
+            if city is None:
+                return not self._order_city and not self._incoming and not self._in_flight
+            return not self._pending.get(city) and city not in self._in_flight and not self._incoming
+
+    def get_city_counters(self, city=None):
+        """累计分配/丢弃/匹配次数，city 为 None 时返回全部城市之和"""
+        with self._condition:
+            if city is not None:
+                return dict(self._city_counters[city])
+            return {
+                'assigned': self.orders_assigned,
+                'dropped': self.orders_dropped,
+                'matches': self.matches
+            }
+
+    def get_metrics(self):
+        """调度器运行指标"""
+        with self._condition:
+            cities = {}
+            for city in set(self._pending) | set(self._city_counters):
+                counters = self._city_counters[city]
+                cities[city] = {
+                    'pending': len(self._pending.get(city, ())),
+                    'waiting_for_vehicles': city in self._waiting,
+                    'in_flight': city in self._in_flight,
+                    'assigned': counters['assigned'],
+                    'dropped': counters['dropped'],
+                    'matches': counters['matches']
+                }
+            return {
+                'running': self.is_alive(),
+                'enabled': self.enabled,
+                'match_window_ms': round(self.match_window * 1000),
+                'max_batch_orders': self.max_batch_orders,
+                'max_pending_orders': self.max_pending_orders,
+                'pending_orders': len(self._order_city),
+                'incoming_orders': len(self._incoming),
+                'in_flight_cities': sorted(self._in_flight),
+                'order_events': self.order_events,
+                'vehicle_events': self.vehicle_events,
+                'orders_queued': self.orders_queued,
+                'orders_deferred': self.orders_deferred,
+                'orders_assigned': self.orders_assigned,
+                'orders_dropped': self.orders_dropped,
+                'windows': self.windows,
+                'matches': self.matches,
+                'reconcile_count': self.reconcile_count,
+                'last_match_ms': round(self.last_match_duration * 1000, 3),
+                'last_reconcile_ms': round(self.last_reconcile_duration * 1000, 3),
+                'avg_queue_wait_ms': round(self.wait_time_total / self.orders_assigned * 1000, 3)
+                if self.orders_assigned else 0,
+                'max_queue_wait_ms': round(self.wait_time_max * 1000, 3),
+                'cities': cities
+            }
+
+    def shutdown(self):
+        """停止调度线程，等待正在进行的匹配结束"""
+        self._shutdown.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._executor.shutdown(wait=True)
+
+    # ------------------------------------------------------------------
+    # 主循环
+    # ------------------------------------------------------------------
+    def run(self):
+        while not self._shutdown.is_set():
+            with self._condition:
+                while not self._shutdown.is_set() and not self._has_work():
+                    self._condition.wait(self._seconds_until_reconcile())
+            if self._shutdown.is_set():
+                break
+            # 匹配窗口：聚合窗口期内陆续到达的事件
+            if self._shutdown.wait(self.match_window):
+                break
+            try:
+                if self.enabled and time.time() >= self._next_reconcile:
+                    self._reconcile()
+                self._load_incoming()
+                if self.enabled:
+                    self._dispatch_dirty_cities()
+            except Exception as e:
+                print(f"订单调度窗口处理出错: {e}")
+                traceback.print_exc()
+
+    def _has_work(self):
+        if not self.enabled:
+            return bool(self._incoming)
+        if self._incoming or time.time() >= self._next_reconcile:
+            return True
+        return any(city not in self._in_flight for city in self._dirty)
+
+    def _seconds_until_reconcile(self):
+        if not self.enabled:
+            return self.reconcile_interval
+        return max(self._next_reconcile - time.time(), 0.05)
+
+    def _reconcile(self):
+        """与数据库对账：补入队列外的待分配订单，移除已不在待分配状态的订单"""
+        started = time.time()
+        rows = BaseDAO.execute_query(
+            _SELECT_PENDING_ORDERS + " ORDER BY create_time ASC LIMIT %s", (self.max_pending_orders,)
+        )
+        with self._condition:
+            for row in rows:
+                self._enqueue(row)
+            # 结果未被截断时，队列中早于本次查询入队、且不在结果中的订单已不再是待分配
+            if len(rows) < self.max_pending_orders:
+                current = {row['order_id'] for row in rows}
+                for order_id, city in list(self._order_city.items()):
+                    entry = self._pending[city].get(order_id)
+                    if order_id not in current and entry and entry['queued_at'] < started:
+                        self._discard(order_id)
+            # 对账后给等待车辆的城市一次重试机会，吸收其他进程释放的车辆
+            for city in self._waiting:
+                if self._pending.get(city):
+                    self._dirty.add(city)
+            self._waiting.clear()
+            self.reconcile_count += 1
+            self._next_reconcile = time.time() + self.reconcile_interval
+        self.last_reconcile_duration = time.time() - started
+
+    def _load_incoming(self):
+        """批量加载新订单事件对应的订单记录"""
+        with self._condition:
+            order_ids, self._incoming = self._incoming, []
+        if not order_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(order_ids))
+        rows = BaseDAO.execute_query(
+            _SELECT_PENDING_ORDERS + f" AND order_id IN ({placeholders}) ORDER BY create_time ASC",
+            tuple(order_ids)
+        )
+        with self._condition:
+            for row in rows:
+                self._enqueue(row)
+
+    def _enqueue(self, row):
+        """订单入队（调用方持有锁），超出队列上限的订单计入 deferred"""
+        order_id = row['order_id']
+        if order_id in self._order_city:
+            return
+        if len(self._order_city) >= self.max_pending_orders:
+            self.orders_deferred += 1
+            return
+        city = row['city_code']
+        entry = dict(row)
+        entry['queued_at'] = time.time()
+        self._pending[city][order_id] = entry
+        self._order_city[order_id] = city
+        self.orders_queued += 1
+        if city not in self._waiting:
+            self._dirty.add(city)
+
+    def _discard(self, order_id):
+        """从队列中移除订单（调用方持有锁）"""
+        city = self._order_city.pop(order_id, None)
+        if city is None:
+            return None
+        entry = self._pending[city].pop(order_id, None)
+        if not self._pending[city]:
+            del self._pending[city]
+            self._waiting.discard(city)
+            self._dirty.discard(city)
+        return entry
+
+    def _dispatch_dirty_cities(self):
+        """把需要匹配且未在匹配中的城市提交到线程池"""
+        with self._condition:
+            self.windows += 1
+            batches = []
+            for city in list(self._dirty):
+                if city in self._in_flight:
+                    continue
+                self._dirty.discard(city)
+                queue = self._pending.get(city)
+                if not queue:
+                    continue
+                batch = [dict(entry) for _, entry in zip(range(self.max_batch_orders), queue.values())]
+                self._in_flight.add(city)
+                batches.append((city, batch))
+        for city, batch in batches:
+            self._executor.submit(self._match_city, city, batch)
+
+    def _match_city(self, city, orders):
+        """对一个城市的一批订单做全局匹配并处理结果"""
+        from app.admin.algorithm import OrderAssignmentAlgorithm
+
+        started = time.time()
+        successful = []
+        failed = []
+        try:
+            result = OrderAssignmentAlgorithm._batch_assign_vehicles(city, orders)
+            successful = result['successful']
+            failed = result['failed']
+        except Exception as e:
+            print(f"城市 {city} 订单匹配出错: {e}")
+            traceback.print_exc()
+
+        vehicle_conflict = False
+        assigned = []
+        finished = time.time()
+        with self._condition:
+            counters = self._city_counters[city]
+            counters['matches'] += 1
+            self.matches += 1
+            for assignment in successful:
+                entry = self._discard(assignment['order_id'])
+                if entry is None:
+                    continue
+                waited = finished - entry['queued_at']
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+                self.orders_assigned += 1
+                counters['assigned'] += 1
+                assigned.append((entry, assignment['vehicle_id']))
+            for failure in failed:
+                if failure.get('reason') == ORDER_GONE_REASON:
+                    if self._discard(failure['order_id']) is not None:
+                        self.orders_dropped += 1
+                        counters['dropped'] += 1
+                elif failure.get('reason') == VEHICLE_TAKEN_REASON:
+                    vehicle_conflict = True
+            self._in_flight.discard(city)
+            if self._pending.get(city):
+                if assigned or vehicle_conflict:
+                    # 本批有进展（或车辆被抢占），队列中剩余订单进入下一个窗口
+                    self._dirty.add(city)
+                    self._condition.notify()
+                else:
+                    # 没有可用车辆，等待车辆空闲事件或下一次对账
+                    self._waiting.add(city)
+            self.last_match_duration = finished - started
+
+        for entry, vehicle_id in assigned:
+            self._start_trip(entry, vehicle_id)
+
+    @staticmethod
+    def _start_trip(order, vehicle_id):
+        """为分配成功的订单启动车辆行程仿真，行程未能启动时撤销分配"""
+        from app.admin.orders import start_vehicle_movement
+        from app.utils.fleet_state import get_fleet_state
+
+        started = False
+        try:
+            vehicle = get_fleet_state().get(vehicle_id)
+            if vehicle and order.get('dropoff_location_x') is not None and order.get('dropoff_location_y') is not None:
+                started = start_vehicle_movement(
+                    vehicle_id=vehicle_id,
+                    order_id=order['order_id'],
+                    vehicle_x=float(vehicle['current_location_x']),
+                    vehicle_y=float(vehicle['current_location_y']),
+                    pickup_x=float(order['pickup_location_x']),
+                    pickup_y=float(order['pickup_location_y']),
+                    dropoff_x=float(order['dropoff_location_x']),
+                    dropoff_y=float(order['dropoff_location_y']),
+                    pickup_name=order['pickup_location'],
+                    dropoff_name=order['dropoff_location']
+                )
+        except Exception as e:
+            print(f"启动车辆移动线程失败: {str(e)}")
+            traceback.print_exc()
+        if not started:
+            rollback_assignment(order['order_id'], vehicle_id)
+
+
+def rollback_assignment(order_id, vehicle_id):
+    """行程未能启动时撤销分配：订单退回待分配，车辆恢复空闲
+
+    Returns:
+        bool: 撤销是否成功
+    """
+    from app.dao.vehicle_dao import VehicleDAO
+
+    print(f"订单 {order_id} 无法开始行程，撤销车辆 {vehicle_id} 的分配")
+    try:
+        BaseDAO.execute_update("""
+            UPDATE orders SET order_status = '待分配', vehicle_id = NULL
+            WHERE order_id = %s AND order_status = '进行中' AND vehicle_id = %s
+        """, (order_id, vehicle_id))
+        VehicleDAO.update_vehicle_status(vehicle_id, '空闲中')
+        return True
+    except Exception as e:
+        print(f"撤销订单 {order_id} 的分配失败: {str(e)}")
+        traceback.print_exc()
+        return False
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """获取全局订单调度器（首次调用时启动调度线程并订阅车辆状态变化）"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                from app.utils.fleet_state import get_fleet_state
+
+                dispatcher = ContinuousDispatcher()
+                get_fleet_state().add_status_listener(dispatcher.on_vehicle_status)
+                dispatcher.start()
+                atexit.register(dispatcher.shutdown)
+                _dispatcher = dispatcher
+    return _dispatcher
+
+
+def notify_order_created(order_id):
+    """通知调度器有新订单（调度器未启动时不做任何事）"""
+    if _dispatcher is not None:
+        _dispatcher.submit_order(order_id)
+
+
+def notify_orders_bulk_created():
+    """批量创建订单后请求调度器对账（调度器未启动时不做任何事）"""
+    if _dispatcher is not None:
+        _dispatcher.request_reconcile()
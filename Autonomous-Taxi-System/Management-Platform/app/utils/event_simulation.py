@@ -0,0 +1,829 @@
+"""
+离散事件仿真
+以虚拟时钟和事件优先队列推进一份内存中的车队副本，用于车队规模、运营参数和需求变化的假设研究：
+仿真时间不再随真实时间流逝，一天的运营可以在几分钟内回放完毕，只读取生产数据，不写入任何业务表。
+
+- 事件：订单到达、匹配窗口、到达上车点、乘客上车、到达下车点、到达充电站、充电完成、电量耗尽、订单超时；
+- 车队：从车队状态（app.utils.fleet_state）复制车辆，可按 fleet_size 抽样或复制扩充；
+- 需求：回放某一天的历史订单，或按该城市近 30 天的小时分布生成合成订单（app.utils.order_generator）；
+- 调度：与连续调度器相同的匹配窗口和批量全局匹配（OrderAssignmentAlgorithm._match_vehicles）；
+- 行驶：速度、耗电、上车等待、充电速率和单次充电时长上限与仿真引擎（app.utils.fleet_simulation）的公式一致，
+  行驶距离查城市行驶距离表（避障），没有障碍物的城市使用直线距离；
+- 计价：OrderDAO.calculate_order_amount（不含优惠券），充电费用与 record_charging_expense 的公式一致；
+- 充电：低电量车辆前往最近的有空位充电站（出发时即占用容量），没有空位时进入城市等待队列，
+  充电站有车辆离开时按排队先后通知下一辆。
+
+结果为 KPI 报告：订单完成情况、等待时间分布、车辆时间占比（利用率）、收入与充电成本、按小时统计和充电站统计。
+
+命令行：python -m app.utils.event_simulation 北京市 --date 2025-05-01 [--fleet-size 300] [--param LOW_BATTERY_THRESHOLD=30]
+"""
+import argparse
+import heapq
+import json
+import math
+import time
+import traceback
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.dao.base_dao import BaseDAO
+from app.utils.dispatcher import MATCH_WINDOW, MAX_BATCH_ORDERS
+from app.utils.fleet_simulation import (
+    DEFAULT_SIMULATION_PARAMS, MAX_CHARGING_TIME, STATION_TRIP_CONSUMPTION_FACTOR, _coefficient, load_simulation_params
+)
+from app.utils.obstacle_index import normalize_city
+from app.utils.travel_time import get_travel_time_tables
+from app.utils.vehicle_profiles import get_vehicle_profiles
+
+# 仿真时长（秒）
+SIMULATION_HORIZON = 24 * 3600
+# 仿真时长结束后允许进行中的行程和充电继续完成的时间（秒）
+DRAIN_TIME = 2 * 3600
+# 每处理多少个事件回调一次进度
+PROGRESS_EVENT_INTERVAL = 5000
+# 合成订单的小时分布统计天数
+DEMAND_PROFILE_DAYS = 30
+
+# 事件类型
+EVENT_ORDER_ARRIVAL = 1
+EVENT_DISPATCH = 2
+EVENT_PICKUP_ARRIVAL = 3
+EVENT_BOARDED = 4
+EVENT_DROPOFF_ARRIVAL = 5
+EVENT_STATION_ARRIVAL = 6
+EVENT_CHARGE_COMPLETE = 7
+EVENT_BATTERY_DEPLETED = 8
+EVENT_ORDER_TIMEOUT = 9
+
+# 车辆状态（与车辆表的状态名称一致）
+STATE_IDLE = '空闲中'
+STATE_BUSY = '运行中'
+STATE_TO_STATION = '前往充电'
+STATE_CHARGING = '充电中'
+STATE_WAITING_CHARGE = '等待充电'
+STATE_DEPLETED = '电量耗尽'
+VEHICLE_STATES = (STATE_IDLE, STATE_BUSY, STATE_TO_STATION, STATE_CHARGING, STATE_WAITING_CHARGE, STATE_DEPLETED)
+
+# 订单结果
+ORDER_PENDING = 'pending'
+ORDER_ASSIGNED = 'assigned'
+ORDER_COMPLETED = 'completed'
+ORDER_ABANDONED = 'abandoned'
+ORDER_STRANDED = 'stranded'
+
+# 可在研究中覆盖的参数
+OVERRIDABLE_PARAMS = tuple(DEFAULT_SIMULATION_PARAMS) + ('CHARGING_PRICE_PER_PERCENT',)
+
+
+class SimVehicle:
+    """仿真车辆"""
+
+    __slots__ = ('vehicle_id', 'model', 'x', 'y', 'battery', 'state', 'state_since', 'time_in_state',
+                 'speed_coef', 'energy_coef', 'charging_coef', 'capacity_coef',
+                 'order', 'station', 'leg', 'charge_start_battery', 'queued_at',
+                 'trips', 'revenue', 'distance')
+
+    def __init__(self, vehicle_id, model, x, y, battery, profile):
+        self.vehicle_id = vehicle_id
+        self.model = model
+        self.x = x
+        self.y = y
+        self.battery = battery
+        self.state = STATE_IDLE
+        self.state_since = 0.0
+        self.time_in_state = dict.fromkeys(VEHICLE_STATES, 0.0)
+        self.speed_coef = _coefficient(profile.speed)
+        self.energy_coef = _coefficient(profile.energy_consumption)
+        self.charging_coef = _coefficient(profile.charging_speed)
+        self.capacity_coef = _coefficient(profile.capacity)
+        self.order = None
+        self.station = None
+        self.leg = None               # (目标X, 目标Y, 耗电, 距离)
+        self.charge_start_battery = None
+        self.queued_at = None
+        self.trips = 0
+        self.revenue = 0.0
+        self.distance = 0.0
+
+
+class SimStation:
+    """仿真充电站，occupied 包含正在前往和正在充电的车辆"""
+
+    __slots__ = ('station_code', 'x', 'y', 'capacity', 'occupied', 'sessions', 'charged', 'cost')
+
+    def __init__(self, station_code, x, y, capacity):
+        self.station_code = station_code
+        self.x = x
+        self.y = y
+        self.capacity = capacity
+        self.occupied = 0
+        self.sessions = 0
+        self.charged = 0.0
+        self.cost = 0.0
+
+
+class SimOrder:
+    """仿真订单，时间均为仿真秒"""
+
+    __slots__ = ('order_id', 'created', 'pickup_x', 'pickup_y', 'dropoff_x', 'dropoff_y', 'trip_distance',
+                 'status', 'assigned_at', 'pickup_at', 'completed_at', 'vehicle_id', 'amount')
+
+    def __init__(self, order_id, created, pickup_x, pickup_y, dropoff_x, dropoff_y):
+        self.order_id = order_id
+        self.created = created
+        self.pickup_x = pickup_x
+        self.pickup_y = pickup_y
+        self.dropoff_x = dropoff_x
+        self.dropoff_y = dropoff_y
+        self.trip_distance = 0.0
+        self.status = ORDER_PENDING
+        self.assigned_at = None
+        self.pickup_at = None
+        self.completed_at = None
+        self.vehicle_id = None
+        self.amount = 0.0
+
+
+class EventSimulation:
+    """单个城市的离散事件仿真"""
+
+    def __init__(self, city_code, vehicles, stations, orders, params=None, match_window=MATCH_WINDOW,
+                 max_batch_orders=MAX_BATCH_ORDERS, max_wait=None, horizon=SIMULATION_HORIZON, travel_table=None):
+        """
+        Args:
+            city_code: 城市中文名
+            vehicles: 车辆字典列表（车队状态字段）
+            stations: 充电站字典列表（station_code、location_x、location_y、max_capacity）
+            orders: 订单字典列表（order_id、created 仿真秒、pickup_x/y、dropoff_x/y）
+            params: 仿真参数，缺省时从参数表读取
+            match_window: 匹配窗口（仿真秒）
+            max_batch_orders: 单次匹配的最大订单数
+            max_wait: 订单等待分配的最长时间（仿真秒），超时视为乘客放弃；None 表示一直等待
+            horizon: 仿真时长（仿真秒）
+            travel_table: 城市行驶距离表，None 时使用直线距离
+        """
+        self.city_code = city_code
+        self.params = params or load_simulation_params()
+        self.match_window = match_window
+        self.max_batch_orders = max_batch_orders
+        self.max_wait = max_wait
+        self.horizon = horizon
+        self.travel_table = travel_table
+        self.clock = 0.0
+
+        profiles = get_vehicle_profiles()
+        self.vehicles = []
+        for row in vehicles:
+            model = row.get('model')
+            self.vehicles.append(SimVehicle(
+                row['vehicle_id'], model, float(row.get('current_location_x') or 0),
+                float(row.get('current_location_y') or 0), float(row.get('battery_level') or 0),
+                profiles.for_model(model)
+            ))
+        self.stations = [SimStation(row['station_code'], float(row['location_x']), float(row['location_y']),
+                                    int(row.get('max_capacity') or 0)) for row in stations]
+        self.orders = [SimOrder(row['order_id'], float(row['created']), float(row['pickup_x']),
+                                float(row['pickup_y']), float(row['dropoff_x']), float(row['dropoff_y']))
+                       for row in orders]
+        if self.orders:
+            trip_distances = self._pair_distances(
+                [(order.pickup_x, order.pickup_y) for order in self.orders],
+                [(order.dropoff_x, order.dropoff_y) for order in self.orders]
+            )
+            for order, distance in zip(self.orders, trip_distances.tolist()):
+                order.trip_distance = distance
+
+        self._events = []
+        self._sequence = 0
+        self._pending = OrderedDict()        # 订单ID -> SimOrder，等待分配
+        self._idle = {}                      # 车辆ID -> SimVehicle
+        self._charge_queue = deque()         # 等待充电的车辆
+        self._dispatch_scheduled = False
+        self._waiting_for_vehicles = False
+
+        self._distance_ratio, self._charging_factor = self._city_factors()
+
+        # 统计
+        self.events_processed = 0
+        self.dispatch_windows = 0
+        self.max_charge_queue = 0
+        self.charge_queue_wait = 0.0
+        self.charge_queue_count = 0
+
+    # ------------------------------------------------------------------
+    # 运行
+    # ------------------------------------------------------------------
+    def run(self, progress=None, cancelled=None):
+        """运行仿真直到事件耗尽或超过仿真时长加收尾时间
+
+        Args:
+            progress: 进度回调 progress(仿真秒, 仿真时长)
+            cancelled: 定期调用，返回 True 时提前结束
+
+        Returns:
+            dict: KPI 报告
+        """
+        started = time.time()
+        for order in self.orders:
+            self._schedule(order.created, EVENT_ORDER_ARRIVAL, order)
+        low_battery = self.params['LOW_BATTERY_THRESHOLD']
+        for vehicle in self.vehicles:
+            if vehicle.battery < low_battery:
+                self._seek_charging(vehicle)
+            else:
+                self._set_idle(vehicle)
+
+        handlers = {
+            EVENT_ORDER_ARRIVAL: self._on_order_arrival,
+            EVENT_DISPATCH: self._on_dispatch,
+            EVENT_PICKUP_ARRIVAL: self._on_pickup_arrival,
+            EVENT_BOARDED: self._on_boarded,
+            EVENT_DROPOFF_ARRIVAL: self._on_dropoff_arrival,
+            EVENT_STATION_ARRIVAL: self._on_station_arrival,
+            EVENT_CHARGE_COMPLETE: self._on_charge_complete,
+            EVENT_BATTERY_DEPLETED: self._on_battery_depleted,
+            EVENT_ORDER_TIMEOUT: self._on_order_timeout
+        }
+        end_time = self.horizon + DRAIN_TIME
+        interrupted = False
+        while self._events:
+            event_time, _, kind, subject = self._events[0]
+            if event_time > end_time:
+                break
+            heapq.heappop(self._events)
+            self.clock = event_time
+            handlers[kind](subject)
+            self.events_processed += 1
+            if self.events_processed % PROGRESS_EVENT_INTERVAL == 0:
+                if progress:
+                    progress(min(self.clock, self.horizon), self.horizon)
+                if cancelled and cancelled():
+                    interrupted = True
+                    break
+
+        self.clock = max(self.clock, self.horizon) if not interrupted else self.clock
+        for vehicle in self.vehicles:
+            self._set_state(vehicle, vehicle.state)
+        report = self.report(time.time() - started)
+        report['interrupted'] = interrupted
+        return report
+
+    # ------------------------------------------------------------------
+    # 事件处理
+    # ------------------------------------------------------------------
+    def _on_order_arrival(self, order):
+        self._pending[order.order_id] = order
+        if self.max_wait is not None:
+            self._schedule(self.clock + self.max_wait, EVENT_ORDER_TIMEOUT, order)
+        if not self._waiting_for_vehicles:
+            self._request_dispatch()
+
+    def _on_order_timeout(self, order):
+        if order.status == ORDER_PENDING and self._pending.pop(order.order_id, None) is not None:
+            order.status = ORDER_ABANDONED
+
+    def _on_dispatch(self, _):
+        """一个匹配窗口：与连续调度器相同的批量全局匹配"""
+        from app.admin.algorithm import OrderAssignmentAlgorithm
+
+        self._dispatch_scheduled = False
+        self.dispatch_windows += 1
+        if not self._pending:
+            return
+        idle = [vehicle for vehicle in self._idle.values() if vehicle.speed_coef > 0]
+        if not idle:
+            self._waiting_for_vehicles = True
+            return
+        batch = [order for _, order in zip(range(self.max_batch_orders), self._pending.values())]
+        vehicle_xy = np.array([(vehicle.x, vehicle.y) for vehicle in idle])
+        speed_factors = np.array([vehicle.speed_coef for vehicle in idle], dtype=float)
+        order_xy = np.array([(order.pickup_x, order.pickup_y) for order in batch])
+        assignments = OrderAssignmentAlgorithm._match_vehicles(
+            vehicle_xy, speed_factors, order_xy, self.travel_table, verbose=False
+        )
+        for vehicle_idx, order_idx, _ in assignments:
+            vehicle = idle[vehicle_idx]
+            order = batch[order_idx]
+            del self._pending[order.order_id]
+            del self._idle[vehicle.vehicle_id]
+            order.status = ORDER_ASSIGNED
+            order.assigned_at = self.clock
+            order.vehicle_id = vehicle.vehicle_id
+            vehicle.order = order
+            self._set_state(vehicle, STATE_BUSY)
+            self._start_leg(vehicle, order.pickup_x, order.pickup_y, EVENT_PICKUP_ARRIVAL,
+                            self.params['BATTERY_CONSUMPTION_RATE'], vehicle.energy_coef)
+        if self._pending:
+            if assignments:
+                self._request_dispatch()
+            else:
+                self._waiting_for_vehicles = True
+
+    def _on_pickup_arrival(self, vehicle):
+        self._finish_leg(vehicle)
+        vehicle.order.pickup_at = self.clock
+        self._schedule(self.clock + self.params['PICKUP_WAITING_TIME'], EVENT_BOARDED, vehicle)
+
+    def _on_boarded(self, vehicle):
+        order = vehicle.order
+        self._start_leg(vehicle, order.dropoff_x, order.dropoff_y, EVENT_DROPOFF_ARRIVAL,
+                        self.params['BATTERY_CONSUMPTION_RATE'], vehicle.energy_coef, order.trip_distance)
+
+    def _on_dropoff_arrival(self, vehicle):
+        from app.dao.order_dao import OrderDAO
+
+        self._finish_leg(vehicle)
+        order = vehicle.order
+        vehicle.order = None
+        order.status = ORDER_COMPLETED
+        order.completed_at = self.clock
+        distance_km = round(order.trip_distance * self._distance_ratio, 2)
+        amount, _, _ = OrderDAO.calculate_order_amount(distance_km, vehicle.vehicle_id, vehicle.model, self.city_code)
+        order.amount = float(amount)
+        vehicle.trips += 1
+        vehicle.revenue += order.amount
+        if vehicle.battery < self.params['LOW_BATTERY_THRESHOLD']:
+            self._seek_charging(vehicle)
+        else:
+            self._set_idle(vehicle)
+
+    def _on_station_arrival(self, vehicle):
+        self._finish_leg(vehicle)
+        if vehicle.battery >= 100:
+            vehicle.charge_start_battery = vehicle.battery
+            self._on_charge_complete(vehicle)
+            return
+        charging_rate = self.params['CHARGING_RATE'] * vehicle.charging_coef
+        if charging_rate <= 0:
+            charging_rate = 0.5
+        charging_time = min((100 - vehicle.battery) / charging_rate, MAX_CHARGING_TIME)
+        vehicle.charge_start_battery = vehicle.battery
+        self._set_state(vehicle, STATE_CHARGING)
+        self._schedule(self.clock + charging_time, EVENT_CHARGE_COMPLETE, vehicle)
+
+    def _on_charge_complete(self, vehicle):
+        station = vehicle.station
+        charged = 100.0 - vehicle.charge_start_battery
+        vehicle.battery = 100.0
+        station.sessions += 1
+        station.charged += charged
+        station.cost += (charged * self.params['CHARGING_PRICE_PER_PERCENT'] * vehicle.capacity_coef
+                         * self._charging_factor)
+        vehicle.station = None
+        self._release_station(station)
+        self._set_idle(vehicle)
+
+    def _on_battery_depleted(self, vehicle):
+        """行驶途中电量耗尽：车辆停在途中退出运营，载客订单视为滞留"""
+        self._finish_leg(vehicle)
+        vehicle.battery = 0.0
+        if vehicle.order is not None:
+            vehicle.order.status = ORDER_STRANDED
+            vehicle.order = None
+        if vehicle.station is not None:
+            station, vehicle.station = vehicle.station, None
+            self._release_station(station)
+        self._set_state(vehicle, STATE_DEPLETED)
+
+    # ------------------------------------------------------------------
+    # 车辆动作
+    # ------------------------------------------------------------------
+    def _start_leg(self, vehicle, target_x, target_y, arrival_event, consumption_rate, energy_coef, distance=None):
+        """开始一段行驶，安排到达事件；途中电量不足时改为安排电量耗尽事件"""
+        if distance is None:
+            distance = self._distance(vehicle.x, vehicle.y, target_x, target_y)
+        params = self.params
+        speed = params['VEHICLE_MOVEMENT_SPEED'] * vehicle.speed_coef
+        duration = distance / speed if speed > 0 else math.inf
+        # 与仿真引擎一致：每秒耗电 = 耗电率 × 电量更新间隔 × 能耗系数 / 移动间隔
+        drain_rate = consumption_rate * params['BATTERY_UPDATE_INTERVAL'] * energy_coef / params['POSITION_MOVEMENT_INTERVAL']
+        drain = drain_rate * duration if math.isfinite(duration) else math.inf
+        if drain >= vehicle.battery:
+            depleted_after = vehicle.battery / drain_rate if drain_rate > 0 else 0.0
+            fraction = min(depleted_after / duration, 1.0) if duration > 0 and math.isfinite(duration) else 0.0
+            vehicle.leg = (vehicle.x + (target_x - vehicle.x) * fraction,
+                           vehicle.y + (target_y - vehicle.y) * fraction, 0.0, distance * fraction)
+            self._schedule(self.clock + depleted_after, EVENT_BATTERY_DEPLETED, vehicle)
+            return
+        vehicle.leg = (target_x, target_y, drain, distance)
+        self._schedule(self.clock + duration, arrival_event, vehicle)
+
+    def _finish_leg(self, vehicle):
+        target_x, target_y, drain, distance = vehicle.leg
+        vehicle.x, vehicle.y = target_x, target_y
+        vehicle.battery = max(vehicle.battery - drain, 0.0)
+        vehicle.distance += distance
+        vehicle.leg = None
+
+    def _seek_charging(self, vehicle):
+        """前往最近的有空位充电站，没有空位时进入等待队列"""
+        station = None
+        best = math.inf
+        for candidate in self.stations:
+            if candidate.occupied >= candidate.capacity:
+                continue
+            distance = math.hypot(candidate.x - vehicle.x, candidate.y - vehicle.y)
+            if distance < best:
+                station, best = candidate, distance
+        if station is None or vehicle.speed_coef <= 0:
+            self._set_state(vehicle, STATE_WAITING_CHARGE)
+            vehicle.queued_at = self.clock
+            self._charge_queue.append(vehicle)
+            self.max_charge_queue = max(self.max_charge_queue, len(self._charge_queue))
+            return
+        self._send_to_station(vehicle, station)
+
+    def _send_to_station(self, vehicle, station):
+        station.occupied += 1
+        vehicle.station = station
+        self._set_state(vehicle, STATE_TO_STATION)
+        # 前往充电站途中按固定系数耗电，不区分车型（与仿真引擎一致）
+        self._start_leg(vehicle, station.x, station.y, EVENT_STATION_ARRIVAL, STATION_TRIP_CONSUMPTION_FACTOR, 1.0)
+
+    def _release_station(self, station):
+        """释放充电站容量，并通知排队最久的等待充电车辆前往"""
+        station.occupied = max(station.occupied - 1, 0)
+        while self._charge_queue and station.occupied < station.capacity:
+            vehicle = self._charge_queue.popleft()
+            if vehicle.state != STATE_WAITING_CHARGE:
+                continue
+            self.charge_queue_wait += self.clock - vehicle.queued_at
+            self.charge_queue_count += 1
+            vehicle.queued_at = None
+            self._send_to_station(vehicle, station)
+
+    def _set_idle(self, vehicle):
+        self._set_state(vehicle, STATE_IDLE)
+        self._idle[vehicle.vehicle_id] = vehicle
+        if self._pending:
+            self._waiting_for_vehicles = False
+            self._request_dispatch()
+
+    def _set_state(self, vehicle, state):
+        vehicle.time_in_state[vehicle.state] += self.clock - vehicle.state_since
+        vehicle.state = state
+        vehicle.state_since = self.clock
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+    def _schedule(self, event_time, kind, subject=None):
+        self._sequence += 1
+        heapq.heappush(self._events, (event_time, self._sequence, kind, subject))
+
+    def _request_dispatch(self):
+        """安排下一个匹配窗口（窗口内的多次请求合并为一次匹配）"""
+        if not self._dispatch_scheduled:
+            self._dispatch_scheduled = True
+            self._schedule(self.clock + self.match_window, EVENT_DISPATCH)
+
+    def _distance(self, x1, y1, x2, y2):
+        return float(self._pair_distances([(x1, y1)], [(x2, y2)])[0])
+
+    def _pair_distances(self, from_xy, to_xy):
+        """行驶距离，距离表中不可达的点对退回直线距离"""
+        from_xy = np.asarray(from_xy, dtype=float).reshape(-1, 2)
+        to_xy = np.asarray(to_xy, dtype=float).reshape(-1, 2)
+        straight = np.hypot(from_xy[:, 0] - to_xy[:, 0], from_xy[:, 1] - to_xy[:, 1])
+        if self.travel_table is None:
+            return straight
+        distances = self.travel_table.pair_distances(from_xy, to_xy)
+        return np.where(np.isfinite(distances), distances, straight)
+
+    def _city_factors(self):
+        """城市距离换算比例和充电价格系数"""
+        from app.config.vehicle_params import CITY_DISTANCE_RATIO, get_city_charging_price_factor
+
+        distance_ratio = (CITY_DISTANCE_RATIO or {}).get(self.city_code, 0.1)
+        try:
+            charging_factor = get_city_charging_price_factor(self.city_code) or 1.0
+        except Exception as e:
+            print(f"获取城市 {self.city_code} 充电价格系数失败，使用1.0: {e}")
+            charging_factor = 1.0
+        return distance_ratio, charging_factor
+
+    # ------------------------------------------------------------------
+    # 报告
+    # ------------------------------------------------------------------
+    def report(self, wall_seconds):
+        """汇总 KPI 报告（时间单位为仿真秒，金额单位为元）"""
+        orders = self.orders
+        completed = [order for order in orders if order.status == ORDER_COMPLETED]
+        counts = {status: 0 for status in (ORDER_PENDING, ORDER_ASSIGNED, ORDER_COMPLETED, ORDER_ABANDONED, ORDER_STRANDED)}
+        for order in orders:
+            counts[order.status] += 1
+
+        assigned = [order for order in orders if order.assigned_at is not None]
+        picked = [order for order in orders if order.pickup_at is not None]
+        gross = sum(order.amount for order in completed)
+        charging_cost = sum(station.cost for station in self.stations)
+
+        vehicle_time = dict.fromkeys(VEHICLE_STATES, 0.0)
+        for vehicle in self.vehicles:
+            for state, seconds in vehicle.time_in_state.items():
+                vehicle_time[state] += seconds
+        total_vehicle_time = sum(vehicle_time.values())
+        busy_ratios = [vehicle.time_in_state[STATE_BUSY] / self.clock for vehicle in self.vehicles] if self.clock else []
+
+        hours = int(math.ceil(self.horizon / 3600))
+        hourly = [{'hour': hour, 'orders': 0, 'completed': 0, 'abandoned': 0, 'pickup_waits': [], 'revenue': 0.0}
+                  for hour in range(hours)]
+        for order in orders:
+            hour = min(int(order.created // 3600), hours - 1)
+            hourly[hour]['orders'] += 1
+            if order.status == ORDER_ABANDONED:
+                hourly[hour]['abandoned'] += 1
+            if order.pickup_at is not None:
+                hourly[hour]['pickup_waits'].append(order.pickup_at - order.created)
+            if order.completed_at is not None:
+                completed_hour = min(int(order.completed_at // 3600), hours - 1)
+                hourly[completed_hour]['completed'] += 1
+                hourly[completed_hour]['revenue'] += order.amount
+        for row in hourly:
+            waits = row.pop('pickup_waits')
+            row['mean_pickup_wait'] = round(float(np.mean(waits)), 1) if waits else None
+            row['revenue'] = round(row['revenue'], 2)
+
+        return {
+            'city_code': self.city_code,
+            'simulated_seconds': round(self.clock, 1),
+            'horizon_seconds': self.horizon,
+            'wall_seconds': round(wall_seconds, 2),
+            'speedup': round(self.clock / wall_seconds, 1) if wall_seconds > 0 else None,
+            'events': self.events_processed,
+            'dispatch_windows': self.dispatch_windows,
+            'distance_model': 'travel_table' if self.travel_table is not None else 'straight_line',
+            'fleet': {
+                'vehicles': len(self.vehicles),
+                'charging_stations': len(self.stations),
+                'charging_capacity': sum(station.capacity for station in self.stations)
+            },
+            'orders': {
+                'total': len(orders),
+                'completed': counts[ORDER_COMPLETED],
+                'unserved': counts[ORDER_PENDING],
+                'in_progress': counts[ORDER_ASSIGNED],
+                'abandoned': counts[ORDER_ABANDONED],
+                'stranded': counts[ORDER_STRANDED],
+                'completion_rate': round(counts[ORDER_COMPLETED] / len(orders), 4) if orders else None
+            },
+            'wait_time': {
+                'assignment': _distribution([order.assigned_at - order.created for order in assigned]),
+                'pickup': _distribution([order.pickup_at - order.created for order in picked])
+            },
+            'trip_time': _distribution([order.completed_at - order.pickup_at for order in completed]),
+            'utilization': {
+                'state_share': {state: round(seconds / total_vehicle_time, 4) if total_vehicle_time else 0.0
+                                for state, seconds in vehicle_time.items()},
+                'busy_ratio': _distribution(busy_ratios, digits=4),
+                'trips_per_vehicle': round(len(completed) / len(self.vehicles), 2) if self.vehicles else 0.0,
+                'distance_per_vehicle': round(sum(vehicle.distance for vehicle in self.vehicles) / len(self.vehicles), 1)
+                if self.vehicles else 0.0
+            },
+            'revenue': {
+                'gross': round(gross, 2),
+                'charging_cost': round(charging_cost, 2),
+                'net': round(gross - charging_cost, 2),
+                'per_vehicle': round(gross / len(self.vehicles), 2) if self.vehicles else 0.0,
+                'per_completed_order': round(gross / len(completed), 2) if completed else 0.0
+            },
+            'charging': {
+                'sessions': sum(station.sessions for station in self.stations),
+                'charged_percent': round(sum(station.charged for station in self.stations), 1),
+                'max_queue_length': self.max_charge_queue,
+                'mean_queue_wait': round(self.charge_queue_wait / self.charge_queue_count, 1)
+                if self.charge_queue_count else 0.0,
+                'still_waiting': sum(1 for vehicle in self.vehicles if vehicle.state == STATE_WAITING_CHARGE),
+                'depleted_vehicles': sum(1 for vehicle in self.vehicles if vehicle.state == STATE_DEPLETED)
+            },
+            'hourly': hourly,
+            'stations': [{
+                'station_code': station.station_code,
+                'capacity': station.capacity,
+                'sessions': station.sessions,
+                'charged_percent': round(station.charged, 1),
+                'cost': round(station.cost, 2)
+            } for station in self.stations],
+            'params': dict(self.params),
+            'match_window': self.match_window,
+            'max_wait': self.max_wait
+        }
+
+
+def _distribution(values, digits=1):
+    """均值和分位数统计"""
+    if not values:
+        return {'count': 0, 'mean': None, 'p50': None, 'p90': None, 'p95': None, 'max': None}
+    array = np.asarray(values, dtype=float)
+    p50, p90, p95 = np.percentile(array, [50, 90, 95])
+    return {
+        'count': int(array.size),
+        'mean': round(float(array.mean()), digits),
+        'p50': round(float(p50), digits),
+        'p90': round(float(p90), digits),
+        'p95': round(float(p95), digits),
+        'max': round(float(array.max()), digits)
+    }
+
+
+# ----------------------------------------------------------------------
+# 输入数据
+# ----------------------------------------------------------------------
+def load_fleet(city_code, fleet_size=None, seed=None):
+    """复制城市车队，维护中和电量为0的车辆不参与；fleet_size 小于实际数量时抽样，大于时复制车辆扩充"""
+    from app.utils.fleet_state import get_fleet_state
+
+    vehicles = [vehicle for vehicle in get_fleet_state().get_city_vehicles(city_code)
+                if vehicle.get('current_status') != '维护中' and float(vehicle.get('battery_level') or 0) > 0]
+    if not fleet_size or not vehicles or fleet_size == len(vehicles):
+        return vehicles
+    rng = np.random.default_rng(seed)
+    if fleet_size < len(vehicles):
+        return [vehicles[index] for index in sorted(rng.choice(len(vehicles), fleet_size, replace=False).tolist())]
+    # 复制的车辆使用负数ID，避免与真实车辆混淆
+    clones = []
+    for index, source in enumerate(rng.choice(len(vehicles), fleet_size - len(vehicles)).tolist()):
+        clone = dict(vehicles[source])
+        clone['vehicle_id'] = -(index + 1)
+        clones.append(clone)
+    return vehicles + clones
+
+
+def load_stations(city_code):
+    """城市充电站（只读）"""
+    return BaseDAO.execute_query("""
+        SELECT station_code, location_x, location_y, max_capacity
+        FROM charging_stations
+        WHERE city_code = %s
+        ORDER BY station_id
+    """, (city_code,)) or []
+
+
+def load_history_orders(city_code, day):
+    """某一天的历史订单，created 为相对当天零点的秒数"""
+    start = datetime.combine(day, datetime.min.time())
+    rows = BaseDAO.execute_query("""
+        SELECT order_id, create_time, pickup_location_x, pickup_location_y, dropoff_location_x, dropoff_location_y
+        FROM orders
+        WHERE city_code = %s AND create_time >= %s AND create_time < %s
+          AND pickup_location_x IS NOT NULL AND pickup_location_y IS NOT NULL
+          AND dropoff_location_x IS NOT NULL AND dropoff_location_y IS NOT NULL
+        ORDER BY create_time
+    """, (city_code, start, start + timedelta(days=1))) or []
+    return [{
+        'order_id': row['order_id'],
+        'created': (row['create_time'] - start).total_seconds(),
+        'pickup_x': row['pickup_location_x'],
+        'pickup_y': row['pickup_location_y'],
+        'dropoff_x': row['dropoff_location_x'],
+        'dropoff_y': row['dropoff_location_y']
+    } for row in rows]
+
+
+def load_hourly_demand_profile(city_code, days=DEMAND_PROFILE_DAYS):
+    """城市近 days 天的订单小时分布（24 个概率），没有历史订单时为均匀分布"""
+    rows = BaseDAO.execute_query("""
+        SELECT HOUR(create_time) AS hour, COUNT(*) AS order_count
+        FROM orders
+        WHERE city_code = %s AND create_time >= %s
+        GROUP BY HOUR(create_time)
+    """, (city_code, datetime.now() - timedelta(days=days))) or []
+    counts = np.zeros(24)
+    for row in rows:
+        counts[int(row['hour'])] = row['order_count']
+    total = counts.sum()
+    return counts / total if total else np.full(24, 1 / 24)
+
+
+def synthetic_orders(city_code, order_count, follow_hotspots=False, seed=None):
+    """按小时分布生成一天的合成订单，上下车点由批量订单生成器生成（避开障碍物）"""
+    from app.utils.order_generator import OrderBatchGenerator
+
+    rng = np.random.default_rng(seed)
+    hours = rng.choice(24, size=order_count, p=load_hourly_demand_profile(city_code))
+    created = np.sort(hours * 3600 + rng.uniform(0, 3600, order_count))
+    generator = OrderBatchGenerator(city_code, [0], follow_hotspots=follow_hotspots, avoid_obstacles=True,
+                                    seed=seed, reserve_numbers=False)
+    batch = generator.generate(order_count)
+    return [{
+        'order_id': index + 1,
+        'created': float(created[index]),
+        'pickup_x': int(batch['pickup_x'][index]),
+        'pickup_y': int(batch['pickup_y'][index]),
+        'dropoff_x': int(batch['dropoff_x'][index]),
+        'dropoff_y': int(batch['dropoff_y'][index])
+    } for index in range(order_count)]
+
+
+def load_travel_table(city_code):
+    """城市行驶距离表，表尚未生成时同步生成；城市没有障碍物时返回 None"""
+    tables = get_travel_time_tables()
+    return tables.get_table(city_code, build=False) or tables.build(city_code)
+
+
+def run_fleet_study(city_code, day=None, order_count=None, fleet_size=None, param_overrides=None,
+                    match_window=MATCH_WINDOW, max_wait=None, follow_hotspots=False, seed=None,
+                    progress=None, cancelled=None):
+    """运行一次车队研究：回放 day 当天的历史订单，或指定 order_count 生成合成订单
+
+    Args:
+        city_code: 城市中文名
+        day: 回放日期（date），与 order_count 二选一
+        order_count: 合成订单数量
+        fleet_size: 车队规模，None 时使用城市当前车队
+        param_overrides: 覆盖的仿真参数，键见 OVERRIDABLE_PARAMS
+        match_window: 匹配窗口（仿真秒）
+        max_wait: 订单等待分配的最长时间（仿真秒）
+        follow_hotspots: 合成订单按历史热点分布
+        seed: 随机数种子
+        progress: 进度回调 progress(仿真秒, 仿真时长)
+        cancelled: 返回 True 时提前结束
+
+    Returns:
+        dict: KPI 报告
+
+    Raises:
+        ValueError: 参数无效或城市没有可用车辆
+    """
+    city_code = normalize_city(city_code)
+    if day is None and not order_count:
+        raise ValueError("请指定回放日期或合成订单数量")
+    unknown = set(param_overrides or {}) - set(OVERRIDABLE_PARAMS)
+    if unknown:
+        raise ValueError(f"不支持覆盖的参数: {', '.join(sorted(unknown))}")
+
+    params = load_simulation_params()
+    try:
+        from app.config.vehicle_params import get_param
+        params['CHARGING_PRICE_PER_PERCENT'] = get_param('CHARGING_PRICE_PER_PERCENT')
+    except Exception as e:
+        print(f"读取充电价格参数失败，使用0: {e}")
+        params['CHARGING_PRICE_PER_PERCENT'] = 0
+    params.update({key: float(value) for key, value in (param_overrides or {}).items()})
+
+    vehicles = load_fleet(city_code, fleet_size, seed)
+    if not vehicles:
+        raise ValueError(f"城市 {city_code} 没有可参与仿真的车辆")
+    if order_count:
+        orders = synthetic_orders(city_code, int(order_count), follow_hotspots, seed)
+        source = {'type': 'synthetic', 'order_count': int(order_count), 'follow_hotspots': follow_hotspots}
+    else:
+        orders = load_history_orders(city_code, day)
+        source = {'type': 'history', 'date': day.strftime('%Y-%m-%d')}
+
+    simulation = EventSimulation(
+        city_code, vehicles, load_stations(city_code), orders, params=params,
+        match_window=match_window, max_wait=max_wait, travel_table=load_travel_table(city_code)
+    )
+    report = simulation.run(progress=progress, cancelled=cancelled)
+    report['source'] = source
+    report['fleet']['requested_size'] = fleet_size
+    report['param_overrides'] = param_overrides or {}
+    report['seed'] = seed
+    return report
+
+
+def main():
+    """命令行：python -m app.utils.event_simulation 北京市 --date 2025-05-01 [--fleet-size 300]"""
+    parser = argparse.ArgumentParser(description='离散事件车队仿真（不写入业务表）')
+    parser.add_argument('city', help='城市中文名，如 北京市')
+    parser.add_argument('--date', help='回放该日期的历史订单，格式 YYYY-MM-DD')
+    parser.add_argument('--orders', type=int, help='生成合成订单的数量（不指定日期时使用）')
+    parser.add_argument('--fleet-size', type=int, help='车队规模，默认使用当前车队')
+    parser.add_argument('--param', action='append', default=[], metavar='KEY=VALUE', help='覆盖仿真参数，可重复')
+    parser.add_argument('--match-window', type=float, default=MATCH_WINDOW, help='匹配窗口（仿真秒）')
+    parser.add_argument('--max-wait', type=float, help='订单最长等待分配时间（仿真秒）')
+    parser.add_argument('--hotspots', action='store_true', help='合成订单按历史热点分布')
+    parser.add_argument('--seed', type=int, help='随机数种子')
+    parser.add_argument('--output', help='报告输出文件（JSON），默认打印到终端')
+    args = parser.parse_args()
+
+    try:
+        overrides = {}
+        for item in args.param:
+            key, _, value = item.partition('=')
+            overrides[key.strip()] = float(value)
+        report = run_fleet_study(
+            args.city,
+            day=datetime.strptime(args.date, '%Y-%m-%d').date() if args.date else None,
+            order_count=args.orders, fleet_size=args.fleet_size, param_overrides=overrides,
+            match_window=args.match_window, max_wait=args.max_wait, follow_hotspots=args.hotspots,
+            seed=args.seed,
+            progress=lambda clock, horizon: print(f"仿真进度 {clock / horizon:.0%}")
+        )
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text)
+            print(f"报告已写入 {args.output}")
+        else:
+            print(text)
+    except Exception as e:
+        print(f"仿真失败: {str(e)}")
+        traceback.print_exc()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,868 @@
+"""
+车队仿真引擎
+由一个调度线程按固定节拍统一推进所有行驶中/充电中车辆的状态，
+替代原先每辆车一个 VehicleMovementThread / ChargingStationMovementThread 的实现。
+
+车辆的数值状态（坐标、目标点、剩余距离、电量、计时器、阶段）和车型系数
+（速度、能耗、充电）以列数组保存，每个节拍对全部车辆做一次批量的NumPy运算；
+每个行驶阶段沿避障路线（app.utils.routing）的折线逐个拐点行驶，目标点数组保存当前拐点；
+数据库写入和订单完成等回调交给按车辆ID分片的后台工作线程执行，
+同一辆车的副作用保持先后顺序，且不会阻塞仿真节拍。
+"""
+import math
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, date
+
+import numpy as np
+
+from app.dao.vehicle_dao import VehicleDAO
+from app.utils.charging_reservations import get_charging_reservations
+from app.utils.routing import get_routing_engine, polyline_length
+from app.utils.settlement import get_settlement_pipeline
+from app.utils.telemetry_buffer import get_telemetry_buffer
+from app.utils.vehicle_profiles import get_vehicle_profiles
+
+# 车辆仿真阶段
+PHASE_NONE = 0          # 槽位空闲
+PHASE_TO_PICKUP = 1     # 前往上车点
+PHASE_PICKUP_WAIT = 2   # 等待乘客上车
+PHASE_TO_DROPOFF = 3    # 前往下车点
+PHASE_TO_STATION = 4    # 前往充电站
+PHASE_CHARGING = 5      # 充电中
+
+PHASE_NAMES = {
+    PHASE_TO_PICKUP: 'TO_PICKUP',
+    PHASE_PICKUP_WAIT: 'PICKUP_WAIT',
+    PHASE_TO_DROPOFF: 'TO_DROPOFF',
+    PHASE_TO_STATION: 'TO_STATION',
+    PHASE_CHARGING: 'CHARGING'
+}
+
+# 每5秒写一次充电进度（与原充电线程一致）
+CHARGING_STEP_INTERVAL = 5
+# 单次充电最长时间（秒）
+MAX_CHARGING_TIME = 600
+# 前往充电站途中每步固定耗电系数（与原充电站移动线程一致）
+STATION_TRIP_CONSUMPTION_FACTOR = 0.1
+# 单个节拍最多补偿的间隔数，防止长时间卡顿后车辆瞬移
+MAX_TICK_CATCHUP = 5
+# 副作用工作线程数量
+SIDE_EFFECT_WORKERS = 4
+
+MOVING_PHASES = (PHASE_TO_PICKUP, PHASE_TO_DROPOFF, PHASE_TO_STATION)
+
+# 仿真所需全局参数及数据库缺失时的默认值
+DEFAULT_SIMULATION_PARAMS = {
+    'VEHICLE_MOVEMENT_SPEED': 5,
+    'POSITION_MOVEMENT_INTERVAL': 0.2,
+    'BATTERY_UPDATE_INTERVAL': 10,
+    'POSITION_UPDATE_INTERVAL': 5,
+    'RUNNING_BATTERY_UPDATE_INTERVAL': 15,
+    'BATTERY_CONSUMPTION_RATE': 0.1,
+    'PICKUP_WAITING_TIME': 1,
+    'LOW_BATTERY_THRESHOLD': 20,
+    'CHARGING_RATE': 0.5
+}
+
+
+def load_simulation_params():
+    """从参数表读取仿真参数，读取失败的参数使用默认值"""
+    from app.config.vehicle_params import get_param
+
+    params = {}
+    for param_name, default_value in DEFAULT_SIMULATION_PARAMS.items():
+        try:
+            params[param_name] = get_param(param_name)
+        except Exception as e:
+            print(f"仿真引擎加载参数 {param_name} 失败: {e}，使用默认值 {default_value}")
+            params[param_name] = default_value
+    return params
+
+
+def integrate_motion(x, y, target_x, target_y, step):
+    """批量推进车辆位置
+
+    Args:
+        x, y: 当前坐标数组
+        target_x, target_y: 目标坐标数组
+        step: 本节拍可行驶距离数组
+
+    Returns:
+        tuple: (新X坐标, 新Y坐标, 剩余距离, 是否到达)
+    """
+    dx = target_x - x
+    dy = target_y - y
+    distance = np.hypot(dx, dy)
+    arrived = step >= distance
+    ratio = np.divide(step, distance, out=np.ones_like(distance), where=distance > 0)
+    new_x = np.where(arrived, target_x, x + dx * ratio)
+    new_y = np.where(arrived, target_y, y + dy * ratio)
+    remaining = np.where(arrived, 0.0, distance - step)
+    return new_x, new_y, remaining, arrived
+
+
+def integrate_battery(battery, consumption_rate, energy_coefficient, battery_update_interval, step_fraction):
+    """批量计算行驶耗电
+
+    每个名义移动间隔耗电 = 基础耗电率 × BATTERY_UPDATE_INTERVAL × 车型能耗系数，
+    按本节拍实际经过的间隔数折算。
+
+    Returns:
+        tuple: (新电量, 是否耗尽)
+    """
+    drain = consumption_rate * battery_update_interval * energy_coefficient * step_fraction
+    new_battery = np.maximum(battery - drain, 0.0)
+    return new_battery, new_battery <= 0
+
+
+class VehicleJob:
+    """单辆车的仿真任务信息，数值状态保存在引擎数组中"""
+
+    def __init__(self, kind, vehicle_id, city_code=None):
+        self.kind = kind                    # 'trip' 或 'charging'
+        self.vehicle_id = vehicle_id
+        self.city_code = city_code
+        self.vehicle_model = None
+        # 订单行程
+        self.order_id = None
+        self.pickup = None                  # (x, y, 名称)
+        self.dropoff = None                 # (x, y, 名称)
+        # 充电行程
+        self.station_code = None
+        self.station = None                 # (x, y)
+        self.capacity_coefficient = None
+        self.initial_battery = None         # 开始充电时的电量
+        # 路线：阶段 -> 拐点列表（不含出发点，最后一个为目标点）
+        self.routes = {}
+        self.waypoints = deque()            # 当前阶段尚未到达的后续拐点
+
+    def target_name(self, phase):
+        """当前阶段目标点名称"""
+        if phase == PHASE_TO_PICKUP:
+            return self.pickup[2]
+        if phase == PHASE_TO_DROPOFF:
+            return self.dropoff[2]
+        return f"充电站 {self.station_code}"
+
+    def moving_location_name(self, phase):
+        """行驶途中的位置名称"""
+        if phase == PHASE_TO_PICKUP:
+            return f"前往上车点: {self.pickup[2]}"
+        if phase == PHASE_TO_DROPOFF:
+            return f"前往下车点: {self.dropoff[2]}"
+        return f"前往充电站 {self.station_code}"
+
+
+class SideEffectWorkers:
+    """按车辆ID分片的后台执行线程，保证同一辆车的数据库写入按顺序执行"""
+
+    def __init__(self, size=SIDE_EFFECT_WORKERS):
+        self._queues = [queue.Queue() for _ in range(size)]
+        for index, task_queue in enumerate(self._queues):
+            worker = threading.Thread(
+                target=self._worker_loop, args=(task_queue,),
+                name=f"fleet-io-{index}", daemon=True
+            )
+            worker.start()
+
+    def submit(self, vehicle_id, func, *args):
+        """提交一个副作用任务"""
+        self._queues[hash(vehicle_id) % len(self._queues)].put((func, args))
+
+    def pending_count(self):
+        """待执行的任务数量"""
+        return sum(task_queue.qsize() for task_queue in self._queues)
+
+    @staticmethod
+    def _worker_loop(task_queue):
+        while True:
+            func, args = task_queue.get()
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"车队仿真后台任务执行出错: {e}")
+                traceback.print_exc()
+            finally:
+                task_queue.task_done()
+
+
+class FleetSimulationEngine(threading.Thread):
+    """车队仿真引擎 - 单线程按节拍推进所有车辆"""
+
+    def __init__(self, capacity=256):
+        super().__init__(name='fleet-simulation', daemon=True)
+        self._lock = threading.RLock()
+        self._shutdown = threading.Event()
+        self.params = load_simulation_params()
+        self._workers = SideEffectWorkers()
+
+        # 槽位数组
+        self._capacity = 0
+        self._phase = np.zeros(0, dtype=np.int8)
+        self._x = np.zeros(0)
+        self._y = np.zeros(0)
+        self._target_x = np.zeros(0)
+        self._target_y = np.zeros(0)
+        self._remaining = np.zeros(0)        # 沿路线到阶段目标点的剩余距离
+        self._tail = np.zeros(0)             # 当前拐点之后的路线长度
+        self._battery = np.zeros(0)
+        self._speed_coef = np.zeros(0)       # 车型速度系数
+        self._energy_coef = np.zeros(0)      # 车型能耗系数
+        self._consumption_rate = np.zeros(0) # 基础耗电率
+        self._charging_coef = np.zeros(0)    # 车型充电速度系数
+        self._timer = np.zeros(0)            # 上车等待剩余时间 / 充电写入计时
+        self._charge_rate = np.zeros(0)      # 每秒充电百分比
+        self._position_elapsed = np.zeros(0)
+        self._battery_elapsed = np.zeros(0)
+        self._grow(capacity)
+
+        self._jobs = {}                      # 槽位 -> VehicleJob
+        self._slot_by_vehicle = {}           # 车辆ID -> 槽位
+        self._free_slots = list(range(capacity - 1, -1, -1))
+
+        # 运行指标
+        self.tick_count = 0
+        self.last_tick_duration = 0.0
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+    def start_trip(self, vehicle_id, order_id, vehicle_x, vehicle_y, pickup_x, pickup_y,
+                   dropoff_x, dropoff_y, pickup_name, dropoff_name):
+        """开始模拟订单行程（前往上车点 -> 等待上车 -> 前往下车点）
+
+        Returns:
+            bool: 是否成功加入仿真
+        """
+        self.stop_vehicle(vehicle_id)
+        self.params = load_simulation_params()
+
+        vehicle = VehicleDAO.get_vehicle_by_id(vehicle_id)
+        if not vehicle:
+            print(f"找不到车辆 {vehicle_id}，无法模拟移动")
+            return False
+
+        vehicle_model, profile = get_vehicle_profiles().for_vehicle(vehicle_id)
+        speed_coefficient = _coefficient(profile.speed)
+        if self.params['VEHICLE_MOVEMENT_SPEED'] * speed_coefficient <= 0:
+            print(f"车辆 {vehicle_id} 速度为0或无效，无法模拟移动")
+            return False
+
+        current_battery = float(vehicle['battery_level'])
+        if current_battery <= 0:
+            self._workers.submit(vehicle_id, VehicleDAO.update_vehicle_battery, vehicle_id, 0)
+            print(f"车辆 {vehicle_id} 初始电量已为0，无法开始移动")
+            return False
+
+        job = VehicleJob('trip', vehicle_id, vehicle.get('current_city'))
+        job.vehicle_model = vehicle_model
+        job.order_id = order_id
+        job.pickup = (float(pickup_x), float(pickup_y), pickup_name)
+        job.dropoff = (float(dropoff_x), float(dropoff_y), dropoff_name)
+        job.routes[PHASE_TO_PICKUP] = plan_leg(job.city_code, float(vehicle_x), float(vehicle_y), job.pickup)
+        job.routes[PHASE_TO_DROPOFF] = plan_leg(job.city_code, job.pickup[0], job.pickup[1], job.dropoff)
+
+        with self._lock:
+            slot = self._allocate_slot(vehicle_id, job)
+            self._x[slot] = float(vehicle_x)
+            self._y[slot] = float(vehicle_y)
+            self._battery[slot] = current_battery
+            self._speed_coef[slot] = speed_coefficient
+            self._energy_coef[slot] = _coefficient(profile.energy_consumption)
+            self._consumption_rate[slot] = self.params['BATTERY_CONSUMPTION_RATE']
+            self._charging_coef[slot] = _coefficient(profile.charging_speed)
+            self._begin_leg(slot, PHASE_TO_PICKUP, job.pickup)
+        return True
+
+    def start_charging(self, vehicle_id, current_x, current_y, station_x, station_y,
+                       station_code, current_battery, city_code, speed=None):
+        """开始模拟车辆前往充电站并充电（调用前应已预占充电站容量）
+
+        Returns:
+            bool: 是否成功加入仿真
+        """
+        self.stop_vehicle(vehicle_id)
+        self.params = load_simulation_params()
+
+        vehicle_model, profile = get_vehicle_profiles().for_vehicle(vehicle_id)
+        if not vehicle_model:
+            print(f"无法获取车辆 {vehicle_id} 的型号信息，无法前往充电站")
+            return False
+        if profile.capacity is None:
+            print(f"无法加载车辆 {vehicle_id} ({vehicle_model}) 的电池容量系数")
+            return False
+
+        base_speed = self.params['VEHICLE_MOVEMENT_SPEED']
+        if speed is None:
+            speed_coefficient = _coefficient(profile.speed)
+        else:
+            speed_coefficient = speed / base_speed if base_speed else 0
+        if base_speed * speed_coefficient <= 0:
+            print(f"车辆 {vehicle_id} 速度为0或负值，无法前往充电站")
+            self._workers.submit(vehicle_id, VehicleDAO.update_vehicle_status, vehicle_id, "等待充电")
+            return False
+
+        job = VehicleJob('charging', vehicle_id, city_code)
+        job.vehicle_model = vehicle_model
+        job.station_code = station_code
+        job.station = (float(station_x), float(station_y))
+        job.capacity_coefficient = profile.capacity
+        job.routes[PHASE_TO_STATION] = plan_leg(city_code, float(current_x), float(current_y), job.station)
+
+        self._workers.submit(vehicle_id, VehicleDAO.update_vehicle_status, vehicle_id, "前往充电")
+
+        with self._lock:
+            slot = self._allocate_slot(vehicle_id, job)
+            self._x[slot] = float(current_x)
+            self._y[slot] = float(current_y)
+            self._battery[slot] = float(current_battery or 0)
+            self._speed_coef[slot] = speed_coefficient
+            # 前往充电站途中按固定系数耗电，不区分车型
+            self._energy_coef[slot] = 1.0
+            self._consumption_rate[slot] = STATION_TRIP_CONSUMPTION_FACTOR
+            self._charging_coef[slot] = _coefficient(profile.charging_speed)
+            self._begin_leg(slot, PHASE_TO_STATION, job.station + (job.target_name(PHASE_TO_STATION),))
+        return True
+
+    def stop_vehicle(self, vehicle_id):
+        """停止车辆当前的仿真任务
+
+        订单行程直接停止；前往充电站途中停止会释放预占容量并置为等待充电；
+        充电中停止会按已充电量结算并释放充电站。
+
+        Returns:
+            bool: 是否存在并停止了任务
+        """
+        with self._lock:
+            slot = self._slot_by_vehicle.get(vehicle_id)
+            if slot is None:
+                return False
+            job = self._jobs[slot]
+            phase = int(self._phase[slot])
+            battery = float(self._battery[slot])
+            self._release_slot(slot)
+
+        if phase == PHASE_TO_STATION:
+            print(f"车辆 {vehicle_id} 前往充电站途中收到停止信号，释放充电站预分配容量")
+            self._workers.submit(vehicle_id, self._abort_station_trip, job)
+        elif phase == PHASE_CHARGING:
+            print(f"车辆 {vehicle_id} 充电过程被中断")
+            self._workers.submit(vehicle_id, self._finish_charging, job, battery, True)
+        return True
+
+    def is_moving(self, vehicle_id):
+        """车辆是否处于仿真任务中"""
+        with self._lock:
+            return vehicle_id in self._slot_by_vehicle
+
+    def get_vehicle_status(self, vehicle_id):
+        """获取车辆仿真状态，不在仿真中时返回None"""
+        with self._lock:
+            slot = self._slot_by_vehicle.get(vehicle_id)
+            if slot is None:
+                return None
+            job = self._jobs[slot]
+            phase = int(self._phase[slot])
+            waypoints = []
+            if phase in MOVING_PHASES:
+                waypoints = [(float(self._target_x[slot]), float(self._target_y[slot]))] + list(job.waypoints)
+            return {
+                'vehicle_id': vehicle_id,
+                'phase': PHASE_NAMES.get(phase),
+                'location_x': float(self._x[slot]),
+                'location_y': float(self._y[slot]),
+                'battery_level': float(self._battery[slot]),
+                'remaining_distance': float(self._remaining[slot]),
+                'waypoints': waypoints
+            }
+
+    def get_metrics(self):
+        """获取引擎运行指标"""
+        with self._lock:
+            active = self._phase[self._phase != PHASE_NONE]
+            phase_counts = {name: int(np.count_nonzero(active == code)) for code, name in PHASE_NAMES.items()}
+            return {
+                'active_vehicles': int(active.size),
+                'phase_counts': phase_counts,
+                'capacity': self._capacity,
+                'tick_count': self.tick_count,
+                'last_tick_ms': round(self.last_tick_duration * 1000, 3),
+                'pending_side_effects': self._workers.pending_count(),
+                'telemetry_buffer': get_telemetry_buffer().get_metrics(),
+                'settlement': get_settlement_pipeline().get_metrics()
+            }
+
+    def shutdown(self):
+        """停止仿真线程"""
+        self._shutdown.set()
+
+    # ------------------------------------------------------------------
+    # 节拍循环
+    # ------------------------------------------------------------------
+    def run(self):
+        last_tick = time.monotonic()
+        while not self._shutdown.is_set():
+            interval = self.params['POSITION_MOVEMENT_INTERVAL']
+            tick_start = time.monotonic()
+            dt = min(tick_start - last_tick, interval * MAX_TICK_CATCHUP)
+            last_tick = tick_start
+
+            try:
+                self._tick(dt)
+            except Exception as e:
+                print(f"车队仿真节拍执行出错: {e}")
+                traceback.print_exc()
+
+            self.last_tick_duration = time.monotonic() - tick_start
+            self.tick_count += 1
+            self._shutdown.wait(max(0.0, interval - self.last_tick_duration))
+
+    def _tick(self, dt):
+        """推进一个节拍"""
+        if dt <= 0:
+            return
+        effects = []
+        with self._lock:
+            active = np.flatnonzero(self._phase != PHASE_NONE)
+            if active.size:
+                phase = self._phase[active]
+                self._advance_moving(active[np.isin(phase, MOVING_PHASES)], dt, effects)
+                self._advance_waiting(active[phase == PHASE_PICKUP_WAIT], dt)
+                self._advance_charging(active[phase == PHASE_CHARGING], dt, effects)
+        for vehicle_id, func, args in effects:
+            self._workers.submit(vehicle_id, func, *args)
+
+    def _advance_moving(self, slots, dt, effects):
+        """批量推进所有行驶中车辆的位置、剩余距离和电量"""
+        if not slots.size:
+            return
+        params = self.params
+        step = params['VEHICLE_MOVEMENT_SPEED'] * self._speed_coef[slots] * dt
+        new_x, new_y, remaining, arrived = integrate_motion(
+            self._x[slots], self._y[slots], self._target_x[slots], self._target_y[slots], step
+        )
+        new_battery, depleted = integrate_battery(
+            self._battery[slots], self._consumption_rate[slots], self._energy_coef[slots],
+            params['BATTERY_UPDATE_INTERVAL'], dt / params['POSITION_MOVEMENT_INTERVAL']
+        )
+        self._x[slots] = new_x
+        self._y[slots] = new_y
+        self._remaining[slots] = remaining + self._tail[slots]
+        self._battery[slots] = new_battery
+        self._position_elapsed[slots] += dt
+        self._battery_elapsed[slots] += dt
+
+        # 到达中间拐点的车辆转向下一个拐点，不算到达目标
+        for index in np.flatnonzero(arrived & ~depleted):
+            slot = int(slots[index])
+            job = self._jobs[slot]
+            if job.waypoints:
+                self._next_waypoint(slot, job)
+                arrived[index] = False
+
+        # 电量耗尽优先于到达
+        for slot in slots[depleted]:
+            slot = int(slot)
+            job = self._jobs[slot]
+            phase = int(self._phase[slot])
+            x, y = float(self._x[slot]), float(self._y[slot])
+            self._release_slot(slot)
+            effects.append((job.vehicle_id, self._on_battery_depleted, (job, phase, x, y)))
+
+        for slot in slots[arrived & ~depleted]:
+            slot = int(slot)
+            self._on_arrival(slot, int(self._phase[slot]), self._jobs[slot], effects)
+
+        report_due = ~arrived & ~depleted & (self._position_elapsed[slots] >= params['POSITION_UPDATE_INTERVAL'])
+        for slot in slots[report_due]:
+            slot = int(slot)
+            self._report_position(slot, effects)
+
+    def _advance_waiting(self, slots, dt):
+        """批量推进等待上车计时"""
+        if not slots.size:
+            return
+        self._timer[slots] -= dt
+        for slot in slots[self._timer[slots] <= 0]:
+            slot = int(slot)
+            self._begin_leg(slot, PHASE_TO_DROPOFF, self._jobs[slot].dropoff)
+
+    def _advance_charging(self, slots, dt, effects):
+        """批量推进充电中车辆的电量"""
+        if not slots.size:
+            return
+        self._battery[slots] = np.minimum(self._battery[slots] + self._charge_rate[slots] * dt, 100.0)
+        self._timer[slots] += dt
+        full = self._battery[slots] >= 100
+        for slot in slots[full]:
+            slot = int(slot)
+            job = self._jobs[slot]
+            self._release_slot(slot)
+            effects.append((job.vehicle_id, self._finish_charging, (job, 100.0, False)))
+        step_due = ~full & (self._timer[slots] >= CHARGING_STEP_INTERVAL)
+        for slot in slots[step_due]:
+            slot = int(slot)
+            self._timer[slot] = 0
+            vehicle_id = self._jobs[slot].vehicle_id
+            effects.append((vehicle_id, VehicleDAO.update_vehicle_battery, (vehicle_id, float(self._battery[slot]))))
+
+    def _report_position(self, slot, effects):
+        """按位置更新频率把行驶途中的位置（及电量）写入遥测缓冲"""
+        job = self._jobs[slot]
+        phase = int(self._phase[slot])
+        vehicle_id = job.vehicle_id
+        x, y, battery = float(self._x[slot]), float(self._y[slot]), float(self._battery[slot])
+        location_name = job.moving_location_name(phase)
+        self._position_elapsed[slot] = 0
+        write_battery = (phase == PHASE_TO_STATION or
+                         self._battery_elapsed[slot] >= self.params['RUNNING_BATTERY_UPDATE_INTERVAL'])
+        if write_battery:
+            self._battery_elapsed[slot] = 0
+            effects.append((vehicle_id, VehicleDAO.buffer_vehicle_telemetry,
+                            (vehicle_id, x, y, location_name, battery)))
+        else:
+            effects.append((vehicle_id, VehicleDAO.buffer_vehicle_telemetry,
+                            (vehicle_id, x, y, location_name)))
+
+    def _on_arrival(self, slot, phase, job, effects):
+        """车辆到达当前阶段目标点"""
+        vehicle_id = job.vehicle_id
+        x, y, battery = float(self._x[slot]), float(self._y[slot]), float(self._battery[slot])
+        target_name = job.target_name(phase)
+
+        if phase == PHASE_TO_PICKUP:
+            effects.append((vehicle_id, VehicleDAO.update_vehicle_location_and_battery,
+                            (vehicle_id, x, y, target_name, battery)))
+            self._phase[slot] = PHASE_PICKUP_WAIT
+            self._timer[slot] = self.params['PICKUP_WAITING_TIME']
+        elif phase == PHASE_TO_DROPOFF:
+            self._release_slot(slot)
+            effects.append((vehicle_id, self._complete_trip, (job, x, y, battery)))
+        elif phase == PHASE_TO_STATION:
+            effects.append((vehicle_id, self._arrive_at_station, (job, x, y, battery)))
+            if battery >= 100:
+                self._release_slot(slot)
+                effects.append((vehicle_id, self._finish_charging, (job, battery, False)))
+                return
+            charging_rate = self.params['CHARGING_RATE'] * self._charging_coef[slot]
+            if charging_rate <= 0:
+                charging_rate = 0.5
+            remaining = 100 - battery
+            total_charging_time = min(remaining / charging_rate, MAX_CHARGING_TIME)
+            job.initial_battery = battery
+            self._phase[slot] = PHASE_CHARGING
+            self._charge_rate[slot] = remaining / max(total_charging_time, 1e-6)
+            self._timer[slot] = 0
+
+    # ------------------------------------------------------------------
+    # 槽位管理
+    # ------------------------------------------------------------------
+    def _grow(self, new_capacity):
+        """扩容槽位数组"""
+        def extend(array):
+            grown = np.zeros(new_capacity, dtype=array.dtype)
+            grown[:array.size] = array
+            return grown
+
+        old_capacity = self._capacity
+        self._phase = extend(self._phase)
+        self._x = extend(self._x)
+        self._y = extend(self._y)
+        self._target_x = extend(self._target_x)
+        self._target_y = extend(self._target_y)
+        self._remaining = extend(self._remaining)
+        self._tail = extend(self._tail)
+        self._battery = extend(self._battery)
+        self._speed_coef = extend(self._speed_coef)
+        self._energy_coef = extend(self._energy_coef)
+        self._consumption_rate = extend(self._consumption_rate)
+        self._charging_coef = extend(self._charging_coef)
+        self._timer = extend(self._timer)
+        self._charge_rate = extend(self._charge_rate)
+        self._position_elapsed = extend(self._position_elapsed)
+        self._battery_elapsed = extend(self._battery_elapsed)
+        self._capacity = new_capacity
+        if old_capacity:
+            self._free_slots.extend(range(new_capacity - 1, old_capacity - 1, -1))
+
+    def _allocate_slot(self, vehicle_id, job):
+        """为车辆分配槽位（调用方持有锁）"""
+        if not self._free_slots:
+            self._grow(self._capacity * 2)
+        slot = self._free_slots.pop()
+        self._jobs[slot] = job
+        self._slot_by_vehicle[vehicle_id] = slot
+        self._timer[slot] = 0
+        self._charge_rate[slot] = 0
+        self._position_elapsed[slot] = 0
+        self._battery_elapsed[slot] = 0
+        return slot
+
+    def _release_slot(self, slot):
+        """释放槽位（调用方持有锁）"""
+        job = self._jobs.pop(slot, None)
+        if job is not None and self._slot_by_vehicle.get(job.vehicle_id) == slot:
+            del self._slot_by_vehicle[job.vehicle_id]
+        self._phase[slot] = PHASE_NONE
+        self._free_slots.append(slot)
+
+    def _begin_leg(self, slot, phase, target):
+        """开始新的行驶阶段，沿该阶段的路线拐点行驶（调用方持有锁）"""
+        job = self._jobs[slot]
+        waypoints = job.routes.get(phase) or [(target[0], target[1])]
+        job.waypoints = deque(waypoints)
+        self._phase[slot] = phase
+        self._next_waypoint(slot, job)
+        self._position_elapsed[slot] = 0
+        self._battery_elapsed[slot] = 0
+
+    def _next_waypoint(self, slot, job):
+        """把下一个拐点设为目标点（调用方持有锁）"""
+        x, y = job.waypoints.popleft()
+        self._target_x[slot] = x
+        self._target_y[slot] = y
+        self._tail[slot] = polyline_length([(x, y)] + list(job.waypoints))
+        self._remaining[slot] = math.hypot(x - self._x[slot], y - self._y[slot]) + self._tail[slot]
+
+    # ------------------------------------------------------------------
+    # 完成回调（在后台工作线程中执行）
+    # ------------------------------------------------------------------
+    def _complete_trip(self, job, x, y, battery):
+        """订单行程结束：更新订单并决定车辆后续状态"""
+        vehicle_id = job.vehicle_id
+        try:
+            VehicleDAO.update_vehicle_location_and_battery(vehicle_id, x, y, job.dropoff[2], battery)
+            get_settlement_pipeline().submit(job.order_id, datetime.now())
+            new_status = self._resolve_post_trip_status(job, x, y, battery)
+            VehicleDAO.update_vehicle_status(vehicle_id, new_status)
+        except Exception as e:
+            print(f"订单完成阶段出错: {e}")
+            traceback.print_exc()
+            # 发生异常时，重新读取电量并设置合适的状态
+            try:
+                vehicle = VehicleDAO.get_vehicle_by_id(vehicle_id)
+                if vehicle:
+                    current_battery = vehicle['battery_level']
+                    new_status = self._resolve_post_trip_status(job, x, y, current_battery)
+                    VehicleDAO.update_vehicle_status(vehicle_id, new_status)
+                    print(f"异常处理：已将车辆 {vehicle_id} 状态设为 {new_status} (电量: {current_battery}%)")
+                else:
+                    VehicleDAO.update_vehicle_status(vehicle_id, "空闲中")
+                    print(f"异常处理：无法获取车辆电量，已将车辆 {vehicle_id} 状态设为空闲")
+            except Exception as status_error:
+                print(f"设置车辆状态出错: {status_error}")
+
+    def _resolve_post_trip_status(self, job, x, y, battery):
+        """根据电量决定行程结束后的状态，低电量时预约最近的有空位充电站，没有空位时排队等待"""
+        if battery >= self.params['LOW_BATTERY_THRESHOLD']:
+            return "空闲中"
+
+        vehicle_id = job.vehicle_id
+        try:
+            nearest_station = get_charging_reservations().reserve_or_enqueue(job.city_code, vehicle_id, x, y)
+        except Exception as station_error:
+            print("预约充电站出错，设置为等待充电状态")
+            print(f"错误详情: {station_error}")
+            return "等待充电"
+        if not nearest_station:
+            print(f"城市 {job.city_code} 充电站已满，车辆 {vehicle_id} 排队等待充电")
+            return "等待充电"
+
+        if not self._send_to_station(vehicle_id, x, y, battery, job.city_code, nearest_station):
+            return "等待充电"
+        return "前往充电"
+
+    def _send_to_station(self, vehicle_id, x, y, battery, city_code, station):
+        """派已预约车位的车辆前往充电站，失败时释放预约"""
+        station_code = station['station_code']
+        try:
+            VehicleDAO.update_vehicle_location_name(vehicle_id, f"前往充电站 {station_code}")
+        except Exception as e:
+            print(f"更新车辆 {vehicle_id} 位置名称出错: {e}")
+            get_charging_reservations().release(vehicle_id)
+            return False
+
+        started = self.start_charging(
+            vehicle_id=vehicle_id,
+            current_x=x,
+            current_y=y,
+            station_x=station['location_x'],
+            station_y=station['location_y'],
+            station_code=station_code,
+            current_battery=battery,
+            city_code=city_code
+        )
+        if not started:
+            get_charging_reservations().release(vehicle_id)
+        return started
+
+    def dispatch_to_station(self, vehicle_id, city_code, station):
+        """排队的车辆获得充电站车位（由充电站预约管理器调用），在后台工作线程中派车"""
+        self._workers.submit(vehicle_id, self._dispatch_waiting_vehicle, vehicle_id, city_code, station)
+
+    def _dispatch_waiting_vehicle(self, vehicle_id, city_code, station):
+        vehicle = VehicleDAO.get_vehicle_by_id(vehicle_id)
+        if not vehicle or vehicle.get('current_status') != '等待充电':
+            print(f"车辆 {vehicle_id} 已不在等待充电状态，释放充电站 {station['station_code']} 的预约")
+            get_charging_reservations().release(vehicle_id)
+            return
+        print(f"通知等待充电的车辆 {vehicle_id} 前往充电站 {station['station_code']}")
+        self._send_to_station(
+            vehicle_id, vehicle.get('current_location_x'), vehicle.get('current_location_y'),
+            vehicle.get('battery_level'), city_code, station
+        )
+
+    def _arrive_at_station(self, job, x, y, battery):
+        """到达充电站：更新位置和状态为充电中"""
+        try:
+            VehicleDAO.update_vehicle_location_coordinates(
+                job.vehicle_id, x, y, f"充电站 {job.station_code}"
+            )
+            VehicleDAO.update_vehicle_status(job.vehicle_id, "充电中")
+            get_charging_reservations().begin_charging(job.vehicle_id)
+        except Exception as e:
+            print(f"车辆 {job.vehicle_id} 到达充电站更新状态出错: {e}")
+            traceback.print_exc()
+
+    def _abort_station_trip(self, job):
+        """前往充电站途中被停止：释放预约，在原充电站附近重新排队"""
+        self._release_station(job)
+        VehicleDAO.update_vehicle_status(job.vehicle_id, "等待充电")
+        get_charging_reservations().enqueue(job.city_code, job.vehicle_id, job.station[0], job.station[1])
+
+    def _finish_charging(self, job, final_battery, interrupted):
+        """充电结束（完成或中断）：写电量、置空闲、记录费用并释放充电站"""
+        vehicle_id = job.vehicle_id
+        try:
+            VehicleDAO.update_vehicle_battery(vehicle_id, final_battery)
+            VehicleDAO.update_vehicle_status(vehicle_id, "空闲中")
+            if interrupted:
+                print(f"充电中断，最终电量: {final_battery:.2f}%")
+
+            start_battery = job.initial_battery if job.initial_battery is not None else final_battery
+            if final_battery - start_battery > 0:
+                try:
+                    record_charging_expense(job, start_battery, final_battery)
+                except Exception as e:
+                    print(f"记录充电费用时出错: {e}")
+                    traceback.print_exc()
+
+            # 释放的车位由预约管理器分配给排队的车辆
+            self._release_station(job)
+        except Exception as e:
+            print(f"更新充电完成状态出错: {e}")
+            traceback.print_exc()
+
+    def _on_battery_depleted(self, job, phase, x, y):
+        """行驶途中电量耗尽"""
+        vehicle_id = job.vehicle_id
+        try:
+            if phase == PHASE_TO_STATION:
+                VehicleDAO.update_vehicle_battery(vehicle_id, 0)
+                VehicleDAO.update_vehicle_status(vehicle_id, "电量耗尽")
+                VehicleDAO.update_vehicle_location_coordinates(
+                    vehicle_id, x, y, f"前往充电站 {job.station_code} (电量耗尽)"
+                )
+                self._release_station(job)
+                print(f"车辆 {vehicle_id} 电量耗尽，无法到达充电站")
+            else:
+                # 状态会在 update_vehicle_location_and_battery 中自动更新为电量不足
+                VehicleDAO.update_vehicle_location_and_battery(
+                    vehicle_id, x, y, job.moving_location_name(phase), 0
+                )
+                print(f"车辆 {vehicle_id} 电量耗尽，停止移动")
+        except Exception as e:
+            print(f"车辆 {vehicle_id} 电量耗尽更新状态时出错: {e}")
+            traceback.print_exc()
+
+    @staticmethod
+    def _release_station(job):
+        """释放车辆在充电站的车位"""
+        success = get_charging_reservations().release(job.vehicle_id, job.city_code, job.station_code)
+        if not success:
+            print(f"释放车辆 {job.vehicle_id} 在充电站 {job.station_code} 的车位失败")
+        return success
+
+
+def record_charging_expense(job, start_battery, end_battery):
+    """记录充电费用
+
+    参数:
+        job: 充电任务
+        start_battery: 充电开始时的电量百分比
+        end_battery: 充电结束时的电量百分比
+    """
+    from app.config.vehicle_params import get_param, get_city_charging_price_factor
+    from app.dao.expense_dao import ExpenseDAO
+    from app.dao.base_dao import BaseDAO
+
+    station_query = "SELECT station_id FROM charging_stations WHERE station_code = %s"
+    station_result = BaseDAO.execute_query(station_query, (job.station_code,))
+    if not station_result:
+        print(f"找不到充电站 {job.station_code} 的ID，无法记录充电费用")
+        return
+    station_id = station_result[0]['station_id']
+
+    charged_percentage = end_battery - start_battery
+    if charged_percentage <= 0:
+        print("充电量为零或负值，不记录费用")
+        return
+
+    charging_price_per_percent = get_param('CHARGING_PRICE_PER_PERCENT')
+    city_charging_price_factor = get_city_charging_price_factor(job.city_code)
+    vehicle_model = job.vehicle_model or '未知'
+
+    # 费用 = 充电百分比 * 每百分比价格 * 电池容量系数 * 城市充电价格系数
+    total_cost = (charged_percentage * charging_price_per_percent * job.capacity_coefficient
+                  * city_charging_price_factor)
+
+    description = (f"车辆 {job.vehicle_id} ({vehicle_model}) 在充电站 {job.station_code} "
+                   f"充电 {charged_percentage:.2f}%，从 {start_battery:.2f}% 到 {end_battery:.2f}%，"
+                   f"电池容量系数: {job.capacity_coefficient:.2f}, 城市充电价格系数: {city_charging_price_factor:.2f}")
+
+    expense_id = ExpenseDAO.add_expense(
+        amount=total_cost,
+        expense_type='充电站支出',
+        vehicle_id=job.vehicle_id,
+        charging_station_id=station_id,
+        date=date.today().strftime('%Y-%m-%d'),
+        description=description
+    )
+    if not expense_id:
+        print("记录充电费用失败")
+
+
+def plan_leg(city_code, start_x, start_y, target):
+    """规划一段行驶阶段的避障路线，返回不含出发点的拐点列表；规划失败时直接驶向目标点"""
+    try:
+        waypoints = get_routing_engine().route(city_code, start_x, start_y, target[0], target[1])['waypoints']
+        return [(float(x), float(y)) for x, y in waypoints[1:]]
+    except Exception as e:
+        print(f"规划路线失败，按直线行驶: {e}")
+        traceback.print_exc()
+        return [(float(target[0]), float(target[1]))]
+
+
+def _coefficient(value):
+    """车型系数，缺失时按1.0处理"""
+    return 1.0 if value is None else float(value)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_fleet_engine():
+    """获取全局车队仿真引擎（首次调用时启动）"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = FleetSimulationEngine()
+                engine.start()
+                _engine = engine
+    return _engine
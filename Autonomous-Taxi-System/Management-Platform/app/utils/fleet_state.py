@@ -0,0 +1,347 @@
+"""
+车队实时状态存储
+进程内保存所有车辆的最新位置、电量和状态，按城市和状态建立索引，
+并按 (运营城市, 状态) 维护空间网格索引，支持最近车辆和半径查询。
+仿真引擎和 VehicleDAO 的写操作同步更新这里，地图刷新和订单分配直接读内存，
+MySQL 作为异步同步的持久层（位置/电量由遥测写缓冲批量落库）。
+
+首次访问时从数据库整体加载，之后定期全量对账一次，用来吸收其他进程（如约车平台）
+直接写库造成的差异；对账期间在内存中发生过变化的车辆以内存为准。
+绕过 VehicleDAO 直接写库的代码应调用 invalidate()，该车下次被读取时会从数据库重新加载。
+
+车辆状态发生变化时依次调用通过 add_status_listener() 注册的回调（例如调度器监听车辆变为空闲），
+回调在锁外执行，参数为 (车辆ID, 运营城市, 旧状态, 新状态)，回调中不应做耗时操作。
+"""
+import threading
+import time
+import traceback
+from collections import defaultdict
+
+from app.dao.base_dao import BaseDAO
+from app.utils.telemetry_buffer import flush_pending_telemetry
+from app.utils.spatial_index import GridIndex
+
+# 全量对账间隔（秒）
+RESYNC_INTERVAL = 60
+
+FLEET_STATE_COLUMNS = (
+    'vehicle_id', 'plate_number', 'model', 'current_status', 'battery_level',
+    'mileage', 'current_location_x', 'current_location_y', 'current_location_name',
+    'current_city', 'operating_city', 'is_available', 'last_maintenance_date'
+)
+
+_SELECT_FLEET_STATE = f"SELECT {', '.join(FLEET_STATE_COLUMNS)} FROM vehicles"
+
+
+class FleetStateStore:
+    """车队实时状态存储，按车辆ID保存，按运营城市和状态建立索引"""
+
+    def __init__(self, resync_interval=RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._vehicles = {}                   # 车辆ID -> 状态字典
+        self._versions = defaultdict(int)     # 车辆ID -> 内存修改次数，对账时用于判断是否被覆盖
+        self._by_city = defaultdict(set)      # 运营城市 -> 车辆ID集合
+        self._by_status = defaultdict(set)    # 状态 -> 车辆ID集合
+        self._grid = GridIndex()              # 空间索引，分区键为 (运营城市, 状态)
+        self._stale = set()                   # 需要从数据库重新加载的车辆
+        self._listeners = []                  # 状态变化回调
+        self._loaded = False
+        self._last_sync = 0.0
+
+        # 运行指标
+        self.reads = 0
+        self.read_through_loads = 0
+        self.sync_count = 0
+        self.last_sync_duration = 0.0
+
+    # ------------------------------------------------------------------
+    # 读接口
+    # ------------------------------------------------------------------
+    def get(self, vehicle_id):
+        """获取单辆车的状态副本，不存在时返回None"""
+        self._ensure_synced()
+        self.reads += 1
+        if vehicle_id in self._stale or vehicle_id not in self._vehicles:
+            self._reload_vehicle(vehicle_id)
+        with self._lock:
+            state = self._vehicles.get(vehicle_id)
+            return dict(state) if state else None
+
+    def get_city_vehicles(self, city):
+        """获取指定运营城市的车辆状态副本，city 为 'all' 时返回全部车辆"""
+        self._ensure_synced()
+        self._reload_stale()
+        self.reads += 1
+        with self._lock:
+            vehicle_ids = list(self._vehicles) if city == 'all' else list(self._by_city.get(city, ()))
+        return self._copies(vehicle_ids)
+
+    def find(self, city=None, status=None):
+        """按运营城市和/或状态查找车辆状态副本"""
+        self._ensure_synced()
+        self._reload_stale()
+        self.reads += 1
+        with self._lock:
+            if city is not None and status is not None:
+                vehicle_ids = self._by_city.get(city, set()) & self._by_status.get(status, set())
+            elif city is not None:
+                vehicle_ids = set(self._by_city.get(city, ()))
+            elif status is not None:
+                vehicle_ids = set(self._by_status.get(status, ()))
+            else:
+                vehicle_ids = set(self._vehicles)
+        return self._copies(vehicle_ids)
+
+    def nearest(self, city, x, y, k=1, status=None, min_battery=None, max_distance=None):
+        """查找距离 (x, y) 最近的 k 辆车
+
+        Args:
+            city: 运营城市
+            status: 车辆状态，None 表示不限
+            min_battery: 最低电量，None 表示不限
+            max_distance: 最大距离，None 表示不限
+
+        Returns:
+            list: 按距离升序排列的车辆状态副本，附带 distance 字段；
+                  距离相同的车辆全部返回，由调用方决定次级排序
+        """
+        self._ensure_synced()
+        self._reload_stale()
+        self.reads += 1
+        with self._lock:
+            results = self._grid.nearest(
+                self._grid_keys(city, status), float(x), float(y), k=k,
+                max_distance=max_distance, predicate=self._battery_predicate(min_battery)
+            )
+            return self._with_distance(results)
+
+    def within_radius(self, city, x, y, radius, status=None, min_battery=None):
+        """查找距离 (x, y) 不超过 radius 的车辆，按距离升序返回"""
+        self._ensure_synced()
+        self._reload_stale()
+        self.reads += 1
+        with self._lock:
+            results = self._grid.within(
+                self._grid_keys(city, status), float(x), float(y), radius,
+                predicate=self._battery_predicate(min_battery)
+            )
+            return self._with_distance(results)
+
+    # ------------------------------------------------------------------
+    # 写接口
+    # ------------------------------------------------------------------
+    def add_status_listener(self, callback):
+        """注册车辆状态变化回调 callback(车辆ID, 运营城市, 旧状态, 新状态)"""
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def apply(self, vehicle_id, **fields):
+        """把已写入（或即将异步写入）数据库的字段同步到内存"""
+        if not self._loaded:
+            return
+        transition = None
+        with self._lock:
+            state = self._vehicles.get(vehicle_id)
+            if state is None:
+                self._stale.add(vehicle_id)
+                return
+            old_city = state.get('operating_city')
+            old_status = state.get('current_status')
+            state.update(fields)
+            self._versions[vehicle_id] += 1
+            if state.get('operating_city') != old_city or state.get('current_status') != old_status:
+                self._unindex(vehicle_id, old_city, old_status)
+                self._index(vehicle_id, state)
+                if state.get('current_status') != old_status:
+                    transition = (vehicle_id, state.get('operating_city'), old_status, state.get('current_status'))
+            elif 'current_location_x' in fields or 'current_location_y' in fields:
+                self._grid.upsert(vehicle_id, (old_city, old_status),
+                                  state.get('current_location_x'), state.get('current_location_y'))
+        if transition:
+            self._notify([transition])
+
+    def invalidate(self, vehicle_id):
+        """标记车辆需要从数据库重新加载"""
+        if not self._loaded:
+            return
+        with self._lock:
+            self._stale.add(vehicle_id)
+            self._versions[vehicle_id] += 1
+
+    def remove(self, vehicle_id):
+        """从内存中删除车辆"""
+        with self._lock:
+            state = self._vehicles.pop(vehicle_id, None)
+            if state is not None:
+                self._unindex(vehicle_id, state.get('operating_city'), state.get('current_status'))
+            self._stale.discard(vehicle_id)
+            self._versions[vehicle_id] += 1
+
+    def resync(self):
+        """从数据库全量对账，对账期间内存中发生变化的车辆保留内存值"""
+        with self._sync_lock:
+            started = time.monotonic()
+            with self._lock:
+                versions = dict(self._versions)
+            rows = BaseDAO.execute_query(_SELECT_FLEET_STATE)
+            pending = _pending_telemetry_checker()
+            transitions = []
+            with self._lock:
+                notify = self._loaded
+                seen = set()
+                for row in rows:
+                    vehicle_id = row['vehicle_id']
+                    seen.add(vehicle_id)
+                    if self._loaded and (self._versions.get(vehicle_id, 0) != versions.get(vehicle_id, 0)
+                                         or pending(vehicle_id)):
+                        continue
+                    transition = self._store(vehicle_id, row)
+                    if transition and notify:
+                        transitions.append(transition)
+                for vehicle_id in list(self._vehicles):
+                    if vehicle_id not in seen and self._versions.get(vehicle_id, 0) == versions.get(vehicle_id, 0):
+                        self.remove(vehicle_id)
+                self._loaded = True
+                self._last_sync = time.time()
+            self.sync_count += 1
+            self.last_sync_duration = time.monotonic() - started
+        self._notify(transitions)
+
+    def get_metrics(self):
+        """存储运行指标"""
+        with self._lock:
+            return {
+                'vehicles': len(self._vehicles),
+                'cities': {city: len(ids) for city, ids in self._by_city.items()},
+                'statuses': {status: len(ids) for status, ids in self._by_status.items()},
+                'stale_vehicles': len(self._stale),
+                'indexed_vehicles': len(self._grid),
+                'reads': self.reads,
+                'read_through_loads': self.read_through_loads,
+                'sync_count': self.sync_count,
+                'last_sync_ms': round(self.last_sync_duration * 1000, 3),
+                'seconds_since_sync': round(time.time() - self._last_sync, 1) if self._loaded else None
+            }
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+    def _ensure_synced(self):
+        if not self._loaded:
+            self.resync()
+        elif time.time() - self._last_sync > self.resync_interval and not self._sync_lock.locked():
+            try:
+                self.resync()
+            except Exception as e:
+                # 对账失败不影响读取，继续使用内存数据
+                print(f"车队状态对账失败: {e}")
+                traceback.print_exc()
+
+    def _reload_stale(self):
+        """重新加载被标记失效的车辆（含新增车辆），保证索引查询结果完整"""
+        with self._lock:
+            stale = list(self._stale)
+        for vehicle_id in stale:
+            self._reload_vehicle(vehicle_id)
+
+    def _copies(self, vehicle_ids):
+        with self._lock:
+            return [dict(self._vehicles[vehicle_id]) for vehicle_id in vehicle_ids if vehicle_id in self._vehicles]
+
+    def _reload_vehicle(self, vehicle_id):
+        # 先写出缓冲中的位置，避免读到比内存更旧的坐标
+        flush_pending_telemetry(vehicle_id)
+        rows = BaseDAO.execute_query(_SELECT_FLEET_STATE + " WHERE vehicle_id = %s", (vehicle_id,))
+        self.read_through_loads += 1
+        transition = None
+        with self._lock:
+            self._stale.discard(vehicle_id)
+            if rows:
+                transition = self._store(vehicle_id, rows[0])
+            else:
+                self.remove(vehicle_id)
+        if transition:
+            self._notify([transition])
+
+    def _store(self, vehicle_id, row):
+        """写入整行状态，状态发生变化时返回 (车辆ID, 运营城市, 旧状态, 新状态)"""
+        old = self._vehicles.get(vehicle_id)
+        if old is not None:
+            self._unindex(vehicle_id, old.get('operating_city'), old.get('current_status'))
+        state = dict(row)
+        self._vehicles[vehicle_id] = state
+        self._index(vehicle_id, state)
+        self._stale.discard(vehicle_id)
+        old_status = old.get('current_status') if old is not None else None
+        if old_status != state.get('current_status'):
+            return vehicle_id, state.get('operating_city'), old_status, state.get('current_status')
+        return None
+
+    def _notify(self, transitions):
+        """在锁外依次调用状态变化回调，单个回调出错不影响其他回调"""
+        if not transitions or not self._listeners:
+            return
+        for callback in list(self._listeners):
+            for transition in transitions:
+                try:
+                    callback(*transition)
+                except Exception as e:
+                    print(f"车辆状态变化回调出错: {e}")
+                    traceback.print_exc()
+
+    def _index(self, vehicle_id, state):
+        city, status = state.get('operating_city'), state.get('current_status')
+        self._by_city[city].add(vehicle_id)
+        self._by_status[status].add(vehicle_id)
+        self._grid.upsert(vehicle_id, (city, status),
+                          state.get('current_location_x'), state.get('current_location_y'))
+
+    def _unindex(self, vehicle_id, city, status):
+        self._by_city.get(city, set()).discard(vehicle_id)
+        self._by_status.get(status, set()).discard(vehicle_id)
+        self._grid.remove(vehicle_id)
+
+    def _grid_keys(self, city, status):
+        if status is not None:
+            return [(city, status)]
+        return [key for key in self._grid.keys() if key[0] == city]
+
+    def _battery_predicate(self, min_battery):
+        if min_battery is None:
+            return None
+        vehicles = self._vehicles
+        return lambda vehicle_id: (vehicles[vehicle_id].get('battery_level') or 0) >= min_battery
+
+    def _with_distance(self, results):
+        vehicles = []
+        for distance, vehicle_id in results:
+            vehicle = dict(self._vehicles[vehicle_id])
+            vehicle['distance'] = distance
+            vehicles.append(vehicle)
+        return vehicles
+
+
+def _pending_telemetry_checker():
+    """返回判断车辆是否有未落库遥测记录的函数"""
+    from app.utils import telemetry_buffer
+    buffer = telemetry_buffer._buffer
+    if buffer is None:
+        return lambda vehicle_id: False
+    return buffer.has_pending
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_fleet_state():
+    """获取全局车队状态存储"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FleetStateStore()
+    return _store
@@ -0,0 +1,273 @@
+"""
+车队位置推送通道
+地图页面不再定时下载整个城市的车辆列表，而是通过 Socket.IO 加入城市房间（fleet:<城市>），
+由后台线程按固定帧率从车队实时状态存储读取有观看者的城市，只把与上一帧相比发生变化的车辆推送给房间。
+
+每个城市每帧只读取、比较、编码一次，再整体广播给房间内的所有观看者，
+服务端开销随被观看城市的车队规模增长，不随观看人数增长；带宽随观看人数 × 变化车辆数增长。
+
+帧格式（事件 fleet_frame）：
+    {'city': 城市, 'seq': 帧序号, 'keyframe': 是否关键帧,
+     'statuses': 状态表（关键帧或状态表有新增时才带）,
+     'updates': 二进制，每辆车 10 字节 '<IHHBB'：车辆ID、x*10、y*10、状态序号、电量，坐标缺失为 0xFFFF,
+     'removed': 二进制，离开该城市的车辆ID数组 '<I'}
+关键帧包含城市全部车辆，每 KEYFRAME_INTERVAL 秒广播一次，新加入或发现帧序号不连续的客户端单独补发。
+"""
+import atexit
+import struct
+import threading
+import time
+import traceback
+
+from flask import request
+from flask_socketio import join_room, leave_room
+
+from app.utils.fleet_state import get_fleet_state
+
+# 帧间隔（秒），即最高推送帧率的倒数
+FRAME_INTERVAL = 0.5
+# 关键帧间隔（秒）
+KEYFRAME_INTERVAL = 10.0
+# 坐标量化倍数（0.1 个坐标单位以内的移动不推送）
+COORDINATE_SCALE = 10
+MISSING_COORDINATE = 0xFFFF
+
+_RECORD = struct.Struct('<IHHBB')
+_REMOVED = struct.Struct('<I')
+
+
+def _room(city):
+    return f'fleet:{city}'
+
+
+def _quantize(value):
+    try:
+        return min(max(int(round(float(value) * COORDINATE_SCALE)), 0), MISSING_COORDINATE - 1)
+    except (TypeError, ValueError):
+        return MISSING_COORDINATE
+
+
+def _battery(value):
+    try:
+        return min(max(int(round(float(value))), 0), 255)
+    except (TypeError, ValueError):
+        return 0
+
+
+class _CityState:
+    """某个城市最近一帧的编码状态"""
+
+    def __init__(self):
+        self.seq = 0
+        self.records = {}          # 车辆ID -> (x, y, 状态序号, 电量)
+        self.last_keyframe = 0.0
+
+
+class FleetStream(threading.Thread):
+    """按城市房间推送车辆位置变化的后台线程"""
+
+    def __init__(self, socketio, frame_interval=FRAME_INTERVAL, keyframe_interval=KEYFRAME_INTERVAL):
+        super().__init__(name='fleet-stream', daemon=True)
+        self.socketio = socketio
+        self.frame_interval = frame_interval
+        self.keyframe_interval = keyframe_interval
+        self._lock = threading.Lock()         # 保护观看者、城市状态和状态表
+        self._viewers = {}                    # 城市 -> 客户端sid集合
+        self._subscriptions = {}              # 客户端sid -> 城市
+        self._cities = {}                     # 城市 -> _CityState
+        self._statuses = []                   # 状态序号 -> 状态
+        self._status_index = {}               # 状态 -> 状态序号
+        self._shutdown = threading.Event()
+
+        self.frames_sent = 0
+        self.keyframes_sent = 0
+        self.bytes_sent = 0
+        self.vehicles_sent = 0
+        self.last_frame_duration = 0.0
+
+    # ---- 订阅管理 ----
+
+    def subscribe(self, sid, city):
+        """客户端加入城市房间，并立即单独发送一个关键帧"""
+        self.unsubscribe(sid)
+        with self._lock:
+            self._viewers.setdefault(city, set()).add(sid)
+            self._subscriptions[sid] = city
+        join_room(_room(city), sid=sid)
+        self.send_keyframe(sid, city)
+
+    def unsubscribe(self, sid):
+        """客户端离开当前城市房间，城市没有观看者时丢弃其编码状态"""
+        with self._lock:
+            city = self._subscriptions.pop(sid, None)
+            if city is None:
+                return
+            viewers = self._viewers.get(city)
+            if viewers is not None:
+                viewers.discard(sid)
+                if not viewers:
+                    del self._viewers[city]
+                    self._cities.pop(city, None)
+        leave_room(_room(city), sid=sid)
+
+    def send_keyframe(self, sid, city=None):
+        """给单个客户端补发关键帧（与房间当前帧序号一致，之后的增量帧可以直接应用）"""
+        city = city or self._subscriptions.get(sid)
+        if city is None:
+            return
+        with self._lock:
+            state = self._cities.get(city)
+        if state is None:
+            # 城市的第一个观看者：生成首帧并广播给房间（此时房间内只有该客户端）
+            self._frame(city, force_keyframe=True)
+            return
+        with self._lock:
+            payload = self._payload(city, state.seq, True, state.records, (), include_statuses=True)
+        self._emit(payload, to=sid)
+
+    # ---- 帧生成 ----
+
+    def run(self):
+        while not self._shutdown.wait(self.frame_interval):
+            with self._lock:
+                cities = list(self._viewers)
+            started = time.monotonic()
+            for city in cities:
+                try:
+                    self._frame(city)
+                except Exception as e:
+                    print(f"推送城市 {city} 的车队帧出错: {e}")
+                    traceback.print_exc()
+            if cities:
+                self.last_frame_duration = time.monotonic() - started
+
+    def _frame(self, city, force_keyframe=False):
+        """读取城市车辆、与上一帧比较，把变化的车辆广播给城市房间"""
+        vehicles = get_fleet_state().get_city_vehicles(city)
+        now = time.time()
+        with self._lock:
+            if city not in self._viewers:
+                return
+            statuses_before = len(self._statuses)
+            current = {}
+            for vehicle in vehicles:
+                current[vehicle['vehicle_id']] = (
+                    _quantize(vehicle.get('current_location_x')),
+                    _quantize(vehicle.get('current_location_y')),
+                    self._status_code(vehicle.get('current_status')),
+                    _battery(vehicle.get('battery_level'))
+                )
+            state = self._cities.get(city)
+            if state is None:
+                state = self._cities[city] = _CityState()
+                force_keyframe = True
+            keyframe = force_keyframe or now - state.last_keyframe >= self.keyframe_interval
+            if keyframe:
+                updates = current
+                removed = ()
+                state.last_keyframe = now
+            else:
+                previous = state.records
+                updates = {vehicle_id: record for vehicle_id, record in current.items()
+                           if previous.get(vehicle_id) != record}
+                removed = [vehicle_id for vehicle_id in previous if vehicle_id not in current]
+                if not updates and not removed:
+                    return
+            state.seq += 1
+            state.records = current
+            payload = self._payload(city, state.seq, keyframe, updates, removed,
+                                    include_statuses=keyframe or len(self._statuses) != statuses_before)
+        self._emit(payload)
+
+    def _payload(self, city, seq, keyframe, updates, removed, include_statuses=False):
+        payload = {
+            'city': city,
+            'seq': seq,
+            'keyframe': keyframe,
+            'updates': b''.join(_RECORD.pack(vehicle_id, *record) for vehicle_id, record in updates.items()),
+            'removed': b''.join(_REMOVED.pack(vehicle_id) for vehicle_id in removed)
+        }
+        if include_statuses:
+            payload['statuses'] = list(self._statuses)
+        return payload
+
+    def _status_code(self, status):
+        status = status or ''
+        code = self._status_index.get(status)
+        if code is None:
+            code = self._status_index[status] = len(self._statuses)
+            self._statuses.append(status)
+        return code
+
+    def _emit(self, payload, to=None):
+        room = to or _room(payload['city'])
+        self.socketio.emit('fleet_frame', payload, to=room)
+        size = len(payload['updates']) + len(payload['removed'])
+        self.frames_sent += 1
+        self.keyframes_sent += 1 if payload['keyframe'] else 0
+        self.vehicles_sent += len(payload['updates']) // _RECORD.size
+        self.bytes_sent += size
+
+    def get_metrics(self):
+        """推送通道运行指标"""
+        with self._lock:
+            viewers = {city: len(sids) for city, sids in self._viewers.items()}
+            fleet_sizes = {city: len(state.records) for city, state in self._cities.items()}
+        return {
+            'viewers': viewers,
+            'streamed_vehicles': fleet_sizes,
+            'frames_sent': self.frames_sent,
+            'keyframes_sent': self.keyframes_sent,
+            'vehicles_sent': self.vehicles_sent,
+            'payload_bytes_sent': self.bytes_sent,
+            'last_frame_ms': round(self.last_frame_duration * 1000, 3),
+            'frame_interval': self.frame_interval,
+            'keyframe_interval': self.keyframe_interval
+        }
+
+    def shutdown(self):
+        """停止后台线程"""
+        self._shutdown.set()
+
+
+_stream = None
+_stream_lock = threading.Lock()
+
+
+def get_fleet_stream():
+    """获取全局车队推送通道（首次调用时启动后台推送线程）"""
+    global _stream
+    if _stream is None:
+        with _stream_lock:
+            if _stream is None:
+                # 在函数内部动态导入socketio，避免循环导入
+                from app import socketio
+
+                _stream = FleetStream(socketio)
+                _stream.start()
+                atexit.register(_stream.shutdown)
+    return _stream
+
+
+def register_fleet_stream_handlers(socketio):
+    """注册地图页面使用的 Socket.IO 事件"""
+
+    def on_subscribe(data):
+        city = (data or {}).get('city')
+        if city:
+            get_fleet_stream().subscribe(request.sid, city)
+
+    def on_unsubscribe(data=None):
+        get_fleet_stream().unsubscribe(request.sid)
+
+    def on_resync(data=None):
+        get_fleet_stream().send_keyframe(request.sid)
+
+    def on_disconnect(*args):
+        if _stream is not None:
+            _stream.unsubscribe(request.sid)
+
+    socketio.on_event('fleet_subscribe', on_subscribe)
+    socketio.on_event('fleet_unsubscribe', on_unsubscribe)
+    socketio.on_event('fleet_resync', on_resync)
+    socketio.on_event('disconnect', on_disconnect)
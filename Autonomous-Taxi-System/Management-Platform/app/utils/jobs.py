@@ -0,0 +1,508 @@
+"""
+后台任务队列
+批量生成订单、报表导出、自动分配进度跟踪等耗时的管理操作提交为后台任务，由固定数量的工作线程执行，
+请求线程只负责提交并返回任务ID，前端通过 /jobs 接口查询进度、取消任务和下载结果文件。
+
+任务记录以 JSON 文件保存在 JOB_DIR 中（默认在系统临时目录下，可用 JOB_DIR 环境变量指定），
+进程重启后仍可查询；重启前尚未结束的任务标记为 interrupted。结束的任务（含结果文件）
+保留 JOB_RESULT_TTL 秒后清理。
+
+任务函数的第一个参数是 JobContext，用于上报进度、检查取消请求和保存结果文件；
+函数返回值（需可 JSON 序列化）作为任务结果。任务在 Flask 应用上下文中执行。
+只需记录进度、不需要执行代码的任务（如自动分配进度跟踪）用 track() 登记，不占用工作线程，
+由调用方在查询时计算进度并通过 update_progress()/complete() 更新。
+文件导出视图加上 async_export 装饰器后，请求带 async=1 参数时改为提交后台任务。
+"""
+import functools
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+from flask import current_app, jsonify, request
+from werkzeug.http import parse_options_header
+
+# 工作线程数
+JOB_WORKERS = 4
+# 排队任务上限，超过时拒绝提交
+MAX_QUEUED_JOBS = 100
+# 结束任务的保留时间（秒）
+JOB_RESULT_TTL = 6 * 3600
+# 进度写盘的最小间隔（秒）
+PROGRESS_SAVE_INTERVAL = 1.0
+# 任务记录目录
+JOB_DIR = os.environ.get('JOB_DIR') or os.path.join(tempfile.gettempdir(), 'autonomous_taxi_jobs')
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+JOB_INTERRUPTED = 'interrupted'
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED, JOB_INTERRUPTED)
+
+
+class JobCancelled(Exception):
+    """任务被取消"""
+    pass
+
+
+class JobQueueFull(Exception):
+    """排队任务已达上限"""
+    pass
+
+
+class JobContext:
+    """传给任务函数的上下文"""
+
+    def __init__(self, manager, job_id):
+        self._manager = manager
+        self.job_id = job_id
+
+    @property
+    def cancelled(self):
+        """是否收到取消请求"""
+        return self._manager._is_cancel_requested(self.job_id)
+
+    def check_cancelled(self):
+        """收到取消请求时抛出 JobCancelled"""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, current, total=None, message=None, **details):
+        """上报进度，details 中的附加字段保存在 progress['details']"""
+        self._manager._update_progress(self.job_id, current, total, message, details)
+
+    def save_file(self, data, filename, mimetype='application/octet-stream'):
+        """保存结果文件，供 /jobs/<id>/download 下载"""
+        self._manager._save_file(self.job_id, data, filename, mimetype)
+
+
+class JobManager:
+    """后台任务管理器"""
+
+    def __init__(self, workers=JOB_WORKERS, job_dir=JOB_DIR, result_ttl=JOB_RESULT_TTL,
+                 max_queued=MAX_QUEUED_JOBS):
+        self.workers = workers
+        self.job_dir = job_dir
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # 保证任务记录按状态变化的顺序写盘
+        self._jobs = {}                 # 任务ID -> 任务记录
+        self._functions = {}            # 任务ID -> (函数, 位置参数, 关键字参数)，仅排队中的任务
+        self._cancel_requested = set()
+        self._saved_at = {}             # 任务ID -> 上次写盘时间
+        self._threads = []
+        self._app = None
+
+        # 运行指标
+        self.submitted = 0
+        self.rejected = 0
+        self.purged = 0
+
+        os.makedirs(self.job_dir, exist_ok=True)
+        self._load()
+
+    def init_app(self, app):
+        """绑定 Flask 应用，任务在该应用的上下文中执行"""
+        self._app = app
+
+    def submit(self, job_type, func, *args, description=None, **kwargs):
+        """提交任务
+
+        Returns:
+            dict: 任务记录副本
+
+        Raises:
+            JobQueueFull: 排队任务已达上限
+        """
+        self._ensure_workers()
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'type': job_type,
+            'description': description or job_type,
+            'status': JOB_QUEUED,
+            'progress': {'current': 0, 'total': None, 'percent': 0, 'message': '排队中'},
+            'result': None,
+            'error': None,
+            'file': None,
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'expires_at': None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._functions[job_id] = (func, args, kwargs)
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+                self._functions.pop(job_id, None)
+            self.rejected += 1
+            raise JobQueueFull("后台任务排队数量已达上限，请稍后再试")
+        self.submitted += 1
+        self._save(job)
+        return self._public(job)
+
+    def track(self, job_type, description=None, timeout=None, **state):
+        """登记一个不占用工作线程的跟踪任务，state 中的字段（需可 JSON 序列化）保存在 job['state']
+
+        Args:
+            timeout: 跟踪时长上限（秒），到期后即使没有结束也会在保留时间过后清理
+
+        Returns:
+            dict: 任务记录副本
+        """
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'type': job_type,
+            'description': description or job_type,
+            'status': JOB_RUNNING,
+            'tracked': True,
+            'state': state,
+            'progress': {'current': 0, 'total': None, 'percent': 0, 'message': '执行中'},
+            'result': None,
+            'error': None,
+            'file': None,
+            'created_at': now,
+            'started_at': now,
+            'finished_at': None,
+            'expires_at': now + timeout + self.result_ttl if timeout else None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        self.submitted += 1
+        self._save(job)
+        return self._public(job)
+
+    def update_progress(self, job_id, current, total=None, message=None, **details):
+        """更新跟踪任务的进度"""
+        self._update_progress(job_id, current, total, message, details)
+
+    def complete(self, job_id, result=None, message='已完成'):
+        """把跟踪任务置为完成
+
+        Returns:
+            bool: 任务是否存在且此前尚未结束
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] in FINISHED_STATUSES:
+                return False
+            job['result'] = result
+            self._finish(job, JOB_SUCCEEDED, message=message)
+        self._save(job)
+        return True
+
+    def get(self, job_id):
+        """任务记录副本，不存在或已过期时返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def list(self, job_type=None, status=None, limit=100):
+        """按创建时间倒序列出任务"""
+        self.purge_expired()
+        with self._lock:
+            jobs = [job for job in self._jobs.values()
+                    if (job_type is None or job['type'] == job_type)
+                    and (status is None or job['status'] == status)]
+        jobs.sort(key=lambda job: job['created_at'], reverse=True)
+        return [self._public(job) for job in jobs[:limit]]
+
+    def cancel(self, job_id):
+        """请求取消任务：排队中的任务和跟踪任务直接取消，运行中的任务在下一次检查时停止
+
+        Returns:
+            bool: 任务是否存在且尚未结束
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] in FINISHED_STATUSES:
+                return False
+            self._cancel_requested.add(job_id)
+            if job['status'] == JOB_QUEUED or job.get('tracked'):
+                self._finish(job, JOB_CANCELLED, message='任务已取消')
+        self._save(job)
+        return True
+
+    def file_info(self, job_id):
+        """结果文件 (路径, 文件名, MIME类型)，没有文件时返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.get('file'):
+                return None
+            info = job['file']
+        path = os.path.join(self.job_dir, info['stored_name'])
+        if not os.path.exists(path):
+            return None
+        return path, info['filename'], info['mimetype']
+
+    def purge_expired(self):
+        """清理超过保留时间的任务记录和结果文件"""
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job['expires_at'] and job['expires_at'] <= now]
+            for job in expired:
+                self._jobs.pop(job['job_id'], None)
+                self._saved_at.pop(job['job_id'], None)
+        for job in expired:
+            self._remove_files(job)
+        self.purged += len(expired)
+        return len(expired)
+
+    def get_metrics(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+        return {
+            'workers': self.workers,
+            'alive_workers': sum(1 for thread in self._threads if thread.is_alive()),
+            'queued': self._queue.qsize(),
+            'status_counts': counts,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'purged': self.purged,
+            'result_ttl': self.result_ttl,
+            'job_dir': self.job_dir
+        }
+
+    # ------------------------------------------------------------------
+    # 工作线程
+    # ------------------------------------------------------------------
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f'job-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker_loop(self):
+        while True:
+            try:
+                job_id = self._queue.get(timeout=60)
+            except queue.Empty:
+                self.purge_expired()
+                continue
+            try:
+                self._run(job_id)
+            except Exception as e:
+                print(f"执行后台任务 {job_id} 出错: {e}")
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            entry = self._functions.pop(job_id, None)
+            if job is None or entry is None or job['status'] != JOB_QUEUED:
+                return
+            job['status'] = JOB_RUNNING
+            job['started_at'] = time.time()
+            job['progress']['message'] = '执行中'
+        self._save(job)
+
+        func, args, kwargs = entry
+        context = JobContext(self, job_id)
+        try:
+            if self._app is not None:
+                with self._app.app_context():
+                    result = func(context, *args, **kwargs)
+            else:
+                result = func(context, *args, **kwargs)
+            if self._is_cancel_requested(job_id):
+                raise JobCancelled()
+            with self._lock:
+                job['result'] = result
+                self._finish(job, JOB_SUCCEEDED, message='已完成')
+        except JobCancelled:
+            with self._lock:
+                self._finish(job, JOB_CANCELLED, message='任务已取消')
+        except Exception as e:
+            print(f"后台任务 {job['type']} ({job_id}) 失败: {e}")
+            traceback.print_exc()
+            with self._lock:
+                job['error'] = str(e)
+                self._finish(job, JOB_FAILED, message=f'任务失败: {str(e)}')
+        self._save(job)
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+    def _finish(self, job, status, message=None):
+        """把任务置为结束状态（调用方持有 _lock）"""
+        now = time.time()
+        job['status'] = status
+        job['finished_at'] = now
+        job['expires_at'] = now + self.result_ttl
+        if message:
+            job['progress']['message'] = message
+        if status == JOB_SUCCEEDED:
+            job['progress']['percent'] = 100
+        self._cancel_requested.discard(job['job_id'])
+        self._functions.pop(job['job_id'], None)
+
+    def _is_cancel_requested(self, job_id):
+        return job_id in self._cancel_requested
+
+    def _update_progress(self, job_id, current, total, message, details=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            progress = job['progress']
+            progress['current'] = current
+            if total is not None:
+                progress['total'] = total
+            if message is not None:
+                progress['message'] = message
+            if details:
+                progress['details'] = details
+            if progress['total']:
+                progress['percent'] = min(100, round(current * 100.0 / progress['total'], 1))
+            now = time.time()
+            due = now - self._saved_at.get(job_id, 0) >= PROGRESS_SAVE_INTERVAL
+        if due:
+            self._save(job)
+
+    def _save_file(self, job_id, data, filename, mimetype):
+        stored_name = f"{job_id}.result"
+        path = os.path.join(self.job_dir, stored_name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job['file'] = {'stored_name': stored_name, 'filename': filename,
+                               'mimetype': mimetype, 'size': len(data)}
+
+    def _save(self, job):
+        """把任务记录写入 JOB_DIR（先写临时文件再替换）
+
+        序列化和写文件都在 _save_lock 内完成，避免其他线程较早序列化的旧状态覆盖新状态。
+        """
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps(job, ensure_ascii=False, default=str)
+                self._saved_at[job['job_id']] = time.time()
+            path = os.path.join(self.job_dir, f"{job['job_id']}.json")
+            try:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"保存任务记录 {job['job_id']} 失败: {e}")
+
+    def _load(self):
+        """加载上次运行留下的任务记录，未结束的任务标记为 interrupted"""
+        now = time.time()
+        for name in os.listdir(self.job_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.job_dir, name), encoding='utf-8') as f:
+                    job = json.load(f)
+            except Exception as e:
+                print(f"读取任务记录 {name} 失败: {e}")
+                continue
+            if job.get('expires_at') and job['expires_at'] <= now:
+                self._remove_files(job)
+                continue
+            if job.get('status') not in FINISHED_STATUSES:
+                self._finish(job, JOB_INTERRUPTED, message='服务重启，任务已中断')
+                self._jobs[job['job_id']] = job
+                self._save(job)
+            else:
+                self._jobs[job['job_id']] = job
+
+    def _remove_files(self, job):
+        names = [f"{job['job_id']}.json"]
+        if job.get('file'):
+            names.append(job['file']['stored_name'])
+        for name in names:
+            try:
+                os.remove(os.path.join(self.job_dir, name))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"删除任务文件 {name} 失败: {e}")
+
+    @staticmethod
+    def _public(job):
+        """对外返回的任务记录（不含内部文件名）"""
+        data = dict(job)
+        data['progress'] = dict(job['progress'])
+        if job.get('state') is not None:
+            data['state'] = dict(job['state'])
+        if job.get('file'):
+            data['file'] = {'filename': job['file']['filename'], 'size': job['file']['size']}
+        return data
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """获取全局后台任务管理器"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager()
+    return _manager
+
+
+def run_export_view(job, view, path, query_string, view_args):
+    """后台任务：在模拟请求上下文中执行导出视图，把响应内容保存为结果文件"""
+    job.progress(0, None, "正在生成文件...")
+    with current_app.test_request_context(path, query_string=query_string):
+        response = current_app.make_response(view(**view_args))
+    if response.status_code != 200 or 'attachment' not in response.headers.get('Content-Disposition', ''):
+        raise RuntimeError(f"导出失败（HTTP {response.status_code}）")
+    response.direct_passthrough = False
+    data = response.get_data()
+    _, options = parse_options_header(response.headers['Content-Disposition'])
+    filename = options.get('filename') or f"{job.job_id}.dat"
+    job.save_file(data, filename, response.mimetype)
+    return {"message": f"已生成 {filename}", "filename": filename, "size": len(data)}
+
+
+def async_export(job_type, description=None):
+    """导出视图装饰器：请求带 async=1 参数时提交后台任务并返回任务ID，否则直接导出"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            if request.args.get('async') != '1':
+                return view(**view_args)
+            query_string = request.args.to_dict(flat=False)
+            query_string.pop('async', None)
+            try:
+                job = get_job_manager().submit(
+                    job_type, run_export_view, view, request.path, query_string, view_args,
+                    description=description or job_type
+                )
+            except JobQueueFull as e:
+                return jsonify({"status": "error", "message": str(e)}), 503
+            return jsonify({"status": "success", "message": "导出任务已提交", "data": {"job_id": job['job_id']}})
+        return wrapper
+    return decorator
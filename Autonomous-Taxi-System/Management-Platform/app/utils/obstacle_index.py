@@ -0,0 +1,478 @@
+"""
+障碍物占用栅格索引
+每个城市的激活障碍物只解析一次：多边形/线段的点集字符串解析为坐标数组并计算外包矩形，
+再栅格化到 1000×1000 的系统坐标栅格（每格 1×1 坐标单位）：
+
+- inside：整格都在某个多边形内部的格子，点/线段落在这里可以直接判定碰撞；
+- 候选表：多边形边界和线段障碍物经过的格子（向外扩一圈，保证浮点误差下不漏判），
+  每格记录经过它的障碍物编号，落在这些格子里时只对少数候选障碍物做精确几何判断；
+- 其余格子一定不与任何障碍物相交。
+
+点查询只看一个格子，为 O(1)；线段查询沿线段采样经过的格子，只对候选障碍物做精确判断。
+精确判断与 MapObstacleDAO 原有的射线法/线段相交算法一致，结果不变。
+超出栅格范围的障碍物不参与栅格化，查询时总是精确判断。
+
+障碍物新增、修改、删除、启停后调用 invalidate()，下次查询时按城市重新编译；
+另按 TTL 定期重建，吸收直接改库造成的差异。
+"""
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from app.dao.base_dao import BaseDAO
+
+# 栅格边长（坐标范围 0-999，每格 1 个坐标单位）
+GRID_SIZE = 1000
+# 边界采样步长（格），配合外扩一圈保证边界格子不遗漏
+EDGE_SAMPLE_STEP = 0.25
+# 线段查询采样步长（格）
+SEGMENT_SAMPLE_STEP = 0.5
+# 采样点不超过该数量的线段逐格查表
+SHORT_SEGMENT_SAMPLES = 24
+# 编译结果的最长有效期（秒）
+OBSTACLE_INDEX_TTL = 300
+
+# 障碍物表使用城市拼音代码，车辆和订单使用城市中文名，两种写法都可以查询
+CITY_NAMES = {
+    'shanghai': '上海市',
+    'beijing': '北京市',
+    'guangzhou': '广州市',
+    'shenzhen': '深圳市',
+    'hangzhou': '杭州市',
+    'nanjing': '南京市',
+    'chengdu': '成都市',
+    'chongqing': '重庆市',
+    'wuhan': '武汉市',
+    'xian': '西安市',
+    'shenyang': '沈阳市'
+}
+CITY_CODES = {name: code for code, name in CITY_NAMES.items()}
+
+_NEIGHBOR_OFFSETS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+
+def parse_points(polygon_points_str):
+    """解析点集字符串 "x1,y1;x2,y2;..."，格式错误的点被忽略"""
+    points = []
+    for point_str in (polygon_points_str or '').split(';'):
+        if ',' in point_str:
+            x_str, y_str = point_str.split(',')[:2]
+            try:
+                points.append((float(x_str), float(y_str)))
+            except ValueError:
+                continue
+    return points
+
+
+def point_in_points(x, y, points):
+    """射线法判断点是否在多边形（已解析的点列表）内"""
+    if len(points) < 3:
+        return False
+    inside = False
+    j = len(points) - 1
+    for i in range(len(points)):
+        xi, yi = points[i]
+        xj, yj = points[j]
+        if ((yi > y) != (yj > y)) and (x < (xj - xi) * (y - yi) / (yj - yi) + xi):
+            inside = not inside
+        j = i
+    return inside
+
+
+def segments_intersect(x1, y1, x2, y2, x3, y3, x4, y4):
+    """判断两条线段是否相交（含共线重叠和端点接触）"""
+    def direction(xi, yi, xj, yj, xk, yk):
+        return (xk - xi) * (yj - yi) - (xj - xi) * (yk - yi)
+
+    def on_segment(xi, yi, xj, yj, xk, yk):
+        return (min(xi, xj) <= xk <= max(xi, xj) and
+                min(yi, yj) <= yk <= max(yi, yj))
+
+    d1 = direction(x3, y3, x4, y4, x1, y1)
+    d2 = direction(x3, y3, x4, y4, x2, y2)
+    d3 = direction(x1, y1, x2, y2, x3, y3)
+    d4 = direction(x1, y1, x2, y2, x4, y4)
+
+    if ((d1 > 0 and d2 < 0) or (d1 < 0 and d2 > 0)) and \
+       ((d3 > 0 and d4 < 0) or (d3 < 0 and d4 > 0)):
+        return True
+    if d1 == 0 and on_segment(x3, y3, x4, y4, x1, y1):
+        return True
+    if d2 == 0 and on_segment(x3, y3, x4, y4, x2, y2):
+        return True
+    if d3 == 0 and on_segment(x1, y1, x2, y2, x3, y3):
+        return True
+    if d4 == 0 and on_segment(x1, y1, x2, y2, x4, y4):
+        return True
+    return False
+
+
+def segment_hits_shape(x1, y1, x2, y2, points, geometry_type):
+    """线段与单个障碍物（已解析）是否相交：线段障碍物判断两线段相交，
+    多边形判断端点在内部或与任一条边相交"""
+    if geometry_type == 'line':
+        if len(points) == 2:
+            (x3, y3), (x4, y4) = points
+            return segments_intersect(x1, y1, x2, y2, x3, y3, x4, y4)
+        return False
+    if len(points) < 3:
+        return False
+    if point_in_points(x1, y1, points) or point_in_points(x2, y2, points):
+        return True
+    j = len(points) - 1
+    for i in range(len(points)):
+        x3, y3 = points[i]
+        x4, y4 = points[j]
+        if segments_intersect(x1, y1, x2, y2, x3, y3, x4, y4):
+            return True
+        j = i
+    return False
+
+
+class _Shape:
+    """编译后的单个障碍物"""
+
+    __slots__ = ('obstacle_id', 'geometry_type', 'points', 'min_x', 'min_y', 'max_x', 'max_y')
+
+    def __init__(self, obstacle_id, geometry_type, points):
+        self.obstacle_id = obstacle_id
+        self.geometry_type = geometry_type
+        self.points = points
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        self.min_x, self.max_x = min(xs), max(xs)
+        self.min_y, self.max_y = min(ys), max(ys)
+
+    @property
+    def is_polygon(self):
+        return self.geometry_type != 'line'
+
+    def in_grid(self):
+        return self.min_x >= 0 and self.min_y >= 0 and self.max_x < GRID_SIZE and self.max_y < GRID_SIZE
+
+    def bbox_overlaps(self, min_x, min_y, max_x, max_y):
+        return not (self.max_x < min_x or self.min_x > max_x or self.max_y < min_y or self.min_y > max_y)
+
+
+def normalize_city(city_code):
+    """统一为城市中文名，未知城市原样返回"""
+    return CITY_NAMES.get(city_code, city_code)
+
+
+class CityObstacleGrid:
+    """单个城市的障碍物占用栅格"""
+
+    def __init__(self, city_code, obstacles, version=0):
+        self.city_code = city_code
+        self.version = version               # 编译序号，路线缓存用它区分不同版本的障碍物
+        self.source = [{'id': obstacle.get('id'),
+                        'geometry_type': obstacle.get('geometry_type'),
+                        'polygon_points': obstacle.get('polygon_points')} for obstacle in obstacles]
+        self._coarse = {}
+        self.shapes = []
+        for obstacle in obstacles:
+            points = parse_points(obstacle.get('polygon_points'))
+            geometry_type = obstacle.get('geometry_type') or 'polygon'
+            if (geometry_type == 'line' and len(points) != 2) or (geometry_type != 'line' and len(points) < 3):
+                continue
+            self.shapes.append(_Shape(obstacle.get('id'), geometry_type, points))
+
+        # 超出栅格范围的障碍物不栅格化，查询时总是精确判断
+        self.unrasterized = [index for index, shape in enumerate(self.shapes) if not shape.in_grid()]
+        # inside[x, y]：整格位于某个多边形内部
+        self.inside = np.zeros((GRID_SIZE, GRID_SIZE), dtype=bool)
+        # occupied[x, y]：格子中心在多边形内或有障碍物边界经过，供寻路等栅格算法使用
+        self.occupied = np.zeros((GRID_SIZE, GRID_SIZE), dtype=bool)
+        # 候选表（CSR 结构）：slot[x, y] >= 0 时，候选障碍物为 ids[starts[slot]:starts[slot + 1]]
+        self._slot = np.full((GRID_SIZE, GRID_SIZE), -1, dtype=np.int32)
+        self._starts = np.zeros(1, dtype=np.int64)
+        self._ids = np.zeros(0, dtype=np.int32)
+        self._rasterize()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def point_blocked(self, x, y):
+        """点是否在任何多边形障碍物内（线段障碍物不考虑内部）"""
+        x, y = float(x), float(y)
+        for index in self.unrasterized:
+            shape = self.shapes[index]
+            if shape.is_polygon and point_in_points(x, y, shape.points):
+                return True
+        if not (0 <= x < GRID_SIZE and 0 <= y < GRID_SIZE):
+            return self._exact_point(x, y)
+        cell_x, cell_y = int(x), int(y)
+        if self.inside[cell_x, cell_y]:
+            return True
+        slot = self._slot[cell_x, cell_y]
+        if slot < 0:
+            return False
+        for index in self._ids[self._starts[slot]:self._starts[slot + 1]]:
+            shape = self.shapes[index]
+            if shape.is_polygon and point_in_points(x, y, shape.points):
+                return True
+        return False
+
+    def segment_blocked(self, x1, y1, x2, y2):
+        """线段是否与任何障碍物相交"""
+        x1, y1, x2, y2 = float(x1), float(y1), float(x2), float(y2)
+        for index in self.unrasterized:
+            shape = self.shapes[index]
+            if segment_hits_shape(x1, y1, x2, y2, shape.points, shape.geometry_type):
+                return True
+        if not (0 <= min(x1, x2) and max(x1, x2) < GRID_SIZE and 0 <= min(y1, y2) and max(y1, y2) < GRID_SIZE):
+            return self._exact_segment(x1, y1, x2, y2)
+        length = max(abs(x2 - x1), abs(y2 - y1))
+        samples = int(length / SEGMENT_SAMPLE_STEP) + 2
+        if samples <= SHORT_SEGMENT_SAMPLES:
+            # 短线段（仿真单步移动）逐格查表，避免 numpy 调用开销
+            slots = set()
+            for step in range(samples):
+                t = step / (samples - 1)
+                cell_x = min(int(x1 + (x2 - x1) * t), GRID_SIZE - 1)
+                cell_y = min(int(y1 + (y2 - y1) * t), GRID_SIZE - 1)
+                if self.inside[cell_x, cell_y]:
+                    return True
+                slot = self._slot[cell_x, cell_y]
+                if slot >= 0:
+                    slots.add(int(slot))
+        else:
+            t = np.linspace(0.0, 1.0, samples)
+            cells_x = np.minimum((x1 + (x2 - x1) * t).astype(np.int64), GRID_SIZE - 1)
+            cells_y = np.minimum((y1 + (y2 - y1) * t).astype(np.int64), GRID_SIZE - 1)
+            if self.inside[cells_x, cells_y].any():
+                return True
+            slots = self._slot[cells_x, cells_y]
+            slots = np.unique(slots[slots >= 0]).tolist()
+        if not slots:
+            return False
+        candidates = set()
+        for slot in slots:
+            candidates.update(self._ids[self._starts[slot]:self._starts[slot + 1]].tolist())
+        for index in sorted(candidates):
+            shape = self.shapes[index]
+            if segment_hits_shape(x1, y1, x2, y2, shape.points, shape.geometry_type):
+                return True
+        return False
+
+    def coarse_blocked(self, cell_size):
+        """按 cell_size×cell_size 合并的粗粒度占用栅格，块内任一格被占用即视为阻塞
+
+        Returns:
+            tuple: (bytearray 按 x * 边长 + y 展平的阻塞标记, 边长)
+        """
+        cached = self._coarse.get(cell_size)
+        if cached is None:
+            side = -(-GRID_SIZE // cell_size)
+            padded = np.zeros((side * cell_size, side * cell_size), dtype=bool)
+            padded[:GRID_SIZE, :GRID_SIZE] = self.occupied
+            blocked = padded.reshape(side, cell_size, side, cell_size).any(axis=(1, 3))
+            cached = (bytearray(blocked.astype(np.uint8).tobytes()), side)
+            self._coarse[cell_size] = cached
+        return cached
+
+    def get_metrics(self):
+        return {
+            'version': self.version,
+            'obstacles': len(self.shapes),
+            'unrasterized': len(self.unrasterized),
+            'inside_cells': int(self.inside.sum()),
+            'occupied_cells': int(self.occupied.sum()),
+            'candidate_cells': int(len(self._starts) - 1)
+        }
+
+    # ------------------------------------------------------------------
+    # 编译
+    # ------------------------------------------------------------------
+    def _rasterize(self):
+        boundary_cells = []
+        boundary_ids = []
+        for index, shape in enumerate(self.shapes):
+            points = np.array(shape.points, dtype=float)
+            if shape.is_polygon:
+                edges = np.concatenate([points, points[:1]])
+            else:
+                edges = points
+            edge_cells = self._edge_cells(edges)
+            if not len(edge_cells):
+                continue
+            self.occupied[edge_cells[:, 0], edge_cells[:, 1]] = True
+            if not shape.in_grid():
+                # 超出范围的障碍物只标记栅格内的占用格，碰撞查询仍走精确判断
+                if shape.is_polygon:
+                    centers_inside, (x0, y0) = self._fill_polygon(shape, points)
+                    if centers_inside is not None:
+                        width, height = centers_inside.shape
+                        self.occupied[x0:x0 + width, y0:y0 + height] |= centers_inside
+                continue
+
+            # 边界格子向外扩一圈作为候选，保证采样和浮点误差下不漏判
+            dilated = (edge_cells[:, None, :] + _NEIGHBOR_OFFSETS[None, :, :]).reshape(-1, 2)
+            dilated = dilated[((dilated >= 0) & (dilated < GRID_SIZE)).all(axis=1)]
+            flat = np.unique(dilated[:, 0] * GRID_SIZE + dilated[:, 1])
+            boundary_cells.append(flat)
+            boundary_ids.append(np.full(len(flat), index, dtype=np.int32))
+
+            if shape.is_polygon:
+                centers_inside, (x0, y0) = self._fill_polygon(shape, points)
+                if centers_inside is None:
+                    continue
+                width, height = centers_inside.shape
+                window_x = slice(x0, x0 + width)
+                window_y = slice(y0, y0 + height)
+                self.occupied[window_x, window_y] |= centers_inside
+                # 没有边界经过的格子整格与中心点同侧
+                near_edge = np.zeros_like(centers_inside)
+                local_x, local_y = flat // GRID_SIZE - x0, flat % GRID_SIZE - y0
+                in_window = (local_x >= 0) & (local_x < width) & (local_y >= 0) & (local_y < height)
+                near_edge[local_x[in_window], local_y[in_window]] = True
+                self.inside[window_x, window_y] |= centers_inside & ~near_edge
+
+        if not boundary_cells:
+            return
+        cells = np.concatenate(boundary_cells)
+        ids = np.concatenate(boundary_ids)
+        order = np.argsort(cells, kind='stable')
+        cells, ids = cells[order], ids[order]
+        unique_cells, starts = np.unique(cells, return_index=True)
+        self._slot[unique_cells // GRID_SIZE, unique_cells % GRID_SIZE] = np.arange(len(unique_cells), dtype=np.int32)
+        self._starts = np.append(starts, len(cells)).astype(np.int64)
+        self._ids = ids
+
+    @staticmethod
+    def _edge_cells(vertices):
+        """按固定步长采样折线经过的格子"""
+        cells = []
+        for (x1, y1), (x2, y2) in zip(vertices[:-1], vertices[1:]):
+            length = max(abs(x2 - x1), abs(y2 - y1))
+            samples = int(np.ceil(length / EDGE_SAMPLE_STEP)) + 1
+            t = np.linspace(0.0, 1.0, samples)
+            xs = np.floor(x1 + (x2 - x1) * t).astype(np.int64)
+            ys = np.floor(y1 + (y2 - y1) * t).astype(np.int64)
+            cells.append(np.stack([xs, ys], axis=1))
+        cells = np.unique(np.concatenate(cells), axis=0)
+        return cells[((cells >= 0) & (cells < GRID_SIZE)).all(axis=1)]
+
+    @staticmethod
+    def _fill_polygon(shape, points):
+        """对外包矩形（裁剪到栅格范围）内的格子中心做向量化射线法，返回 (中心在内部的布尔窗口, 窗口左下角)"""
+        x0, y0 = max(int(np.floor(shape.min_x)), 0), max(int(np.floor(shape.min_y)), 0)
+        x1 = min(int(np.floor(shape.max_x)) + 1, GRID_SIZE)
+        y1 = min(int(np.floor(shape.max_y)) + 1, GRID_SIZE)
+        if x1 <= x0 or y1 <= y0:
+            return None, (x0, y0)
+        center_x = (np.arange(x0, x1) + 0.5)[:, None]
+        center_y = (np.arange(y0, y1) + 0.5)[None, :]
+        inside = np.zeros((x1 - x0, y1 - y0), dtype=bool)
+        j = len(points) - 1
+        for i in range(len(points)):
+            xi, yi = points[i]
+            xj, yj = points[j]
+            j = i
+            if yi == yj:
+                continue
+            crosses = (yi > center_y) != (yj > center_y)
+            x_cross = (xj - xi) * (center_y - yi) / (yj - yi) + xi
+            inside ^= crosses & (center_x < x_cross)
+        return inside, (x0, y0)
+
+    def _exact_point(self, x, y):
+        for shape in self.shapes:
+            if shape.is_polygon and shape.bbox_overlaps(x, y, x, y) and point_in_points(x, y, shape.points):
+                return True
+        return False
+
+    def _exact_segment(self, x1, y1, x2, y2):
+        min_x, max_x = min(x1, x2), max(x1, x2)
+        min_y, max_y = min(y1, y2), max(y1, y2)
+        for shape in self.shapes:
+            if shape.bbox_overlaps(min_x, min_y, max_x, max_y) and \
+                    segment_hits_shape(x1, y1, x2, y2, shape.points, shape.geometry_type):
+                return True
+        return False
+
+
+class ObstacleIndex:
+    """按城市缓存的障碍物占用栅格"""
+
+    def __init__(self, ttl=OBSTACLE_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._grids = {}             # 城市 -> (CityObstacleGrid, 编译时间)
+        self._generation = 0         # 每次失效加一，编译期间发生失效时结果不入缓存
+        self.builds = 0
+        self.last_build_duration = 0.0
+
+    def invalidate(self, city_code=None):
+        """障碍物变更后调用，city_code 为 None 时清空所有城市"""
+        with self._lock:
+            self._generation += 1
+            if city_code is None:
+                self._grids.clear()
+            else:
+                self._grids.pop(normalize_city(city_code), None)
+
+    def get_city_grid(self, city_code):
+        """获取城市的占用栅格（必要时从数据库编译），city_code 可以是中文名或拼音代码"""
+        city_code = normalize_city(city_code)
+        with self._lock:
+            cached = self._grids.get(city_code)
+            generation = self._generation
+        if cached is not None and time.time() - cached[1] <= self.ttl:
+            return cached[0]
+        started = time.time()
+        obstacles = BaseDAO.execute_query("""
+            SELECT id, geometry_type, polygon_points FROM map_obstacles
+            WHERE city_code IN (%s, %s) AND is_active = 1
+            ORDER BY obstacle_type, id
+        """, (city_code, CITY_CODES.get(city_code, city_code)))
+        with self._lock:
+            self.builds += 1
+            version = self.builds
+        grid = CityObstacleGrid(city_code, obstacles or [], version)
+        with self._lock:
+            if generation == self._generation:
+                self._grids[city_code] = (grid, started)
+            self.last_build_duration = time.time() - started
+        return grid
+
+    def is_point_blocked(self, x, y, city_code):
+        return self.get_city_grid(city_code).point_blocked(x, y)
+
+    def is_segment_blocked(self, x1, y1, x2, y2, city_code):
+        return self.get_city_grid(city_code).segment_blocked(x1, y1, x2, y2)
+
+    def get_metrics(self):
+        with self._lock:
+            grids = {city: grid.get_metrics() for city, (grid, _) in self._grids.items()}
+        return {
+            'cities': grids,
+            'builds': self.builds,
+            'last_build_ms': round(self.last_build_duration * 1000, 3)
+        }
+
+
+_obstacle_index = None
+_obstacle_index_lock = threading.Lock()
+
+
+def get_obstacle_index():
+    """获取全局障碍物占用栅格索引"""
+    global _obstacle_index
+    if _obstacle_index is None:
+        with _obstacle_index_lock:
+            if _obstacle_index is None:
+                _obstacle_index = ObstacleIndex()
+    return _obstacle_index
+
+
+def invalidate_obstacle_index(city_code=None):
+    """障碍物变更后使缓存失效（索引未创建时不做任何事）"""
+    if _obstacle_index is not None:
+        try:
+            _obstacle_index.invalidate(city_code)
+        except Exception as e:
+            print(f"障碍物索引失效出错: {e}")
+            traceback.print_exc()
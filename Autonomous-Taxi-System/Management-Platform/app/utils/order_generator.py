@@ -0,0 +1,286 @@
+"""
+批量订单生成器
+用 NumPy 按块整批生成待分配订单的用户、上车点和下车点，逐块以多行 INSERT 写入数据库，
+用于批量添加订单和压测造数（百万级订单）。
+
+- 上下车点默认在 0-999 的城市坐标内均匀分布；开启热点后按该城市历史订单在
+  HOTSPOT_CELL×HOTSPOT_CELL 粗格上的上车/下车密度抽样，HOTSPOT_RATIO 比例的订单来自热点，其余仍均匀分布；
+- 开启避障后落在障碍物占用栅格（app.utils.obstacle_index）上的点整批重抽；
+- 上下车距离不足 MIN_TRIP_DISTANCE 的订单整批重抽下车点，代替逐单的拒绝采样循环；
+- 订单编号为 O + 日期 + 本次生成的随机批次标识 + 序号，批次标识生成前先确认数据库中未使用，
+  同一批次内按序号递增，不会重复。
+
+每写完一块提交一次事务并回调进度，中途失败或取消时已提交的块保留。
+
+压测造数命令：python -m app.utils.order_generator 北京市 1000000 [--hotspots] [--avoid-obstacles] [--seed 42]
+"""
+import argparse
+import secrets
+import time
+import traceback
+from datetime import datetime
+
+import numpy as np
+
+from app.dao.base_dao import BaseDAO
+from app.utils.obstacle_index import GRID_SIZE, normalize_city, get_obstacle_index
+
+# 上下车点最小距离（坐标单位）
+MIN_TRIP_DISTANCE = 50
+# 热点统计的粗格边长（坐标单位）
+HOTSPOT_CELL = 50
+# 开启热点时来自热点分布的订单比例
+HOTSPOT_RATIO = 0.7
+# 每块生成并提交的订单数
+GENERATION_CHUNK_SIZE = 20000
+# 单条 INSERT 语句包含的行数
+INSERT_ROWS_PER_STATEMENT = 1000
+# 按热点/避障重抽的最多轮数，超过后剩余的点从空闲格子中均匀抽取
+MAX_RESAMPLE_ROUNDS = 20
+
+_INSERT_PREFIX = """
+    INSERT INTO orders
+    (order_number, user_id, vehicle_id, order_status, create_time, arrival_time,
+    pickup_location, pickup_location_x, pickup_location_y,
+    dropoff_location, dropoff_location_x, dropoff_location_y, city_code)
+    VALUES """
+_ROW_PLACEHOLDER = "(%s, %s, NULL, '待分配', %s, NULL, %s, %s, %s, %s, %s, %s, %s)"
+
+
+def load_demand_hotspots(city_code, cell=HOTSPOT_CELL):
+    """城市历史订单的上车/下车密度
+
+    Returns:
+        tuple: (上车权重, 下车权重)，均为按粗格 x * 边长 + y 展平的概率数组；没有历史订单时为 None
+    """
+    side = -(-GRID_SIZE // cell)
+    weights = []
+    for column in ('pickup', 'dropoff'):
+        rows = BaseDAO.execute_query(f"""
+            SELECT FLOOR({column}_location_x / %s) AS cell_x, FLOOR({column}_location_y / %s) AS cell_y,
+                   COUNT(*) AS order_count
+            FROM orders
+            WHERE city_code = %s AND {column}_location_x BETWEEN 0 AND %s AND {column}_location_y BETWEEN 0 AND %s
+            GROUP BY cell_x, cell_y
+        """, (cell, cell, city_code, GRID_SIZE - 1, GRID_SIZE - 1))
+        counts = np.zeros(side * side, dtype=float)
+        for row in rows or []:
+            counts[int(row['cell_x']) * side + int(row['cell_y'])] += row['order_count']
+        total = counts.sum()
+        weights.append(counts / total if total else None)
+    return tuple(weights)
+
+
+class OrderBatchGenerator:
+    """按块生成订单数据的生成器"""
+
+    def __init__(self, city_code, user_ids, follow_hotspots=False, avoid_obstacles=False,
+                 min_distance=MIN_TRIP_DISTANCE, seed=None, reserve_numbers=True):
+        if not user_ids:
+            raise ValueError(f"城市 {city_code} 没有可用的用户，无法创建订单")
+        self.city_code = city_code
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.min_distance = min_distance
+        self.rng = np.random.default_rng(seed)
+        self.sequence = 0
+
+        self.hotspots = (None, None)
+        if follow_hotspots:
+            self.hotspots = load_demand_hotspots(city_code)
+        self.side = -(-GRID_SIZE // HOTSPOT_CELL)
+
+        # 避障时只在空闲格子上落点
+        self.blocked = None
+        self.free_cells = None
+        if avoid_obstacles:
+            occupied = get_obstacle_index().get_city_grid(normalize_city(city_code)).occupied
+            if occupied.any():
+                self.blocked = occupied
+                self.free_cells = np.flatnonzero(~occupied)
+
+        # 只生成坐标（如离散事件仿真）时不需要订单编号
+        self.order_number_prefix = self._reserve_prefix() if reserve_numbers else None
+        self.resampled = 0
+
+    def generate(self, count):
+        """生成 count 个订单
+
+        Returns:
+            dict: 'sequence'、'user_id'、'pickup_x'、'pickup_y'、'dropoff_x'、'dropoff_y' 的数组
+        """
+        pickup_x, pickup_y = self._sample_points(count, self.hotspots[0])
+        dropoff_x, dropoff_y = self._sample_points(count, self.hotspots[1])
+
+        # 上下车点太近的订单整批重抽下车点
+        min_distance_sq = self.min_distance ** 2
+        too_close = np.flatnonzero((dropoff_x - pickup_x) ** 2 + (dropoff_y - pickup_y) ** 2 < min_distance_sq)
+        rounds = 0
+        while len(too_close):
+            hotspot = self.hotspots[1] if rounds < MAX_RESAMPLE_ROUNDS else None
+            new_x, new_y = self._sample_points(len(too_close), hotspot)
+            dropoff_x[too_close] = new_x
+            dropoff_y[too_close] = new_y
+            self.resampled += len(too_close)
+            distance_sq = (dropoff_x[too_close] - pickup_x[too_close]) ** 2 + (dropoff_y[too_close] - pickup_y[too_close]) ** 2
+            too_close = too_close[distance_sq < min_distance_sq]
+            rounds += 1
+
+        sequence = np.arange(self.sequence, self.sequence + count, dtype=np.int64)
+        self.sequence += count
+        return {
+            'sequence': sequence,
+            'user_id': self.user_ids[self.rng.integers(0, len(self.user_ids), count)],
+            'pickup_x': pickup_x,
+            'pickup_y': pickup_y,
+            'dropoff_x': dropoff_x,
+            'dropoff_y': dropoff_y
+        }
+
+    def rows(self, batch, create_time, width):
+        """把一块订单数组转换为 INSERT 参数（按行展平）"""
+        prefix = self.order_number_prefix
+        params = []
+        for sequence, user_id, px, py, dx, dy in zip(
+                batch['sequence'].tolist(), batch['user_id'].tolist(),
+                batch['pickup_x'].tolist(), batch['pickup_y'].tolist(),
+                batch['dropoff_x'].tolist(), batch['dropoff_y'].tolist()):
+            params.extend((
+                f"{prefix}{sequence:0{width}d}", user_id, create_time,
+                f"({px}, {py})", px, py,
+                f"({dx}, {dy})", dx, dy, self.city_code
+            ))
+        return params
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+    def _sample_points(self, count, hotspot_weights):
+        """抽取 count 个坐标点，开启避障时保证不落在障碍物上"""
+        x, y = self._draw(count, hotspot_weights)
+        if self.blocked is None:
+            return x, y
+        blocked = np.flatnonzero(self.blocked[x, y])
+        rounds = 0
+        while len(blocked) and rounds < MAX_RESAMPLE_ROUNDS:
+            new_x, new_y = self._draw(len(blocked), hotspot_weights)
+            x[blocked] = new_x
+            y[blocked] = new_y
+            self.resampled += len(blocked)
+            blocked = blocked[self.blocked[new_x, new_y]]
+            rounds += 1
+        if len(blocked):
+            cells = self.free_cells[self.rng.integers(0, len(self.free_cells), len(blocked))]
+            x[blocked], y[blocked] = np.divmod(cells, GRID_SIZE)
+        return x, y
+
+    def _draw(self, count, hotspot_weights):
+        """均匀抽样，或按热点权重抽取粗格后在格内均匀抽样"""
+        x = self.rng.integers(0, GRID_SIZE, count)
+        y = self.rng.integers(0, GRID_SIZE, count)
+        if hotspot_weights is None:
+            return x, y
+        from_hotspot = np.flatnonzero(self.rng.random(count) < HOTSPOT_RATIO)
+        cells = self.rng.choice(len(hotspot_weights), size=len(from_hotspot), p=hotspot_weights)
+        cell_x, cell_y = np.divmod(cells, self.side)
+        x[from_hotspot] = np.minimum(cell_x * HOTSPOT_CELL + self.rng.integers(0, HOTSPOT_CELL, len(cells)), GRID_SIZE - 1)
+        y[from_hotspot] = np.minimum(cell_y * HOTSPOT_CELL + self.rng.integers(0, HOTSPOT_CELL, len(cells)), GRID_SIZE - 1)
+        return x, y
+
+    def _reserve_prefix(self):
+        """生成本次的订单编号前缀，确认数据库中没有以它开头的订单"""
+        date_part = datetime.now().strftime('%Y%m%d')
+        while True:
+            prefix = f"O{date_part}{secrets.token_hex(3).upper()}"
+            rows = BaseDAO.execute_query(
+                "SELECT 1 FROM orders WHERE order_number LIKE %s LIMIT 1", (f"{prefix}%",)
+            )
+            if not rows:
+                return prefix
+
+
+def stream_insert_orders(generator, order_count, progress=None, cancelled=None,
+                         chunk_size=GENERATION_CHUNK_SIZE, rows_per_statement=INSERT_ROWS_PER_STATEMENT):
+    """按块生成订单并以多行 INSERT 写入，每块提交一次
+
+    Args:
+        generator: OrderBatchGenerator
+        order_count: 订单总数
+        progress: 进度回调 progress(已写入数, 总数)
+        cancelled: 每块开始前调用，返回 True 时停止写入（已提交的块保留）
+        chunk_size: 每块订单数
+        rows_per_statement: 单条 INSERT 的行数
+
+    Returns:
+        dict: 'inserted' 已写入订单数，'user_ids' 涉及的用户ID（去重）
+    """
+    width = max(6, len(str(order_count)))
+    create_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    inserted = 0
+    user_ids = set()
+    conn = None
+    cursor = None
+    try:
+        conn = BaseDAO.get_connection()
+        cursor = conn.cursor()
+        while inserted < order_count:
+            if cancelled and cancelled():
+                break
+            batch = generator.generate(min(chunk_size, order_count - inserted))
+            params = generator.rows(batch, create_time, width)
+            row_count = len(batch['sequence'])
+            columns = len(params) // row_count
+            try:
+                for start in range(0, row_count, rows_per_statement):
+                    rows = min(rows_per_statement, row_count - start)
+                    cursor.execute(
+                        _INSERT_PREFIX + ", ".join([_ROW_PLACEHOLDER] * rows),
+                        params[start * columns:(start + rows) * columns]
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            inserted += row_count
+            user_ids.update(np.unique(batch['user_id']).tolist())
+            if progress:
+                progress(inserted, order_count)
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+    return {'inserted': inserted, 'user_ids': sorted(user_ids)}
+
+
+def main():
+    """压测造数命令：python -m app.utils.order_generator 北京市 1000000 [--hotspots] [--avoid-obstacles]"""
+    parser = argparse.ArgumentParser(description='批量生成待分配订单（压测造数）')
+    parser.add_argument('city', help='城市中文名，如 北京市')
+    parser.add_argument('count', type=int, help='订单数量')
+    parser.add_argument('--hotspots', action='store_true', help='按历史订单热点分布上下车点')
+    parser.add_argument('--avoid-obstacles', action='store_true', help='上下车点避开障碍物')
+    parser.add_argument('--seed', type=int, help='随机数种子')
+    parser.add_argument('--chunk-size', type=int, default=GENERATION_CHUNK_SIZE, help='每次提交的订单数')
+    args = parser.parse_args()
+
+    from app.dao.order_dao import OrderDAO
+
+    started = time.time()
+
+    def report(inserted, total):
+        elapsed = time.time() - started
+        print(f"已写入 {inserted}/{total} 个订单，{inserted / elapsed:.0f} 单/秒")
+
+    try:
+        result = OrderDAO.bulk_create_orders(
+            args.city, args.count, progress=report, follow_hotspots=args.hotspots,
+            avoid_obstacles=args.avoid_obstacles, seed=args.seed, chunk_size=args.chunk_size
+        )
+        print(f"完成：共写入 {result['success_count']} 个订单，用时 {time.time() - started:.1f} 秒")
+    except Exception as e:
+        print(f"生成订单失败: {str(e)}")
+        traceback.print_exc()
+
+
+if __name__ == '__main__':
+    main()
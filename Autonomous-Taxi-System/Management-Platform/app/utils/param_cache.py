@@ -0,0 +1,252 @@
+"""
+系统参数缓存
+进程内共享一份 system_parameters 的类型化快照，用一条 SELECT 批量加载，读取时不访问数据库。
+
+失效检测：每隔 PARAM_POLL_INTERVAL 秒由访问线程顺带执行一次轻量的水位查询
+（行数 + MAX(updated_at) + 键值校验和），水位变化时才重新加载全表；
+本进程内修改参数后调用 invalidate() 立即失效。快照整体替换，读取方无需加锁。
+
+加载时按车型预先解析好六个车型系数（速度、电池容量、充电速度、能耗、维护成本、订单价格），
+get_vehicle_parameters 等热点路径直接取用。
+"""
+import json
+import threading
+import time
+import traceback
+
+from app.dao.base_dao import BaseDAO
+
+# 水位轮询间隔（秒）
+PARAM_POLL_INTERVAL = 5
+
+# 车型系数名称 -> 参数键后缀（参数键为 车型(连字符替换为下划线) + 后缀）
+MODEL_COEFFICIENT_SUFFIXES = {
+    'speed_coefficient': '_SPEED',
+    'capacity_coefficient': '_CAPACITY',
+    'charging_speed_coefficient': '_CHARGING_SPEED',
+    'energy_consumption_coefficient': '_ENERGY_CONSUMPTION_COEFFICIENT',
+    'maintenance_cost_coefficient': '_MAINTENANCE_COST',
+    'order_price_coefficient': '_ORDER_PRICE'
+}
+
+# 没有车型信息时使用的默认系数参数键
+DEFAULT_COEFFICIENT_KEYS = {
+    'speed_coefficient': 'DEFAULT_SPEED_COEFFICIENT',
+    'capacity_coefficient': 'DEFAULT_CAPACITY_COEFFICIENT',
+    'charging_speed_coefficient': 'DEFAULT_CHARGING_SPEED_COEFFICIENT',
+    'energy_consumption_coefficient': 'DEFAULT_ENERGY_CONSUMPTION_COEFFICIENT',
+    'maintenance_cost_coefficient': 'DEFAULT_MAINTENANCE_COST_COEFFICIENT',
+    'order_price_coefficient': 'DEFAULT_ORDER_PRICE_COEFFICIENT'
+}
+
+_WATERMARK_QUERY = """
+    SELECT COUNT(*) AS total, MAX(updated_at) AS watermark,
+           COALESCE(SUM(CRC32(CONCAT(param_key, '=', param_value, ':', param_type))), 0) AS checksum
+    FROM system_parameters
+"""
+
+_MISSING = object()
+
+
+def convert_param_value(param_value, param_type):
+    """按参数类型转换参数值，转换失败时抛出 ValueError"""
+    try:
+        if param_type == 'int':
+            return int(param_value)
+        if param_type == 'float':
+            return float(param_value)
+        if param_type == 'boolean':
+            return param_value.lower() in ('true', '1', 'yes')
+        if param_type in ('json', 'array'):
+            return json.loads(param_value)
+        return param_value
+    except (ValueError, AttributeError, json.JSONDecodeError) as e:
+        raise ValueError(str(e))
+
+
+def model_key(vehicle_model):
+    """车型名称对应的参数键前缀"""
+    return vehicle_model.replace('-', '_')
+
+
+class ParamSnapshot:
+    """某一时刻的参数快照（只读）"""
+
+    def __init__(self, values, version, watermark):
+        self.values = values
+        self.version = version
+        self.watermark = watermark
+        self.loaded_at = time.time()
+        # 车型 -> 系数字典，加载时预先解析出所有配置了订单价格系数的车型
+        self.models = {}
+        for key in values:
+            if key.endswith('_ORDER_PRICE'):
+                prefix = key[:-len('_ORDER_PRICE')]
+                self.models[prefix] = self._resolve_model(prefix)
+        self.defaults = {name: values.get(key) for name, key in DEFAULT_COEFFICIENT_KEYS.items()}
+
+    def model_params(self, vehicle_model):
+        """车型系数字典，车型为空时返回默认系数"""
+        if not vehicle_model:
+            return self.defaults
+        prefix = model_key(vehicle_model)
+        params = self.models.get(prefix)
+        if params is None:
+            params = self._resolve_model(prefix)
+            self.models[prefix] = params
+        return params
+
+    def _resolve_model(self, prefix):
+        return {name: self.values.get(prefix + suffix) for name, suffix in MODEL_COEFFICIENT_SUFFIXES.items()}
+
+
+class ParameterCache:
+    """系统参数缓存"""
+
+    def __init__(self, poll_interval=PARAM_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._failed_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._version = 0
+
+        # 运行指标
+        self.reloads = 0
+        self.watermark_checks = 0
+        self.last_error = None
+
+    @property
+    def version(self):
+        """参数版本号，每次重新加载加一"""
+        snapshot = self.snapshot()
+        return snapshot.version if snapshot is not None else 0
+
+    def snapshot(self):
+        """获取当前快照，必要时检查水位并重新加载
+
+        Raises:
+            Exception: 首次加载失败时抛出数据库异常
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() - self._checked_at < self.poll_interval:
+            return snapshot
+        if snapshot is None:
+            # 首次加载必须等待结果；刚失败过时直接报错，避免每次读取都去连接数据库
+            with self._refresh_lock:
+                if self._snapshot is None:
+                    if time.time() - self._failed_at < self.poll_interval:
+                        raise RuntimeError(f"系统参数加载失败: {self.last_error}")
+                    try:
+                        self._reload()
+                    except Exception as e:
+                        self._failed_at = time.time()
+                        self.last_error = str(e)
+                        raise
+                return self._snapshot
+        # 已有快照时由一个线程检查水位，其他线程继续使用旧快照
+        if self._refresh_lock.acquire(blocking=False):
+            try:
+                if time.time() - self._checked_at >= self.poll_interval:
+                    self._check_watermark()
+            except Exception as e:
+                self.last_error = str(e)
+                self._checked_at = time.time()
+                print(f"检查系统参数水位失败，继续使用缓存: {str(e)}")
+            finally:
+                self._refresh_lock.release()
+        return self._snapshot
+
+    def get(self, param_key, default=_MISSING):
+        """获取类型化的参数值
+
+        Raises:
+            KeyError: 参数不存在且未提供默认值
+        """
+        value = self.snapshot().values.get(param_key, _MISSING)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(param_key)
+            return default
+        return value
+
+    def get_all(self):
+        """全部参数（副本）"""
+        return dict(self.snapshot().values)
+
+    def get_model_params(self, vehicle_model):
+        """车型系数字典（副本），键与 get_vehicle_parameters 返回的参数字典一致"""
+        return dict(self.snapshot().model_params(vehicle_model))
+
+    def invalidate(self):
+        """本进程修改参数后调用，立即重新加载"""
+        with self._refresh_lock:
+            self._reload()
+
+    def get_metrics(self):
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version if snapshot else 0,
+            'params': len(snapshot.values) if snapshot else 0,
+            'models': sorted(snapshot.models) if snapshot else [],
+            'loaded_at': snapshot.loaded_at if snapshot else None,
+            'reloads': self.reloads,
+            'watermark_checks': self.watermark_checks,
+            'poll_interval': self.poll_interval,
+            'last_error': self.last_error
+        }
+
+    # ------------------------------------------------------------------
+    # 内部方法（调用方持有 _refresh_lock）
+    # ------------------------------------------------------------------
+    def _watermark(self):
+        rows = BaseDAO.execute_query(_WATERMARK_QUERY)
+        row = rows[0] if rows else {}
+        return (int(row.get('total') or 0), str(row.get('watermark')), int(row.get('checksum') or 0))
+
+    def _check_watermark(self):
+        self.watermark_checks += 1
+        watermark = self._watermark()
+        self._checked_at = time.time()
+        if self._snapshot is None or watermark != self._snapshot.watermark:
+            self._reload(watermark)
+
+    def _reload(self, watermark=None):
+        if watermark is None:
+            watermark = self._watermark()
+        rows = BaseDAO.execute_query("SELECT param_key, param_value, param_type FROM system_parameters")
+        values = {}
+        for row in rows:
+            try:
+                values[row['param_key']] = convert_param_value(row['param_value'], row['param_type'])
+            except ValueError as e:
+                print(f"参数 {row['param_key']} 值转换失败，已跳过: {str(e)}")
+        self._version += 1
+        self._snapshot = ParamSnapshot(values, self._version, watermark)
+        self._checked_at = time.time()
+        self.reloads += 1
+        self.last_error = None
+
+
+_param_cache = None
+_param_cache_lock = threading.Lock()
+
+
+def get_param_cache():
+    """获取全局系统参数缓存"""
+    global _param_cache
+    if _param_cache is None:
+        with _param_cache_lock:
+            if _param_cache is None:
+                _param_cache = ParameterCache()
+    return _param_cache
+
+
+def invalidate_param_cache():
+    """参数修改后调用；缓存尚未创建时无需处理"""
+    if _param_cache is not None:
+        try:
+            _param_cache.invalidate()
+        except Exception as e:
+            print(f"刷新系统参数缓存失败: {str(e)}")
+            traceback.print_exc()
@@ -0,0 +1,519 @@
+"""
+按天预聚合的财务/订单事实表
+收入、支出和订单详情在写入时，由写入方在同一事务中把金额增量累加到事实表
+（INSERT ... ON DUPLICATE KEY UPDATE），修改和删除先扣减旧行再累加新行，
+事实表与明细表始终同时提交或同时回滚。财务和分析页面只读取事实表，
+读取量取决于日期范围和维度组合数，与历史明细的行数无关。
+
+事实表：
+    fact_daily_income   日期 × 城市 × 车型 × 收入来源
+    fact_daily_expense  日期 × 城市 × 车型 × 支出类型 × 支出子类
+    fact_daily_orders   日期 × 城市 × 车型（订单详情）
+
+无法确定的维度记为空字符串。收入和订单详情的城市、车型来自关联订单及其车辆，
+支出的城市来自充电站（其次是车辆运营城市），车型来自车辆。
+约车平台（Booking-Platform，独立进程，同一数据库）写入的充值/优惠券包收入和提现支出
+由其自身在同一会话中按相同的维度规则累加事实表（城市和车型为空字符串），见其 record_income_fact/record_expense_fact。
+首次建表或数据需要修复时执行重建：python -m app.utils.rollups rebuild [--start 日期] [--end 日期]
+"""
+import argparse
+import time
+import traceback
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from app.dao.base_dao import BaseDAO
+
+# 事实表定义：维度列、度量列和建表语句
+FACT_TABLES = {
+    'fact_daily_income': {
+        'dimensions': ('fact_date', 'city_code', 'vehicle_model', 'source'),
+        'measures': ('amount', 'record_count'),
+        'ddl': """
+            CREATE TABLE IF NOT EXISTS fact_daily_income (
+                fact_date DATE NOT NULL COMMENT '收入日期',
+                city_code VARCHAR(50) NOT NULL DEFAULT '' COMMENT '城市',
+                vehicle_model VARCHAR(50) NOT NULL DEFAULT '' COMMENT '车型',
+                source VARCHAR(50) NOT NULL DEFAULT '' COMMENT '收入来源',
+                amount DECIMAL(16,2) NOT NULL DEFAULT 0 COMMENT '收入金额合计',
+                record_count INT NOT NULL DEFAULT 0 COMMENT '收入记录数',
+                PRIMARY KEY (fact_date, city_code, vehicle_model, source)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='每日收入事实表'
+        """
+    },
+    'fact_daily_expense': {
+        'dimensions': ('fact_date', 'city_code', 'vehicle_model', 'expense_type', 'sub_type'),
+        'measures': ('amount', 'record_count'),
+        'ddl': """
+            CREATE TABLE IF NOT EXISTS fact_daily_expense (
+                fact_date DATE NOT NULL COMMENT '支出日期',
+                city_code VARCHAR(50) NOT NULL DEFAULT '' COMMENT '城市',
+                vehicle_model VARCHAR(50) NOT NULL DEFAULT '' COMMENT '车型',
+                expense_type VARCHAR(50) NOT NULL DEFAULT '' COMMENT '支出类型',
+                sub_type VARCHAR(50) NOT NULL DEFAULT '' COMMENT '支出子类',
+                amount DECIMAL(16,2) NOT NULL DEFAULT 0 COMMENT '支出金额合计',
+                record_count INT NOT NULL DEFAULT 0 COMMENT '支出记录数',
+                PRIMARY KEY (fact_date, city_code, vehicle_model, expense_type, sub_type)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='每日支出事实表'
+        """
+    },
+    'fact_daily_orders': {
+        'dimensions': ('fact_date', 'city_code', 'vehicle_model'),
+        'measures': ('order_count', 'amount', 'distance'),
+        'ddl': """
+            CREATE TABLE IF NOT EXISTS fact_daily_orders (
+                fact_date DATE NOT NULL COMMENT '订单详情日期',
+                city_code VARCHAR(50) NOT NULL DEFAULT '' COMMENT '城市',
+                vehicle_model VARCHAR(50) NOT NULL DEFAULT '' COMMENT '车型',
+                order_count INT NOT NULL DEFAULT 0 COMMENT '订单数',
+                amount DECIMAL(16,2) NOT NULL DEFAULT 0 COMMENT '订单金额合计',
+                distance DECIMAL(16,2) NOT NULL DEFAULT 0 COMMENT '行驶距离合计',
+                PRIMARY KEY (fact_date, city_code, vehicle_model)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='每日订单事实表'
+        """
+    }
+}
+
+# 支出子类规则：支出类型 -> ([(子类, 描述关键字, 金额上限)], 默认子类)
+# 按顺序匹配，金额上限不为 None 时金额小于上限即命中，否则描述包含任一关键字即命中
+EXPENSE_SUB_TYPE_RULES = {
+    '车辆支出': ([
+        ('车辆保险', ('保险',), None),
+        ('车辆维护', ('维护', '维修', '保养'), None),
+        ('车辆采购', ('购置', '购买', '采购'), None)
+    ], '其他车辆支出'),
+    '充电站支出': ([
+        ('充电费用', (), 10000),
+        ('充电站维护', ('维护', '维修', '检测'), None),
+        ('充电站建设', ('建设', '建造', '安装'), None)
+    ], '其他充电站支出'),
+    '其他支出': ([
+        ('人力成本', ('人工', '工资', '薪资'), None),
+        ('平台运营', ('平台', '系统', '服务器'), None),
+        ('市场营销', ('营销', '推广', '广告'), None)
+    ], '其他运营支出')
+}
+
+# 重建时每个事务覆盖的天数
+REBUILD_CHUNK_DAYS = 31
+
+
+def classify_expense(expense_type, description, amount):
+    """按 EXPENSE_SUB_TYPE_RULES 计算支出子类，未配置规则的支出类型返回空字符串"""
+    rules = EXPENSE_SUB_TYPE_RULES.get(expense_type)
+    if rules is None:
+        return ''
+    entries, default = rules
+    description = description or ''
+    for sub_type, keywords, amount_below in entries:
+        if amount_below is not None:
+            if amount is not None and float(amount) < amount_below:
+                return sub_type
+        elif any(keyword in description for keyword in keywords):
+            return sub_type
+    return default
+
+
+def _expense_sub_type_sql(alias='e'):
+    """生成与 classify_expense 等价的 SQL CASE 表达式及其参数"""
+    clauses = []
+    params = []
+    for expense_type, (entries, default) in EXPENSE_SUB_TYPE_RULES.items():
+        for sub_type, keywords, amount_below in entries:
+            if amount_below is not None:
+                condition = f"{alias}.amount < %s"
+                condition_params = [amount_below]
+            else:
+                condition = ' OR '.join([f"{alias}.description LIKE %s"] * len(keywords))
+                condition_params = [f"%{keyword}%" for keyword in keywords]
+            clauses.append(f"WHEN {alias}.type = %s AND ({condition}) THEN %s")
+            params.extend([expense_type] + condition_params + [sub_type])
+        clauses.append(f"WHEN {alias}.type = %s THEN %s")
+        params.extend([expense_type, default])
+    return f"CASE {' '.join(clauses)} ELSE '' END", params
+
+
+def _to_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _fetchone(cursor, query, params):
+    """兼容元组游标和字典游标，按SELECT列顺序返回元组"""
+    cursor.execute(query, params)
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return tuple(row.values())
+    return tuple(row)
+
+
+class _DimensionResolver:
+    """在写入方的事务中查找城市和车型，同一批写入内缓存查询结果"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self._orders = {}
+        self._vehicles = {}
+        self._stations = {}
+
+    def order(self, order_ref):
+        """订单引用（订单ID或订单号）-> (城市, 车辆ID)"""
+        if order_ref in (None, ''):
+            return '', None
+        order_ref = str(order_ref)
+        if order_ref not in self._orders:
+            row = None
+            if order_ref.isdigit():
+                row = _fetchone(self.cursor, "SELECT city_code, vehicle_id FROM orders WHERE order_id = %s", (int(order_ref),))
+            if row is None:
+                row = _fetchone(self.cursor, "SELECT city_code, vehicle_id FROM orders WHERE order_number = %s", (order_ref,))
+            self._orders[order_ref] = (row[0] or '', row[1]) if row else ('', None)
+        return self._orders[order_ref]
+
+    def vehicle(self, vehicle_id):
+        """车辆ID -> (车型, 运营城市)"""
+        if vehicle_id in (None, ''):
+            return '', ''
+        if vehicle_id not in self._vehicles:
+            row = _fetchone(self.cursor, "SELECT model, operating_city FROM vehicles WHERE vehicle_id = %s", (vehicle_id,))
+            self._vehicles[vehicle_id] = (row[0] or '', row[1] or '') if row else ('', '')
+        return self._vehicles[vehicle_id]
+
+    def station_city(self, station_id):
+        if station_id in (None, ''):
+            return ''
+        if station_id not in self._stations:
+            row = _fetchone(self.cursor, "SELECT city_code FROM charging_stations WHERE station_id = %s", (station_id,))
+            self._stations[station_id] = (row[0] or '') if row else ''
+        return self._stations[station_id]
+
+
+def _upsert(cursor, table, deltas):
+    """把 {维度元组: [度量增量...]} 累加到事实表
+
+    按维度排序后写入，并发事务以相同顺序锁行，避免热点行上的死锁
+    """
+    if not deltas:
+        return
+    spec = FACT_TABLES[table]
+    columns = spec['dimensions'] + spec['measures']
+    updates = ', '.join(f"{measure} = {measure} + VALUES({measure})" for measure in spec['measures'])
+    query = f"""
+        INSERT INTO {table} ({', '.join(columns)})
+        VALUES ({', '.join(['%s'] * len(columns))})
+        ON DUPLICATE KEY UPDATE {updates}
+    """
+    rows = [key + tuple(values) for key, values in sorted(deltas.items())]
+    cursor.executemany(query, rows)
+
+
+def record_income(cursor, rows, sign=1):
+    """把收入记录累加（sign=-1 时扣减）到 fact_daily_income
+
+    Args:
+        cursor: 写入收入记录的游标，事实表与收入记录在同一事务中提交
+        rows: 收入记录字典列表，包含 date、source、amount，可选 order_id；
+              已知维度时可直接提供 city_code、vehicle_model 省去查询
+        sign: 1 表示新增，-1 表示撤销
+    """
+    resolver = _DimensionResolver(cursor)
+    deltas = defaultdict(lambda: [0.0, 0])
+    for row in rows:
+        fact_date = _to_date(row.get('date'))
+        if fact_date is None or row.get('amount') is None:
+            continue
+        city_code, vehicle_model = row.get('city_code'), row.get('vehicle_model')
+        if city_code is None or vehicle_model is None:
+            order_city, vehicle_id = resolver.order(row.get('order_id'))
+            city_code = order_city if city_code is None else city_code
+            vehicle_model = resolver.vehicle(vehicle_id)[0] if vehicle_model is None else vehicle_model
+        key = (fact_date, city_code or '', vehicle_model or '', row.get('source') or '')
+        deltas[key][0] += sign * float(row['amount'])
+        deltas[key][1] += sign
+    _upsert(cursor, 'fact_daily_income', deltas)
+
+
+def record_expense(cursor, rows, sign=1):
+    """把支出记录累加（sign=-1 时扣减）到 fact_daily_expense
+
+    Args:
+        rows: 支出记录字典列表，包含 date、type、amount、description、vehicle_id、charging_station_id
+    """
+    resolver = _DimensionResolver(cursor)
+    deltas = defaultdict(lambda: [0.0, 0])
+    for row in rows:
+        fact_date = _to_date(row.get('date'))
+        if fact_date is None or row.get('amount') is None:
+            continue
+        vehicle_model, vehicle_city = resolver.vehicle(row.get('vehicle_id'))
+        city_code = resolver.station_city(row.get('charging_station_id')) or vehicle_city
+        expense_type = row.get('type') or ''
+        sub_type = classify_expense(expense_type, row.get('description'), row['amount'])
+        key = (fact_date, city_code, vehicle_model, expense_type, sub_type)
+        deltas[key][0] += sign * float(row['amount'])
+        deltas[key][1] += sign
+    _upsert(cursor, 'fact_daily_expense', deltas)
+
+
+def record_orders(cursor, rows, sign=1):
+    """把订单详情累加（sign=-1 时扣减）到 fact_daily_orders
+
+    Args:
+        rows: 订单详情字典列表，包含 order_id、vehicle_id、amount、distance，
+              date 为订单详情创建日期（缺省为今天），可直接提供 city_code、vehicle_model
+    """
+    resolver = _DimensionResolver(cursor)
+    deltas = defaultdict(lambda: [0, 0.0, 0.0])
+    for row in rows:
+        fact_date = _to_date(row.get('date')) or date.today()
+        city_code, vehicle_model = row.get('city_code'), row.get('vehicle_model')
+        if city_code is None or vehicle_model is None:
+            # 订单详情没有车辆时使用订单上的车辆，与重建时的口径一致
+            order_city, order_vehicle = resolver.order(row.get('order_id'))
+            city_code = order_city if city_code is None else city_code
+            if vehicle_model is None:
+                vehicle_model = resolver.vehicle(row.get('vehicle_id') or order_vehicle)[0]
+        key = (fact_date, city_code or '', vehicle_model or '')
+        deltas[key][0] += sign
+        deltas[key][1] += sign * float(row.get('amount') or 0)
+        deltas[key][2] += sign * float(row.get('distance') or 0)
+    _upsert(cursor, 'fact_daily_orders', deltas)
+
+
+def ensure_rollup_tables():
+    """创建缺失的事实表，返回本次新建的表名列表"""
+    tables = list(FACT_TABLES)
+    existing = {
+        row['name'] for row in BaseDAO.execute_query(f"""
+            SELECT table_name AS name FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name IN ({', '.join(['%s'] * len(tables))})
+        """, tuple(tables))
+    }
+    created = []
+    for table, spec in FACT_TABLES.items():
+        if table not in existing:
+            BaseDAO.execute_update(spec['ddl'])
+            created.append(table)
+    return created
+
+
+# 收入/订单详情关联订单：纯数字引用按订单ID匹配，其余按订单号匹配
+_ORDER_JOIN = """
+    LEFT JOIN orders o1 ON {ref} REGEXP '^[0-9]+$' AND o1.order_id = CAST({ref} AS UNSIGNED)
+    LEFT JOIN orders o2 ON o1.order_id IS NULL AND o2.order_number = {ref} COLLATE utf8mb4_unicode_ci
+    LEFT JOIN vehicles v ON v.vehicle_id = COALESCE(o1.vehicle_id, o2.vehicle_id)
+"""
+
+
+def _rebuild_statements(start_date, end_date):
+    """重建一个日期区间的 (SQL, 参数) 列表"""
+    statements = []
+    for table in FACT_TABLES:
+        statements.append((f"DELETE FROM {table} WHERE fact_date BETWEEN %s AND %s", (start_date, end_date)))
+    statements.append((f"""
+        INSERT INTO fact_daily_income (fact_date, city_code, vehicle_model, source, amount, record_count)
+        SELECT i.date, COALESCE(o1.city_code, o2.city_code, ''), COALESCE(v.model, ''),
+               COALESCE(i.source, ''), SUM(i.amount), COUNT(*)
+        FROM income i
+        {_ORDER_JOIN.format(ref='i.order_id')}
+        WHERE i.date BETWEEN %s AND %s AND i.amount IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """, (start_date, end_date)))
+    sub_type_sql, sub_type_params = _expense_sub_type_sql('e')
+    statements.append((f"""
+        INSERT INTO fact_daily_expense (fact_date, city_code, vehicle_model, expense_type, sub_type, amount, record_count)
+        SELECT e.date, COALESCE(NULLIF(cs.city_code, ''), v.operating_city, ''), COALESCE(v.model, ''),
+               COALESCE(e.type, ''), {sub_type_sql}, SUM(e.amount), COUNT(*)
+        FROM expense e
+        LEFT JOIN vehicles v ON v.vehicle_id = e.vehicle_id
+        LEFT JOIN charging_stations cs ON cs.station_id = e.charging_station_id
+        WHERE e.date BETWEEN %s AND %s AND e.amount IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5
+    """, tuple(sub_type_params) + (start_date, end_date)))
+    statements.append((f"""
+        INSERT INTO fact_daily_orders (fact_date, city_code, vehicle_model, order_count, amount, distance)
+        SELECT DATE(od.created_at), COALESCE(o1.city_code, o2.city_code, ''), COALESCE(dv.model, v.model, ''),
+               COUNT(*), COALESCE(SUM(od.amount), 0), COALESCE(SUM(od.distance), 0)
+        FROM order_details od
+        {_ORDER_JOIN.format(ref='od.order_id')}
+        LEFT JOIN vehicles dv ON dv.vehicle_id = od.vehicle_id
+        WHERE od.created_at >= %s AND od.created_at < %s
+        GROUP BY 1, 2, 3
+    """, (start_date, end_date + timedelta(days=1))))
+    return statements
+
+
+def _source_date_range():
+    """明细表中最早和最晚的日期"""
+    row = BaseDAO.execute_query("""
+        SELECT LEAST(
+                   COALESCE((SELECT MIN(date) FROM income), '9999-12-31'),
+                   COALESCE((SELECT MIN(date) FROM expense), '9999-12-31'),
+                   COALESCE((SELECT DATE(MIN(created_at)) FROM order_details), '9999-12-31')
+               ) AS first_date,
+               GREATEST(
+                   COALESCE((SELECT MAX(date) FROM income), '0001-01-01'),
+                   COALESCE((SELECT MAX(date) FROM expense), '0001-01-01'),
+                   COALESCE((SELECT DATE(MAX(created_at)) FROM order_details), '0001-01-01')
+               ) AS last_date
+    """)[0]
+    first_date, last_date = _to_date(row['first_date']), _to_date(row['last_date'])
+    if first_date is None or last_date is None or first_date > last_date:
+        return None, None
+    return first_date, last_date
+
+
+def rebuild(start_date=None, end_date=None, progress=None, cancelled=None):
+    """从明细表重建事实表
+
+    按 REBUILD_CHUNK_DAYS 天一个事务依次 DELETE + INSERT ... SELECT，
+    每段提交后事实表在该区间内与明细一致。重建期间同一区间的实时写入可能被覆盖，
+    应在业务低峰执行。
+
+    Args:
+        start_date, end_date: 重建区间（含），缺省时取明细表的最早/最晚日期
+        progress: 可选回调 progress(已完成天数, 总天数, 说明)
+        cancelled: 可选回调，返回 True 时在当前分段结束后停止
+
+    Returns:
+        dict: {'start_date', 'end_date', 'days', 'chunks', 'rows', 'elapsed', 'cancelled'}
+    """
+    first_date, last_date = _source_date_range() if start_date is None or end_date is None else (None, None)
+    start_date = _to_date(start_date) or first_date
+    end_date = _to_date(end_date) or last_date
+    result = {'start_date': None, 'end_date': None, 'days': 0, 'chunks': 0, 'rows': 0,
+              'elapsed': 0.0, 'cancelled': False}
+    if start_date is None or end_date is None or start_date > end_date:
+        return result
+    result['start_date'] = start_date.strftime('%Y-%m-%d')
+    result['end_date'] = end_date.strftime('%Y-%m-%d')
+    total_days = (end_date - start_date).days + 1
+    result['days'] = total_days
+
+    started = time.time()
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        if cancelled is not None and cancelled():
+            result['cancelled'] = True
+            break
+        chunk_end = min(chunk_start + timedelta(days=REBUILD_CHUNK_DAYS - 1), end_date)
+        conn = None
+        cursor = None
+        try:
+            conn = BaseDAO.get_connection()
+            conn.start_transaction()
+            cursor = conn.cursor()
+            for query, params in _rebuild_statements(chunk_start, chunk_end):
+                cursor.execute(query, params)
+                if query.lstrip().startswith('INSERT'):
+                    result['rows'] += max(cursor.rowcount, 0)
+            conn.commit()
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            print(f"重建事实表失败 ({chunk_start} ~ {chunk_end}): {str(e)}")
+            traceback.print_exc()
+            raise e
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+        result['chunks'] += 1
+        if progress is not None:
+            done = (chunk_end - start_date).days + 1
+            progress(done, total_days, f"已重建 {result['start_date']} ~ {chunk_end.strftime('%Y-%m-%d')}")
+        chunk_start = chunk_end + timedelta(days=1)
+
+    result['elapsed'] = round(time.time() - started, 2)
+    return result
+
+
+def rebuild_job(job, start_date=None, end_date=None):
+    """后台任务入口：重建事实表"""
+    return rebuild(start_date, end_date, progress=job.progress, cancelled=lambda: job.cancelled)
+
+
+def summarize(table, start_date, end_date, group_by=(), filters=None):
+    """读取事实表并按维度汇总
+
+    Args:
+        table: 事实表名
+        start_date, end_date: 日期区间（含）
+        group_by: 分组维度列，空时返回整体合计
+        filters: 可选的 {维度列: 值} 等值过滤
+
+    Returns:
+        list: 字典列表，包含分组维度和各度量列的合计（金额为 float）
+    """
+    spec = FACT_TABLES[table]
+    group_by = tuple(group_by)
+    for column in group_by + tuple(filters or ()):
+        if column not in spec['dimensions']:
+            raise ValueError(f"{table} 没有维度列 {column}")
+    where = ["fact_date BETWEEN %s AND %s"]
+    params = [_to_date(start_date), _to_date(end_date)]
+    for column, value in (filters or {}).items():
+        where.append(f"{column} = %s")
+        params.append(value)
+    measures = ', '.join(f"COALESCE(SUM({measure}), 0) AS {measure}" for measure in spec['measures'])
+    query = f"SELECT {', '.join(group_by + (measures,))} FROM {table} WHERE {' AND '.join(where)}"
+    if group_by:
+        query += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
+    rows = BaseDAO.execute_query(query, tuple(params))
+    for row in rows:
+        for measure in spec['measures']:
+            row[measure] = float(row[measure] or 0)
+    return rows
+
+
+def daily_series(table, start_date, end_date, measure='amount', filters=None):
+    """按天返回度量序列 {date: 值}，没有数据的日期为 0"""
+    start_date, end_date = _to_date(start_date), _to_date(end_date)
+    values = {row['fact_date']: row[measure] for row in summarize(table, start_date, end_date, ('fact_date',), filters)}
+    series = {}
+    current = start_date
+    while current <= end_date:
+        series[current] = values.get(current, 0.0)
+        current += timedelta(days=1)
+    return series
+
+
+def main():
+    """事实表维护命令：python -m app.utils.rollups rebuild [--start 2024-01-01] [--end 2024-12-31]"""
+    parser = argparse.ArgumentParser(description='维护财务/订单事实表')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('init', help='创建缺失的事实表')
+    rebuild_parser = subparsers.add_parser('rebuild', help='从明细表重建事实表')
+    rebuild_parser.add_argument('--start', help='开始日期 YYYY-MM-DD，缺省为明细中的最早日期')
+    rebuild_parser.add_argument('--end', help='结束日期 YYYY-MM-DD，缺省为明细中的最晚日期')
+    args = parser.parse_args()
+
+    try:
+        created = ensure_rollup_tables()
+        if created:
+            print(f"已创建事实表: {', '.join(created)}")
+        if args.command == 'rebuild':
+            def report(done, total, message):
+                print(f"[{done}/{total}] {message}")
+
+            result = rebuild(args.start, args.end, progress=report)
+            if result['start_date'] is None:
+                print("明细表中没有需要重建的数据")
+            else:
+                print(f"完成：{result['start_date']} ~ {result['end_date']}，{result['chunks']} 个分段，"
+                      f"写入 {result['rows']} 行，用时 {result['elapsed']} 秒")
+    except Exception as e:
+        print(f"维护事实表失败: {str(e)}")
+        traceback.print_exc()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""
+避障路径规划
+在障碍物占用栅格（app.utils.obstacle_index）上为车辆规划折线路线：
+
+1. 起终点连线不与任何障碍物相交时直接返回直线；
+2. 否则在按 ROUTING_CELL_SIZE 合并的粗粒度栅格上做 8 邻域 A*（octile 启发函数，禁止斜穿障碍物拐角），
+   起终点落在阻塞格中时吸附到最近的空闲格；
+3. 对格子中心路径做拉直：用精确的线段碰撞检测尽量跳过中间点，得到少量拐点的折线。
+   找不到路径时退回直线，并在结果中标记 reachable=False。
+
+路线按 (城市, 障碍物版本, 起点粗格, 终点粗格) 缓存在 LRU 中，命中时只替换首尾端点并复核首尾两段。
+一批调度结果的路线通过 route_many() 在进程池中并行规划（少量路线直接在本进程计算）。
+
+路线结果为字典：
+    waypoints: [(x, y), ...]  含起点和终点
+    distance: 折线总长度
+    reachable: 是否找到避障路线
+    direct: 是否为直线
+"""
+import heapq
+import math
+import multiprocessing
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from app.utils.obstacle_index import GRID_SIZE, CityObstacleGrid, get_obstacle_index, normalize_city
+
+# 寻路栅格边长（坐标单位），1000×1000 的占用栅格合并为 200×200 个寻路格
+ROUTING_CELL_SIZE = 5
+# 起终点吸附到空闲格的最大搜索半径（寻路格）
+SNAP_MAX_RADIUS = 20
+# 路线缓存容量
+ROUTE_CACHE_SIZE = 4096
+# 批量规划时未命中缓存的路线达到该数量才使用进程池
+BULK_ROUTE_MIN_PAIRS = 32
+# 进程池每个任务包含的路线数
+BULK_ROUTE_CHUNK = 64
+# 进程池大小
+BULK_ROUTE_WORKERS = 2
+
+_SQRT2 = math.sqrt(2)
+_OCTILE_SAVING = 2 - _SQRT2
+_DIRECTIONS = (
+    (1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+    (1, 1, _SQRT2), (1, -1, _SQRT2), (-1, 1, _SQRT2), (-1, -1, _SQRT2)
+)
+
+
+def polyline_length(waypoints):
+    """折线总长度"""
+    return sum(math.hypot(x2 - x1, y2 - y1) for (x1, y1), (x2, y2) in zip(waypoints[:-1], waypoints[1:]))
+
+
+def _make_route(waypoints, reachable=True, direct=False):
+    return {
+        'waypoints': waypoints,
+        'distance': polyline_length(waypoints),
+        'reachable': reachable,
+        'direct': direct
+    }
+
+
+def plan_route(grid, x1, y1, x2, y2, cell_size=ROUTING_CELL_SIZE):
+    """在城市占用栅格上规划一条从 (x1, y1) 到 (x2, y2) 的路线
+
+    Args:
+        grid: CityObstacleGrid，为 None 时直接返回直线
+
+    Returns:
+        dict: 路线
+    """
+    start, goal = (float(x1), float(y1)), (float(x2), float(y2))
+    if grid is None or not grid.shapes or not grid.segment_blocked(x1, y1, x2, y2):
+        return _make_route([start, goal], direct=True)
+
+    blocked, side = grid.coarse_blocked(cell_size)
+    source = _snap(blocked, side, _coarse_index(start, cell_size, side))
+    target = _snap(blocked, side, _coarse_index(goal, cell_size, side))
+    if source is None or target is None:
+        return _make_route([start, goal], reachable=False, direct=True)
+
+    cells = _astar(blocked, side, source, target)
+    if cells is None:
+        return _make_route([start, goal], reachable=False, direct=True)
+
+    centers = [((index // side + 0.5) * cell_size, (index % side + 0.5) * cell_size) for index in cells]
+    return _make_route(_smooth(grid, [start] + centers + [goal]))
+
+
+def _coarse_index(point, cell_size, side):
+    cell_x = min(max(int(point[0] // cell_size), 0), side - 1)
+    cell_y = min(max(int(point[1] // cell_size), 0), side - 1)
+    return cell_x * side + cell_y
+
+
+def _snap(blocked, side, index):
+    """阻塞格吸附到切比雪夫距离最近的空闲格"""
+    if not blocked[index]:
+        return index
+    cell_x, cell_y = divmod(index, side)
+    for radius in range(1, SNAP_MAX_RADIUS + 1):
+        best = None
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                if max(abs(dx), abs(dy)) != radius:
+                    continue
+                nx, ny = cell_x + dx, cell_y + dy
+                if 0 <= nx < side and 0 <= ny < side and not blocked[nx * side + ny]:
+                    distance = dx * dx + dy * dy
+                    if best is None or distance < best[0]:
+                        best = (distance, nx * side + ny)
+        if best is not None:
+            return best[1]
+    return None
+
+
+def _astar(blocked, side, source, target):
+    """8 邻域 A*，octile 启发函数；返回格子序号列表（含起终点），不可达时返回 None"""
+    if source == target:
+        return [source]
+    target_x, target_y = divmod(target, side)
+    size = side * side
+    g_score = [math.inf] * size
+    came_from = [-1] * size
+    closed = bytearray(size)
+    g_score[source] = 0.0
+    open_heap = [(0.0, source)]
+    while open_heap:
+        _, current = heapq.heappop(open_heap)
+        if closed[current]:
+            continue
+        if current == target:
+            path = [current]
+            while current != source:
+                current = came_from[current]
+                path.append(current)
+            path.reverse()
+            return path
+        closed[current] = 1
+        cost = g_score[current]
+        cell_x, cell_y = divmod(current, side)
+        for dx, dy, step in _DIRECTIONS:
+            nx, ny = cell_x + dx, cell_y + dy
+            if nx < 0 or ny < 0 or nx >= side or ny >= side:
+                continue
+            neighbor = nx * side + ny
+            if blocked[neighbor] or closed[neighbor]:
+                continue
+            # 斜向移动要求两个相邻的正交格都空闲，避免穿过障碍物拐角
+            if dx and dy and (blocked[current + dy] or blocked[neighbor - dy]):
+                continue
+            tentative = cost + step
+            if tentative < g_score[neighbor]:
+                g_score[neighbor] = tentative
+                came_from[neighbor] = current
+                hx = nx - target_x if nx > target_x else target_x - nx
+                hy = ny - target_y if ny > target_y else target_y - ny
+                heuristic = hx + hy - _OCTILE_SAVING * (hx if hx < hy else hy)
+                # 启发值略微放大，等价路径中优先扩展离终点近的节点
+                heapq.heappush(open_heap, (tentative + heuristic * 1.001, neighbor))
+    return None
+
+
+def _smooth(grid, points):
+    """拉直路径：从当前拐点出发尽量连到更远的点"""
+    waypoints = [points[0]]
+    anchor = 0
+    last = len(points) - 1
+    while anchor < last:
+        reach = anchor + 1
+        while reach < last and not grid.segment_blocked(*points[anchor], *points[reach + 1]):
+            reach += 1
+        waypoints.append(points[reach])
+        anchor = reach
+    return waypoints
+
+
+class RoutingEngine:
+    """带 LRU 缓存的路径规划服务"""
+
+    def __init__(self, cache_size=ROUTE_CACHE_SIZE, cell_size=ROUTING_CELL_SIZE):
+        self.cache_size = cache_size
+        self.cell_size = cell_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+        # 运行指标
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.routes_planned = 0
+        self.planning_time = 0.0
+        self.bulk_batches = 0
+        self.bulk_routes = 0
+
+    def route(self, city_code, x1, y1, x2, y2):
+        """规划单条路线（优先使用缓存）"""
+        grid = self._grid(city_code)
+        key = self._cache_key(city_code, grid, x1, y1, x2, y2)
+        cached = self._cache_get(key)
+        if cached is not None:
+            adapted = self._adapt(grid, cached, x1, y1, x2, y2)
+            if adapted is not None:
+                return adapted
+        started = time.time()
+        route = plan_route(grid, x1, y1, x2, y2, self.cell_size)
+        self._record_planning(1, time.time() - started)
+        self._cache_put(key, route)
+        return route
+
+    def route_many(self, city_code, pairs):
+        """批量规划同一城市的多条路线
+
+        Args:
+            pairs: [(x1, y1, x2, y2), ...]
+
+        Returns:
+            list: 与 pairs 顺序一致的路线列表
+        """
+        grid = self._grid(city_code)
+        results = [None] * len(pairs)
+        misses = []
+        for index, (x1, y1, x2, y2) in enumerate(pairs):
+            key = self._cache_key(city_code, grid, x1, y1, x2, y2)
+            cached = self._cache_get(key)
+            adapted = self._adapt(grid, cached, x1, y1, x2, y2) if cached is not None else None
+            if adapted is not None:
+                results[index] = adapted
+            else:
+                misses.append((index, key))
+        if not misses:
+            return results
+
+        started = time.time()
+        miss_pairs = [tuple(float(value) for value in pairs[index]) for index, _ in misses]
+        planned = None
+        if grid is not None and grid.shapes and len(miss_pairs) >= BULK_ROUTE_MIN_PAIRS:
+            try:
+                planned = self._plan_in_pool(grid, miss_pairs)
+                self.bulk_batches += 1
+                self.bulk_routes += len(miss_pairs)
+            except Exception as e:
+                print(f"进程池批量规划路线失败，改为本进程计算: {e}")
+                traceback.print_exc()
+                self._reset_pool()
+        if planned is None:
+            planned = [plan_route(grid, *pair, cell_size=self.cell_size) for pair in miss_pairs]
+        self._record_planning(len(miss_pairs), time.time() - started)
+
+        for (index, key), route in zip(misses, planned):
+            results[index] = route
+            self._cache_put(key, route)
+        return results
+
+    def route_distance(self, city_code, x1, y1, x2, y2):
+        """路线距离，规划失败时返回直线距离"""
+        try:
+            return self.route(city_code, x1, y1, x2, y2)['distance']
+        except Exception as e:
+            print(f"规划路线失败，使用直线距离: {e}")
+            traceback.print_exc()
+            return math.hypot(float(x2) - float(x1), float(y2) - float(y1))
+
+    def estimate_eta(self, city_code, x1, y1, x2, y2, speed):
+        """按路线距离估算到达时间（与 speed 的时间单位一致），速度无效时返回无穷大"""
+        if not speed or speed <= 0:
+            return math.inf
+        return self.route_distance(city_code, x1, y1, x2, y2) / speed
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_metrics(self):
+        with self._lock:
+            cached = len(self._cache)
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            'cached_routes': cached,
+            'cache_size': self.cache_size,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'hit_rate': round(self.cache_hits / lookups, 4) if lookups else 0,
+            'routes_planned': self.routes_planned,
+            'avg_planning_ms': round(self.planning_time / self.routes_planned * 1000, 3)
+            if self.routes_planned else 0,
+            'bulk_batches': self.bulk_batches,
+            'bulk_routes': self.bulk_routes,
+            'cell_size': self.cell_size
+        }
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _grid(city_code):
+        if not city_code:
+            return None
+        return get_obstacle_index().get_city_grid(city_code)
+
+    def _cache_key(self, city_code, grid, x1, y1, x2, y2):
+        """缓存键使用规范化的城市名（与障碍物索引一致），拼音和中文城市名共用同一份缓存"""
+        def cell(value):
+            return min(max(int(float(value) // self.cell_size), 0), GRID_SIZE // self.cell_size)
+        return (normalize_city(city_code), grid.version if grid is not None else 0, cell(x1), cell(y1), cell(x2), cell(y2))
+
+    def _cache_get(self, key):
+        with self._lock:
+            route = self._cache.get(key)
+            if route is None:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return route
+
+    def _cache_put(self, key, route):
+        with self._lock:
+            self._cache[key] = route
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _adapt(grid, cached, x1, y1, x2, y2):
+        """把缓存路线的首尾端点替换为实际起终点，首尾两段被障碍物阻挡时返回 None"""
+        start, goal = (float(x1), float(y1)), (float(x2), float(y2))
+        interior = cached['waypoints'][1:-1]
+        waypoints = [start] + interior + [goal]
+        if grid is not None and grid.shapes and cached['reachable']:
+            if grid.segment_blocked(*start, *waypoints[1]):
+                return None
+            if interior and grid.segment_blocked(*waypoints[-2], *goal):
+                return None
+        route = _make_route(waypoints, cached['reachable'], cached['direct'])
+        return route
+
+    def _record_planning(self, count, duration):
+        with self._lock:
+            self.routes_planned += count
+            self.planning_time += duration
+
+    def _plan_in_pool(self, grid, pairs):
+        pool = self._get_pool()
+        chunks = [pairs[index:index + BULK_ROUTE_CHUNK] for index in range(0, len(pairs), BULK_ROUTE_CHUNK)]
+        futures = [
+            pool.submit(_plan_routes_worker, grid.city_code, grid.version, grid.source, chunk, self.cell_size)
+            for chunk in chunks
+        ]
+        planned = []
+        for future in futures:
+            planned.extend(future.result())
+        return planned
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # 使用 spawn 启动子进程，避免 fork 复制 Web 进程中的线程锁和数据库连接
+                self._pool = ProcessPoolExecutor(
+                    max_workers=BULK_ROUTE_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def _reset_pool(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# 子进程中按 (城市, 版本) 缓存编译好的占用栅格
+_worker_grids = {}
+
+
+def _plan_routes_worker(city_code, version, obstacles, pairs, cell_size):
+    """进程池任务：在子进程中编译（或复用）城市占用栅格并规划一组路线"""
+    grid = _worker_grids.get(city_code)
+    if grid is None or grid.version != version:
+        grid = CityObstacleGrid(city_code, obstacles, version)
+        _worker_grids[city_code] = grid
+    return [plan_route(grid, *pair, cell_size=cell_size) for pair in pairs]
+
+
+_routing_engine = None
+_routing_engine_lock = threading.Lock()
+
+
+def get_routing_engine():
+    """获取全局路径规划服务"""
+    global _routing_engine
+    if _routing_engine is None:
+        with _routing_engine_lock:
+            if _routing_engine is None:
+                _routing_engine = RoutingEngine()
+    return _routing_engine
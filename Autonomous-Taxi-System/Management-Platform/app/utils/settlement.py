@@ -0,0 +1,262 @@
+"""
+订单结算流水线
+行程结束时仿真引擎只把 (订单ID, 到达时间) 放入队列，由后台线程按微批调用
+OrderDAO.settle_completed_orders，在一个事务内完成整批订单的状态、车辆统计、优惠券、
+支付、收入、订单详情和信用积分写入，优惠券和用户信息按批量一次读取。
+
+幂等：队列中和最近已处理的订单ID会被去重，数据库侧以订单状态加行锁判断，
+已完成的订单不会被重复结算。整批失败时逐单重试以隔离出错的订单，
+仍失败的订单在后续批次中重试，超过 MAX_ATTEMPTS 次后移入放弃列表（在运行指标中列出），
+后台线程每隔 RECONCILE_INTERVAL 秒把放弃列表中的订单重新入队，也可以通过接口立即重试。
+"""
+import atexit
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+
+# 队列检查间隔（秒）
+SETTLEMENT_INTERVAL = 0.5
+# 单个事务最多结算的订单数
+SETTLEMENT_BATCH_SIZE = 100
+# 单个订单最多尝试结算的次数
+MAX_ATTEMPTS = 3
+# 用于去重的最近已处理订单数
+RECENT_HISTORY_SIZE = 10000
+# 吞吐量统计窗口（秒）
+THROUGHPUT_WINDOW = 60
+# 放弃结算的订单重新入队的间隔（秒）
+RECONCILE_INTERVAL = 300
+# 运行指标中最多列出的放弃订单数
+DROPPED_REPORT_LIMIT = 100
+
+
+class SettlementPipeline(threading.Thread):
+    """订单结算流水线"""
+
+    def __init__(self, interval=SETTLEMENT_INTERVAL, batch_size=SETTLEMENT_BATCH_SIZE,
+                 reconcile_interval=RECONCILE_INTERVAL):
+        super().__init__(name='order-settlement', daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reconcile_interval = reconcile_interval
+        self._pending = OrderedDict()         # 订单ID -> 到达时间
+        self._attempts = {}                   # 订单ID -> 已失败次数
+        self._recent = OrderedDict()          # 最近已处理的订单ID
+        self._dropped = OrderedDict()         # 订单ID -> (到达时间, 最后一次错误)，重试次数用尽的订单
+        self._lock = threading.Lock()         # 保护 _pending / _attempts / _recent / _dropped
+        self._flush_lock = threading.Lock()   # 同一时刻只有一个线程在结算
+        self._wakeup = threading.Event()
+        self._shutdown = threading.Event()
+        self._window = deque()                # (完成时间, 结算订单数)，用于计算吞吐量
+
+        # 运行指标
+        self.submitted = 0
+        self.duplicates = 0
+        self.settled = 0
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.requeued = 0
+        self.batch_count = 0
+        self.batch_failures = 0
+        self.last_batch_size = 0
+        self.last_batch_duration = 0.0
+        self.max_batch_duration = 0.0
+        self.total_batch_duration = 0.0
+
+    def submit(self, order_id, arrival_time):
+        """提交一个到达终点的订单
+
+        Returns:
+            bool: 是否加入队列（已在队列中或最近已处理时返回 False）
+        """
+        with self._lock:
+            if order_id in self._pending or order_id in self._recent:
+                self.duplicates += 1
+                return False
+            self._dropped.pop(order_id, None)
+            self._pending[order_id] = arrival_time
+            self.submitted += 1
+            backlog = len(self._pending)
+        if backlog >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def flush(self):
+        """结算调用时队列中的全部订单（本次失败后重新入队的订单留到下一次）
+
+        Returns:
+            int: 处理的订单数
+        """
+        processed = 0
+        with self._flush_lock:
+            with self._lock:
+                remaining = len(self._pending)
+            while remaining > 0:
+                with self._lock:
+                    batch = []
+                    while self._pending and len(batch) < min(self.batch_size, remaining):
+                        batch.append(self._pending.popitem(last=False))
+                if not batch:
+                    break
+                remaining -= len(batch)
+                self._settle(batch)
+                processed += len(batch)
+        return processed
+
+    def retry_dropped(self):
+        """把重试次数用尽的订单重新放入队列（重试次数清零）
+
+        Returns:
+            int: 重新入队的订单数
+        """
+        with self._lock:
+            dropped = list(self._dropped.items())
+            self._dropped.clear()
+            for order_id, (arrival_time, _) in dropped:
+                self._attempts.pop(order_id, None)
+                self._pending.setdefault(order_id, arrival_time)
+            self.requeued += len(dropped)
+        if dropped:
+            print(f"{len(dropped)} 个放弃结算的订单已重新入队")
+            self._wakeup.set()
+        return len(dropped)
+
+    def get_dropped(self, limit=DROPPED_REPORT_LIMIT):
+        """重试次数用尽、等待重新入队的订单 [{'order_id', 'arrival_time', 'error'}]"""
+        with self._lock:
+            dropped = list(self._dropped.items())[:limit]
+        return [{'order_id': order_id, 'arrival_time': str(arrival_time), 'error': error}
+                for order_id, (arrival_time, error) in dropped]
+
+    def get_metrics(self):
+        """流水线运行指标"""
+        with self._lock:
+            pending = len(self._pending)
+            retrying = len(self._attempts)
+            dropped_ids = list(self._dropped)[:DROPPED_REPORT_LIMIT]
+            dropped = len(self._dropped)
+            now = time.monotonic()
+            while self._window and now - self._window[0][0] > THROUGHPUT_WINDOW:
+                self._window.popleft()
+            window_settled = sum(count for _, count in self._window)
+        return {
+            'pending_orders': pending,
+            'retrying_orders': retrying,
+            'submitted': self.submitted,
+            'duplicates': self.duplicates,
+            'settled': self.settled,
+            'completed_without_settlement': self.completed,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'dropped_orders': dropped,
+            'dropped_order_ids': dropped_ids,
+            'requeued': self.requeued,
+            'reconcile_interval': self.reconcile_interval,
+            'batch_count': self.batch_count,
+            'batch_failures': self.batch_failures,
+            'last_batch_size': self.last_batch_size,
+            'last_batch_ms': round(self.last_batch_duration * 1000, 3),
+            'max_batch_ms': round(self.max_batch_duration * 1000, 3),
+            'avg_batch_ms': round(self.total_batch_duration * 1000 / self.batch_count, 3) if self.batch_count else 0.0,
+            'settlements_per_sec': round(window_settled / THROUGHPUT_WINDOW, 3),
+            'settlements_per_batch_sec': round(self.settled / self.total_batch_duration, 1) if self.total_batch_duration else 0.0,
+            'batch_size': self.batch_size,
+            'interval': self.interval
+        }
+
+    def shutdown(self):
+        """停止后台线程并结算剩余订单"""
+        self._shutdown.set()
+        self._wakeup.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"结算剩余订单出错: {e}")
+
+    def run(self):
+        last_reconcile = time.monotonic()
+        while not self._shutdown.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                if time.monotonic() - last_reconcile >= self.reconcile_interval:
+                    last_reconcile = time.monotonic()
+                    self.retry_dropped()
+                self.flush()
+            except Exception as e:
+                print(f"订单结算流水线出错: {e}")
+                traceback.print_exc()
+
+    def _settle(self, batch):
+        from app.dao.order_dao import OrderDAO
+
+        started = time.monotonic()
+        results = []
+        try:
+            results.append(OrderDAO.settle_completed_orders(batch))
+        except Exception as e:
+            # 整批回滚后逐单结算，隔离出错的订单
+            self.batch_failures += 1
+            print(f"批量结算 {len(batch)} 个订单失败，改为逐单结算: {e}")
+            for order_id, arrival_time in batch:
+                try:
+                    results.append(OrderDAO.settle_completed_orders([(order_id, arrival_time)]))
+                except Exception as order_error:
+                    self._retry_later(order_id, arrival_time, order_error)
+        duration = time.monotonic() - started
+
+        settled = sum(len(result['settled']) for result in results)
+        with self._lock:
+            for result in results:
+                for order_id in result['settled'] + result['completed']:
+                    self._remember(order_id)
+                for skipped in result['skipped']:
+                    self._remember(skipped['order_id'])
+            self._window.append((time.monotonic(), settled))
+        self.settled += settled
+        self.completed += sum(len(result['completed']) for result in results)
+        self.skipped += sum(len(result['skipped']) for result in results)
+        self.batch_count += 1
+        self.last_batch_size = len(batch)
+        self.last_batch_duration = duration
+        self.max_batch_duration = max(self.max_batch_duration, duration)
+        self.total_batch_duration += duration
+
+    def _remember(self, order_id):
+        """记录已处理的订单用于去重（调用方持有 _lock）"""
+        self._attempts.pop(order_id, None)
+        self._dropped.pop(order_id, None)
+        self._recent[order_id] = True
+        while len(self._recent) > RECENT_HISTORY_SIZE:
+            self._recent.popitem(last=False)
+
+    def _retry_later(self, order_id, arrival_time, error):
+        with self._lock:
+            attempts = self._attempts.get(order_id, 0) + 1
+            if attempts >= MAX_ATTEMPTS:
+                self._attempts.pop(order_id, None)
+                self._dropped[order_id] = (arrival_time, str(error))
+                self.failed += 1
+                print(f"订单 {order_id} 结算失败 {attempts} 次，暂时放弃，{self.reconcile_interval} 秒后重新入队: {error}")
+                return
+            self._attempts[order_id] = attempts
+            self._pending.setdefault(order_id, arrival_time)
+        print(f"订单 {order_id} 结算失败（第 {attempts} 次），稍后重试: {error}")
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_settlement_pipeline():
+    """获取全局订单结算流水线（首次调用时启动后台线程）"""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = SettlementPipeline()
+                _pipeline.start()
+                atexit.register(_pipeline.shutdown)
+    return _pipeline
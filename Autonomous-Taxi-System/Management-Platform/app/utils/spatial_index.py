@@ -0,0 +1,241 @@
+"""
+空间网格索引
+城市坐标范围为 0-999，按固定大小的方格划分，每个方格保存落在其中的对象ID。
+最近邻查询从查询点所在方格开始逐圈向外扩展，找到足够的结果且下一圈不可能更近时停止，
+半径查询只扫描与圆相交的方格，不再需要在数据库中对全表计算 SQRT(POWER(...)) 再排序。
+
+对象按分区键（例如 (城市, 状态)）分别建格，查询时指定需要的分区。
+GridIndex 本身不加锁，由持有它的对象（车队状态存储、充电站索引）负责并发控制。
+"""
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+
+from app.dao.base_dao import BaseDAO
+
+# 方格边长（坐标单位）
+CELL_SIZE = 50
+# 坐标范围上限
+COORDINATE_MAX = 999
+# 充电站索引刷新间隔（秒），充电站位置很少变化
+STATION_INDEX_TTL = 300
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class GridIndex:
+    """按分区键划分的均匀网格索引"""
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.max_ring = int(math.ceil((COORDINATE_MAX + 1) / cell_size))
+        self._cells = defaultdict(set)      # (分区键, 格X, 格Y) -> 对象ID集合
+        self._counts = defaultdict(int)     # 分区键 -> 对象数量
+        self._items = {}                    # 对象ID -> (分区键, x, y, 格X, 格Y)
+
+    def __len__(self):
+        return len(self._items)
+
+    def keys(self):
+        """当前非空的分区键"""
+        return [key for key, count in self._counts.items() if count > 0]
+
+    def position(self, item_id):
+        """对象的 (分区键, x, y)，不存在时返回None"""
+        item = self._items.get(item_id)
+        return item[:3] if item else None
+
+    def upsert(self, item_id, key, x, y):
+        """插入或移动对象；坐标无效时从索引中移除"""
+        x, y = _to_float(x), _to_float(y)
+        if x is None or y is None:
+            self.remove(item_id)
+            return
+        cell_x, cell_y = self._cell(x), self._cell(y)
+        old = self._items.get(item_id)
+        if old is not None:
+            old_key, _, _, old_cell_x, old_cell_y = old
+            if old_key == key and old_cell_x == cell_x and old_cell_y == cell_y:
+                self._items[item_id] = (key, x, y, cell_x, cell_y)
+                return
+            self.remove(item_id)
+        self._cells[(key, cell_x, cell_y)].add(item_id)
+        self._counts[key] += 1
+        self._items[item_id] = (key, x, y, cell_x, cell_y)
+
+    def remove(self, item_id):
+        """从索引中移除对象"""
+        old = self._items.pop(item_id, None)
+        if old is None:
+            return
+        key, _, _, cell_x, cell_y = old
+        cell = self._cells.get((key, cell_x, cell_y))
+        if cell is not None:
+            cell.discard(item_id)
+            if not cell:
+                del self._cells[(key, cell_x, cell_y)]
+        self._counts[key] -= 1
+
+    def nearest(self, keys, x, y, k=1, max_distance=None, predicate=None):
+        """k 近邻查询
+
+        Args:
+            keys: 要查询的分区键列表
+            x, y: 查询点坐标
+            k: 返回数量，与第 k 个结果距离相同的对象也一并返回
+            max_distance: 最大距离，None 表示不限
+            predicate: 可选的过滤函数，参数为对象ID
+
+        Returns:
+            list: 按距离升序排列的 (距离, 对象ID) 列表
+        """
+        keys = [key for key in keys if self._counts.get(key, 0) > 0]
+        if not keys or k <= 0:
+            return []
+        total = sum(self._counts[key] for key in keys)
+        center_x, center_y = self._cell(x), self._cell(y)
+        best = []            # 大顶堆，保存 (-距离, 对象ID)
+        visited = 0
+        for ring in range(self.max_ring + 1):
+            for cell_x, cell_y in self._ring_cells(center_x, center_y, ring):
+                for key in keys:
+                    cell = self._cells.get((key, cell_x, cell_y))
+                    if not cell:
+                        continue
+                    visited += len(cell)
+                    for item_id in cell:
+                        _, item_x, item_y, _, _ = self._items[item_id]
+                        distance = math.hypot(item_x - x, item_y - y)
+                        if max_distance is not None and distance > max_distance:
+                            continue
+                        if predicate is not None and not predicate(item_id):
+                            continue
+                        heapq.heappush(best, (-distance, item_id))
+            # 保留前 k 个及与第 k 个距离相同的结果
+            if len(best) > k:
+                ordered = sorted(best, reverse=True)
+                kth = -ordered[k - 1][0]
+                best = [entry for entry in ordered if -entry[0] <= kth]
+                heapq.heapify(best)
+            # 未扫描的方格距离查询点至少 ring * cell_size
+            reach = ring * self.cell_size
+            if visited >= total:
+                break
+            if max_distance is not None and reach > max_distance:
+                break
+            if len(best) >= k and -best[0][0] <= reach:
+                break
+        return sorted((-negative, item_id) for negative, item_id in best)
+
+    def within(self, keys, x, y, radius, predicate=None):
+        """半径查询，返回按距离升序排列的 (距离, 对象ID) 列表"""
+        keys = [key for key in keys if self._counts.get(key, 0) > 0]
+        if not keys:
+            return []
+        results = []
+        for cell_x in range(self._cell(x - radius), self._cell(x + radius) + 1):
+            for cell_y in range(self._cell(y - radius), self._cell(y + radius) + 1):
+                for key in keys:
+                    for item_id in self._cells.get((key, cell_x, cell_y), ()):
+                        _, item_x, item_y, _, _ = self._items[item_id]
+                        distance = math.hypot(item_x - x, item_y - y)
+                        if distance <= radius and (predicate is None or predicate(item_id)):
+                            results.append((distance, item_id))
+        results.sort()
+        return results
+
+    def _cell(self, value):
+        return int(min(max(value, 0), COORDINATE_MAX) // self.cell_size)
+
+    def _ring_cells(self, center_x, center_y, ring):
+        """与中心方格切比雪夫距离恰为 ring 的所有方格（含越界方格，查询时自然为空）"""
+        if ring == 0:
+            yield center_x, center_y
+            return
+        for offset in range(-ring, ring + 1):
+            yield center_x + offset, center_y - ring
+            yield center_x + offset, center_y + ring
+        for offset in range(-ring + 1, ring):
+            yield center_x - ring, center_y + offset
+            yield center_x + ring, center_y + offset
+
+
+class ChargingStationIndex:
+    """充电站空间索引，按城市分区；充电站坐标基本不变，按TTL整体刷新"""
+
+    def __init__(self, ttl=STATION_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._grid = GridIndex()
+        self._stations = {}         # (城市, 充电站编号) -> 充电站基本信息
+        self._loaded_at = 0.0
+
+    def invalidate(self):
+        """充电站新增或修改后调用，下次查询时重新加载"""
+        self._loaded_at = 0.0
+
+    def nearest_stations(self, city_code, x, y, k=None):
+        """按距离升序返回城市内的充电站（附带 distance 字段）"""
+        self._ensure_loaded()
+        with self._lock:
+            if k is None:
+                k = len(self._grid)
+            results = self._grid.nearest([city_code], float(x), float(y), k=k)
+            stations = []
+            for distance, item_id in results:
+                station = dict(self._stations[item_id])
+                station['distance'] = distance
+                stations.append(station)
+            return stations
+
+    def get_station(self, city_code, station_code):
+        """按编号获取充电站基本信息副本，不存在时返回 None"""
+        self._ensure_loaded()
+        with self._lock:
+            station = self._stations.get((city_code, station_code))
+            return dict(station) if station is not None else None
+
+    def city_stations(self, city_code):
+        """城市内全部充电站基本信息副本"""
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(station) for (city, _), station in self._stations.items() if city == city_code]
+
+    def _ensure_loaded(self):
+        if time.time() - self._loaded_at <= self.ttl:
+            return
+        rows = BaseDAO.execute_query("""
+            SELECT station_id, station_code, city_code, location_x, location_y, max_capacity
+            FROM charging_stations
+        """)
+        grid = GridIndex()
+        stations = {}
+        for row in rows:
+            item_id = (row['city_code'], row['station_code'])
+            stations[item_id] = row
+            grid.upsert(item_id, row['city_code'], row['location_x'], row['location_y'])
+        with self._lock:
+            self._grid = grid
+            self._stations = stations
+            self._loaded_at = time.time()
+
+
+_station_index = None
+_station_index_lock = threading.Lock()
+
+
+def get_station_index():
+    """获取全局充电站空间索引"""
+    global _station_index
+    if _station_index is None:
+        with _station_index_lock:
+            if _station_index is None:
+                _station_index = ChargingStationIndex()
+    return _station_index
@@ -0,0 +1,165 @@
+"""
+车辆遥测写缓冲
+行驶途中的位置/电量上报不再逐条 UPDATE，而是先写入内存缓冲，每辆车只保留最新一条，
+由后台线程按固定节奏把整个车队合并成一条 CASE 批量 UPDATE 写入数据库。
+
+车辆发生状态变更（到达、电量耗尽、开始充电等）时，VehicleDAO 会先同步刷新该车的缓冲记录，
+保证数据库中的位置和电量与状态变更的先后顺序一致。
+"""
+import atexit
+import threading
+import time
+import traceback
+
+# 缓冲刷新间隔（秒）
+FLUSH_INTERVAL = 1.0
+# 单条批量 UPDATE 最多包含的车辆数
+FLUSH_CHUNK_SIZE = 500
+
+
+class VehicleTelemetryBuffer(threading.Thread):
+    """车辆位置/电量写缓冲"""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        super().__init__(name='vehicle-telemetry-buffer', daemon=True)
+        self.flush_interval = flush_interval
+        self._pending = {}                    # 车辆ID -> 最新遥测记录
+        self._lock = threading.Lock()         # 保护 _pending
+        self._flush_lock = threading.Lock()   # 保证批量刷新与单车同步刷新互斥
+        self._in_flight = set()               # 已从缓冲取出、正在批量写入的车辆ID
+        self._shutdown = threading.Event()
+
+        # 运行指标
+        self.records_received = 0
+        self.records_coalesced = 0
+        self.flush_count = 0
+        self.rows_written = 0
+        self.last_flush_duration = 0.0
+
+    def record(self, vehicle_id, location_x, location_y, location_name=None, battery_level=None):
+        """写入一条遥测记录，覆盖该车尚未刷新的旧记录
+
+        新记录未携带的字段（位置名称、电量）沿用旧记录中的值。
+        """
+        with self._lock:
+            self.records_received += 1
+            previous = self._pending.get(vehicle_id)
+            if previous is not None:
+                self.records_coalesced += 1
+                if location_name is None:
+                    location_name = previous['location_name']
+                if battery_level is None:
+                    battery_level = previous['battery_level']
+            self._pending[vehicle_id] = {
+                'vehicle_id': vehicle_id,
+                'location_x': location_x,
+                'location_y': location_y,
+                'location_name': location_name,
+                'battery_level': battery_level
+            }
+
+    def has_pending(self, vehicle_id):
+        """该车是否有尚未刷新（或正在批量写入）的记录"""
+        with self._lock:
+            return vehicle_id in self._pending or vehicle_id in self._in_flight
+
+    def flush_vehicle(self, vehicle_id):
+        """同步刷新单辆车的缓冲记录
+
+        该车的记录正在被批量刷新时，等待批量写入完成后再返回，
+        保证调用方随后的直接 UPDATE 不会被较旧的批量写入覆盖。
+
+        Returns:
+            bool: 是否写入了记录
+        """
+        if not self.has_pending(vehicle_id):
+            return False
+        with self._flush_lock:
+            with self._lock:
+                entry = self._pending.pop(vehicle_id, None)
+            if entry is None:
+                return False
+            self._write([entry])
+            return True
+
+    def flush(self):
+        """把当前缓冲中的所有记录批量写入数据库
+
+        Returns:
+            int: 写入的车辆数
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                entries = list(self._pending.values())
+                self._pending = {}
+                self._in_flight = {entry['vehicle_id'] for entry in entries}
+            started = time.monotonic()
+            try:
+                for index in range(0, len(entries), FLUSH_CHUNK_SIZE):
+                    self._write(entries[index:index + FLUSH_CHUNK_SIZE])
+            finally:
+                with self._lock:
+                    self._in_flight = set()
+            self.last_flush_duration = time.monotonic() - started
+            self.flush_count += 1
+            return len(entries)
+
+    def get_metrics(self):
+        """缓冲运行指标"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending_vehicles': pending,
+            'records_received': self.records_received,
+            'records_coalesced': self.records_coalesced,
+            'flush_count': self.flush_count,
+            'rows_written': self.rows_written,
+            'last_flush_ms': round(self.last_flush_duration * 1000, 3),
+            'flush_interval': self.flush_interval
+        }
+
+    def shutdown(self):
+        """停止后台线程并写出剩余记录"""
+        self._shutdown.set()
+        self.flush()
+
+    def run(self):
+        while not self._shutdown.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"刷新车辆遥测缓冲出错: {e}")
+                traceback.print_exc()
+
+    def _write(self, entries):
+        from app.dao.vehicle_dao import VehicleDAO
+
+        try:
+            self.rows_written += VehicleDAO.bulk_update_vehicle_telemetry(entries)
+        except Exception as e:
+            print(f"批量写入车辆遥测失败，共 {len(entries)} 辆车: {e}")
+            traceback.print_exc()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_telemetry_buffer():
+    """获取全局遥测缓冲（首次调用时启动后台刷新线程）"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = VehicleTelemetryBuffer()
+                _buffer.start()
+                atexit.register(_buffer.shutdown)
+    return _buffer
+
+
+def flush_pending_telemetry(vehicle_id):
+    """如果该车有缓冲中的遥测记录，则同步写入数据库（未启用缓冲时不做任何事）"""
+    if _buffer is not None:
+        _buffer.flush_vehicle(vehicle_id)
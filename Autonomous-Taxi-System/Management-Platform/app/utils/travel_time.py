@@ -0,0 +1,358 @@
+"""
+城市行驶距离表
+把 0-999 的城市坐标划分为 TRAVEL_TIME_CELLS×TRAVEL_TIME_CELLS 个粗格，在障碍物占用栅格
+（app.utils.obstacle_index）上对粗格连通图做一次全源最短路，得到任意两格之间的避障行驶距离。
+调度成本和价格预估直接查表（O(1)），不再为每个 车辆×订单 组合单独寻路。
+
+表按城市保存为 .npy 文件，文件名包含障碍物内容的指纹，读取时使用 np.load(mmap_mode='r')，
+同一台机器上的多个进程共享同一份页缓存，不会各自复制一份。障碍物变化后指纹随之变化，
+下次查询时在后台线程重新计算，计算完成前调用方退回直线距离。
+
+表中的值是行驶距离（坐标单位），除以速度系数即得到与调度成本同单位的 ETA。
+没有障碍物的城市不建表，直线距离就是精确值。
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import queue
+import tempfile
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from app.utils.obstacle_index import GRID_SIZE, CITY_NAMES, CITY_CODES, normalize_city, get_obstacle_index
+
+# 每个方向的粗格数量
+TRAVEL_TIME_CELLS = 50
+# 粗格内空闲面积占比不低于该值时视为可通行
+PASSABLE_FREE_RATIO = 0.5
+# 表的计算方式版本，计算方式变化时使旧的表文件失效
+TRAVEL_TABLE_FORMAT = 2
+# 表文件目录，可通过环境变量覆盖
+TRAVEL_TIME_DIR = os.getenv('TRAVEL_TIME_DIR', os.path.join(tempfile.gettempdir(), 'autonomous_taxi_travel_time'))
+
+_SQRT2 = math.sqrt(2)
+
+
+def obstacle_fingerprint(grid, cells=TRAVEL_TIME_CELLS):
+    """障碍物内容指纹，障碍物增删改或表参数变化时随之变化"""
+    rows = sorted((str(row['id']), str(row['geometry_type']), str(row['polygon_points'])) for row in grid.source)
+    payload = json.dumps([TRAVEL_TABLE_FORMAT, cells, PASSABLE_FREE_RATIO, rows], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def build_travel_table(grid, cells=TRAVEL_TIME_CELLS):
+    """在城市占用栅格上计算粗格之间的行驶距离
+
+    粗格按空闲面积判断是否可通行，线段障碍物（墙）占不满一个粗格，因此相邻粗格之间是否连通
+    还要在精细栅格上检查两格中心的连线是否与障碍物相交，否则距离表会直接穿墙。
+
+    Returns:
+        tuple: (cells²×cells² 的 float32 距离矩阵，不可达为 inf；
+                长度 cells² 的 int32 吸附表，不可通行的格子映射到最近的可通行格)
+    """
+    from scipy.ndimage import distance_transform_edt
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+
+    cell_size = GRID_SIZE / cells
+    block = GRID_SIZE // cells
+    free_ratio = 1.0 - grid.occupied[:block * cells, :block * cells].reshape(cells, block, cells, block).mean(axis=(1, 3))
+    passable = free_ratio >= PASSABLE_FREE_RATIO
+    # 含有障碍物格子的粗格，经过它们的相邻边需要精确检查
+    touched = grid.occupied[:block * cells, :block * cells].reshape(cells, block, cells, block).any(axis=(1, 3))
+    node = np.arange(cells * cells).reshape(cells, cells)
+
+    sources, targets, weights = [], [], []
+    for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+        x_from = slice(0, cells - dx)
+        x_to = slice(dx, cells)
+        y_from = slice(max(0, -dy), cells - max(0, dy))
+        y_to = slice(max(0, dy), cells - max(0, -dy))
+        allowed = passable[x_from, y_from] & passable[x_to, y_to]
+        if dx and dy:
+            # 斜向相邻要求两个正交方向的格子也可通行，避免穿过障碍物拐角
+            allowed &= passable[x_to, y_from] & passable[x_from, y_to]
+        near_obstacle = touched[x_from, y_from] | touched[x_to, y_to]
+        if dx and dy:
+            near_obstacle |= touched[x_to, y_from] | touched[x_from, y_to]
+        for from_x, from_y in np.argwhere(allowed & near_obstacle):
+            from_x += x_from.start
+            from_y += y_from.start
+            if grid.segment_blocked((from_x + 0.5) * cell_size, (from_y + 0.5) * cell_size,
+                                    (from_x + dx + 0.5) * cell_size, (from_y + dy + 0.5) * cell_size):
+                allowed[from_x - x_from.start, from_y - y_from.start] = False
+        sources.append(node[x_from, y_from][allowed])
+        targets.append(node[x_to, y_to][allowed])
+        weights.append(np.full(int(allowed.sum()), cell_size * (_SQRT2 if dx and dy else 1.0)))
+    graph = csr_matrix(
+        (np.concatenate(weights), (np.concatenate(sources), np.concatenate(targets))),
+        shape=(cells * cells, cells * cells)
+    )
+    table = dijkstra(graph, directed=False).astype(np.float32)
+
+    if passable.any():
+        _, (near_x, near_y) = distance_transform_edt(~passable, return_indices=True)
+        snap = (near_x * cells + near_y).astype(np.int32).ravel()
+    else:
+        snap = node.astype(np.int32).ravel()
+    return table, snap
+
+
+class TravelTable:
+    """单个城市的粗格行驶距离表（只读内存映射）"""
+
+    def __init__(self, city_code, fingerprint, table, snap, cells=TRAVEL_TIME_CELLS):
+        self.city_code = city_code
+        self.fingerprint = fingerprint
+        self.table = table
+        self.snap = snap
+        self.cells = cells
+        self.cell_size = GRID_SIZE / cells
+
+    def cell_of(self, xy):
+        """坐标数组 (n, 2) 对应的（吸附后）格子序号"""
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        cell = np.clip((xy // self.cell_size).astype(np.int64), 0, self.cells - 1)
+        return self.snap[cell[:, 0] * self.cells + cell[:, 1]]
+
+    def pair_distances(self, from_xy, to_xy):
+        """逐对查表得到行驶距离，同格或相邻时取直线距离，结果不小于直线距离"""
+        from_xy = np.asarray(from_xy, dtype=float).reshape(-1, 2)
+        to_xy = np.asarray(to_xy, dtype=float).reshape(-1, 2)
+        straight = np.hypot(from_xy[:, 0] - to_xy[:, 0], from_xy[:, 1] - to_xy[:, 1])
+        if not len(straight):
+            return straight
+        looked_up = self.table[self.cell_of(from_xy), self.cell_of(to_xy)].astype(float)
+        return np.maximum(looked_up, straight)
+
+    def distance_matrix(self, from_xy, to_xy):
+        """from×to 的行驶距离矩阵"""
+        from_xy = np.asarray(from_xy, dtype=float).reshape(-1, 2)
+        to_xy = np.asarray(to_xy, dtype=float).reshape(-1, 2)
+        straight = np.hypot(from_xy[:, 0, None] - to_xy[None, :, 0], from_xy[:, 1, None] - to_xy[None, :, 1])
+        if not straight.size:
+            return straight
+        looked_up = self.table[np.ix_(self.cell_of(from_xy), self.cell_of(to_xy))].astype(float)
+        return np.maximum(looked_up, straight)
+
+    def distance(self, x1, y1, x2, y2):
+        return float(self.pair_distances([(x1, y1)], [(x2, y2)])[0])
+
+
+class TravelTimeTables:
+    """按城市管理行驶距离表：按指纹加载文件，缺失或过期时在后台重建"""
+
+    def __init__(self, directory=TRAVEL_TIME_DIR, cells=TRAVEL_TIME_CELLS):
+        self.directory = directory
+        self.cells = cells
+        self._lock = threading.Lock()
+        self._tables = {}            # 城市 -> TravelTable
+        self._fingerprints = {}      # 城市 -> (栅格版本, 指纹)
+        self._building = set()
+        self._build_queue = queue.Queue()
+        self._builder = None
+
+        # 运行指标
+        self.builds = 0
+        self.last_build_duration = 0.0
+        self.lookups = 0
+        self.misses = 0
+
+    def get_table(self, city_code, build=True):
+        """获取城市的行驶距离表
+
+        Args:
+            build: 表不存在或已过期时是否安排后台重建
+
+        Returns:
+            TravelTable: 城市没有障碍物或表尚未建好时返回 None
+        """
+        self.lookups += 1
+        city = normalize_city(city_code)
+        grid = get_obstacle_index().get_city_grid(city)
+        if grid is None or not grid.shapes:
+            return None
+        fingerprint = self._fingerprint(city, grid)
+        with self._lock:
+            table = self._tables.get(city)
+        if table is not None and table.fingerprint == fingerprint:
+            return table
+        table = self._load(city, fingerprint)
+        if table is not None:
+            with self._lock:
+                self._tables[city] = table
+            return table
+        self.misses += 1
+        if build:
+            self.schedule_build(city)
+        return None
+
+    def schedule_build(self, city_code=None):
+        """安排后台生成城市的表（已有当前指纹的表文件时直接加载）；city_code 为 None 时处理所有已加载过的城市"""
+        with self._lock:
+            cities = [normalize_city(city_code)] if city_code else list(self._tables)
+            cities = [city for city in cities if city not in self._building]
+            self._building.update(cities)
+            for city in cities:
+                self._build_queue.put(city)
+            if cities and (self._builder is None or not self._builder.is_alive()):
+                self._builder = threading.Thread(target=self._build_loop, name='travel-time-builder', daemon=True)
+                self._builder.start()
+
+    def warm_up(self):
+        """应用启动时在后台为所有城市加载或生成表"""
+        for city in CITY_NAMES.values():
+            self.schedule_build(city)
+
+    def build(self, city_code):
+        """同步计算并保存城市的行驶距离表
+
+        Returns:
+            TravelTable: 城市没有障碍物时返回 None
+        """
+        city = normalize_city(city_code)
+        grid = get_obstacle_index().get_city_grid(city)
+        if grid is None or not grid.shapes:
+            return None
+        fingerprint = self._fingerprint(city, grid)
+        started = time.time()
+        table, snap = build_travel_table(grid, self.cells)
+        os.makedirs(self.directory, exist_ok=True)
+        table_path, snap_path = self._paths(city, fingerprint)
+        # 先写临时文件再替换，其他进程不会读到写了一半的文件
+        for path, array in ((table_path, table), (snap_path, snap)):
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(temp_path, path)
+        self._remove_stale(city, fingerprint)
+        self.builds += 1
+        self.last_build_duration = time.time() - started
+        print(f"城市 {city} 行驶距离表已生成，耗时 {self.last_build_duration:.2f} 秒")
+
+        loaded = self._load(city, fingerprint)
+        with self._lock:
+            self._tables[city] = loaded
+        return loaded
+
+    def get_metrics(self):
+        with self._lock:
+            tables = {city: table.fingerprint for city, table in self._tables.items()}
+            building = sorted(self._building)
+        return {
+            'directory': self.directory,
+            'cells': self.cells,
+            'tables': tables,
+            'building': building,
+            'builds': self.builds,
+            'last_build_seconds': round(self.last_build_duration, 3),
+            'lookups': self.lookups,
+            'misses': self.misses
+        }
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+    def _fingerprint(self, city, grid):
+        with self._lock:
+            cached = self._fingerprints.get(city)
+        if cached is not None and cached[0] == grid.version:
+            return cached[1]
+        fingerprint = obstacle_fingerprint(grid, self.cells)
+        with self._lock:
+            self._fingerprints[city] = (grid.version, fingerprint)
+        return fingerprint
+
+    def _paths(self, city, fingerprint):
+        prefix = os.path.join(self.directory, f"{CITY_CODES.get(city, city)}_{self.cells}_{fingerprint}")
+        return f"{prefix}.npy", f"{prefix}_snap.npy"
+
+    def _load(self, city, fingerprint):
+        table_path, snap_path = self._paths(city, fingerprint)
+        if not (os.path.exists(table_path) and os.path.exists(snap_path)):
+            return None
+        try:
+            table = np.load(table_path, mmap_mode='r')
+            snap = np.load(snap_path)
+            return TravelTable(city, fingerprint, table, snap, self.cells)
+        except Exception as e:
+            print(f"加载城市 {city} 行驶距离表失败: {str(e)}")
+            traceback.print_exc()
+            return None
+
+    def _remove_stale(self, city, fingerprint):
+        """删除该城市旧指纹的表文件（其他进程已映射的文件在 Windows 上可能删不掉，忽略即可）"""
+        prefix = f"{CITY_CODES.get(city, city)}_{self.cells}_"
+        keep = {os.path.basename(path) for path in self._paths(city, fingerprint)}
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith('.npy') and name not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _build_loop(self):
+        while True:
+            try:
+                city = self._build_queue.get(timeout=5)
+            except queue.Empty:
+                with self._lock:
+                    if self._build_queue.empty():
+                        self._builder = None
+                        return
+                continue
+            try:
+                if self.get_table(city, build=False) is None:
+                    self.build(city)
+            except Exception as e:
+                print(f"生成城市 {city} 行驶距离表失败: {str(e)}")
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self._building.discard(city)
+
+
+_travel_time_tables = None
+_travel_time_tables_lock = threading.Lock()
+
+
+def get_travel_time_tables():
+    """获取全局行驶距离表管理器"""
+    global _travel_time_tables
+    if _travel_time_tables is None:
+        with _travel_time_tables_lock:
+            if _travel_time_tables is None:
+                _travel_time_tables = TravelTimeTables()
+    return _travel_time_tables
+
+
+def rebuild_travel_tables(city_code=None):
+    """障碍物变化后调用，安排后台重建行驶距离表"""
+    if _travel_time_tables is not None:
+        _travel_time_tables.schedule_build(city_code)
+
+
+def main():
+    """预计算命令：python -m app.utils.travel_time [--city 沈阳市]"""
+    parser = argparse.ArgumentParser(description='预计算城市行驶距离表')
+    parser.add_argument('--city', help='只计算指定城市（中文名或拼音代码），默认计算全部城市')
+    args = parser.parse_args()
+
+    tables = get_travel_time_tables()
+    cities = [args.city] if args.city else list(CITY_NAMES.values())
+    for city in cities:
+        try:
+            if tables.build(city) is None:
+                print(f"城市 {normalize_city(city)} 没有障碍物，跳过")
+        except Exception as e:
+            print(f"生成城市 {city} 行驶距离表失败: {str(e)}")
+            traceback.print_exc()
+
+
+if __name__ == '__main__':
+    main()
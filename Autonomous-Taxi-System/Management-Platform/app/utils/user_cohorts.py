@@ -0,0 +1,271 @@
+"""
+用户群组分析引擎
+用一条 SELECT 把用户表的分析列（注册时间、最后登录时间、注册城市、注册渠道、性别、生日、
+信用分、余额、标签）分块读入列式 NumPy 数组，留存矩阵、增长趋势和各类分布都在数组上
+向量化计算，不再为每个月份、每个区间各发一条 COUNT 查询。
+
+注册时间和登录时间另外保存一份升序数组，区间计数用 searchsorted 二分完成；
+留存计数先按注册时间二分出群组切片，再在切片内比较登录时间。
+
+快照按自然日缓存：同一天内的分析页面和报表导出共用一份快照（及其计算结果），
+新增/删除用户后调用 invalidate_user_cohorts() 立即失效。
+"""
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+from app.dao.base_dao import BaseDAO
+
+# 分块读取的行数
+FETCH_CHUNK_SIZE = 50000
+
+# 注册渠道
+CHANNELS = ['手机应用', '网站', '微信小程序', '合作推广', '其他']
+# 年龄段：标签与 [下限, 上限] 年龄（含），上限为 None 表示不限
+AGE_BUCKETS = [('18-24岁', 18, 24), ('25-34岁', 25, 34), ('35-44岁', 35, 44), ('45-54岁', 45, 54), ('55岁以上', 55, None)]
+# 信用分区间：标签与分界点（score < 30 为第一档，>= 120 为最后一档）
+CREDIT_LABELS = ['0-30', '31-60', '61-90', '91-120', '121-150']
+CREDIT_EDGES = [30, 60, 90, 120]
+# 留存口径：名称 -> (起始天数, 结束天数)，注册群组为 [窗口起点 - 起始天数, 窗口起点 - 结束天数)
+RETENTION_HORIZONS = {
+    'one_month_retention': (30, 0),
+    'three_month_retention': (90, 60),
+    'six_month_retention': (180, 150)
+}
+
+_COLUMNS = ('registration_time', 'last_login_time', 'registration_city', 'registration_channel',
+            'gender', 'birth_date', 'credit_score', 'balance', 'tags')
+
+
+def _datetime64(values):
+    return np.array([value if value is not None else np.datetime64('NaT') for value in values], dtype='datetime64[s]')
+
+
+def _ts(value):
+    return np.datetime64(value, 's')
+
+
+class UserCohorts:
+    """某一时刻的用户分析快照"""
+
+    def __init__(self, rows, now=None):
+        """
+        Args:
+            rows: 按 _COLUMNS 顺序的元组序列
+            now: 快照时间，缺省为当前时间
+        """
+        self.now = now or datetime.now()
+        self.day = self.now.date()
+        columns = list(zip(*rows)) if rows else [()] * len(_COLUMNS)
+        registration, last_login, city, channel, gender, birth, credit, balance, tags = columns
+
+        self.registration = _datetime64(registration)
+        self.last_login = _datetime64(last_login)
+        self.city = np.array([value or '' for value in city], dtype=object)
+        self.channel = np.array([value or '' for value in channel], dtype=object)
+        self.gender = np.array([value or '' for value in gender], dtype=object)
+        self.birth = np.array([value if value is not None else np.datetime64('NaT') for value in birth], dtype='datetime64[D]')
+        self.credit = np.array([value or 0 for value in credit], dtype=np.int64)
+        self.balance = np.array([float(value) if value is not None else np.nan for value in balance], dtype=np.float64)
+        self._tags = tags
+        self.total = len(self.registration)
+
+        # 按注册时间排序，群组切片内的登录时间用于留存计算
+        order = np.argsort(self.registration, kind='stable')
+        self._registration_sorted = self.registration[order]
+        self._login_by_registration = self.last_login[order]
+        self._registered = int(np.count_nonzero(~np.isnat(self._registration_sorted)))
+        login_sorted = np.sort(self.last_login)
+        self._login_sorted = login_sorted[:int(np.count_nonzero(~np.isnat(login_sorted)))]
+
+        self._lock = threading.Lock()
+        self._results = {}
+
+    @classmethod
+    def load(cls, now=None):
+        """从数据库读取全部用户的分析列"""
+        rows = []
+        conn = None
+        cursor = None
+        try:
+            conn = BaseDAO.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {', '.join(_COLUMNS)} FROM users")
+            while True:
+                chunk = cursor.fetchmany(FETCH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                rows.extend(chunk)
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+        return cls(rows, now)
+
+    # ---- 区间计数 ----
+
+    def _range(self, sorted_values, valid, start=None, end=None, end_inclusive=False):
+        left = 0 if start is None else int(np.searchsorted(sorted_values[:valid], _ts(start), side='left'))
+        if end is None:
+            right = valid
+        else:
+            right = int(np.searchsorted(sorted_values[:valid], _ts(end), side='right' if end_inclusive else 'left'))
+        return left, max(left, right)
+
+    def registered(self, start=None, end=None, end_inclusive=False):
+        """注册时间在 [start, end) 内的用户数（end_inclusive=True 时为闭区间）"""
+        left, right = self._range(self._registration_sorted, self._registered, start, end, end_inclusive)
+        return right - left
+
+    def logged_in(self, start=None, end=None, end_inclusive=False):
+        """最后登录时间在 [start, end) 内的用户数"""
+        left, right = self._range(self._login_sorted, len(self._login_sorted), start, end, end_inclusive)
+        return right - left
+
+    def retained(self, registration_start, registration_end, login_start, login_end=None, login_end_inclusive=False):
+        """注册时间在 [registration_start, registration_end) 内、最后登录时间在登录区间内的 (群组人数, 留存人数)"""
+        left, right = self._range(self._registration_sorted, self._registered, registration_start, registration_end)
+        logins = self._login_by_registration[left:right]
+        mask = logins >= _ts(login_start)
+        if login_end is not None:
+            mask &= (logins <= _ts(login_end)) if login_end_inclusive else (logins < _ts(login_end))
+        return right - left, int(np.count_nonzero(mask))
+
+    # ---- 分布 ----
+
+    def channel_counts(self, channels=CHANNELS):
+        return [int(np.count_nonzero(self.channel == channel)) for channel in channels]
+
+    def gender_counts(self):
+        """(男, 女, 其他) 人数"""
+        return tuple(int(np.count_nonzero(self.gender == value)) for value in ('男', '女', '其他'))
+
+    def age_counts(self, by_year=False):
+        """各年龄段人数
+
+        Args:
+            by_year: False 时年龄按 (今天 - 生日).days // 365 计算（分析页面口径），
+                     True 时按 今年 - 出生年份 计算（报表导出口径）
+        """
+        birth = self.birth[~np.isnat(self.birth)]
+        if by_year:
+            ages = self.day.year - birth.astype('datetime64[Y]').astype(np.int64) - 1970
+        else:
+            ages = (np.datetime64(self.day, 'D') - birth).astype(np.int64) // 365
+        counts = []
+        for _, low, high in AGE_BUCKETS:
+            mask = ages >= low
+            if high is not None:
+                mask &= ages <= high
+            counts.append(int(np.count_nonzero(mask)))
+        return counts
+
+    def credit_counts(self):
+        """各信用分区间人数（没有信用分记为 0 分）"""
+        return np.bincount(np.digitize(self.credit, CREDIT_EDGES), minlength=len(CREDIT_LABELS)).tolist()
+
+    def city_counts(self):
+        """{注册城市: 人数}，不含空城市"""
+        cities = self.city[self.city != '']
+        if len(cities) == 0:
+            return {}
+        values, counts = np.unique(cities.astype(str), return_counts=True)
+        return {str(value): int(count) for value, count in zip(values, counts)}
+
+    def tag_counts(self, limit=50):
+        """标签出现次数，按次数降序返回前 limit 个"""
+        counter = Counter()
+        for value in self._tags:
+            if value:
+                counter.update(tag.strip() for tag in value.split(',') if tag.strip())
+        return [{"name": tag, "count": count} for tag, count in counter.most_common(limit)]
+
+    def average_balance(self):
+        valid = self.balance[~np.isnan(self.balance)]
+        return float(valid.mean()) if len(valid) else 0.0
+
+    # ---- 趋势与留存 ----
+
+    def monthly_trend(self, months=12):
+        """最近 months 个自然月的 (月初列表, 新增用户数列表, 活跃用户数列表)，当月截至快照时间"""
+        month_starts = []
+        new_users = []
+        active_users = []
+        this_month = self.now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        for i in range(months - 1, -1, -1):
+            month_start = this_month - relativedelta(months=i)
+            month_end = month_start + relativedelta(months=1)
+            month_starts.append(month_start)
+            new_users.append(self.registered(month_start, month_end))
+            active_users.append(self.logged_in(month_start, month_end))
+        return month_starts, new_users, active_users
+
+    def retention_matrix(self, months=6):
+        """最近 months 个月、各留存口径的留存率（%）
+
+        第 i 列的统计窗口为快照时间往前 i 个月的 30 天；各口径的注册群组为窗口起点之前
+        RETENTION_HORIZONS 所定义的 30 天区间，留存即群组中最后登录时间落在统计窗口内的比例。
+        """
+        data = {'months': []}
+        for key in RETENTION_HORIZONS:
+            data[key] = []
+        for i in range(months - 1, -1, -1):
+            data['months'].append(f'{months - i}个月前')
+            window_end = self.now - relativedelta(months=i) if i > 0 else self.now
+            window_start = window_end - timedelta(days=30)
+            for key, (start_days, end_days) in RETENTION_HORIZONS.items():
+                cohort, retained = self.retained(
+                    window_start - timedelta(days=start_days),
+                    window_start - timedelta(days=end_days),
+                    window_start, window_end, login_end_inclusive=True
+                )
+                data[key].append(round(retained / cohort * 100, 1) if cohort > 0 else 0)
+        return data
+
+    def memoize(self, key, compute):
+        """同一快照内只计算一次的结果"""
+        with self._lock:
+            if key in self._results:
+                return self._results[key]
+        value = compute()
+        with self._lock:
+            return self._results.setdefault(key, value)
+
+
+_cohorts = None
+_cohorts_lock = threading.Lock()
+_metrics = {'loads': 0, 'hits': 0, 'last_load_seconds': 0.0, 'users': 0}
+
+
+def get_user_cohorts():
+    """获取当天的用户分析快照，跨天或失效后重新加载"""
+    global _cohorts
+    today = date.today()
+    cohorts = _cohorts
+    if cohorts is not None and cohorts.day == today:
+        _metrics['hits'] += 1
+        return cohorts
+    with _cohorts_lock:
+        if _cohorts is None or _cohorts.day != today:
+            started = time.time()
+            _cohorts = UserCohorts.load()
+            _metrics['loads'] += 1
+            _metrics['last_load_seconds'] = round(time.time() - started, 3)
+            _metrics['users'] = _cohorts.total
+        return _cohorts
+
+
+def invalidate_user_cohorts():
+    """用户增删后调用，下次访问时重新加载"""
+    global _cohorts
+    with _cohorts_lock:
+        _cohorts = None
+
+
+def get_metrics():
+    return dict(_metrics)
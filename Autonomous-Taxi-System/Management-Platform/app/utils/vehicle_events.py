@@ -0,0 +1,399 @@
+"""
+车辆状态变更事件流
+vehicle_logs 中的状态变更是给人看的句子，统计时只能对 log_content 做 LIKE 扫描。
+这里另建一张只追加的结构化事件表 vehicle_state_events，每次状态变更记录
+(车辆ID, 原状态, 新状态, 时间, 运营城市, 电量)：
+
+- 写入：状态变更处调用 record()，事件先进入内存队列，由后台线程按固定节奏用 executemany 批量写入；
+- 索引：(vehicle_id, event_time)、(to_status, event_time)、(city_code, event_time)，
+  利用率、空闲时长、状态流转统计都是按时间范围的索引扫描；
+- 分区：按 event_time 每月一个 RANGE COLUMNS 分区，后台线程定期预建未来分区、删除超过保留期的分区，
+  按时间范围的查询只访问相关分区。
+
+维护命令：python -m app.utils.vehicle_events init|maintain
+"""
+import argparse
+import atexit
+import threading
+import time
+import traceback
+from datetime import date, datetime, timedelta
+
+from app.dao.base_dao import BaseDAO
+
+EVENT_TABLE = 'vehicle_state_events'
+# 队列刷新间隔（秒）
+FLUSH_INTERVAL = 1.0
+# 单条 executemany 最多写入的事件数
+FLUSH_CHUNK_SIZE = 1000
+# 写库失败时队列中最多保留的事件数，超出后丢弃最早的事件
+MAX_PENDING = 100000
+# 分区维护间隔（秒）
+MAINTENANCE_INTERVAL = 3600
+# 预建的未来月份分区数
+PARTITION_MONTHS_AHEAD = 2
+# 保留的月份数，更早的分区整体删除
+RETENTION_MONTHS = 24
+# 统计区间起点之前向前查找车辆初始状态的天数
+STATE_LOOKBACK_DAYS = 7
+
+_COLUMNS = ('event_time', 'vehicle_id', 'city_code', 'from_status', 'to_status', 'battery_level')
+
+_TABLE_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {EVENT_TABLE} (
+        event_id BIGINT NOT NULL AUTO_INCREMENT,
+        event_time DATETIME(3) NOT NULL,
+        vehicle_id INT NOT NULL,
+        city_code VARCHAR(50) NULL,
+        from_status VARCHAR(20) NULL,
+        to_status VARCHAR(20) NOT NULL,
+        battery_level TINYINT UNSIGNED NULL,
+        PRIMARY KEY (event_id, event_time),
+        KEY idx_vehicle_time (vehicle_id, event_time),
+        KEY idx_to_status_time (to_status, event_time),
+        KEY idx_city_time (city_code, event_time)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='车辆状态变更事件'
+"""
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(month):
+    return f"p{month.year:04d}{month.month:02d}"
+
+
+def _partition_definition(month):
+    return f"PARTITION {_partition_name(month)} VALUES LESS THAN ('{_add_months(month, 1).isoformat()}')"
+
+
+def ensure_vehicle_event_table():
+    """创建缺失的事件表（含当月及未来 PARTITION_MONTHS_AHEAD 个月的分区），返回是否新建"""
+    existing = BaseDAO.execute_query("""
+        SELECT table_name AS name FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = %s
+    """, (EVENT_TABLE,))
+    if existing:
+        return False
+    this_month = _month_start(date.today())
+    partitions = [_partition_definition(_add_months(this_month, i)) for i in range(PARTITION_MONTHS_AHEAD + 1)]
+    partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    try:
+        BaseDAO.execute_update(_TABLE_DDL + f" PARTITION BY RANGE COLUMNS(event_time) ({', '.join(partitions)})")
+    except Exception as e:
+        # 不支持分区的 MySQL 实例退回到普通表，索引不受影响
+        print(f"创建分区事件表失败，改为创建普通表: {str(e)}")
+        BaseDAO.execute_update(_TABLE_DDL)
+    return True
+
+
+def maintain_partitions(months_ahead=PARTITION_MONTHS_AHEAD, retention_months=RETENTION_MONTHS):
+    """预建未来月份分区、删除超过保留期的分区
+
+    Returns:
+        dict: {'added': 新建的分区名列表, 'dropped': 删除的分区名列表}
+    """
+    result = {'added': [], 'dropped': []}
+    rows = BaseDAO.execute_query("""
+        SELECT partition_name AS name FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL
+    """, (EVENT_TABLE,))
+    names = {row['name'] for row in rows}
+    if 'pmax' not in names:
+        return result
+
+    this_month = _month_start(date.today())
+    missing = [
+        _add_months(this_month, i) for i in range(months_ahead + 1)
+        if _partition_name(_add_months(this_month, i)) not in names
+    ]
+    latest = max((name for name in names if name != 'pmax'), default=None)
+    # 只能从 pmax 中拆出比现有分区更晚的月份
+    missing = [month for month in missing if latest is None or _partition_name(month) > latest]
+    if missing:
+        definitions = [_partition_definition(month) for month in missing]
+        definitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+        BaseDAO.execute_update(f"ALTER TABLE {EVENT_TABLE} REORGANIZE PARTITION pmax INTO ({', '.join(definitions)})")
+        result['added'] = [_partition_name(month) for month in missing]
+
+    if retention_months:
+        cutoff = _partition_name(_add_months(this_month, -retention_months))
+        expired = sorted(name for name in names if name != 'pmax' and name < cutoff)
+        if expired:
+            BaseDAO.execute_update(f"ALTER TABLE {EVENT_TABLE} DROP PARTITION {', '.join(expired)}")
+            result['dropped'] = expired
+    return result
+
+
+class VehicleEventLog(threading.Thread):
+    """车辆状态变更事件的批量写入线程"""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, maintenance_interval=MAINTENANCE_INTERVAL):
+        super().__init__(name='vehicle-event-log', daemon=True)
+        self.flush_interval = flush_interval
+        self.maintenance_interval = maintenance_interval
+        self._pending = []                    # 待写入的事件元组，按 _COLUMNS 顺序
+        self._lock = threading.Lock()         # 保护 _pending
+        self._flush_lock = threading.Lock()   # 保证同一时间只有一次写入
+        self._shutdown = threading.Event()
+        self._last_maintenance = 0.0
+
+        self.events_recorded = 0
+        self.events_written = 0
+        self.events_dropped = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.last_flush_duration = 0.0
+
+    def record(self, vehicle_id, from_status, to_status, city_code=None, battery_level=None, event_time=None):
+        """记录一次状态变更（只入队，不访问数据库）"""
+        if to_status is None or from_status == to_status:
+            return
+        if battery_level is not None:
+            battery_level = max(0, min(int(battery_level), 100))
+        event = (event_time or datetime.now(), int(vehicle_id), city_code, from_status, to_status, battery_level)
+        with self._lock:
+            self._pending.append(event)
+            self.events_recorded += 1
+
+    def flush(self):
+        """把队列中的事件批量写入数据库，返回写入的事件数"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                events = self._pending
+                self._pending = []
+            started = time.monotonic()
+            written = 0
+            try:
+                for index in range(0, len(events), FLUSH_CHUNK_SIZE):
+                    self._write(events[index:index + FLUSH_CHUNK_SIZE])
+                    written = index + min(FLUSH_CHUNK_SIZE, len(events) - index)
+            except Exception as e:
+                self.flush_errors += 1
+                print(f"写入车辆状态事件失败，{len(events) - written} 条事件留待下次写入: {e}")
+                traceback.print_exc()
+                self._requeue(events[written:])
+            self.events_written += written
+            self.last_flush_duration = time.monotonic() - started
+            self.flush_count += 1
+            return written
+
+    def get_metrics(self):
+        """写入线程运行指标"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending_events': pending,
+            'events_recorded': self.events_recorded,
+            'events_written': self.events_written,
+            'events_dropped': self.events_dropped,
+            'flush_count': self.flush_count,
+            'flush_errors': self.flush_errors,
+            'last_flush_ms': round(self.last_flush_duration * 1000, 3),
+            'flush_interval': self.flush_interval
+        }
+
+    def shutdown(self):
+        """停止后台线程并写出剩余事件"""
+        self._shutdown.set()
+        self.flush()
+
+    def run(self):
+        while not self._shutdown.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() - self._last_maintenance > self.maintenance_interval:
+                    self._last_maintenance = time.time()
+                    maintain_partitions()
+            except Exception as e:
+                print(f"车辆状态事件后台任务出错: {e}")
+                traceback.print_exc()
+
+    def _write(self, events):
+        conn = None
+        cursor = None
+        try:
+            conn = BaseDAO.get_connection()
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"INSERT INTO {EVENT_TABLE} ({', '.join(_COLUMNS)}) VALUES ({', '.join(['%s'] * len(_COLUMNS))})",
+                events
+            )
+            conn.commit()
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def _requeue(self, events):
+        """写入失败的事件放回队列头部，超过 MAX_PENDING 时丢弃最早的事件"""
+        with self._lock:
+            self._pending = events + self._pending
+            overflow = len(self._pending) - MAX_PENDING
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.events_dropped += overflow
+
+
+_event_log = None
+_event_log_lock = threading.Lock()
+
+
+def get_vehicle_event_log():
+    """获取全局状态事件写入器（首次调用时启动后台写入线程）"""
+    global _event_log
+    if _event_log is None:
+        with _event_log_lock:
+            if _event_log is None:
+                _event_log = VehicleEventLog()
+                _event_log.start()
+                atexit.register(_event_log.shutdown)
+    return _event_log
+
+
+def record_transition(vehicle_id, from_status, to_status, city_code=None, battery_level=None):
+    """记录一次车辆状态变更"""
+    get_vehicle_event_log().record(vehicle_id, from_status, to_status, city_code, battery_level)
+
+
+# ---- 统计查询 ----
+
+def _filters(city_code=None, to_status=None):
+    conditions = []
+    params = []
+    if city_code:
+        conditions.append("city_code = %s")
+        params.append(city_code)
+    if to_status:
+        conditions.append("to_status = %s")
+        params.append(to_status)
+    return ''.join(f" AND {condition}" for condition in conditions), params
+
+
+def count_transitions(start, end, to_status=None, city_code=None):
+    """[start, end) 内的状态变更次数，可按目标状态和城市过滤"""
+    where, params = _filters(city_code, to_status)
+    rows = BaseDAO.execute_query(f"""
+        SELECT COUNT(*) AS count FROM {EVENT_TABLE}
+        WHERE event_time >= %s AND event_time < %s{where}
+    """, tuple([start, end] + params))
+    return int(rows[0]['count']) if rows else 0
+
+
+def transition_matrix(start, end, city_code=None):
+    """[start, end) 内各 (原状态, 新状态) 的变更次数，按次数降序"""
+    where, params = _filters(city_code)
+    rows = BaseDAO.execute_query(f"""
+        SELECT from_status, to_status, COUNT(*) AS count FROM {EVENT_TABLE}
+        WHERE event_time >= %s AND event_time < %s{where}
+        GROUP BY from_status, to_status
+        ORDER BY count DESC
+    """, tuple([start, end] + params))
+    return [{'from_status': row['from_status'], 'to_status': row['to_status'], 'count': int(row['count'])} for row in rows]
+
+
+def status_durations(start, end, city_code=None):
+    """[start, end) 内每辆车在各状态停留的秒数
+
+    车辆在区间起点的状态取起点前 STATE_LOOKBACK_DAYS 天内的最后一条事件，没有时取区间内第一条事件的原状态；
+    区间内和回看期内都没有事件的车辆不计入。区间终点晚于当前时间时按当前时间截止。
+
+    Returns:
+        dict: {车辆ID: {状态: 秒数}}
+    """
+    end = min(end, datetime.now())
+    if end <= start:
+        return {}
+    where, params = _filters(city_code)
+    seeds = BaseDAO.execute_query(f"""
+        SELECT e.vehicle_id, e.to_status
+        FROM {EVENT_TABLE} e
+        JOIN (
+            SELECT vehicle_id, MAX(event_time) AS event_time FROM {EVENT_TABLE}
+            WHERE event_time >= %s AND event_time < %s{where}
+            GROUP BY vehicle_id
+        ) last ON last.vehicle_id = e.vehicle_id AND last.event_time = e.event_time
+    """, tuple([start - timedelta(days=STATE_LOOKBACK_DAYS), start] + params))
+    current = {row['vehicle_id']: row['to_status'] for row in seeds}
+    events = BaseDAO.execute_query(f"""
+        SELECT vehicle_id, event_time, from_status, to_status FROM {EVENT_TABLE}
+        WHERE event_time >= %s AND event_time < %s{where}
+        ORDER BY vehicle_id, event_time, event_id
+    """, tuple([start, end] + params))
+
+    durations = {}
+    since = {vehicle_id: start for vehicle_id in current}
+    for event in events:
+        vehicle_id = event['vehicle_id']
+        if vehicle_id not in since:
+            current[vehicle_id] = event['from_status']
+            since[vehicle_id] = start
+        status = current[vehicle_id]
+        if status is not None:
+            seconds = (event['event_time'] - since[vehicle_id]).total_seconds()
+            totals = durations.setdefault(vehicle_id, {})
+            totals[status] = totals.get(status, 0.0) + seconds
+        current[vehicle_id] = event['to_status']
+        since[vehicle_id] = event['event_time']
+    for vehicle_id, status in current.items():
+        if status is None:
+            continue
+        totals = durations.setdefault(vehicle_id, {})
+        totals[status] = totals.get(status, 0.0) + (end - since[vehicle_id]).total_seconds()
+    return durations
+
+
+def utilization(start, end, city_code=None, busy_status='运行中', idle_status='空闲中'):
+    """[start, end) 内车队的状态时长汇总
+
+    Returns:
+        dict: {'vehicles': 车辆数, 'status_seconds': {状态: 总秒数},
+               'utilization': 运行时长占比（%）, 'avg_idle_minutes': 每车平均空闲分钟数}
+    """
+    durations = status_durations(start, end, city_code)
+    totals = {}
+    for statuses in durations.values():
+        for status, seconds in statuses.items():
+            totals[status] = totals.get(status, 0.0) + seconds
+    tracked = sum(totals.values())
+    vehicles = len(durations)
+    return {
+        'vehicles': vehicles,
+        'status_seconds': {status: round(seconds, 3) for status, seconds in totals.items()},
+        'utilization': round(totals.get(busy_status, 0.0) / tracked * 100, 1) if tracked > 0 else 0,
+        'avg_idle_minutes': round(totals.get(idle_status, 0.0) / vehicles / 60, 1) if vehicles else 0
+    }
+
+
+def main():
+    """事件表维护命令：python -m app.utils.vehicle_events init|maintain"""
+    parser = argparse.ArgumentParser(description='维护车辆状态变更事件表')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('init', help='创建缺失的事件表')
+    maintain_parser = subparsers.add_parser('maintain', help='预建未来分区并删除过期分区')
+    maintain_parser.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD, help='预建的未来月份数')
+    maintain_parser.add_argument('--retention-months', type=int, default=RETENTION_MONTHS, help='保留的月份数，0 表示不删除')
+    args = parser.parse_args()
+
+    try:
+        if ensure_vehicle_event_table():
+            print(f"已创建事件表 {EVENT_TABLE}")
+        if args.command == 'maintain':
+            result = maintain_partitions(args.months_ahead, args.retention_months)
+            print(f"新建分区: {', '.join(result['added']) or '无'}；删除分区: {', '.join(result['dropped']) or '无'}")
+    except Exception as e:
+        print(f"维护事件表失败: {str(e)}")
+        traceback.print_exc()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+车型特性档案
+把系统参数中按车型配置的六个系数编译成 VehicleProfile 记录，并维护 车辆ID -> 车型 的索引，
+仿真、计价和调度解析车辆系数时只需一次字典查找，不再拼接参数键或查询数据库。
+
+档案从系统参数缓存（app.utils.param_cache）的快照编译，参数版本变化时整体重新编译；
+车型索引首次使用时从车队状态（app.utils.fleet_state）整体建立，未命中的车辆按需读取。
+车辆被删除或修改车型后应调用 forget_vehicle_model()。
+"""
+import threading
+import traceback
+
+from app.utils.param_cache import get_param_cache
+from app.utils.fleet_state import get_fleet_state
+
+
+class VehicleProfile:
+    """单个车型的特性系数，未配置的系数为 None"""
+
+    __slots__ = ('model', 'speed', 'capacity', 'charging_speed', 'energy_consumption',
+                 'maintenance_cost', 'order_price')
+
+    # 档案字段 -> get_vehicle_parameters 返回字典中的键
+    PARAM_NAMES = {
+        'speed': 'speed_coefficient',
+        'capacity': 'capacity_coefficient',
+        'charging_speed': 'charging_speed_coefficient',
+        'energy_consumption': 'energy_consumption_coefficient',
+        'maintenance_cost': 'maintenance_cost_coefficient',
+        'order_price': 'order_price_coefficient'
+    }
+
+    def __init__(self, model, params):
+        self.model = model
+        for field, name in self.PARAM_NAMES.items():
+            value = params.get(name)
+            setattr(self, field, float(value) if isinstance(value, (int, float)) else value)
+
+    def as_params(self):
+        """转换为 get_vehicle_parameters 使用的参数字典"""
+        return {name: getattr(self, field) for field, name in self.PARAM_NAMES.items()}
+
+    def __repr__(self):
+        return f"VehicleProfile({self.model!r}, speed={self.speed}, order_price={self.order_price})"
+
+
+class VehicleProfileRegistry:
+    """车型档案注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = {}          # 车型 -> VehicleProfile（None 为默认档案）
+        self._param_version = None
+        self._vehicle_models = {}    # 车辆ID -> 车型
+        self._index_loaded = False
+
+        # 运行指标
+        self.compiles = 0
+        self.index_misses = 0
+
+    def for_model(self, vehicle_model):
+        """车型档案；车型为空时返回默认档案
+
+        Raises:
+            Exception: 系统参数首次加载失败时抛出
+        """
+        snapshot = get_param_cache().snapshot()
+        if snapshot.version != self._param_version:
+            self._compile(snapshot)
+        profile = self._profiles.get(vehicle_model or None)
+        if profile is None:
+            profile = VehicleProfile(vehicle_model or None, snapshot.model_params(vehicle_model))
+            self._profiles[vehicle_model or None] = profile
+        return profile
+
+    def model_of(self, vehicle_id):
+        """车辆型号，未知车辆返回 None"""
+        if not self._index_loaded:
+            self._load_index()
+        model = self._vehicle_models.get(vehicle_id)
+        if model is None:
+            self.index_misses += 1
+            vehicle = get_fleet_state().get(vehicle_id)
+            model = vehicle.get('model') if vehicle else None
+            if model:
+                self._vehicle_models[vehicle_id] = model
+        return model
+
+    def for_vehicle(self, vehicle_id):
+        """车辆的 (车型, 档案)，无法确定车型时使用默认档案"""
+        vehicle_model = self.model_of(vehicle_id)
+        return vehicle_model, self.for_model(vehicle_model)
+
+    def forget(self, vehicle_id):
+        """移除车辆的车型索引，下次访问时重新读取"""
+        self._vehicle_models.pop(vehicle_id, None)
+
+    def get_metrics(self):
+        return {
+            'param_version': self._param_version,
+            'models': sorted(model for model in self._profiles if model),
+            'indexed_vehicles': len(self._vehicle_models),
+            'compiles': self.compiles,
+            'index_misses': self.index_misses
+        }
+
+    def _compile(self, snapshot):
+        with self._lock:
+            if snapshot.version == self._param_version:
+                return
+            profiles = {None: VehicleProfile(None, snapshot.defaults)}
+            for vehicle_model in list(self._profiles):
+                if vehicle_model:
+                    profiles[vehicle_model] = VehicleProfile(vehicle_model, snapshot.model_params(vehicle_model))
+            for vehicle_model in set(self._vehicle_models.values()):
+                if vehicle_model not in profiles:
+                    profiles[vehicle_model] = VehicleProfile(vehicle_model, snapshot.model_params(vehicle_model))
+            self._profiles = profiles
+            self._param_version = snapshot.version
+            self.compiles += 1
+
+    def _load_index(self):
+        with self._lock:
+            if self._index_loaded:
+                return
+            try:
+                vehicles = get_fleet_state().get_city_vehicles('all')
+                self._vehicle_models.update(
+                    (vehicle['vehicle_id'], vehicle['model']) for vehicle in vehicles if vehicle.get('model')
+                )
+            except Exception as e:
+                print(f"建立车辆车型索引失败，将按需读取: {str(e)}")
+                traceback.print_exc()
+            self._index_loaded = True
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_vehicle_profiles():
+    """获取全局车型档案注册表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = VehicleProfileRegistry()
+    return _registry
+
+
+def forget_vehicle_model(vehicle_id):
+    """车辆删除或修改车型后调用；注册表尚未创建时无需处理"""
+    if _registry is not None:
+        _registry.forget(vehicle_id)
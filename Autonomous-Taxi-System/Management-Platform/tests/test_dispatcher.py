@@ -0,0 +1,54 @@
+"""
+连续订单调度器：行程未能启动时撤销分配
+"""
+import unittest
+from unittest import mock
+
+from app.utils.dispatcher import ContinuousDispatcher
+
+ORDER = {
+    'order_id': 42,
+    'pickup_location_x': 100.0, 'pickup_location_y': 100.0,
+    'dropoff_location_x': 300.0, 'dropoff_location_y': 400.0,
+    'pickup_location': '上车点', 'dropoff_location': '下车点'
+}
+VEHICLE = {'vehicle_id': 7, 'current_location_x': 90.0, 'current_location_y': 95.0}
+
+
+class StartTripTest(unittest.TestCase):
+
+    def _start_trip(self, order=ORDER, vehicle=VEHICLE, **movement):
+        fleet_state = mock.Mock()
+        fleet_state.get.return_value = vehicle
+        with mock.patch('app.utils.fleet_state.get_fleet_state', return_value=fleet_state), \
+                mock.patch('app.admin.orders.start_vehicle_movement', **movement) as start, \
+                mock.patch('app.utils.dispatcher.rollback_assignment') as rollback:
+            ContinuousDispatcher._start_trip(order, 7)
+        return start, rollback
+
+    def test_started_trip_keeps_assignment(self):
+        start, rollback = self._start_trip(return_value=True)
+        start.assert_called_once()
+        rollback.assert_not_called()
+
+    def test_rejected_trip_rolls_back(self):
+        _, rollback = self._start_trip(return_value=False)
+        rollback.assert_called_once_with(42, 7)
+
+    def test_failed_trip_rolls_back(self):
+        _, rollback = self._start_trip(side_effect=RuntimeError('engine stopped'))
+        rollback.assert_called_once_with(42, 7)
+
+    def test_missing_dropoff_rolls_back(self):
+        start, rollback = self._start_trip(order=dict(ORDER, dropoff_location_x=None), return_value=True)
+        start.assert_not_called()
+        rollback.assert_called_once_with(42, 7)
+
+    def test_missing_vehicle_rolls_back(self):
+        start, rollback = self._start_trip(vehicle=None, return_value=True)
+        start.assert_not_called()
+        rollback.assert_called_once_with(42, 7)
+
+
+if __name__ == '__main__':
+    unittest.main()